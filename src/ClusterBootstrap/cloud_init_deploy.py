@@ -202,6 +202,8 @@ def load_default_config(config):
     apply_config_mapping(config, default_config_mapping)
     if ("mysql_node" not in config):
         config["mysql_node"] = config["infra_node"][0]
+    if ("redis_node" not in config):
+        config["redis_node"] = config["infra_node"][0]
     if ("host" not in config["prometheus"]):
         config["prometheus"]["host"] = config["infra_node"][0]
     config = update_docker_image_config(config)
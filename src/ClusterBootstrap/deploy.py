@@ -270,6 +270,9 @@ def update_config():
     if ("mysql_node" not in config):
         config["mysql_node"] = None if len(get_node_lists_for_service(
             "mysql")) == 0 else get_node_lists_for_service("mysql")[0]
+    if ("redis_node" not in config):
+        config["redis_node"] = None if len(get_node_lists_for_service(
+            "jobmanager")) == 0 else get_node_lists_for_service("jobmanager")[0]
     if ("host" not in config["prometheus"]):
         config["prometheus"]["host"] = None if len(get_node_lists_for_service(
             "prometheus")) == 0 else get_node_lists_for_service("prometheus")[0]
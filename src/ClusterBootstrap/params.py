@@ -36,7 +36,8 @@ default_config_parameters = {
     "azure_blob_log": {
         "enabled": False,
         "port": {
-            "adapter": 6200
+            "adapter": 6200,
+            "metrics": 6201
         }
     },
     "influxdb_port": "8086",
@@ -89,6 +90,8 @@ default_config_parameters = {
         "agent-port": 9081,
     },
     "mysql_port": "3306",
+    # Redis in the jobmanager pod, redis_node defaults to the jobmanager node
+    "redis_port": "9300",
     "mysql_username": "root",
     "mysql_data_path": "/var/lib/mysql",
     "datasource": "MySQL",
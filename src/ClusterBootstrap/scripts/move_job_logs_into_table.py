@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""Moves log tails of jobs from the jobLog field of jobs into joblogs.
+
+The REST API reads the jobLog field of jobs which have no row in joblogs, so
+this can run while the cluster is up, after the REST API and job manager have
+been upgraded. Rows already in joblogs are newer and are kept.
+
+measure reports the size of the tables and the time of scans of jobs, it is
+also run before and after migrate. InnoDB keeps the space freed in jobs until
+the table is rebuilt, with optimize.
+"""
+
+import os
+import sys
+import time
+import yaml
+import argparse
+import logging
+
+import mysql.connector
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "../../utils"))
+
+from job_log_tail import compress_job_log, decode_job_log
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+
+
+def build_mysql_connection(rest_config_path):
+    with open(rest_config_path) as f:
+        cluster_config = yaml.safe_load(f)
+
+    host = cluster_config["mysql"]["hostname"]
+    port = cluster_config["mysql"]["port"]
+    username = cluster_config["mysql"]["username"]
+    password = cluster_config["mysql"]["password"]
+    db_name = "DLWSCluster-%s" % cluster_config["clusterId"]
+    return mysql.connector.connect(user=username,
+                                   password=password,
+                                   host=host,
+                                   port=port,
+                                   database=db_name)
+
+
+def create_table(conn):
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS `joblogs`
+        (
+            `jobId`       VARCHAR(50) NOT NULL,
+            `log`         LONGBLOB    NOT NULL,
+            `lastUpdated` DATETIME    NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (`jobId`)
+        )
+        """)
+    conn.commit()
+    cursor.close()
+
+
+def measure(conn):
+    cursor = conn.cursor()
+    cursor.execute(
+        """SELECT `TABLE_NAME`, `TABLE_ROWS`, `DATA_LENGTH`, `INDEX_LENGTH`,
+                  `DATA_FREE`
+           FROM information_schema.TABLES
+           WHERE `TABLE_SCHEMA` = DATABASE()
+           AND `TABLE_NAME` IN ('jobs', 'joblogs')""")
+    for (table, rows, data_length, index_length, data_free) in cursor:
+        logger.info(
+            "table %s: ~%s rows, data %.1f MB, index %.1f MB, free %.1f MB",
+            table, rows, data_length / 1e6, index_length / 1e6,
+            data_free / 1e6)
+
+    cursor.execute(
+        "SELECT COUNT(*), COALESCE(SUM(LENGTH(`jobLog`)), 0) FROM `jobs` "
+        "WHERE `jobLog` IS NOT NULL")
+    (count, size) = cursor.fetchone()
+    logger.info("%d jobs have %.1f MB in jobLog", count, size / 1e6)
+
+    start = time.time()
+    cursor.execute(
+        "SELECT SQL_NO_CACHE COUNT(*) FROM `jobs` WHERE `jobName` LIKE '%x%'")
+    cursor.fetchall()
+    logger.info("full scan of jobs: %.3f s", time.time() - start)
+
+    start = time.time()
+    cursor.execute("SELECT SQL_NO_CACHE * FROM `jobs`")
+    rows = 0
+    while True:
+        batch = cursor.fetchmany(1000)
+        if not batch:
+            break
+        rows += len(batch)
+    logger.info("SELECT * of %d jobs: %.3f s", rows, time.time() - start)
+    cursor.close()
+
+
+def migrate(conn, batch_size):
+    create_table(conn)
+    cursor = conn.cursor()
+    moved = 0
+    while True:
+        cursor.execute(
+            "SELECT `jobId`, `jobLog` FROM `jobs` "
+            "WHERE `jobLog` IS NOT NULL LIMIT %s", (batch_size,))
+        rows = cursor.fetchall()
+        if len(rows) == 0:
+            break
+
+        values = [(job_id, compress_job_log(decode_job_log(job_log)))
+                  for (job_id, job_log) in rows]
+        cursor.executemany(
+            "INSERT IGNORE INTO `joblogs` (`jobId`, `log`) VALUES (%s, %s)",
+            values)
+        job_ids = [job_id for (job_id, _) in rows]
+        cursor.execute(
+            "UPDATE `jobs` SET `jobLog` = NULL WHERE `jobId` IN (%s)" %
+            ",".join(["%s"] * len(job_ids)), job_ids)
+        conn.commit()
+        moved += len(rows)
+        logger.info("moved log tails of %d jobs", moved)
+    cursor.close()
+
+
+def optimize(conn):
+    cursor = conn.cursor()
+    cursor.execute("OPTIMIZE TABLE `jobs`")
+    cursor.fetchall()
+    conn.commit()
+    cursor.close()
+
+
+def main(action, rest_config_path, batch_size):
+    conn = build_mysql_connection(rest_config_path)
+    try:
+        if action == "measure":
+            measure(conn)
+        elif action == "migrate":
+            measure(conn)
+            migrate(conn, batch_size)
+            measure(conn)
+        elif action == "optimize":
+            optimize(conn)
+            measure(conn)
+        else:
+            logger.error("unknown action %s", action)
+            sys.exit(2)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        format=
+        "%(asctime)s - %(levelname)s - %(filename)s:%(lineno)s - %(message)s",
+        level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("action", choices=["measure", "migrate", "optimize"])
+    parser.add_argument("--batch_size",
+                        help="jobs moved per transaction",
+                        type=int,
+                        default=BATCH_SIZE)
+    parser.add_argument("--rest_path",
+                        help="path to restfulapi config file",
+                        default="/etc/RestfulAPI/config.yaml")
+    args = parser.parse_args()
+    main(args.action, args.rest_path, args.batch_size)
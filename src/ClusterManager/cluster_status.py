@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import copy
+import hashlib
 import sys
 import os
 import json
@@ -17,6 +18,51 @@ from common import base64decode
 
 logger = logging.getLogger(__name__)
 
+# Fields of raw Kubernetes API objects read by ClusterStatusFactory, see
+# k8s_raw.project for the format.
+K8S_NODE_FIELDS = {
+    "metadata": {
+        "name": None,
+        "labels": None,
+        "annotations": None,
+    },
+    "spec": {
+        "unschedulable": None,
+    },
+    "status": {
+        "allocatable": None,
+        "capacity": None,
+        "addresses": {
+            "type": None,
+            "address": None,
+        },
+        "conditions": {
+            "type": None,
+            "status": None,
+        },
+    },
+}
+
+K8S_POD_FIELDS = {
+    "metadata": {
+        "name": None,
+        "namespace": None,
+        "labels": None,
+    },
+    "spec": {
+        "nodeSelector": None,
+        "nodeName": None,
+        "containers": {
+            "resources": {
+                "requests": None,
+            },
+        },
+    },
+    "status": {
+        "phase": None,
+    },
+}
+
 
 def override(func):
     return func
@@ -26,6 +72,26 @@ def str2bool(s):
     return s.lower() in ["true", "1", "t", "y", "yes"]
 
 
+def serialize_cluster_status(cluster_status):
+    """Serializes cluster status into canonical JSON.
+
+    Keys are sorted so that identical cluster statuses always produce identical
+    strings. The content hash of the string is used for change detection and
+    as the version of the cluster status.
+
+    Args:
+        cluster_status: A dictionary representing cluster status.
+
+    Returns:
+        A tuple of (serialized cluster status, version).
+    """
+    serialized = json.dumps(cluster_status,
+                            sort_keys=True,
+                            separators=(",", ":"))
+    version = hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+    return serialized, version
+
+
 def get_jobs(job_list):
     jobs = []
     for job in job_list:
@@ -119,11 +185,12 @@ class ClusterStatus(object):
         return json.dumps(self.to_dict())
 
     def to_dict(self):
-        return dictionarize({
-            k: v
-            for k, v in copy.deepcopy(self.__dict__).items()
-            if k not in self.exclusion
-        })
+        return dictionarize(
+            copy.deepcopy({
+                k: v
+                for k, v in self.__dict__.items()
+                if k not in self.exclusion
+            }))
 
     def compute(self):
         # Generate jobs without k8s pods
@@ -403,6 +470,14 @@ class ClusterStatus(object):
 
 
 class ClusterStatusFactory(object):
+    """Makes ClusterStatus from Kubernetes nodes and pods.
+
+    nodes and pods can be any iterables, e.g. generators streaming pages from
+    the API server. Each of them is iterated exactly once and individual
+    objects are not kept, so that memory does not grow with their number.
+    They can be kubernetes.client models or RawObject with K8S_NODE_FIELDS
+    and K8S_POD_FIELDS.
+    """
     def __init__(self, prometheus_node, nodes, pods, jobs):
         self.prometheus_node = prometheus_node
         self.nodes = nodes
@@ -416,6 +491,10 @@ class ClusterStatusFactory(object):
         self.__gen_pod_statuses()
         self.__update_node_statuses()
 
+        # Nodes and pods have been consumed
+        self.nodes = None
+        self.pods = None
+
     def make(self):
         try:
             cluster_status = ClusterStatus(self.node_statuses,
@@ -646,7 +725,8 @@ class ClusterStatusFactory(object):
                     # .V1ResourceRequirements'
                     resources = container.resources
                     r_requests = {}
-                    if resources.requests is not None:
+                    if resources is not None and \
+                            resources.requests is not None:
                         r_requests = resources.requests
 
                     if gpu_str in r_requests:
@@ -336,7 +336,8 @@ def start_endpoints():
                 update_file_modification_time("endpoint_manager")
 
                 try:
-                    job = data_handler.GetJob(jobId=endpoint["jobId"])[0]
+                    job = data_handler.GetJob(fields=["jobStatus"],
+                                              jobId=endpoint["jobId"])[0]
                     logger.info("checking endpoint %s, status is %s",
                                 endpoint["jobId"], job["jobStatus"])
                     if job["jobStatus"] != "running":
@@ -78,6 +78,18 @@ CREATE TABLE IF NOT EXISTS `jobs`
 );
 """)
 
+# Log tails of jobs shown in the web page, zlib compressed. Kept out of jobs so
+# that scans of jobs do not read them.
+cursor.execute("""
+CREATE TABLE IF NOT EXISTS `joblogs`
+(
+    `jobId`       VARCHAR(50) NOT NULL,
+    `log`         LONGBLOB    NOT NULL,
+    `lastUpdated` DATETIME    NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (`jobId`)
+);
+""")
+
 cursor.execute("""
 CREATE TABLE IF NOT EXISTS `clusterstatus`
 (
@@ -152,6 +164,20 @@ CREATE TABLE IF NOT EXISTS  `acl`
 );
 """)
 
+# Single row table, version is bumped after every change to acl and identity
+cursor.execute("""
+CREATE TABLE IF NOT EXISTS `authversion`
+(
+    `id`      INT    NOT NULL,
+    `version` BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (`id`)
+);
+""")
+
+cursor.execute("""
+INSERT IGNORE INTO `authversion` (`id`, `version`) VALUES (1, 0);
+""")
+
 cursor.execute("""
 CREATE TABLE IF NOT EXISTS `templates`
 (
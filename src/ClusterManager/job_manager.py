@@ -27,6 +27,7 @@ sys.path.append(
 
 from DataHandler import DataHandler
 from config import config, GetStoragePath
+from cluster_status_store import get_cluster_status
 import notify
 import k8sUtils
 from cluster_resource import ClusterResource
@@ -889,10 +890,10 @@ def schedule_jobs(jobs_info, data_handler, redis_conn, launcher,
 
 @record
 def take_job_actions(data_handler, redis_conn, launcher, jobs):
-    # Compute from the latest ClusterStatus in DB:
+    # Compute from the latest ClusterStatus:
     # 1. cluster_schedulable
     # 2. vc_schedulables
-    cluster_status, _ = data_handler.GetClusterStatus()
+    cluster_status, _ = get_cluster_status()
     cluster_schedulable = get_cluster_schedulable(cluster_status)
     vc_schedulables = get_vc_schedulables(cluster_status)
 
@@ -9,6 +9,10 @@ import yaml
 import base64
 import logging
 import logging.config
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from prometheus_client import Gauge
 
 sys.path.append(
     os.path.join(os.path.dirname(os.path.abspath(__file__)), "../utils"))
@@ -18,10 +22,28 @@ from cluster_manager import setup_exporter_thread, manager_iteration_histogram,
 from DataHandler import DataHandler
 from config import config, GetStoragePath
 from osUtils import mkdirsAsUser
+from job_log_tail import LogTail, MAX_FULL_LINES, TRIMMED_LINES, \
+    read_file_tail, timestamp_key
 import k8sUtils
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_WORKERS = 8
+# Seconds between writes of changed log cursors to DB
+DEFAULT_CURSOR_PERSIST_INTERVAL = 10
+
+# Where streaming extraction of a container log stopped, in the job log dir
+STREAM_STATE_FILE = ".log-container-%s.state"
+
+job_log_lag_gauge = Gauge(
+    "joblog_manager_job_log_lag_seconds",
+    "seconds since logs of a running job were last extracted",
+    labelnames=("job_id",))
+
+pending_extractions_gauge = Gauge(
+    "joblog_manager_pending_extractions",
+    "number of log extractions queued or running")
+
 
 def create_log(logdir='/var/log/dlworkspace'):
     if not os.path.exists(logdir):
@@ -35,40 +57,42 @@ def create_log(logdir='/var/log/dlworkspace'):
 
 
 _get_job_log_enabled = config.get('logging') in ['azure_blob', 'elasticsearch']
-_extract_job_log_legacy = config.get('__extract_job_log_legacy', not _get_job_log_enabled)
+_legacy_extraction = config.get('__extract_job_log_legacy',
+                                not _get_job_log_enabled)
+# Legacy extraction fetches only new lines of logs from k8s
+_streaming_extraction = (config.get("joblog_manager") or {}).get(
+    "streaming", False)
 
 
 def extract_job_log(job_id, log_path, user_id):
-    if not _extract_job_log_legacy:
+    if not _legacy_extraction:
         _extract_job_log(job_id, log_path, user_id)
+    else:
+        extract_job_log_from_k8s(job_id, log_path, user_id)
+
+
+def extract_job_log_from_k8s(job_id, log_path, user_id):
+    if _streaming_extraction:
+        _extract_job_log_streaming(job_id, log_path, user_id)
     else:
         _extract_job_log_legacy(job_id, log_path, user_id)
 
 
+def normalize_cursor(cursor):
+    if cursor is not None and len(cursor) == 0:
+        return None
+    return cursor
+
+
 @record
 def _extract_job_log(jobId, logPath, userId):
     dataHandler = None
     try:
         dataHandler = DataHandler()
 
-        old_cursor = dataHandler.GetJobTextField(jobId, "jobLogCursor")
-        if old_cursor is not None and len(old_cursor) == 0:
-            old_cursor = None
-        (pod_logs, new_cursor) = GetJobLog(jobId, cursor=old_cursor)
-
-        jobLogDir = os.path.dirname(logPath)
-        if not os.path.exists(jobLogDir):
-            mkdirsAsUser(jobLogDir, userId)
-
-        for (pod_name, log_text) in pod_logs.items():
-            try:
-                podLogPath = os.path.join(jobLogDir,
-                                          "log-pod-" + pod_name + ".txt")
-                with open(podLogPath, 'a', encoding="utf-8") as f:
-                    f.write(log_text)
-                os.system("chown -R %s %s" % (userId, podLogPath))
-            except Exception:
-                logger.exception("write pod log of {} failed".format(jobId))
+        old_cursor = normalize_cursor(
+            dataHandler.GetJobTextField(jobId, "jobLogCursor"))
+        new_cursor = append_job_log(jobId, logPath, userId, old_cursor)
 
         logging.info("cursor of job %s: %s" % (jobId, new_cursor))
         if new_cursor is not None:
@@ -82,6 +106,29 @@ def _extract_job_log(jobId, logPath, userId):
             dataHandler.Close()
 
 
+@record
+def append_job_log(jobId, logPath, userId, cursor):
+    """Appends logs of job after cursor to per pod log files. Returns the
+    cursor after them, None if there are no new logs."""
+    (pod_logs, new_cursor) = GetJobLog(jobId, cursor=cursor)
+
+    jobLogDir = os.path.dirname(logPath)
+    if not os.path.exists(jobLogDir):
+        mkdirsAsUser(jobLogDir, userId)
+
+    for (pod_name, log_text) in pod_logs.items():
+        try:
+            podLogPath = os.path.join(jobLogDir,
+                                      "log-pod-" + pod_name + ".txt")
+            with open(podLogPath, 'a', encoding="utf-8") as f:
+                f.write(log_text)
+            os.system("chown -R %s %s" % (userId, podLogPath))
+        except Exception:
+            logger.exception("write pod log of {} failed".format(jobId))
+
+    return new_cursor
+
+
 @record
 def _extract_job_log_legacy(jobId, logPath, userId):
     dataHandler = None
@@ -160,10 +207,7 @@ def _extract_job_log_legacy(jobId, logPath, userId):
                     logger.exception("write container log failed")
 
         if len(trimlogstr.strip()) > 0:
-            encoded_log = base64.b64encode(
-                trimlogstr.encode("utf-8")).decode("utf-8")
-            dataHandler.UpdateJobTextFields({"jobId": jobId},
-                                            {"jobLog": encoded_log})
+            dataHandler.update_job_log(jobId, trimlogstr)
             with open(logPath, 'w', encoding="utf-8") as f:
                 f.write(logStr)
             f.close()
@@ -175,32 +219,334 @@ def _extract_job_log_legacy(jobId, logPath, userId):
             dataHandler.Close()
 
 
+def pod_log_header(podName):
+    return "=========================================================\n" \
+        "=========================================================\n" \
+        "=========================================================\n" \
+        "        logs from pod: %s\n" \
+        "=========================================================\n" \
+        "=========================================================\n" \
+        "=========================================================\n" % podName
+
+
+def pod_log_footer(podName, trimmed):
+    footer = "\n\n\n" \
+        "=========================================================\n" \
+        "        end of logs from pod: %s\n" % podName
+    if trimmed:
+        footer += "        Note: the log is too long to display in the webpage.\n" \
+            "        Only the last %d lines are shown here.\n" \
+            "        Please check the log file (in Job Folder) for the full logs.\n" % TRIMMED_LINES
+    footer += "=========================================================\n" \
+        "\n\n\n"
+    return footer
+
+
+def load_stream_state(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return None
+
+
+def stream_container_log(jobLogDir, logPath, podName, containerID):
+    """Appends lines of the log of a container since the last call to its log
+    file and to the job log file, one line at a time.
+
+    Returns:
+        (LogTail of the container log, number of new lines)
+    """
+    containerLogPath = os.path.join(jobLogDir,
+                                    "log-container-" + containerID + ".txt")
+    statePath = os.path.join(jobLogDir, STREAM_STATE_FILE % containerID)
+    state = load_stream_state(statePath)
+    if state is None:
+        # Log file, if any, is written by non streaming extraction
+        state = {"since": None, "same": 0, "lines": 0}
+        mode = "w"
+        tail = LogTail()
+    else:
+        mode = "a"
+        tail = LogTail(lines=read_file_tail(containerLogPath, MAX_FULL_LINES),
+                       total=state["lines"])
+
+    # k8s returns logs since a second, lines up to the last one written are
+    # skipped, including the ones at the same time as it.
+    since_key = None
+    if state["since"] is not None:
+        since_key = timestamp_key(state["since"])
+    skip = state["same"]
+    new_lines = 0
+    with open(containerLogPath, mode, encoding="utf-8") as f, \
+            open(logPath, "a", encoding="utf-8") as job_f:
+        for timestamp, line in k8sUtils.stream_log(podName, state["since"]):
+            key = timestamp_key(timestamp)
+            if since_key is not None and key <= since_key:
+                if key < since_key:
+                    continue
+                if skip > 0:
+                    skip -= 1
+                    continue
+
+            if new_lines == 0:
+                job_f.write(pod_log_header(podName))
+            f.write(line)
+            job_f.write(line)
+            tail.append(line)
+            new_lines += 1
+
+            if key == since_key:
+                state["same"] += 1
+            else:
+                since_key = key
+                skip = 0
+                state["since"] = timestamp
+                state["same"] = 1
+
+    state["lines"] = tail.total
+    with open(statePath, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    return tail, new_lines
+
+
+@record
+def _extract_job_log_streaming(jobId, logPath, userId):
+    """Like _extract_job_log_legacy, in constant memory regardless of log
+    size. Only new lines are fetched and appended to log files, and the last
+    lines of each container are kept for the log tail of the job."""
+    dataHandler = None
+    try:
+        containers = k8sUtils.get_job_containers(jobId)
+        if len(containers) == 0:
+            return
+
+        jobLogDir = os.path.dirname(logPath)
+        if not os.path.exists(jobLogDir):
+            mkdirsAsUser(jobLogDir, userId)
+        if not any(
+                os.path.exists(
+                    os.path.join(jobLogDir, STREAM_STATE_FILE % containerID))
+                for _, containerID in containers):
+            # Written by non streaming extraction, start over
+            open(logPath, "w").close()
+
+        trimlogstr = ""
+        updated = False
+        for podName, containerID in containers:
+            tail, new_lines = stream_container_log(jobLogDir, logPath,
+                                                   podName, containerID)
+            updated = updated or new_lines > 0
+            trimlogstr += pod_log_header(podName) + tail.text() + \
+                pod_log_footer(podName, tail.is_trimmed())
+
+        if updated:
+            os.system("chown -R %s %s" % (userId, jobLogDir))
+            dataHandler = DataHandler()
+            dataHandler.update_job_log(jobId, trimlogstr)
+    except Exception as e:
+        logger.exception("update log for job %s failed", jobId)
+    finally:
+        if dataHandler is not None:
+            dataHandler.Close()
+
+
+class JobLogState(object):
+    __slots__ = ("job_id", "log_path", "user_id", "cursor", "dirty",
+                 "last_active", "last_extracted", "in_flight")
+
+    def __init__(self, job_id, log_path, user_id, cursor, now):
+        self.job_id = job_id
+        self.log_path = log_path
+        self.user_id = user_id
+        self.cursor = cursor
+        # cursor is not written to DB yet
+        self.dirty = False
+        # New jobs are likely to log, they start as active
+        self.last_active = now
+        self.last_extracted = now
+        self.in_flight = False
+
+
+class JobLogExtractor(object):
+    """Extracts logs of running jobs on a bounded thread pool.
+
+    A job is extracted again once its previous extraction is done, so a slow
+    backend request only delays the job it is for. Jobs are queued in order
+    of when they last had new logs, most recent first.
+
+    Cursors are kept in memory and written to DB in one transaction every
+    persist_interval seconds, and when a job stops running. Logs after the
+    last written cursor are appended again after a restart.
+    """
+    def __init__(self,
+                 workers=DEFAULT_WORKERS,
+                 persist_interval=DEFAULT_CURSOR_PERSIST_INTERVAL,
+                 legacy=None,
+                 clock=time.time):
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.persist_interval = persist_interval
+        self.legacy = _legacy_extraction if legacy is None else legacy
+        self.clock = clock
+        self.lock = threading.Lock()
+        # jobId -> JobLogState
+        self.jobs = {}
+        self.last_persist = clock()
+
+    def update(self, running_jobs):
+        """Queues extraction of running jobs, list of (jobId, logPath,
+        userId)."""
+        now = self.clock()
+        running_ids = set(job_id for job_id, _, _ in running_jobs)
+        new_jobs = [job for job in running_jobs if job[0] not in self.jobs]
+        cursors = self.load_cursors([job_id for job_id, _, _ in new_jobs])
+
+        with self.lock:
+            for job_id, log_path, user_id in new_jobs:
+                self.jobs[job_id] = JobLogState(job_id, log_path, user_id,
+                                                cursors.get(job_id), now)
+            stopped = [
+                state for job_id, state in self.jobs.items()
+                if job_id not in running_ids and not state.in_flight
+            ]
+            to_extract = sorted(
+                (state for state in self.jobs.values()
+                 if state.job_id in running_ids and not state.in_flight),
+                key=lambda state: state.last_active,
+                reverse=True)
+            for state in to_extract:
+                state.in_flight = True
+            for state in self.jobs.values():
+                if state.job_id in running_ids:
+                    job_log_lag_gauge.labels(state.job_id).set(
+                        now - state.last_extracted)
+
+        for state in to_extract:
+            self.executor.submit(self.extract, state)
+        pending_extractions_gauge.inc(len(to_extract))
+
+        if stopped or now - self.last_persist >= self.persist_interval:
+            self.persist_cursors(stopped)
+            self.last_persist = now
+
+    def extract(self, state):
+        active = False
+        cursor = state.cursor
+        try:
+            if self.legacy:
+                extract_job_log_from_k8s(state.job_id, state.log_path,
+                                         state.user_id)
+                active = True
+            else:
+                new_cursor = append_job_log(state.job_id, state.log_path,
+                                            state.user_id, cursor)
+                if new_cursor is not None:
+                    cursor = new_cursor
+                    active = True
+        except Exception:
+            logger.exception("handling logs from %s", state.job_id)
+        finally:
+            now = self.clock()
+            with self.lock:
+                if cursor != state.cursor:
+                    state.cursor = cursor
+                    state.dirty = True
+                if active:
+                    state.last_active = now
+                state.last_extracted = now
+                state.in_flight = False
+            pending_extractions_gauge.dec()
+
+    def load_cursors(self, job_ids):
+        if self.legacy or not job_ids:
+            return {}
+        data_handler = None
+        try:
+            data_handler = DataHandler()
+            rows = data_handler.get_fields_for_jobs(
+                job_ids, ["jobId", "jobLogCursor"])
+            return {
+                row["jobId"]: normalize_cursor(row["jobLogCursor"])
+                for row in rows
+            }
+        finally:
+            if data_handler is not None:
+                data_handler.Close()
+
+    def persist_cursors(self, stopped):
+        """Writes changed cursors to DB and forgets stopped jobs."""
+        with self.lock:
+            cursors = {
+                state.job_id: state.cursor
+                for state in self.jobs.values() if state.dirty
+            }
+
+        persisted = True
+        if cursors:
+            data_handler = None
+            try:
+                data_handler = DataHandler()
+                persisted = data_handler.update_job_log_cursors(cursors)
+            except Exception:
+                logger.exception("persisting log cursors failed")
+                persisted = False
+            finally:
+                if data_handler is not None:
+                    data_handler.Close()
+
+        with self.lock:
+            if persisted:
+                for job_id, cursor in cursors.items():
+                    state = self.jobs.get(job_id)
+                    if state is not None and state.cursor == cursor:
+                        state.dirty = False
+            for state in stopped:
+                if not state.dirty:
+                    self.jobs.pop(state.job_id, None)
+                    try:
+                        job_log_lag_gauge.remove(state.job_id)
+                    except KeyError:
+                        pass
+
+
+def get_running_jobs():
+    """Returns (jobId, logPath, userId) of running jobs."""
+    dataHandler = DataHandler()
+    try:
+        pendingJobs = dataHandler.GetPendingJobs()
+    finally:
+        dataHandler.Close()
+
+    running_jobs = []
+    for job in pendingJobs:
+        try:
+            if job["jobStatus"] == "running":
+                jobParams = json.loads(
+                    base64.b64decode(
+                        job["jobParams"].encode("utf-8")).decode("utf-8"))
+                jobPath, workPath, dataPath = GetStoragePath(
+                    jobParams["jobPath"], jobParams["workPath"],
+                    jobParams["dataPath"])
+                localJobPath = os.path.join(config["storage-mount-path"],
+                                            jobPath)
+                logPath = os.path.join(localJobPath, "logs/joblog.txt")
+                running_jobs.append(
+                    (job["jobId"], logPath, jobParams["userId"]))
+        except Exception as e:
+            logger.exception("handling logs from %s", job["jobId"])
+    return running_jobs
+
+
 def update_job_logs():
+    settings = config.get("joblog_manager") or {}
+    extractor = JobLogExtractor(
+        workers=settings.get("workers", DEFAULT_WORKERS),
+        persist_interval=settings.get("cursor_persist_interval",
+                                      DEFAULT_CURSOR_PERSIST_INTERVAL))
     while True:
+        update_file_modification_time("joblog_manager")
         try:
-            dataHandler = DataHandler()
-            pendingJobs = dataHandler.GetPendingJobs()
-            dataHandler.Close()
-            for job in pendingJobs:
-                update_file_modification_time("joblog_manager")
-                try:
-                    if job["jobStatus"] == "running":
-                        logger.info("updating job logs for job %s" %
-                                    job["jobId"])
-                        jobParams = json.loads(
-                            base64.b64decode(job["jobParams"].encode(
-                                "utf-8")).decode("utf-8"))
-                        jobPath, workPath, dataPath = GetStoragePath(
-                            jobParams["jobPath"], jobParams["workPath"],
-                            jobParams["dataPath"])
-                        localJobPath = os.path.join(
-                            config["storage-mount-path"], jobPath)
-                        logPath = os.path.join(localJobPath, "logs/joblog.txt")
-
-                        extract_job_log(job["jobId"], logPath,
-                                        jobParams["userId"])
-                except Exception as e:
-                    logger.exception("handling logs from %s", job["jobId"])
+            extractor.update(get_running_jobs())
         except Exception as e:
             logger.exception("get pending jobs failed")
 
@@ -1,6 +1,5 @@
 #!/usr/bin/env python3
 
-import json
 import os
 import time
 import argparse
@@ -8,8 +7,10 @@ import sys
 import yaml
 import logging
 import logging.config
-import copy
 import datetime
+import timeit
+
+from prometheus_client import Histogram, Gauge
 
 sys.path.append(
     os.path.join(os.path.dirname(os.path.abspath(__file__)), "../utils"))
@@ -19,16 +20,33 @@ from cluster_manager import setup_exporter_thread, \
     update_file_modification_time, AtomicRef
 from DataHandler import DataHandler
 from config import config
+from cluster_status_store import publish_cluster_status
+from redis_utils import get_redis_conn
 
 import k8s_utils
 
-from cluster_status import ClusterStatusFactory
+from cluster_status import ClusterStatusFactory, serialize_cluster_status, \
+    K8S_NODE_FIELDS, K8S_POD_FIELDS
 from virtual_cluster_status import VirtualClusterStatusesFactory
 
 k8s = k8s_utils.K8sUtil()
 
+# Minimum interval between cluster status snapshots written into DB (seconds)
+CLUSTER_STATUS_HISTORY_INTERVAL = 60
+# Interval to republish unchanged cluster status into redis (seconds)
+CLUSTER_STATUS_REPUBLISH_INTERVAL = 60
+
 logger = logging.getLogger(__name__)
 
+cluster_status_serialize_histogram = Histogram(
+    "node_manager_cluster_status_serialize_latency_seconds",
+    "latency for serializing cluster status (seconds)",
+    buckets=(.005, .01, .025, .05, .075, .1, .25, .5, .75, 1.0, 2.5, 5.0,
+             float("inf")))
+
+cluster_status_size_gauge = Gauge("node_manager_cluster_status_size_bytes",
+                                  "size of serialized cluster status (bytes)")
+
 
 def create_log(logdir='/var/log/dlworkspace'):
     if not os.path.exists(logdir):
@@ -41,11 +59,14 @@ def create_log(logdir='/var/log/dlworkspace'):
         logging.config.dictConfig(logging_config)
 
 
-def get_cluster_status():
-    """Update in DB and returns cluster status.
+def get_cluster_status(redis_conn):
+    """Publishes cluster status to redis and keeps history snapshots in DB.
+
+    Args:
+        redis_conn: Redis connection to publish cluster status to.
 
     Returns:
-        A dictionary representing cluster status.
+        A list of VC metrics.
     """
     cluster_status = {}
     metrics = []
@@ -55,9 +76,10 @@ def get_cluster_status():
             vc_list = data_handler.ListVCs()
             jobs = data_handler.GetActiveJobList()
 
-        # Set up cluster status
-        nodes = k8s.get_all_nodes()
-        pods = k8s.get_all_pods()
+        # Set up cluster status. Nodes and pods are streamed page by page as
+        # raw JSON with only the fields read by ClusterStatusFactory.
+        nodes = k8s.get_all_nodes(raw_fields=K8S_NODE_FIELDS)
+        pods = k8s.get_all_pods(raw_fields=K8S_POD_FIELDS)
         prometheus_node = config.get("prometheus_node", "127.0.0.1")
         cs_factory = ClusterStatusFactory(prometheus_node, nodes, pods, jobs)
         cs = cs_factory.make()
@@ -82,21 +104,49 @@ def get_cluster_status():
 
         cluster_status["vc_statuses"] = vc_statuses_dict
     except:
+        # Keep the last published cluster status rather than publishing a
+        # partial one, e.g. when listing nodes or pods failed halfway.
         logger.exception("Exception in setting up cluster status")
+        return metrics
 
     try:
-        if "cluster_status" in config and \
-                config["cluster_status"] != cluster_status:
-            size = len(json.dumps(cluster_status, separators=(",", ":")))
-            logger.info("updating the cluster status (of len %s)...", size)
+        start = timeit.default_timer()
+        serialized, version = serialize_cluster_status(cluster_status)
+        cluster_status_serialize_histogram.observe(timeit.default_timer() -
+                                                   start)
+        cluster_status_size_gauge.set(len(serialized))
+
+        # Republish periodically in case redis evicted or lost the key
+        now = time.time()
+        if config.get("cluster_status_version") != version or \
+                now - config.get("cluster_status_publish_time", 0) >= \
+                CLUSTER_STATUS_REPUBLISH_INTERVAL:
+            logger.info("publishing the cluster status (of len %s, version %s)",
+                        len(serialized), version)
+            if publish_cluster_status(redis_conn, serialized, version):
+                config["cluster_status_version"] = version
+                config["cluster_status_publish_time"] = now
+        else:
+            logger.info("No diff in cluster status, skipping publish...")
+
+        # Readers get the latest cluster status from redis. DB only keeps
+        # history snapshots, unless publishing to redis failed.
+        published = config.get("cluster_status_version") == version
+        if config.get("cluster_status_db_version") != version and \
+                (not published or now - config.get("cluster_status_db_time", 0)
+                 >= CLUSTER_STATUS_HISTORY_INTERVAL):
+            logger.info("updating the cluster status in DB (version %s)...",
+                        version)
             with DataHandler() as data_handler:
-                data_handler.UpdateClusterStatus(cluster_status)
+                if data_handler.UpdateClusterStatus(cluster_status,
+                                                    serialized=serialized):
+                    config["cluster_status_db_version"] = version
+                    config["cluster_status_db_time"] = now
         else:
-            logger.info("No diff in cluster status, skipping update in DB...")
+            logger.info("Skipping update of cluster status in DB...")
     except:
         logger.exception("Error in updating cluster status")
 
-    config["cluster_status"] = copy.deepcopy(cluster_status)
     return metrics
 
 
@@ -110,14 +160,17 @@ def run(args):
     setup_exporter_thread(args.port, refs=[atomic_ref])
 
     logger.info("start to update nodes usage information ...")
-    config["cluster_status"] = None
+    config["cluster_status_version"] = None
+    config["cluster_status_db_version"] = None
+
+    redis_conn = get_redis_conn(args.redis_port)
 
     while True:
         update_file_modification_time("node_manager")
 
         with manager_iteration_histogram.labels("node_manager").time():
             try:
-                metrics = get_cluster_status()
+                metrics = get_cluster_status(redis_conn)
                 atomic_ref.set(metrics, datetime.datetime.now())
             except:
                 logger.exception("get cluster status failed")
@@ -131,6 +184,11 @@ if __name__ == '__main__':
                         help="port of exporter",
                         type=int,
                         default=9202)
+    parser.add_argument("--redis_port",
+                        "-r",
+                        help="port of redis",
+                        type=int,
+                        default=9300)
     args = parser.parse_args()
 
     run(args)
@@ -5,12 +5,16 @@ import logging
 import sys
 
 import unittest
-from cluster_status import str2bool, ClusterStatus, ClusterStatusFactory
+from kubernetes.client import ApiClient
+from cluster_status import str2bool, serialize_cluster_status, \
+    ClusterStatus, ClusterStatusFactory, K8S_NODE_FIELDS, K8S_POD_FIELDS
 from cluster_test_utils import BaseTestClusterSetup
 
 sys.path.append(
     os.path.join(os.path.dirname(os.path.abspath(__file__)), "../utils"))
 
+from k8s_raw import project, RawObject
+
 
 class TestUtils(unittest.TestCase):
     def test_str2bool(self):
@@ -22,6 +26,17 @@ class TestUtils(unittest.TestCase):
         self.assertFalse(str2bool("false"))
         self.assertFalse(str2bool("0"))
 
+    def test_serialize_cluster_status(self):
+        serialized, version = serialize_cluster_status({"b": [1, 2], "a": {}})
+        self.assertEqual('{"a":{},"b":[1,2]}', serialized)
+
+        # Key order does not affect serialization and version
+        _, same_version = serialize_cluster_status({"a": {}, "b": [1, 2]})
+        self.assertEqual(version, same_version)
+
+        _, new_version = serialize_cluster_status({"a": {}, "b": [2, 1]})
+        self.assertNotEqual(version, new_version)
+
 
 class TestClusterStatus(unittest.TestCase):
     def setUp(self):
@@ -87,6 +102,25 @@ class TestClusterStatus(unittest.TestCase):
         t_cluster_status = test_cluster.cluster_status
         self.assertEqual(t_cluster_status, cs)
 
+    def test_compute_cluster_status_from_raw_stream(self):
+        test_cluster = BaseTestClusterSetup()
+        api_client = ApiClient()
+
+        def to_raw_stream(objs, fields):
+            for obj in objs:
+                raw = api_client.sanitize_for_serialization(obj)
+                yield RawObject(project(raw, fields), fields)
+
+        nodes = to_raw_stream(test_cluster.nodes, K8S_NODE_FIELDS)
+        pods = to_raw_stream(test_cluster.pods, K8S_POD_FIELDS)
+        jobs = test_cluster.jobs
+
+        cs_factory = ClusterStatusFactory("", nodes, pods, jobs)
+        cs = cs_factory.make()
+
+        t_cluster_status = test_cluster.cluster_status
+        self.assertEqual(t_cluster_status, cs)
+
 
 if __name__ == '__main__':
     logging.basicConfig(
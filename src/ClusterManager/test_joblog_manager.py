@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "../utils"))
+
+from config import config
+config["datasource"] = "MySQL"
+import joblog_manager
+from joblog_manager import JobLogExtractor
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeDataHandler(object):
+    cursors = {}
+    updates = []
+
+    def get_fields_for_jobs(self, job_ids, fields):
+        return [{
+            "jobId": job_id,
+            "jobLogCursor": self.cursors.get(job_id, "")
+        } for job_id in job_ids]
+
+    def update_job_log_cursors(self, cursors):
+        FakeDataHandler.updates.append(dict(cursors))
+        FakeDataHandler.cursors.update(cursors)
+        return True
+
+    def Close(self):
+        pass
+
+
+class TestJobLogExtractor(unittest.TestCase):
+    def setUp(self):
+        self.log_dir = tempfile.mkdtemp()
+        self.clock = FakeClock()
+        FakeDataHandler.cursors = {"job1": "10"}
+        FakeDataHandler.updates = []
+        # job -> logs returned per call
+        self.logs = {}
+        self.calls = []
+
+        def get_job_log(job_id, cursor=None):
+            self.calls.append((job_id, cursor))
+            self.clock.now += 1
+            logs = self.logs.get(job_id)
+            if not logs:
+                return {}, None
+            return {"pod": logs.pop(0)}, "%s-%d" % (job_id, len(self.calls))
+
+        patches = [
+            patch.object(joblog_manager, "DataHandler", FakeDataHandler),
+            patch.object(joblog_manager, "GetJobLog", get_job_log),
+            patch.object(joblog_manager.os, "system"),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+        self.extractor = JobLogExtractor(workers=1,
+                                         persist_interval=30,
+                                         legacy=False,
+                                         clock=self.clock)
+        self.addCleanup(self.extractor.executor.shutdown)
+        self.addCleanup(shutil.rmtree, self.log_dir)
+
+    def job(self, job_id):
+        job_dir = os.path.join(self.log_dir, job_id)
+        if not os.path.exists(job_dir):
+            os.mkdir(job_dir)
+        return (job_id, os.path.join(job_dir, "joblog.txt"), "0")
+
+    def update(self, job_ids):
+        self.extractor.update([self.job(job_id) for job_id in job_ids])
+        # workers=1, so all queued extractions are done after this
+        self.extractor.executor.submit(lambda: None).result()
+
+    def read_log(self, job_id):
+        with open(os.path.join(self.log_dir, job_id, "log-pod-pod.txt")) as f:
+            return f.read()
+
+    def test_cursors_are_kept_in_memory_and_persisted_in_batch(self):
+        self.logs = {"job1": ["a\n", "b\n"], "job2": ["c\n"]}
+
+        self.update(["job1", "job2"])
+        self.assertEqual([("job1", "10"), ("job2", None)], self.calls)
+        self.assertEqual([], FakeDataHandler.updates)
+
+        self.calls = []
+        self.update(["job1", "job2"])
+        # job2 had logs more recently
+        self.assertEqual([("job2", "job2-2"), ("job1", "job1-1")],
+                         self.calls)
+        self.assertEqual("a\nb\n", self.read_log("job1"))
+        self.assertEqual("c\n", self.read_log("job2"))
+        self.assertEqual([], FakeDataHandler.updates)
+
+        self.clock.now += 30
+        self.update(["job1", "job2"])
+        self.assertEqual([{
+            "job1": "job1-2",
+            "job2": "job2-2"
+        }], FakeDataHandler.updates)
+
+    def test_recently_active_jobs_go_first(self):
+        self.logs = {"job2": ["x\n"]}
+        self.update(["job1", "job2"])
+
+        self.calls = []
+        self.update(["job1", "job2"])
+        self.assertEqual(["job2", "job1"], [job for job, _ in self.calls])
+
+    def test_stopped_jobs_are_persisted_and_forgotten(self):
+        self.logs = {"job1": ["a\n"]}
+        self.update(["job1"])
+        self.assertIn("job1", self.extractor.jobs)
+
+        self.update([])
+        self.assertEqual([{"job1": "job1-1"}], FakeDataHandler.updates)
+        self.assertEqual({}, self.extractor.jobs)
+
+
+
+class TestStreamingExtraction(unittest.TestCase):
+    def setUp(self):
+        self.log_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.log_dir)
+        self.log_path = os.path.join(self.log_dir, "joblog.txt")
+        # (timestamp, line) in the log of pod1
+        self.log = []
+        self.since_times = []
+        self.job_logs = []
+
+        def stream_log(pod_name, since_time=None):
+            self.since_times.append(since_time)
+            since = since_time[:19] if since_time else ""
+            # k8s returns logs since the second of since_time
+            return iter([(ts, line) for ts, line in self.log
+                         if ts[:19] >= since])
+
+        test = self
+
+        class DataHandler(object):
+            def update_job_log(self, job_id, log):
+                test.job_logs.append(log)
+
+            def Close(self):
+                pass
+
+        patches = [
+            patch.object(joblog_manager, "DataHandler", DataHandler),
+            patch.object(joblog_manager.k8sUtils, "get_job_containers",
+                         lambda job_id: [("pod1", "c1")]),
+            patch.object(joblog_manager.k8sUtils, "stream_log", stream_log),
+            patch.object(joblog_manager.os, "system"),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def read(self, name):
+        with open(os.path.join(self.log_dir, name)) as f:
+            return f.read()
+
+    def test_appends_only_new_lines(self):
+        self.log = [
+            ("2020-01-01T00:00:01.1Z", "a\n"),
+            ("2020-01-01T00:00:01.2Z", "b\n"),
+        ]
+        joblog_manager._extract_job_log_streaming("job1", self.log_path, "0")
+        self.assertEqual("a\nb\n", self.read("log-container-c1.txt"))
+
+        # Same timestamp as the last line written
+        self.log += [
+            ("2020-01-01T00:00:01.2Z", "c\n"),
+            ("2020-01-01T00:00:02Z", "d\n"),
+        ]
+        joblog_manager._extract_job_log_streaming("job1", self.log_path, "0")
+        self.assertEqual([None, "2020-01-01T00:00:01.2Z"], self.since_times)
+        self.assertEqual("a\nb\nc\nd\n", self.read("log-container-c1.txt"))
+        self.assertEqual(2,
+                         self.read("joblog.txt").count("from pod: pod1\n"))
+        self.assertIn("a\nb\nc\nd\n", self.job_logs[-1])
+
+        # No new lines, the log tail is not updated
+        joblog_manager._extract_job_log_streaming("job1", self.log_path, "0")
+        self.assertEqual("a\nb\nc\nd\n", self.read("log-container-c1.txt"))
+        self.assertEqual(2, len(self.job_logs))
+
+    def test_tail_of_long_log_is_trimmed(self):
+        self.log = [("2020-01-01T00:00:01Z", "%d\n" % i) for i in range(3500)]
+        joblog_manager._extract_job_log_streaming("job1", self.log_path, "0")
+        self.log.append(("2020-01-01T00:00:02Z", "last\n"))
+        joblog_manager._extract_job_log_streaming("job1", self.log_path, "0")
+
+        job_log = self.job_logs[-1]
+        self.assertIn("Only the last 2000 lines are shown here", job_log)
+        self.assertIn("1501\n", job_log)
+        self.assertNotIn("\n1500\n", job_log)
+        self.assertIn("3499\nlast\n", job_log)
+
+
+if __name__ == '__main__':
+    unittest.main()
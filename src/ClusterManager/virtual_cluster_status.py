@@ -36,20 +36,140 @@ def get_vc_info(vc_list):
     return vc_info
 
 
+def get_vc_jobs_without_pods(vc_info, vc_jobs, vc_pod_statuses):
+    vc_jobs_without_pods = collections.defaultdict(lambda: list())
+    for vc_name in vc_info:
+        jobs = vc_jobs.get(vc_name, [])
+        pod_statuses = vc_pod_statuses.get(vc_name, {})
+        vc_jobs_without_pods[vc_name] = get_jobs_without_pods(
+            jobs, pod_statuses)
+    return vc_jobs_without_pods
+
+
+def get_vc_used(vc_info, vc_pod_statuses, vc_jobs_without_pods):
+    vc_used = collections.defaultdict(lambda: ClusterResource())
+    vc_preemptable_used = collections.defaultdict(lambda: ClusterResource())
+
+    for vc_name in vc_info:
+        # Account all pods in vc
+        pod_statuses = vc_pod_statuses.get(vc_name, {})
+
+        for _, pod_status in pod_statuses.items():
+            pod_res = ClusterResource(
+                params={
+                    "cpu": pod_status.get("cpu", Cpu()).to_dict(),
+                    "memory": pod_status.get("memory", Memory()).to_dict(),
+                    "gpu": pod_status.get("gpu", Gpu()).to_dict(),
+                })
+            vc_used[vc_name] += pod_res
+
+            pod_preemptable_res = ClusterResource(
+                params={
+                    "cpu":
+                        pod_status.get("preemptable_cpu", Cpu()).to_dict(),
+                    "memory":
+                        pod_status.get("preemptable_memory", Memory()
+                                      ).to_dict(),
+                    "gpu":
+                        pod_status.get("preemptable_gpu", Gpu()).to_dict(),
+                })
+            vc_preemptable_used[vc_name] += pod_preemptable_res
+
+        # Account all jobs without pods in vc
+        jobs_without_pods = vc_jobs_without_pods.get(vc_name, [])
+        for job in jobs_without_pods:
+            job_params = job["jobParams"]
+            job_res_params = get_resource_params_from_job_params(job_params)
+            job_res = ClusterResource(params=job_res_params)
+
+            preemption_allowed = job_params.get("preemptionAllowed", False)
+            if not preemption_allowed:
+                vc_used[vc_name] += job_res
+            else:
+                vc_preemptable_used[vc_name] += job_res
+            logger.info("Added job %s resource %s to the usage of vc %s",
+                        job, job_res, vc_name)
+
+    return vc_used, vc_preemptable_used
+
+
+def get_cluster_resource_count(cluster_status):
+    cluster = cluster_status
+    capacity = ClusterResource(
+        params={
+            "cpu": cluster.cpu_capacity,
+            "memory": cluster.memory_capacity,
+            "gpu": cluster.gpu_capacity,
+        })
+    avail = ClusterResource(
+        params={
+            "cpu": cluster.cpu_available,
+            "memory": cluster.memory_available,
+            "gpu": cluster.gpu_available,
+        })
+    reserved = ClusterResource(
+        params={
+            "cpu": cluster.cpu_reserved,
+            "memory": cluster.memory_reserved,
+            "gpu": cluster.gpu_reserved,
+        })
+    return capacity, avail, reserved
+
+
+def get_vc_metrics_map(cluster_status, vc_info, vc_pod_statuses,
+                       vc_jobs_without_pods):
+    """Computes resource metrics of all VCs.
+
+    Returns:
+        A dictionary of metric name to a dictionary of vc name to
+        ClusterResource.
+    """
+    capacity, avail, reserved = get_cluster_resource_count(cluster_status)
+    vc_used, vc_preemptable_used = get_vc_used(vc_info, vc_pod_statuses,
+                                               vc_jobs_without_pods)
+
+    vc_capacity, vc_used, vc_avail, vc_unschedulable = \
+        calculate_vc_resources(capacity, avail, reserved, vc_info, vc_used)
+
+    vc_metrics_map = {
+        "capacity": vc_capacity,
+        "used": vc_used,
+        "preemptable_used": vc_preemptable_used,
+        "available": vc_avail,
+        "unschedulable": vc_unschedulable,
+        # reserved is set to unschedulable for vc
+        "reserved": vc_unschedulable,
+    }
+
+    return vc_metrics_map
+
+
 class VirtualClusterStatus(ClusterStatus):
-    def __init__(self, vc_name, vc_info, cluster_status, node_statuses,
-                 vc_pod_statuses, vc_jobs):
+    def __init__(self,
+                 vc_name,
+                 vc_info,
+                 cluster_status,
+                 node_statuses,
+                 vc_pod_statuses,
+                 vc_jobs,
+                 vc_jobs_without_pods=None,
+                 vc_metrics_map=None):
+        """VC view of cluster status.
+
+        vc_jobs_without_pods and vc_metrics_map cover all VCs and are the
+        same for every VC in cluster_status. They are computed when not given,
+        VirtualClusterStatusesFactory computes them once for all VCs.
+        """
         self.vc_name = vc_name
         self.vc_info = vc_info
         self.cluster_status = cluster_status
         self.vc_pod_statuses = vc_pod_statuses
         self.vc_jobs = vc_jobs
-        self.vc_jobs_without_pods = collections.defaultdict(lambda: list())
-        for _vc_name in self.vc_info:
-            _vc_jobs = self.vc_jobs.get(_vc_name, [])
-            _vc_pod_statuses = vc_pod_statuses.get(_vc_name, {})
-            self.vc_jobs_without_pods[_vc_name] = get_jobs_without_pods(
-                _vc_jobs, _vc_pod_statuses)
+        if vc_jobs_without_pods is None:
+            vc_jobs_without_pods = get_vc_jobs_without_pods(
+                vc_info, vc_jobs, vc_pod_statuses)
+        self.vc_jobs_without_pods = vc_jobs_without_pods
+        self.vc_metrics_map = vc_metrics_map
         self.gpu_interactive_used = Gpu()
 
         pod_statuses = self.vc_pod_statuses.get(self.vc_name, {})
@@ -62,6 +182,7 @@ class VirtualClusterStatus(ClusterStatus):
         self.exclusion.append("vc_pod_statuses")
         self.exclusion.append("vc_jobs")
         self.exclusion.append("vc_jobs_without_pods")
+        self.exclusion.append("vc_metrics_map")
         # node_status is the same as the one in cluster_status
         self.exclusion.append("node_status")
 
@@ -114,93 +235,12 @@ class VirtualClusterStatus(ClusterStatus):
                 self.gpu_interactive_used += pod_status["gpu"]
 
     def __get_vc_metrics_map(self):
-        capacity, avail, reserved = self.__get_cluster_resource_count()
-        vc_used, vc_preemptable_used = self.__get_vc_used(
-            self.vc_pod_statuses, self.vc_jobs_without_pods)
-
-        vc_capacity, vc_used, vc_avail, vc_unschedulable = \
-            calculate_vc_resources(capacity, avail, reserved, self.vc_info,
-                                   vc_used)
-
-        vc_metrics_map = {
-            "capacity": vc_capacity,
-            "used": vc_used,
-            "preemptable_used": vc_preemptable_used,
-            "available": vc_avail,
-            "unschedulable": vc_unschedulable,
-            # reserved is set to unschedulable for vc
-            "reserved": vc_unschedulable,
-        }
-
-        return vc_metrics_map
-
-    def __get_vc_used(self, vc_pod_statuses, vc_jobs_without_pods):
-        vc_used = collections.defaultdict(lambda: ClusterResource())
-        vc_preemptable_used = collections.defaultdict(lambda: ClusterResource())
-
-        for vc_name in self.vc_info:
-            # Account all pods in vc
-            pod_statuses = vc_pod_statuses.get(vc_name, {})
-
-            for _, pod_status in pod_statuses.items():
-                pod_res = ClusterResource(
-                    params={
-                        "cpu": pod_status.get("cpu", Cpu()).to_dict(),
-                        "memory": pod_status.get("memory", Memory()).to_dict(),
-                        "gpu": pod_status.get("gpu", Gpu()).to_dict(),
-                    })
-                vc_used[vc_name] += pod_res
-
-                pod_preemptable_res = ClusterResource(
-                    params={
-                        "cpu":
-                            pod_status.get("preemptable_cpu", Cpu()).to_dict(),
-                        "memory":
-                            pod_status.get("preemptable_memory", Memory()
-                                          ).to_dict(),
-                        "gpu":
-                            pod_status.get("preemptable_gpu", Gpu()).to_dict(),
-                    })
-                vc_preemptable_used[vc_name] += pod_preemptable_res
-
-            # Account all jobs without pods in vc
-            jobs_without_pods = vc_jobs_without_pods.get(vc_name, [])
-            for job in jobs_without_pods:
-                job_params = job["jobParams"]
-                job_res_params = get_resource_params_from_job_params(job_params)
-                job_res = ClusterResource(params=job_res_params)
-
-                preemption_allowed = job_params.get("preemptionAllowed", False)
-                if not preemption_allowed:
-                    vc_used[vc_name] += job_res
-                else:
-                    vc_preemptable_used[vc_name] += job_res
-                logger.info("Added job %s resource %s to the usage of vc %s",
-                            job, job_res, vc_name)
-
-        return vc_used, vc_preemptable_used
-
-    def __get_cluster_resource_count(self):
-        cluster = self.cluster_status
-        capacity = ClusterResource(
-            params={
-                "cpu": cluster.cpu_capacity,
-                "memory": cluster.memory_capacity,
-                "gpu": cluster.gpu_capacity,
-            })
-        avail = ClusterResource(
-            params={
-                "cpu": cluster.cpu_available,
-                "memory": cluster.memory_available,
-                "gpu": cluster.gpu_available,
-            })
-        reserved = ClusterResource(
-            params={
-                "cpu": cluster.cpu_reserved,
-                "memory": cluster.memory_reserved,
-                "gpu": cluster.gpu_reserved,
-            })
-        return capacity, avail, reserved
+        if self.vc_metrics_map is None:
+            self.vc_metrics_map = get_vc_metrics_map(self.cluster_status,
+                                                     self.vc_info,
+                                                     self.vc_pod_statuses,
+                                                     self.vc_jobs_without_pods)
+        return self.vc_metrics_map
 
 
 class VirtualClusterStatusesFactory(object):
@@ -213,11 +253,24 @@ class VirtualClusterStatusesFactory(object):
             vc_pod_statuses = self.__get_vc_pod_statuses()
             vc_jobs = self.__get_vc_jobs()
 
+            # Shared by all VCs, compute only once for this cluster status
+            # and vc quota
+            vc_jobs_without_pods = get_vc_jobs_without_pods(
+                self.vc_info, vc_jobs, vc_pod_statuses)
+            vc_metrics_map = get_vc_metrics_map(self.cluster_status,
+                                                self.vc_info, vc_pod_statuses,
+                                                vc_jobs_without_pods)
+
             vc_statuses = {
-                vc_name:
-                VirtualClusterStatus(vc_name, self.vc_info, self.cluster_status,
-                                     self.cluster_status.node_statuses,
-                                     vc_pod_statuses, vc_jobs)
+                vc_name: VirtualClusterStatus(
+                    vc_name,
+                    self.vc_info,
+                    self.cluster_status,
+                    self.cluster_status.node_statuses,
+                    vc_pod_statuses,
+                    vc_jobs,
+                    vc_jobs_without_pods=vc_jobs_without_pods,
+                    vc_metrics_map=vc_metrics_map)
                 for vc_name in self.vc_info
             }
         except:
@@ -8,7 +8,7 @@ import logging
 from logging.config import dictConfig
 
 from flask import Flask, Response
-from flask_restful import reqparse, Api, Resource
+from flask_restful import reqparse, Api, Resource, inputs
 from flask import request, jsonify
 from flask_cors import CORS
 import prometheus_client
@@ -21,9 +21,17 @@ from authorization import ResourceType, Permission, AuthorizationManager, ACLMan
 from config import config, global_vars
 import authorization
 from DataHandler import DataHandler
+from response_cache import ResponseCache
+import admission
+import job_events
+import json_response
+import request_profile
 
 CONTENT_TYPE_LATEST = str("text/plain; version=0.0.4; charset=utf-8")
 
+# Max number of jobs submitted in one /PostJobs request
+MAX_JOBS_PER_POST = 1000
+
 
 def base64encode(str_val):
     return base64.b64encode(str_val.encode("utf-8")).decode("utf-8")
@@ -35,14 +43,28 @@ def base64decode(str_val):
 
 dir_path = os.path.dirname(os.path.realpath(__file__))
 with open(os.path.join(dir_path, "logging.yaml"), "r") as f:
-    logging_config = yaml.load(f)
+    logging_config = yaml.safe_load(f)
     dictConfig(logging_config)
 logger = logging.getLogger("restfulapi")
 
 app = Flask(__name__)
 CORS(app)
+# Installed first so that its after_request hook runs last
+request_profile.install(app)
+json_response.install(app)
+admission.install(app)
 api = Api(app)
 verbose = True
+response_cache = ResponseCache()
+
+
+@api.representation("application/json")
+def output_json(data, code, headers=None):
+    resp = Response(json_response.dumps(data),
+                    status=code,
+                    mimetype="application/json")
+    resp.headers.extend(headers or {})
+    return resp
 logger.info("Restful API started with config %s", config)
 
 if "initAdminAccess" not in global_vars or not global_vars["initAdminAccess"]:
@@ -75,6 +97,14 @@ def tolist(value):
         return value
 
 
+def parse_fields(fields):
+    """Returns the fields of a comma separated fields= argument as a sorted
+    tuple, None if the argument is not given."""
+    if fields is None:
+        return None
+    return tuple(sorted(set(f.strip() for f in fields.split(",") if f.strip())))
+
+
 def remove_creds(job):
     job_params = job.get("jobParams", None)
     if job_params is None:
@@ -117,6 +147,42 @@ class PostJob(Resource):
         return jsonify(ret)
 
 
+@api.resource("/PostJobs")
+class PostJobs(Resource):
+    def post(self):
+        """Submits a list of jobs, e.g. a hyperparameter sweep, in one
+        request. Body is a list of job params, or {"jobs": [...]}.
+
+        Returns a list of {"jobId": ...} or {"error": ...} in the order of
+        the submitted jobs.
+        """
+        params = request.get_json(force=True)
+        if isinstance(params, dict):
+            params = params.get("jobs")
+        if not isinstance(params, list):
+            return {"error": "a list of jobs is expected"}, 400
+        if len(params) > MAX_JOBS_PER_POST:
+            return {
+                "error":
+                "at most %d jobs can be submitted at once" % MAX_JOBS_PER_POST
+            }, 400
+
+        output = JobRestAPIUtils.SubmitJobs(params)
+
+        ret = []
+        for result in output:
+            if "jobId" in result:
+                ret.append({"jobId": result["jobId"]})
+            else:
+                ret.append({
+                    "error":
+                    "Cannot create job!" + result.get("error", "")
+                })
+
+        logger.info("Submit %d jobs, ret is %s", len(params), ret)
+        return jsonify(ret)
+
+
 @api.resource("/ListJobs")
 class ListJobs(Resource):
     def __init__(self):
@@ -126,6 +192,7 @@ class ListJobs(Resource):
         self.get_parser.add_argument("jobOwner", required=True)
         self.get_parser.add_argument("num", type=int, default=20)
 
+    @admission.coalesced
     def get(self):
         args = self.get_parser.parse_args()
         username = args["userName"]
@@ -195,6 +262,7 @@ class ListJobsV2(Resource):
         self.get_parser.add_argument("vcName", required=True)
         self.get_parser.add_argument("jobOwner", required=True)
         self.get_parser.add_argument("num", type=int, default=20)
+        self.get_parser.add_argument("fields")
 
     def get(self):
         args = self.get_parser.parse_args()
@@ -202,16 +270,23 @@ class ListJobsV2(Resource):
         vc_name = args["vcName"]
         job_owner = args["jobOwner"]
         num = args["num"]
+        fields = parse_fields(args["fields"])
 
-        jobs = JobRestAPIUtils.get_job_list_v2(username, vc_name, job_owner,
-                                               num)
+        def produce():
+            jobs = JobRestAPIUtils.get_job_list_v2(username, vc_name,
+                                                   job_owner, num, fields)
 
-        for _, job_list in jobs.items():
-            if isinstance(job_list, list):
-                for job in job_list:
-                    remove_creds(job)
+            for _, job_list in jobs.items():
+                if isinstance(job_list, list):
+                    for job in job_list:
+                        remove_creds(job)
+            return jobs
 
-        return jsonify(jobs)
+        version = JobRestAPIUtils.get_job_list_version(username, vc_name,
+                                                       job_owner)
+        return response_cache.respond(
+            "ListJobsV2", (username, vc_name, job_owner, num, fields), version,
+            produce)
 
 
 @api.resource("/ListActiveJobs")
@@ -405,13 +480,17 @@ class GetJobDetail(Resource):
         self.get_parser = reqparse.RequestParser()
         self.get_parser.add_argument("jobId", required=True)
         self.get_parser.add_argument("userName", required=True)
+        self.get_parser.add_argument("fields")
 
+    @admission.coalesced
     def get(self):
         args = self.get_parser.parse_args()
         jobId = args["jobId"]
         userName = args["userName"]
-        job = JobRestAPIUtils.GetJobDetail(userName, jobId)
-        job["jobParams"] = json.loads(base64decode(job["jobParams"]))
+        fields = parse_fields(args["fields"])
+        job = JobRestAPIUtils.GetJobDetail(userName, jobId, fields)
+        if job.get("jobParams") is not None:
+            job["jobParams"] = json.loads(base64decode(job["jobParams"]))
         if "endpoints" in job and job["endpoints"] is not None and len(
                 job["endpoints"].strip()) > 0:
             job["endpoints"] = json.loads(job["endpoints"])
@@ -438,14 +517,23 @@ class GetJobDetailV2(Resource):
         self.get_parser = reqparse.RequestParser()
         self.get_parser.add_argument("jobId", required=True)
         self.get_parser.add_argument("userName", required=True)
+        self.get_parser.add_argument("fields")
 
     def get(self):
         args = self.get_parser.parse_args()
         jobId = args["jobId"]
         userName = args["userName"]
-        job = JobRestAPIUtils.GetJobDetailV2(userName, jobId)
-        remove_creds(job)
-        return jsonify(job)
+        fields = parse_fields(args["fields"])
+
+        def produce():
+            job = JobRestAPIUtils.GetJobDetailV2(userName, jobId, fields)
+            remove_creds(job)
+            return job
+
+        version = JobRestAPIUtils.get_job_version(jobId)
+        return response_cache.respond("GetJobDetailV2",
+                                      (userName, jobId, fields), version,
+                                      produce)
 
 
 @api.resource("/GetJobLog")
@@ -456,6 +544,7 @@ class GetJobLog(Resource):
         self.get_parser.add_argument("userName", required=True)
         self.get_parser.add_argument("cursor")
 
+    @admission.coalesced
     def get(self):
         args = self.get_parser.parse_args()
         jobId = args["jobId"]
@@ -466,6 +555,9 @@ class GetJobLog(Resource):
 
 @app.route("/GetJobRawLog")
 def GetJobRawLog():
+    """Raw log of a job. A single byte range of the log of a finished job can
+    be requested with a Range header, to resume or split a download. The log
+    of a job which has not finished is always returned in full."""
     get_parser = reqparse.RequestParser()
     get_parser.add_argument("jobId", required=True)
     get_parser.add_argument("userName", required=True)
@@ -475,8 +567,118 @@ def GetJobRawLog():
     response = JobRestAPIUtils.GetJobRawLog(userName, jobId)
     if type(response) is int:
         return Response(status=response, content_type="text/plain")
-    else:
-        return Response(response, content_type="text/plain")
+
+    raw_log = response
+    headers = {}
+    if raw_log.seekable():
+        headers["Accept-Ranges"] = "bytes"
+    byte_range = request.range
+    if byte_range is not None and raw_log.seekable() and \
+            byte_range.units == "bytes" and len(byte_range.ranges) == 1:
+        size = raw_log.get_size()
+        if size is not None:
+            rng = byte_range.range_for_length(size)
+            if rng is None:
+                headers["Content-Range"] = "bytes */%d" % size
+                return Response(status=416,
+                                headers=headers,
+                                content_type="text/plain")
+            (start, stop) = rng
+            headers["Content-Range"] = "bytes %d-%d/%d" % (start, stop - 1,
+                                                           size)
+            headers["Content-Length"] = str(stop - start)
+            return Response(raw_log.read(start, stop - 1),
+                            status=206,
+                            headers=headers,
+                            content_type="text/plain")
+
+    size = raw_log.size()
+    if size is not None:
+        headers["Content-Length"] = str(size)
+    return Response(raw_log.read(), headers=headers, content_type="text/plain")
+
+
+@api.resource("/SearchJobLog")
+class SearchJobLog(Resource):
+    """Log lines of a job matching pattern, a regular expression, with
+    context lines before and after them. Searched in pods, a comma separated
+    list, and from startTime to endTime, RFC 3339 UTC timestamps, if given.
+    The returned cursor continues the search, it is null after the last
+    match."""
+    def __init__(self):
+        self.get_parser = reqparse.RequestParser()
+        self.get_parser.add_argument("jobId", required=True)
+        self.get_parser.add_argument("userName", required=True)
+        self.get_parser.add_argument("pattern", required=True)
+        self.get_parser.add_argument("pods")
+        self.get_parser.add_argument("startTime")
+        self.get_parser.add_argument("endTime")
+        self.get_parser.add_argument("context", type=int, default=0)
+        self.get_parser.add_argument("limit", type=int)
+        self.get_parser.add_argument("ignoreCase",
+                                     type=inputs.boolean,
+                                     default=False)
+        self.get_parser.add_argument("cursor")
+
+    @admission.coalesced
+    def get(self):
+        args = self.get_parser.parse_args()
+        result = JobRestAPIUtils.SearchJobLog(args["userName"],
+                                              args["jobId"],
+                                              args["pattern"],
+                                              pods=parse_fields(args["pods"]),
+                                              start_time=args["startTime"],
+                                              end_time=args["endTime"],
+                                              context=args["context"],
+                                              limit=args["limit"],
+                                              ignore_case=args["ignoreCase"],
+                                              cursor=args["cursor"])
+        if isinstance(result, int):
+            return {"error": "failed to search job log"}, result
+        return result
+
+
+@app.route("/JobEvents")
+def JobEvents():
+    """Streams job status and endpoint changes as server-sent events.
+
+    Resumes after the Last-Event-ID header, or lastEventId argument for
+    clients that can not set headers.
+    """
+    get_parser = reqparse.RequestParser()
+    get_parser.add_argument("userName", required=True)
+    get_parser.add_argument("vcName", default="all")
+    get_parser.add_argument("jobOwner")
+    get_parser.add_argument("jobId")
+    get_parser.add_argument("lastEventId")
+    args = get_parser.parse_args()
+
+    match = JobRestAPIUtils.get_job_event_filter(args["userName"],
+                                                 args["vcName"],
+                                                 args["jobOwner"],
+                                                 args["jobId"])
+    last_event_id = request.headers.get("Last-Event-ID", args["lastEventId"])
+    # Watchers poll instead while streams are not available
+    if not job_events.stream_limiter.acquire():
+        return Response(
+            status=503,
+            content_type="text/plain",
+            headers={"Retry-After": str(job_events.STREAM_RETRY_AFTER)})
+    try:
+        reader = job_events.get_job_event_reader(last_event_id)
+    except Exception:
+        job_events.stream_limiter.release()
+        logger.exception("Failed to read job events")
+        return Response(status=503, content_type="text/plain")
+
+    resp = Response(job_events.generate_sse(reader, match),
+                    mimetype="text/event-stream",
+                    headers={
+                        "Cache-Control": "no-cache",
+                        "X-Accel-Buffering": "no",
+                    })
+    resp.call_on_close(job_events.stream_limiter.release)
+    return resp
 
 
 @api.resource("/GetJobStatus")
@@ -485,6 +687,7 @@ class GetJobStatus(Resource):
         self.get_parser = reqparse.RequestParser()
         self.get_parser.add_argument("jobId", required=True)
 
+    @admission.coalesced
     def get(self):
         args = self.get_parser.parse_args()
         jobId = args["jobId"]
@@ -500,9 +703,18 @@ class GetClusterStatus(Resource):
     def get(self):
         args = self.get_parser.parse_args()
         userName = args["userName"]
-        cluster_status, last_updated_time = JobRestAPIUtils.GetClusterStatus()
-        cluster_status["last_updated_time"] = last_updated_time
-        return jsonify(cluster_status)
+        def produce():
+            cluster_status, last_updated_time = \
+                JobRestAPIUtils.GetClusterStatus()
+            # Cluster status is shared with other requests, do not modify it
+            cluster_status = dict(cluster_status)
+            cluster_status["last_updated_time"] = last_updated_time
+            return cluster_status
+
+        # Cluster status is the same for all users
+        version = JobRestAPIUtils.get_cluster_status_version()
+        return response_cache.respond("GetClusterStatus", (), version,
+                                      produce)
 
 
 @api.resource("/AddUser")
@@ -540,7 +752,7 @@ class GetAllUsers(Resource):
             data_handler = DataHandler()
             ret = data_handler.GetUsers()
             ret = [(x[0], x[1]) for x in ret] # remove key info
-            return jsonify(ret)
+            return json_response.stream_json(ret)
         except Exception as e:
             return "Internal Server Error. " + str(e), 400
         finally:
@@ -626,7 +838,7 @@ class GetAllACL(Resource):
     def get(self):
         ret = {}
         ret["result"] = ACLManager.GetAllAcl()
-        return jsonify(ret)
+        return json_response.stream_json(ret)
 
 
 @api.resource("/ListVCs")
@@ -635,6 +847,7 @@ class ListVCs(Resource):
         self.get_parser = reqparse.RequestParser()
         self.get_parser.add_argument("userName", required=True)
 
+    @admission.coalesced
     def get(self):
         args = self.get_parser.parse_args()
         userName = args["userName"]
@@ -650,6 +863,7 @@ class GetVC(Resource):
         self.get_parser.add_argument("userName", required=True)
         self.get_parser.add_argument("vcName", required=True)
 
+    @admission.coalesced
     def get(self):
         args = self.get_parser.parse_args()
         username = args["userName"]
@@ -668,7 +882,10 @@ class GetVCV2(Resource):
         args = self.get_parser.parse_args()
         username = args["userName"]
         vc_name = args["vcName"]
-        return jsonify(JobRestAPIUtils.get_vc_v2(username, vc_name))
+        version = JobRestAPIUtils.get_cluster_status_version()
+        return response_cache.respond(
+            "GetVCV2", (username, vc_name), version,
+            lambda: JobRestAPIUtils.get_vc_v2(username, vc_name))
 
 
 @api.resource("/VCMeta")
@@ -0,0 +1,603 @@
+#!/usr/bin/env python3
+"""Load test of the REST API, without MySQL, Redis or a web server.
+
+Runs dlwsrestapi through Flask test clients against a disposable SQLite
+stand-in for MySQL, seeded with synthetic users, VCs, ACLs, cluster status
+and jobs. A mix of requests is sent at the given concurrency, and throughput,
+p50/p99 latency and DB queries are reported per endpoint.
+
+SQLite is not MySQL, so absolute numbers differ from a deployment. The test
+is meant for comparing changes of the REST API and of the queries it runs.
+
+Usage: python3 load_test.py [--jobs 100000] [--users 200] [--vcs 10]
+           [--requests 5000] [--threads 8] [--pool-size 2]
+           [--mix ListJobsV2=40,GetJobDetailV2=30,GetClusterStatus=20,...]
+"""
+
+import argparse
+import base64
+import bisect
+import collections
+import datetime
+import json
+import logging
+import logging.config
+import os
+import queue
+import random
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+import mysql.connector
+import mysql.connector.pooling
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "../utils"))
+
+from config import config
+
+DEFAULT_MIX = "ListJobsV2=40,GetJobDetailV2=30,GetClusterStatus=20," \
+    "PostJob=5,KillJobs=5"
+
+ACTIVE_STATUS = ["unapproved", "queued", "scheduling", "running"]
+FINISHED_STATUS = ["finished", "failed", "killed"]
+
+SCHEMA = [
+    """
+    CREATE TABLE jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        jobId TEXT NOT NULL UNIQUE,
+        familyToken TEXT NOT NULL,
+        isParent INTEGER NOT NULL,
+        jobName TEXT NOT NULL,
+        userName TEXT NOT NULL,
+        vcName TEXT NOT NULL,
+        jobStatus TEXT NOT NULL DEFAULT 'unapproved',
+        jobStatusDetail TEXT NULL,
+        jobType TEXT NOT NULL,
+        jobDescriptionPath TEXT NULL,
+        jobDescription TEXT NULL,
+        jobTime TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        endpoints TEXT NULL,
+        errorMsg TEXT NULL,
+        jobParams TEXT NOT NULL,
+        jobMeta TEXT NULL,
+        jobLog TEXT NULL,
+        jobLogCursor TEXT NULL,
+        retries INTEGER NULL DEFAULT 0,
+        lastUpdated TEXT NOT NULL
+            DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')),
+        priority INTEGER NOT NULL DEFAULT 100,
+        insight TEXT NULL,
+        repairMessage TEXT NULL
+    )
+    """,
+    "CREATE INDEX jobs_userName ON jobs (userName)",
+    "CREATE INDEX jobs_vcName ON jobs (vcName)",
+    "CREATE INDEX jobs_jobTime ON jobs (jobTime)",
+    "CREATE INDEX jobs_jobStatus ON jobs (jobStatus)",
+    # Stands in for ON UPDATE CURRENT_TIMESTAMP of MySQL
+    """
+    CREATE TRIGGER jobs_lastUpdated AFTER UPDATE ON jobs
+    FOR EACH ROW WHEN NEW.lastUpdated = OLD.lastUpdated
+    BEGIN
+        UPDATE jobs SET lastUpdated = strftime('%Y-%m-%d %H:%M:%f', 'now')
+        WHERE id = NEW.id;
+    END
+    """,
+    """
+    CREATE TABLE joblogs (
+        jobId TEXT PRIMARY KEY,
+        log BLOB NOT NULL,
+        lastUpdated TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE clusterstatus (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        status TEXT NOT NULL,
+        time TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE vc (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        vcName TEXT NOT NULL UNIQUE,
+        parent TEXT DEFAULT NULL,
+        quota TEXT NOT NULL,
+        metadata TEXT NOT NULL,
+        resourceQuota TEXT NOT NULL,
+        resourceMetadata TEXT NOT NULL,
+        time TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE identity (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        identityName TEXT NOT NULL UNIQUE,
+        uid INTEGER NOT NULL,
+        gid INTEGER NOT NULL,
+        groups TEXT NOT NULL,
+        public_key TEXT NOT NULL,
+        private_key TEXT NOT NULL,
+        time TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE acl (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        identityName TEXT NOT NULL,
+        identityId INTEGER NOT NULL,
+        resource TEXT NOT NULL,
+        permissions INTEGER NOT NULL,
+        isDeny INTEGER NOT NULL,
+        time TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (identityName, resource)
+    )
+    """,
+    """
+    CREATE TABLE authversion (
+        id INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    "INSERT INTO authversion (id, version) VALUES (1, 0)",
+]
+
+GLOBAL_SCHEMA = [
+    """
+    CREATE TABLE public_keys (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL,
+        key_title TEXT NOT NULL,
+        public_key TEXT NOT NULL,
+        add_time TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+]
+
+UNION_PATTERN = re.compile(r"^\s*\((SELECT .*)\)\s+UNION\s+\((SELECT .*)\)\s*$",
+                           re.DOTALL | re.IGNORECASE)
+UPSERT_PATTERN = re.compile(r"on\s+duplicate\s+key\s+update", re.IGNORECASE)
+
+
+def translate(query, has_params):
+    """Translates the MySQL dialect used by MySQLDataHandler to SQLite."""
+    match = UNION_PATTERN.match(query)
+    if match:
+        query = "SELECT * FROM (%s) UNION SELECT * FROM (%s)" % match.groups()
+    query = UPSERT_PATTERN.sub("ON CONFLICT DO UPDATE SET", query)
+    if has_params:
+        query = query.replace("%s", "?")
+    return query
+
+
+class Stats(object):
+    """DB queries and connects per endpoint of the request being sent."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.queries = collections.Counter()
+        self.connects = collections.Counter()
+
+    def current(self):
+        return getattr(self.local, "endpoint", None)
+
+    def add_query(self):
+        with self.lock:
+            self.queries[self.current()] += 1
+
+    def add_connect(self):
+        with self.lock:
+            self.connects[self.current()] += 1
+
+
+class StandInCursor(object):
+    def __init__(self, conn):
+        self.conn = conn
+        self.cursor = conn.db.cursor()
+        self.description = None
+        self.rowcount = -1
+        self.lastrowid = None
+
+    def execute(self, query, params=None):
+        self.conn.stats.add_query()
+        try:
+            self.cursor.execute(translate(query, params is not None),
+                                tuple(params) if params is not None else ())
+        except sqlite3.IntegrityError as e:
+            raise mysql.connector.errors.IntegrityError(msg=str(e))
+        self.description = self.cursor.description
+        self.rowcount = self.cursor.rowcount
+        self.lastrowid = self.cursor.lastrowid
+
+    def fetchone(self):
+        return self.cursor.fetchone()
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def close(self):
+        self.cursor.close()
+
+
+class StandInConnection(object):
+    def __init__(self, stats, path):
+        self.stats = stats
+        stats.add_connect()
+        # Transactions take the write lock up front like InnoDB row locks
+        # would, instead of failing on lock upgrade
+        self.db = sqlite3.connect(path,
+                                  timeout=60,
+                                  isolation_level="IMMEDIATE",
+                                  check_same_thread=False)
+
+    def cursor(self, *args, **kwargs):
+        return StandInCursor(self)
+
+    def commit(self):
+        self.db.commit()
+
+    def rollback(self):
+        self.db.rollback()
+
+    def is_connected(self):
+        return True
+
+    def close(self):
+        self.db.close()
+
+
+class StandInPooledConnection(object):
+    def __init__(self, pool, conn):
+        self.pool = pool
+        self.conn = conn
+
+    def __getattr__(self, name):
+        if self.conn is None:
+            raise mysql.connector.errors.OperationalError(
+                "connection is closed")
+        return getattr(self.conn, name)
+
+    def close(self):
+        # Like PooledMySQLConnection, closing twice returns it only once
+        if self.conn is None:
+            return
+        self.conn.rollback()
+        self.pool.idle.put(self.conn)
+        self.conn = None
+
+
+def install_stand_in(stats, db_dir, pool_size):
+    def connect(database=None, **kwargs):
+        return StandInConnection(stats,
+                                 os.path.join(db_dir, "%s.db" % database))
+
+    class StandInPool(object):
+        def __init__(self, pool_size, database=None, **kwargs):
+            self.idle = queue.Queue()
+            for _ in range(pool_size):
+                self.idle.put(connect(database=database))
+
+        def get_connection(self):
+            try:
+                conn = self.idle.get_nowait()
+            except queue.Empty:
+                raise mysql.connector.errors.PoolError("pool exhausted")
+            return StandInPooledConnection(self, conn)
+
+    mysql.connector.connect = connect
+    mysql.connector.pooling.MySQLConnectionPool = StandInPool
+
+    config["datasource"] = "MySQL"
+    config["clusterId"] = "loadtest"
+    config["mysql"] = {
+        "hostname": "localhost",
+        "username": "",
+        "password": "",
+        "pool_size": pool_size,
+    }
+    config["global-mysql"] = config["mysql"]
+
+
+def b64(obj):
+    return base64.b64encode(json.dumps(obj).encode("utf-8")).decode("utf-8")
+
+
+def username_of(i):
+    return "user%d@example.com" % i
+
+
+def vc_of_user(i, num_vcs):
+    return "vc%d" % (i % num_vcs)
+
+
+def make_cluster_status(num_nodes):
+    nodes = [{
+        "name": "node%d" % i,
+        "gpu_capacity": {"P40": 4},
+        "gpu_used": {"P40": i % 5},
+        "gpu_preemptable_used": {"P40": 0},
+        "InternalIP": "10.0.%d.%d" % (i // 256, i % 256),
+        "pods": ["job%d-worker" % j for j in range(i % 4)],
+        "unschedulable": False,
+    } for i in range(num_nodes)]
+    return {
+        "node_status": nodes,
+        "gpu_capacity": {"P40": 4 * num_nodes},
+        "gpu_used": {"P40": sum(i % 5 for i in range(num_nodes))},
+        "user_status": [],
+    }
+
+
+def seed(db_dir, args):
+    rand = random.Random(args.seed)
+    db = sqlite3.connect(os.path.join(db_dir, "DLWSCluster-loadtest.db"))
+    db.execute("PRAGMA journal_mode=WAL")
+    for statement in SCHEMA:
+        db.execute(statement)
+
+    quota = json.dumps({"P40": 100})
+    for i in range(args.vcs):
+        db.execute(
+            "INSERT INTO vc (vcName, quota, metadata, resourceQuota, "
+            "resourceMetadata) VALUES (?, ?, ?, ?, ?)",
+            ("vc%d" % i, quota, json.dumps({"user_quota": 10}), "{}", "{}"))
+
+    # Admin group on cluster, users in their VC
+    db.execute(
+        "INSERT INTO acl (identityName, identityId, resource, permissions, "
+        "isDeny) VALUES (?, ?, ?, ?, 0)", ("admins", 20000, "Cluster", 7))
+    for i in range(args.users):
+        name = username_of(i)
+        groups = [20001] if i % 50 else [20000, 20001]
+        db.execute(
+            "INSERT INTO identity (identityName, uid, gid, groups, "
+            "public_key, private_key) VALUES (?, ?, ?, ?, '', '')",
+            (name, 10000 + i, 20001, json.dumps(groups)))
+        db.execute(
+            "INSERT INTO acl (identityName, identityId, resource, "
+            "permissions, isDeny) VALUES (?, ?, ?, ?, 0)",
+            (name, 10000 + i, "Cluster/VC:%s" % vc_of_user(i, args.vcs), 1))
+
+    db.execute("INSERT INTO clusterstatus (status) VALUES (?)",
+               (b64(make_cluster_status(args.nodes)),))
+
+    now = datetime.datetime.utcnow()
+    rows = []
+    for i in range(args.jobs):
+        # Job i is owned by user i % users, so requests can pick own jobs
+        user = i % args.users
+        job_id = "job-%08d" % i
+        status = rand.choice(ACTIVE_STATUS) \
+            if rand.random() < 0.05 else rand.choice(FINISHED_STATUS)
+        job_time = now - datetime.timedelta(seconds=rand.randrange(90 * 86400))
+        params = {
+            "jobId": job_id,
+            "jobName": "loadtest-%d" % i,
+            "userName": username_of(user),
+            "vcName": vc_of_user(user, args.vcs),
+            "image": "ubuntu:18.04",
+            "cmd": "python train.py --lr %f" % rand.random(),
+            "resourcegpu": rand.choice([0, 1, 4]),
+            "jobtrainingtype": "RegularJob",
+        }
+        rows.append((job_id, job_id, 1, params["jobName"], params["userName"],
+                     params["vcName"], status, b64([{"message": status}]),
+                     "training", job_time.strftime("%Y-%m-%d %H:%M:%S"),
+                     b64(params)))
+        if len(rows) == 10000 or i == args.jobs - 1:
+            db.executemany(
+                "INSERT INTO jobs (jobId, familyToken, isParent, jobName, "
+                "userName, vcName, jobStatus, jobStatusDetail, jobType, "
+                "jobTime, jobParams) VALUES (?,?,?,?,?,?,?,?,?,?,?)", rows)
+            rows = []
+    db.commit()
+    db.close()
+
+    db = sqlite3.connect(os.path.join(db_dir, "DLTS_GLOBAL.db"))
+    db.execute("PRAGMA journal_mode=WAL")
+    for statement in GLOBAL_SCHEMA:
+        db.execute(statement)
+    db.commit()
+    db.close()
+
+
+class Workload(object):
+    """Generates requests of the mix, as (endpoint, method, url, body)."""
+    def __init__(self, args):
+        self.args = args
+        self.lock = threading.Lock()
+        self.rand = random.Random(args.seed)
+        self.next_job = args.jobs
+        self.endpoints = []
+        # Cumulative weights of endpoints
+        self.weights = []
+        for item in args.mix.split(","):
+            endpoint, weight = item.split("=")
+            self.endpoints.append(endpoint.strip())
+            self.weights.append(float(weight) + sum(self.weights[-1:]))
+
+    def next(self):
+        with self.lock:
+            endpoint = self.endpoints[bisect.bisect(
+                self.weights,
+                self.rand.random() * self.weights[-1])]
+            user = self.rand.randrange(self.args.users)
+            # A job of the user
+            job = user + self.args.users * self.rand.randrange(
+                max(self.args.jobs // self.args.users, 1))
+            self.next_job += 1
+            new_job = self.next_job
+        username = username_of(user)
+        vc_name = vc_of_user(user, self.args.vcs)
+        return getattr(self, endpoint)(username, vc_name, job, new_job)
+
+    def ListJobsV2(self, username, vc_name, job, new_job):
+        return ("ListJobsV2", "GET",
+                "/ListJobsV2?userName=%s&vcName=%s&jobOwner=%s&num=20" %
+                (username, vc_name, username), None)
+
+    def GetJobDetailV2(self, username, vc_name, job, new_job):
+        return ("GetJobDetailV2", "GET",
+                "/GetJobDetailV2?userName=%s&jobId=job-%08d" % (username, job),
+                None)
+
+    def GetClusterStatus(self, username, vc_name, job, new_job):
+        return ("GetClusterStatus", "GET",
+                "/GetClusterStatus?userName=%s" % username, None)
+
+    def PostJob(self, username, vc_name, job, new_job):
+        return ("PostJob", "POST", "/PostJob", {
+            "jobName": "loadtest-%d" % new_job,
+            "vcName": vc_name,
+            "userName": username,
+            "userId": "10000",
+            "jobtrainingtype": "RegularJob",
+            "jobType": "training",
+            "image": "ubuntu:18.04",
+            "cmd": "sleep infinity",
+            "resourcegpu": 0,
+            "jobPriority": 100,
+        })
+
+    def KillJobs(self, username, vc_name, job, new_job):
+        job_ids = ",".join("job-%08d" % (job + self.args.users * i)
+                           for i in range(5))
+        return ("KillJobs", "GET",
+                "/KillJobs?userName=%s&jobIds=%s" % (username, job_ids), None)
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * p / 100))
+    return sorted_values[index]
+
+
+def run(app, stats, workload, args):
+    latencies = collections.defaultdict(list)
+    errors = collections.Counter()
+    # endpoint -> response of its first error
+    first_errors = {}
+    lock = threading.Lock()
+    remaining = [args.requests]
+
+    def worker():
+        client = app.test_client()
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            endpoint, method, url, body = workload.next()
+            stats.local.endpoint = endpoint
+            start = time.time()
+            if method == "GET":
+                # reqparse of Werkzeug >= 2.1 rejects GETs without JSON body
+                resp = client.get(url, json={})
+            else:
+                resp = client.post(url, json=body)
+            elapsed = time.time() - start
+            stats.local.endpoint = None
+            with lock:
+                latencies[endpoint].append(elapsed)
+                if resp.status_code >= 400 or b'"error"' in resp.data:
+                    errors[endpoint] += 1
+                    first_errors.setdefault(
+                        endpoint, "%d %s" % (resp.status_code, resp.data[:200]))
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.time() - start, latencies, errors, first_errors
+
+
+def report(elapsed, latencies, errors, first_errors, stats):
+    total = sum(len(v) for v in latencies.values())
+    print("%d requests in %.1fs: %.1f requests/sec" %
+          (total, elapsed, total / elapsed))
+    print("%-18s %8s %9s %9s %9s %10s %9s %7s" %
+          ("endpoint", "requests", "req/sec", "p50 ms", "p99 ms",
+           "queries/r", "conns/r", "errors"))
+    for endpoint in sorted(latencies):
+        values = sorted(latencies[endpoint])
+        n = len(values)
+        print("%-18s %8d %9.1f %9.1f %9.1f %10.2f %9.2f %7d" %
+              (endpoint, n, n / elapsed, percentile(values, 50) * 1000,
+               percentile(values, 99) * 1000, stats.queries[endpoint] / n,
+               stats.connects[endpoint] / n, errors[endpoint]))
+    for endpoint, error in sorted(first_errors.items()):
+        print("first error of %s: %s" % (endpoint, error))
+
+
+def load_app(db_dir, log_dir):
+    # Logs go to log_dir instead of /var/log/apache2
+    dict_config = logging.config.dictConfig
+
+    def redirect_logs(logging_config):
+        for handler in logging_config.get("handlers", {}).values():
+            if "filename" in handler:
+                handler["filename"] = os.path.join(
+                    log_dir, os.path.basename(handler["filename"]))
+        dict_config(logging_config)
+
+    logging.config.dictConfig = redirect_logs
+    try:
+        import dlwsrestapi
+    finally:
+        logging.config.dictConfig = dict_config
+    logging.disable(logging.ERROR)
+    return dlwsrestapi.app
+
+
+def main(args):
+    stats = Stats()
+    db_dir = tempfile.mkdtemp(prefix="dlts-load-test-")
+    try:
+        start = time.time()
+        seed(db_dir, args)
+        print("seeded %d users, %d VCs, %d jobs in %.1fs" %
+              (args.users, args.vcs, args.jobs, time.time() - start))
+
+        install_stand_in(stats, db_dir, args.pool_size)
+        app = load_app(db_dir, db_dir)
+        workload = Workload(args)
+
+        # Warm up caches and connection pools
+        warm_up = argparse.Namespace(**vars(args))
+        warm_up.requests = min(args.requests, 100)
+        run(app, stats, workload, warm_up)
+        stats.queries.clear()
+        stats.connects.clear()
+
+        report(*run(app, stats, workload, args), stats=stats)
+    finally:
+        shutil.rmtree(db_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=100000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--vcs", type=int, default=10)
+    parser.add_argument("--nodes", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--pool-size", type=int, default=2)
+    parser.add_argument("--mix",
+                        default=DEFAULT_MIX,
+                        help="comma separated endpoint=weight")
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
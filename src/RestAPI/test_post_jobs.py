@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Tests of /PostJobs against the SQLite stand-in for MySQL of load_test."""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import load_test
+
+app = None
+db_dir = None
+
+
+def setUpModule():
+    global app, db_dir
+    db_dir = tempfile.mkdtemp(prefix="dlts-test-post-jobs-")
+    load_test.seed(
+        db_dir, argparse.Namespace(jobs=10, users=2, vcs=1, nodes=2, seed=0))
+    load_test.install_stand_in(load_test.Stats(), db_dir, 2)
+    app = load_test.load_app(db_dir, db_dir)
+
+
+def tearDownModule():
+    shutil.rmtree(db_dir, ignore_errors=True)
+
+
+def make_job(name, **kwargs):
+    job = {
+        "jobName": name,
+        "vcName": load_test.vc_of_user(0, 1),
+        "userName": load_test.username_of(0),
+        "userId": "10000",
+        "jobtrainingtype": "RegularJob",
+        "jobType": "training",
+        "image": "ubuntu:18.04",
+        "cmd": "sleep infinity",
+        "resourcegpu": 0,
+    }
+    job.update(kwargs)
+    return job
+
+
+class TestPostJobs(unittest.TestCase):
+    def setUp(self):
+        self.client = app.test_client()
+
+    def post(self, body):
+        return self.client.post("/PostJobs", json=body)
+
+    def query(self, sql, params=()):
+        db = sqlite3.connect(os.path.join(db_dir, "DLWSCluster-loadtest.db"))
+        try:
+            return db.execute(sql, params).fetchall()
+        finally:
+            db.close()
+
+    def get_priority(self, job_id):
+        rows = self.query("SELECT priority FROM jobs WHERE jobId = ?",
+                          (job_id,))
+        return rows[0][0] if rows else None
+
+    def test_results_are_in_order(self):
+        resp = self.post({
+            "jobs": [
+                make_job("sweep-1", jobPriority=200),
+                make_job(""),
+                make_job("sweep-2"),
+            ]
+        })
+        self.assertEqual(200, resp.status_code)
+        results = resp.get_json()
+
+        self.assertEqual(3, len(results))
+        self.assertIn("jobId", results[0])
+        self.assertIn("Job name cannot be empty", results[1]["error"])
+        self.assertIn("jobId", results[2])
+        self.assertEqual(200, self.get_priority(results[0]["jobId"]))
+        self.assertEqual(100, self.get_priority(results[2]["jobId"]))
+
+    def test_duplicate_job_id_in_request(self):
+        results = self.post([
+            make_job("dup-1", jobId="dup-job"),
+            make_job("dup-2", jobId="dup-job"),
+            make_job("dup-3"),
+        ]).get_json()
+
+        self.assertEqual({"jobId": "dup-job"}, results[0])
+        self.assertIn("Duplicate jobId dup-job", results[1]["error"])
+        self.assertIn("jobId", results[2])
+        self.assertEqual([("dup-1",)],
+                         self.query("SELECT jobName FROM jobs WHERE jobId = ?",
+                                    ("dup-job",)))
+
+    def test_existing_job_id_only_fails_its_job(self):
+        results = self.post([
+            make_job("exists", jobId="job-00000000"),
+            make_job("new-1", jobPriority=300),
+            make_job("new-2", jobId="new-job"),
+        ]).get_json()
+
+        self.assertIn("Job job-00000000 already exists", results[0]["error"])
+        self.assertIn("jobId", results[1])
+        self.assertEqual({"jobId": "new-job"}, results[2])
+        self.assertEqual(300, self.get_priority(results[1]["jobId"]))
+        self.assertEqual(100, self.get_priority("new-job"))
+        self.assertEqual([("loadtest-0",)],
+                         self.query("SELECT jobName FROM jobs WHERE jobId = ?",
+                                    ("job-00000000",)))
+
+    def test_too_many_jobs(self):
+        with patch("dlwsrestapi.MAX_JOBS_PER_POST", 2):
+            resp = self.post([make_job("max-%d" % i) for i in range(3)])
+        self.assertEqual(400, resp.status_code)
+        self.assertEqual([], self.query(
+            "SELECT jobId FROM jobs WHERE jobName LIKE 'max-%'"))
+
+    def test_not_a_list(self):
+        self.assertEqual(400, self.post({"job": make_job("a")}).status_code)
+
+
+if __name__ == '__main__':
+    unittest.main()
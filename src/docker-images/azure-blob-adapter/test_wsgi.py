@@ -1,3 +1,4 @@
+from azure.common import AzureHttpError
 from os import environ
 from werkzeug.test import Client
 from werkzeug.wrappers import BaseResponse
@@ -5,8 +6,15 @@ from werkzeug.wrappers import BaseResponse
 # https://docs.microsoft.com/en-us/azure/storage/common/storage-use-emulator
 environ['AZURE_STORAGE_CONNECTION_STRING'] = 'UseDevelopmentStorage=true'
 environ['AZURE_STORAGE_CONTAINER_NAME'] = 'mycontainer'
+# Append in the request, buffering is tested with AppendBuffer
+environ['AZURE_BLOB_ADAPTER_FLUSH_INTERVAL'] = '0'
 
-from wsgi import application  # noqa: E402
+import wsgi  # noqa: E402
+from wsgi import AppendBuffer, application  # noqa: E402
+
+
+def setup_function(function):
+    wsgi.blob_writer.tails.clear()
 
 
 def test_healthz(requests_mock):
@@ -176,6 +184,13 @@ def test_no_x_tag():
     assert response.status_code == 400
 
 
+def test_too_large(monkeypatch):
+    monkeypatch.setattr(wsgi, 'MAX_APPEND_SIZE', 4)
+    client = Client(application, BaseResponse)
+    response = client.post('/', headers={'x-tag': 'jobs.d175'}, data="log content")
+    assert response.status_code == 413
+
+
 def test_same_last_modified(requests_mock):
     requests_mock.put('/devstoreaccount1/mycontainer/jobs.d175?comp=appendblock', complete_qs=True,
                       status_code=409)  # 1
@@ -211,3 +226,134 @@ def test_same_last_modified(requests_mock):
     response = client.post('/', headers={'x-tag': 'jobs.d175'}, data="log content")
     assert response.status_code == 201
     assert requests_mock.call_count == 3
+
+
+def test_append_to_remembered_blob(requests_mock):
+    test_append_first_full(requests_mock)
+
+    requests_mock.reset_mock()
+    client = Client(application, BaseResponse)
+    response = client.post('/', headers={'x-tag': 'jobs.d175'}, data="log content")
+    assert response.status_code == 201
+    # Appended to jobs.d175.1 without listing blobs again
+    assert requests_mock.call_count == 1
+    assert requests_mock.last_request.path == '/devstoreaccount1/mycontainer/jobs.d175.1'
+
+
+class FakeWriter(object):
+    def __init__(self):
+        self.appends = []
+        self.fail = False
+        self.error = None
+
+    def append(self, tag, blob):
+        if self.error is not None:
+            raise self.error
+        if self.fail:
+            return False
+        self.appends.append((tag, blob))
+        return True
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_buffer(**kwargs):
+    writer = FakeWriter()
+    clock = FakeClock()
+    append_buffer = AppendBuffer(writer, clock=clock, **kwargs)
+    # No flush thread, flush() is called by the test
+    append_buffer.pid = wsgi.getpid()
+    return append_buffer, writer, clock
+
+
+def test_buffer_flushes_on_interval_and_size():
+    append_buffer, writer, clock = make_buffer(flush_interval=1, flush_size=10)
+
+    assert append_buffer.write('a', b'1\n')
+    assert append_buffer.write('a', b'2\n')
+    assert append_buffer.write('b', b'0123456789\n')
+    append_buffer.flush()
+    # b has flush_size bytes
+    assert writer.appends == [('b', b'0123456789\n')]
+
+    clock.now += 1
+    append_buffer.flush()
+    assert writer.appends[1:] == [('a', b'1\n2\n')]
+    assert append_buffer.size == 0
+
+
+def test_buffer_splits_batches_at_append_limit(monkeypatch):
+    monkeypatch.setattr(wsgi, 'MAX_APPEND_SIZE', 4)
+    append_buffer, writer, clock = make_buffer()
+
+    for blob in [b'1\n', b'2\n', b'3\n', b'45678\n']:
+        append_buffer.write('a', blob)
+    append_buffer.flush(force=True)
+    assert writer.appends == [('a', b'1\n2\n'), ('a', b'3\n'), ('a', b'45678\n')]
+
+
+def test_buffer_keeps_failed_logs_in_order():
+    append_buffer, writer, clock = make_buffer(flush_interval=1, max_size=8)
+
+    append_buffer.write('a', b'1\n')
+    writer.fail = True
+    append_buffer.flush(force=True)
+    append_buffer.write('a', b'2\n')
+    # Retried after flush_interval
+    writer.fail = False
+    append_buffer.flush()
+    assert writer.appends == []
+
+    # Full
+    assert not append_buffer.write('a', b'34567\n')
+
+    clock.now += 1
+    append_buffer.flush()
+    assert writer.appends == [('a', b'1\n2\n')]
+    assert append_buffer.write('a', b'34567\n')
+
+
+def test_buffer_drops_batch_after_attempts(monkeypatch):
+    monkeypatch.setattr(wsgi, 'FLUSH_ATTEMPTS', 3)
+    append_buffer, writer, clock = make_buffer(flush_interval=1)
+
+    append_buffer.write('a', b'1\n')
+    writer.fail = True
+    for _ in range(2):
+        append_buffer.flush(force=True)
+        assert append_buffer.size == 2
+    append_buffer.write('a', b'2\n')
+    append_buffer.flush(force=True)
+    # Logs received after the failures are dropped with the batch
+    assert append_buffer.size == 0
+    assert not append_buffer.pending
+
+    writer.fail = False
+    append_buffer.write('a', b'3\n')
+    append_buffer.flush(force=True)
+    assert writer.appends == [('a', b'3\n')]
+
+
+def test_buffer_drops_batch_on_client_error(monkeypatch):
+    monkeypatch.setattr(wsgi, 'MAX_APPEND_SIZE', 4)
+    append_buffer, writer, clock = make_buffer()
+
+    append_buffer.write('a', b'1\n')
+    append_buffer.write('a', b'2\n')
+    writer.error = AzureHttpError('Forbidden', 403)
+    append_buffer.flush(force=True)
+    assert append_buffer.size == 0
+
+    append_buffer.write('a', b'3\n')
+    writer.error = AzureHttpError('Server Busy', 503)
+    append_buffer.flush(force=True)
+    assert append_buffer.size == 2
+    writer.error = None
+    append_buffer.flush(force=True)
+    assert writer.appends == [('a', b'3\n')]
@@ -1,9 +1,14 @@
+from atexit import register as register_atexit
 from azure.storage.blob import AppendBlobService
 from azure.common import AzureMissingResourceHttpError, AzureConflictHttpError, AzureHttpError
+from collections import OrderedDict
 from dotenv import load_dotenv
 from logging import getLogger, StreamHandler
-from os import environ
+from os import environ, getpid
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
 from sys import stderr
+from threading import Condition, Lock, Thread
+from time import time
 from werkzeug.wrappers import PlainRequest, Response
 
 __all__ = ['application']
@@ -18,9 +23,54 @@ logger = getLogger(__name__)
 connection_string = environ['AZURE_STORAGE_CONNECTION_STRING']
 container_name = environ['AZURE_STORAGE_CONTAINER_NAME']
 
+# Seconds logs of a tag are buffered before they are appended, 0 appends each
+# request before responding.
+FLUSH_INTERVAL = float(environ.get('AZURE_BLOB_ADAPTER_FLUSH_INTERVAL', '1'))
+# Logs of a tag are appended before FLUSH_INTERVAL once there are this many
+# bytes.
+FLUSH_SIZE = int(environ.get('AZURE_BLOB_ADAPTER_FLUSH_SIZE', str(1024 * 1024)))
+# Requests are rejected with 503, and retried by fluent-bit, while this many
+# bytes are buffered.
+MAX_BUFFER_SIZE = int(environ.get('AZURE_BLOB_ADAPTER_MAX_BUFFER_SIZE', str(32 * 1024 * 1024)))
+# Prometheus metrics are served on this port if set
+METRICS_PORT = environ.get('AZURE_BLOB_ADAPTER_METRICS_PORT')
+
+MAX_APPEND_SIZE = 4 * 1024 * 1024  # Max size of an append block
+MAX_TAGS = 10000  # Tags whose last blob is remembered
+APPEND_ATTEMPTS = 10
+# Failed flushes of a batch before it is dropped
+FLUSH_ATTEMPTS = 10
+
+flush_latency = Histogram(
+    'azure_blob_adapter_flush_latency_seconds',
+    'latency of appending a batch of logs to a blob (seconds)',
+    buckets=(.01, .025, .05, .075, .1, .25, .5, .75, 1.0, 2.5, 5.0, 7.5, 10.0, float('inf')))
+batch_size = Histogram(
+    'azure_blob_adapter_batch_size_bytes',
+    'size of a batch of logs appended to a blob (bytes)',
+    buckets=(1024, 4096, 16384, 65536, 262144, 1048576, 4194304, float('inf')))
+list_blobs_count = Counter(
+    'azure_blob_adapter_list_blobs_count',
+    'count of blob listings to find the last blob of a tag')
+buffered_bytes = Gauge(
+    'azure_blob_adapter_buffered_bytes',
+    'bytes of logs received and not appended yet')
+rejected_count = Counter(
+    'azure_blob_adapter_rejected_request_count',
+    'count of requests rejected because the buffer is full')
+dropped_count = Counter(
+    'azure_blob_adapter_dropped_batch_count',
+    'count of batches of logs dropped because they can not be appended')
+
 append_blob_service = AppendBlobService(connection_string=connection_string)
 
 
+def _is_retryable(error):
+    '''Returns whether an append failing with error may succeed later.'''
+    status_code = getattr(error, 'status_code', None)
+    return status_code is None or status_code >= 500 or status_code in (408, 429)
+
+
 def _get_blob_index(blob_name):
     try:
         return int(blob_name.split('.', 2)[2])
@@ -28,6 +78,252 @@ def _get_blob_index(blob_name):
         return 0
 
 
+class BlobWriter(object):
+    '''Appends logs of a tag to blobs tag, tag.1, tag.2, ... creating the next
+    blob when the last one is full. The last blob of each tag is remembered,
+    blobs are only listed when the first blob of a tag is full.'''
+    def __init__(self, service, container_name, max_tags=MAX_TAGS):
+        self.service = service
+        self.container_name = container_name
+        self.max_tags = max_tags
+        self.lock = Lock()
+        self.tails = OrderedDict()  # tag -> name of last blob
+
+    def get_tail(self, tag):
+        with self.lock:
+            blob_name = self.tails.get(tag)
+            if blob_name is None:
+                return tag
+            self.tails.move_to_end(tag)
+            return blob_name
+
+    def set_tail(self, tag, blob_name):
+        with self.lock:
+            self.tails[tag] = blob_name
+            self.tails.move_to_end(tag)
+            while len(self.tails) > self.max_tags:
+                self.tails.popitem(last=False)
+
+    def create_next(self, blob_name):
+        '''Creates blob_name unless another writer already did.'''
+        try:
+            self.service.create_blob(
+                container_name=self.container_name,
+                blob_name=blob_name,
+                if_none_match='*')
+        except AzureHttpError as error:
+            if error.status_code not in (409, 412):
+                raise
+
+    def append(self, tag, blob):
+        '''Returns whether blob is appended to the last blob of tag.'''
+        blob_name = self.get_tail(tag)
+
+        for _ in range(APPEND_ATTEMPTS):
+            try:
+                self.service.append_blob_from_bytes(
+                    container_name=self.container_name,
+                    blob_name=blob_name,
+                    blob=blob,
+                    count=len(blob))
+            except AzureMissingResourceHttpError:
+                self.service.create_blob(
+                    container_name=self.container_name,
+                    blob_name=blob_name)
+                continue
+            except AzureConflictHttpError:
+                # Current blob is full, 4 possibilities:
+                #   P1. [->Full<-]
+                #   P2. [->Full<-, ..., Available]
+                #   P3. [->Full<-, ..., Full]
+                #   P4. [Full, ..., ->Full<-]
+                if blob_name == tag:
+                    # Fist blob is full: P1, P2 or P3
+                    list_blobs_count.inc()
+                    blob_names = self.service.list_blob_names(
+                        container_name=self.container_name,
+                        prefix=tag)
+                    blob_names = [
+                        name for name in blob_names
+                        if name == tag or name.startswith(tag + '.')
+                    ]
+                    if len(blob_names) <= 1:
+                        # P1: make it [Full, ->New<-]
+                        blob_name = tag + '.1'
+                        self.create_next(blob_name)
+                        continue
+                    else:
+                        # P2 or P3: point to the last one and retry
+                        blob_name = max(blob_names, key=_get_blob_index)
+                        continue
+                else:
+                    # P4: make it [Full, ..., Full, ->New<-]
+                    suffix = _get_blob_index(blob_name)
+                    blob_name = tag + '.' + str(suffix + 1)
+                    self.create_next(blob_name)
+                    continue
+
+            self.set_tail(tag, blob_name)
+            return True
+
+        logger.error('Failed to append to blobs of %s after %d attempts', tag, APPEND_ATTEMPTS)
+        return False
+
+
+class _Pending(object):
+    __slots__ = ('chunks', 'size', 'since', 'attempts')
+
+    def __init__(self, chunks, since, attempts=0):
+        self.chunks = chunks
+        self.size = sum(len(chunk) for chunk in chunks)
+        self.since = since
+        self.attempts = attempts  # Failed flushes of the first chunks
+
+
+def _split_batches(chunks, max_size):
+    '''Yields lists of consecutive chunks of up to max_size bytes in total, a
+    larger chunk is a batch on its own.'''
+    batch = []
+    size = 0
+    for chunk in chunks:
+        if batch and size + len(chunk) > max_size:
+            yield batch
+            batch = []
+            size = 0
+        batch.append(chunk)
+        size += len(chunk)
+    if batch:
+        yield batch
+
+
+class AppendBuffer(object):
+    '''Buffers logs per tag. A background thread appends the logs of a tag
+    once they are flush_size bytes or flush_interval seconds old, in batches
+    of up to MAX_APPEND_SIZE bytes. Logs of a failed append are kept and
+    retried after flush_interval, up to FLUSH_ATTEMPTS times. They are dropped
+    earlier if Azure rejects them with a status which is not retryable.'''
+    def __init__(self, writer, flush_interval=FLUSH_INTERVAL, flush_size=FLUSH_SIZE,
+                 max_size=MAX_BUFFER_SIZE, clock=time):
+        self.writer = writer
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.max_size = max_size
+        self.clock = clock
+        self.condition = Condition()
+        self.pending = OrderedDict()  # tag -> _Pending
+        self.size = 0
+        # The thread is started in the process serving requests, uwsgi
+        # imports the application before forking workers.
+        self.pid = None
+
+    def write(self, tag, blob):
+        '''Returns whether blob is buffered, False if the buffer is full.'''
+        self.start()
+        with self.condition:
+            if self.size > 0 and self.size + len(blob) > self.max_size:
+                return False
+            pending = self.pending.get(tag)
+            if pending is None:
+                pending = self.pending[tag] = _Pending([], self.clock())
+            pending.chunks.append(blob)
+            pending.size += len(blob)
+            self.size += len(blob)
+            buffered_bytes.set(self.size)
+            if pending.size >= self.flush_size:
+                self.condition.notify()
+        return True
+
+    def flush(self, force=False):
+        '''Appends logs of tags which are due, all of them if force.'''
+        with self.condition:
+            now = self.clock()
+            due = [
+                tag for (tag, pending) in self.pending.items()
+                if force or pending.size >= self.flush_size or now - pending.since >= self.flush_interval
+            ]
+            due = [(tag, self.pending.pop(tag)) for tag in due]
+
+        for (tag, pending) in due:
+            chunks = pending.chunks
+            attempts = pending.attempts
+            for batch in _split_batches(pending.chunks, MAX_APPEND_SIZE):
+                blob = b''.join(batch)
+                start = time()
+                retryable = True
+                try:
+                    appended = self.writer.append(tag, blob)
+                except Exception as error:
+                    logger.exception('Failed to append to blobs of %s', tag)
+                    appended = False
+                    retryable = _is_retryable(error)
+                flush_latency.observe(time() - start)
+                if not appended:
+                    attempts += 1
+                    if retryable and attempts < FLUSH_ATTEMPTS:
+                        self.requeue(tag, chunks, attempts)
+                        break
+                    logger.error('Dropped %d bytes of logs of %s after %d attempts', len(blob), tag, attempts)
+                    dropped_count.inc()
+                else:
+                    batch_size.observe(len(blob))
+                attempts = 0
+                chunks = chunks[len(batch):]
+                with self.condition:
+                    self.size -= len(blob)
+                    buffered_bytes.set(self.size)
+
+    def requeue(self, tag, chunks, attempts):
+        '''Puts back chunks of a failed append before logs received since.'''
+        with self.condition:
+            pending = self.pending.pop(tag, None)
+            if pending is not None:
+                chunks = chunks + pending.chunks
+            self.pending[tag] = _Pending(chunks, self.clock(), attempts)
+
+    def next_flush(self):
+        '''Returns seconds until logs of a tag are due.'''
+        if not self.pending:
+            return self.flush_interval
+        since = min(pending.since for pending in self.pending.values())
+        return max(0, since + self.flush_interval - self.clock())
+
+    def run(self):
+        while True:
+            with self.condition:
+                self.condition.wait(self.next_flush())
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Failed to flush logs')
+
+    def start(self):
+        if self.pid == getpid():
+            return
+        with self.condition:
+            if self.pid == getpid():
+                return
+            self.pid = getpid()
+            thread = Thread(target=self.run, name='flush', daemon=True)
+            thread.start()
+            register_atexit(self.flush, force=True)
+
+
+blob_writer = BlobWriter(append_blob_service, container_name)
+append_buffer = AppendBuffer(blob_writer)
+metrics_lock = Lock()
+metrics_pid = None
+
+
+def start_metrics_server():
+    global metrics_pid
+    if not METRICS_PORT or metrics_pid == getpid():
+        return
+    with metrics_lock:
+        if metrics_pid != getpid():
+            metrics_pid = getpid()
+            start_http_server(int(METRICS_PORT))
+
+
 @PlainRequest.application
 def application(request):
     '''
@@ -47,55 +343,21 @@ def application(request):
                 return Response(status=400)
 
             blob = request.get_data()
-            count = request.content_length
+            start_metrics_server()
 
-            blob_name = tag
+            if len(blob) > MAX_APPEND_SIZE:
+                # Can never be appended in one block
+                return Response(status=413)
 
-            for _ in range(10):
-                try:
-                    append_blob_service.append_blob_from_bytes(
-                        container_name=container_name,
-                        blob_name=blob_name,
-                        blob=blob,
-                        count=count)
-                except AzureMissingResourceHttpError:
-                    append_blob_service.create_blob(
-                        container_name=container_name,
-                        blob_name=blob_name)
-                    continue
-                except AzureConflictHttpError:
-                    # Current blob is full, 4 possibilities:
-                    #   P1. [->Full<-]
-                    #   P2. [->Full<-, ..., Available]
-                    #   P3. [->Full<-, ..., Full]
-                    #   P4. [Full, ..., ->Full<-]
-                    if blob_name == tag:
-                        # Fist blob is full: P1, P2 or P3
-                        blob_names = append_blob_service.list_blob_names(
-                            container_name=container_name,
-                            prefix=tag)
-                        blob_names = list(blob_names)
-                        if len(blob_names) == 1:
-                            # P1: make it [Full, ->New<-]
-                            blob_name = tag + '.1'
-                            append_blob_service.create_blob(
-                                container_name=container_name,
-                                blob_name=blob_name)
-                            continue
-                        else:
-                            # P2 or P3: point to the last one and retry
-                            blob_name = max(blob_names, key=_get_blob_index)
-                            continue
-                    else:
-                        # P4: make it [Full, ..., Full, ->New<-]
-                        suffix = _get_blob_index(blob_name)
-                        blob_name = tag + '.' + str(suffix + 1)
-                        append_blob_service.create_blob(
-                            container_name=container_name,
-                            blob_name=blob_name)
-                        continue
+            if FLUSH_INTERVAL <= 0:
+                if blob_writer.append(tag, blob):
+                    return Response(status=201)
+                return Response(status=502)
 
-                return Response(status=201)
+            if not append_buffer.write(tag, blob):
+                rejected_count.inc()
+                return Response(status=503)
+            return Response(status=201)
 
         else:
             return Response(status=400)
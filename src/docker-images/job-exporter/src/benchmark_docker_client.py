@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# Copyright (c) Microsoft Corporation
+# All rights reserved.
+#
+# MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and
+# to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED *AS IS*, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+""" Compares docker CLI and Docker Engine API calls of job-exporter on a node,
+run in the job-exporter container. For each of docker info, docker stats,
+docker inspect of all running containers and docker logs --tail 50 of each,
+reports the fork/exec count and the latency of both ways.
+
+Usage: python3 benchmark_docker_client.py [--rounds 5]
+"""
+
+import argparse
+import datetime
+import time
+
+import collector
+import docker_api
+import docker_inspect
+import docker_stats
+import utils
+
+
+class ExecCounter(object):
+    """ wraps utils.exec_cmd to count commands executed """
+    def __init__(self):
+        self.count = 0
+        self.exec_cmd = utils.exec_cmd
+
+    def __call__(self, *args, **kwargs):
+        self.count += 1
+        return self.exec_cmd(*args, **kwargs)
+
+
+def cli_calls(zombie_collector):
+    def info():
+        utils.exec_cmd(["docker", "info"], timeout=10)
+
+    def stats():
+        return docker_stats.stats(None, 60)
+
+    def inspect(ids):
+        docker_inspect.inspect_many(ids, None, 60)
+
+    def logs(ids):
+        for container_id in ids:
+            zombie_collector.docker_logs(container_id, tail=50)
+
+    return info, stats, inspect, logs
+
+
+def api_calls(client, zombie_collector):
+    api_stats = docker_stats.APIStats(client)
+
+    def info():
+        client.info()
+
+    def stats():
+        return api_stats.stats(None, 60)
+
+    def inspect(ids):
+        docker_inspect.inspect_many_api(client, ids, None, 60)
+
+    def logs(ids):
+        client.map(lambda i: zombie_collector.docker_logs(i, tail=50), ids)
+
+    return info, stats, inspect, logs
+
+
+def run(name, calls, rounds, counter):
+    info, stats, inspect, logs = calls
+    ids = list(stats().keys())
+    print("%s, %d containers" % (name, len(ids)))
+    for call_name, call in [
+        ("info", info),
+        ("stats", stats),
+        ("inspect", lambda: inspect(ids)),
+        ("logs", lambda: logs(ids)),
+    ]:
+        counter.count = 0
+        start = time.time()
+        for _ in range(rounds):
+            call()
+        elapsed = (time.time() - start) / rounds
+        print("  %-8s %6d fork/exec %8.3f s" %
+              (call_name, counter.count / rounds, elapsed))
+
+
+def main(args):
+    counter = ExecCounter()
+    utils.exec_cmd = counter
+    client = docker_api.DockerClient()
+
+    def zombie_collector(name, docker_client):
+        decay_time = datetime.timedelta(seconds=60)
+        _, instance = collector.instantiate_collector(
+            name, 0, decay_time, collector.ZombieCollector,
+            collector.AtomicRef(decay_time), collector.AtomicRef(decay_time),
+            docker_client)
+        return instance
+
+    run("docker CLI", cli_calls(zombie_collector("benchmark_cli", None)),
+        args.rounds, counter)
+    run("Docker Engine API",
+        api_calls(client, zombie_collector("benchmark_api", client)),
+        args.rounds, counter)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=5)
+    main(parser.parse_args())
@@ -25,12 +25,14 @@ import time
 import copy
 import os
 import collections
+import socket
 
 from prometheus_client import make_wsgi_app, Counter, Gauge, Histogram
 from prometheus_client.core import GaugeMetricFamily
 
 import network
 import utils
+import docker_api
 import docker_inspect
 import docker_stats
 import nvidia
@@ -362,7 +364,16 @@ class DockerCollector(Collector):
 
     cmd_timeout = 1 # 99th latency is 0.01s
 
+    def __init__(self, name, sleep_time, atomic_ref, iteration_counter,
+                 docker_client=None):
+        Collector.__init__(self, name, sleep_time, atomic_ref,
+                           iteration_counter)
+        self.docker_client = docker_client
+
     def collect_impl(self):
+        if self.docker_client is not None:
+            return self.collect_api()
+
         cmd = ["docker", "info"]
         error = "ok"
 
@@ -387,6 +398,24 @@ class DockerCollector(Collector):
 
         return [counter]
 
+    def collect_api(self):
+        error = "ok"
+
+        try:
+            with docker_api.timer(DockerCollector.cmd_histogram):
+                self.docker_client.info(timeout=DockerCollector.cmd_timeout)
+        except socket.timeout:
+            logger.warning("check docker active timeout")
+            error = "timeout"
+        except Exception as e:
+            logger.exception("check docker active error")
+            error = str(e)
+
+        counter = gen_docker_daemon_counter()
+        counter.add_metric([error], 1)
+
+        return [counter]
+
 
 class GpuCollector(Collector):
     cmd_histogram = Histogram("cmd_nvidia_smi_latency_seconds",
@@ -541,7 +570,9 @@ class ContainerCollector(Collector):
     inspect_histogram = Histogram(
         "cmd_docker_inspect_latency_seconds",
         "Command call latency for docker inspect (seconds)")
-    inspect_timeout = 1 # 99th latency is 0.042s
+    # docker inspect is called once for all new containers, 99th latency of
+    # one container is 0.042s
+    inspect_timeout = 10
 
     iftop_histogram = Histogram("cmd_iftop_latency_seconds",
                                 "Command call latency for iftop (seconds)")
@@ -595,7 +626,7 @@ class ContainerCollector(Collector):
 
     def __init__(self, name, sleep_time, atomic_ref, iteration_counter,
                  gpu_info_ref, stats_info_ref, interface, dcgm_info_ref,
-                 infiniband_info_ref, ipoib_info_ref):
+                 infiniband_info_ref, ipoib_info_ref, docker_client=None):
         Collector.__init__(self, name, sleep_time, atomic_ref,
                            iteration_counter)
         self.gpu_info_ref = gpu_info_ref
@@ -609,6 +640,13 @@ class ContainerCollector(Collector):
         self.infiniband_info_ref = infiniband_info_ref
         self.ipoib_info_ref = ipoib_info_ref
 
+        self.inspect_cache = docker_inspect.InspectCache(
+            ContainerCollector.inspect_histogram,
+            ContainerCollector.inspect_timeout, docker_client)
+        self.api_stats = None
+        if docker_client is not None:
+            self.api_stats = docker_stats.APIStats(docker_client)
+
         # k8s will prepend "k8s_" to pod name. There will also be a container name
         # prepend with "k8s_POD_" which is a docker container used to construct
         # network & pid namespace for specific container. These container prepend
@@ -619,8 +657,12 @@ class ContainerCollector(Collector):
                                   ContainerCollector.iftop_histogram,
                                   ContainerCollector.iftop_timeout)
 
-        stats_obj = docker_stats.stats(ContainerCollector.stats_histogram,
-                                       ContainerCollector.stats_timeout)
+        if self.api_stats is not None:
+            stats_obj = self.api_stats.stats(ContainerCollector.stats_histogram,
+                                             ContainerCollector.stats_timeout)
+        else:
+            stats_obj = docker_stats.stats(ContainerCollector.stats_histogram,
+                                           ContainerCollector.stats_timeout)
 
         now = datetime.datetime.now()
         gpu_infos = self.gpu_info_ref.get(now)
@@ -685,16 +727,12 @@ class ContainerCollector(Collector):
 
         return None
 
-    def process_one_container(self, container_id, stats, gpu_infos, all_conns,
-                              gauges, dcgm_infos, infiniband_infos,
-                              ipoib_infos):
+    def process_one_container(self, container_id, stats, inspect_info,
+                              gpu_infos, all_conns, gauges, dcgm_infos,
+                              infiniband_infos, ipoib_infos):
         container_name = utils.walk_json_field_safe(stats, "name")
         pai_service_name = ContainerCollector.infer_service_name(container_name)
 
-        inspect_info = docker_inspect.inspect(
-            container_id, ContainerCollector.inspect_histogram,
-            ContainerCollector.inspect_timeout)
-
         if inspect_info is None:
             logger.debug("ignore killed container %s", container_id)
             return
@@ -806,11 +844,15 @@ class ContainerCollector(Collector):
 
         gauges = ResourceGauges()
 
+        inspect_infos = self.inspect_cache.update(stats_obj.keys())
+
         for container_id, stats in stats_obj.items():
             try:
-                self.process_one_container(container_id, stats, gpu_infos,
-                                           all_conns, gauges, dcgm_infos,
-                                           infiniband_infos, ipoib_infos)
+                self.process_one_container(container_id, stats,
+                                           inspect_infos.get(container_id),
+                                           gpu_infos, all_conns, gauges,
+                                           dcgm_infos, infiniband_infos,
+                                           ipoib_infos)
             except Exception:
                 logger.exception(
                     "error when trying to process container %s with name %s",
@@ -868,11 +910,12 @@ class ZombieCollector(Collector):
             return len(self.zombies)
 
     def __init__(self, name, sleep_time, atomic_ref, iteration_counter,
-                 stats_info_ref, zombie_ids_ref):
+                 stats_info_ref, zombie_ids_ref, docker_client=None):
         Collector.__init__(self, name, sleep_time, atomic_ref,
                            iteration_counter)
         self.stats_info_ref = stats_info_ref
         self.zombie_ids_ref = zombie_ids_ref
+        self.docker_client = docker_client
 
         self.type1_zombies = ZombieCollector.ZombieRecorder("job_exit_hangs")
         self.type2_zombies = ZombieCollector.ZombieRecorder("residual_job")
@@ -918,6 +961,21 @@ class ZombieCollector(Collector):
         return self.type2_zombies.update(zombie_ids, now)
 
     def docker_logs(self, container_id, tail="all"):
+        if self.docker_client is not None:
+            try:
+                with docker_api.timer(ZombieCollector.logs_histogram):
+                    return self.docker_client.logs(
+                        container_id,
+                        tail=tail,
+                        timeout=ZombieCollector.logs_timeout)
+            except socket.timeout:
+                logger.warning("docker log timeout")
+            except docker_api.DockerAPIError as e:
+                logger.warning("docker logs returns %s", e)
+            except Exception:
+                logger.exception("docker logs error")
+            return ""
+
         try:
             return utils.exec_cmd(
                 ["docker", "logs", "--tail",
@@ -953,7 +1011,17 @@ class ZombieCollector(Collector):
             logger.warning("docker stats is None")
             return
 
-        exited_containers = set(filter(self.is_container_exited, stats.keys()))
+        if self.docker_client is not None:
+            container_ids = list(stats.keys())
+            exited = self.docker_client.map(self.is_container_exited,
+                                            container_ids)
+            exited_containers = set(
+                container_id
+                for container_id, is_exited in zip(container_ids, exited)
+                if is_exited)
+        else:
+            exited_containers = set(
+                filter(self.is_container_exited, stats.keys()))
 
         now = datetime.datetime.now()
         type1_zombies = self.update_zombie_count_type1(exited_containers, now)
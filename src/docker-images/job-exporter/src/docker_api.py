@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# Copyright (c) Microsoft Corporation
+# All rights reserved.
+#
+# MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and
+# to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED *AS IS*, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import contextlib
+import http.client
+import json
+import logging
+import socket
+import struct
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+DOCKER_SOCKET = "/var/run/docker.sock"
+
+# Concurrent requests, each on its own connection
+MAX_CONNECTIONS = 32
+
+DEFAULT_TIMEOUT = 10
+
+
+class DockerAPIError(Exception):
+    """ docker daemon answered with an error status """
+    def __init__(self, status, message):
+        Exception.__init__(self, "%d %s" % (status, message))
+        self.status = status
+        self.message = message
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout):
+        http.client.HTTPConnection.__init__(self, "localhost", timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except Exception:
+            sock.close()
+            raise
+        self.sock = sock
+
+
+class DockerClient(object):
+    """ Docker Engine API client on the unix socket of docker daemon. HTTP
+    connections are kept open and reused, requests made concurrently through
+    map run on up to max_connections connections """
+    def __init__(self, path=DOCKER_SOCKET, max_connections=MAX_CONNECTIONS):
+        self.path = path
+        self.max_connections = max_connections
+        self.lock = threading.Lock()
+        self.idle = [] # connections kept open for reuse
+        self.executor = ThreadPoolExecutor(max_workers=max_connections,
+                                           thread_name_prefix="docker-api")
+
+    def get_connection(self, timeout):
+        with self.lock:
+            if self.idle:
+                conn = self.idle.pop()
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                return conn, True
+        return UnixHTTPConnection(self.path, timeout), False
+
+    def put_connection(self, conn):
+        with self.lock:
+            if len(self.idle) < self.max_connections:
+                self.idle.append(conn)
+                return
+        conn.close()
+
+    def request(self, path, params=None, timeout=DEFAULT_TIMEOUT):
+        """ returns (content type, body) of GET path, raises DockerAPIError
+        if docker daemon returns an error """
+        url = path
+        if params:
+            url += "?" + urllib.parse.urlencode(params)
+
+        conn, reused = self.get_connection(timeout)
+        try:
+            try:
+                conn.request("GET", url)
+                response = conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionError):
+                if not reused:
+                    raise
+                # idle connection was closed by docker daemon
+                conn.close()
+                conn.request("GET", url)
+                response = conn.getresponse()
+            body = response.read()
+        except Exception:
+            conn.close()
+            raise
+
+        if response.will_close:
+            conn.close()
+        else:
+            self.put_connection(conn)
+
+        if response.status >= 400:
+            try:
+                message = json.loads(body.decode("utf-8"))["message"]
+            except Exception:
+                message = body.decode("utf-8", errors="replace")
+            raise DockerAPIError(response.status, message)
+        return response.getheader("Content-Type"), body
+
+    def get_json(self, path, params=None, timeout=DEFAULT_TIMEOUT):
+        _, body = self.request(path, params=params, timeout=timeout)
+        return json.loads(body.decode("utf-8"))
+
+    def map(self, fn, items):
+        """ returns [fn(item) for item in items], called concurrently """
+        return list(self.executor.map(fn, items))
+
+    def info(self, timeout=DEFAULT_TIMEOUT):
+        return self.get_json("/info", timeout=timeout)
+
+    def containers(self, timeout=DEFAULT_TIMEOUT):
+        """ returns list of running containers """
+        return self.get_json("/containers/json", timeout=timeout)
+
+    def inspect(self, container_id, timeout=DEFAULT_TIMEOUT):
+        return self.get_json("/containers/%s/json" % container_id,
+                             timeout=timeout)
+
+    def stats(self, container_id, timeout=DEFAULT_TIMEOUT):
+        """ returns one stats sample of container. Daemons of API 1.41 and
+        later return at once without precpu_stats, older daemons wait for a
+        second sample to fill precpu_stats """
+        params = {"stream": "false", "one-shot": "true"}
+        return self.get_json("/containers/%s/stats" % container_id,
+                             params=params,
+                             timeout=timeout)
+
+    def logs(self, container_id, tail="all", timeout=DEFAULT_TIMEOUT):
+        """ returns stdout and stderr of container, interleaved, as str """
+        params = {"stdout": "1", "stderr": "1", "tail": str(tail)}
+        _, body = self.request("/containers/%s/logs" % container_id,
+                               params=params,
+                               timeout=timeout)
+        return demux_logs(body).decode("utf-8", errors="replace")
+
+
+@contextlib.contextmanager
+def timer(histogram):
+    """ times a block with histogram if not None """
+    if histogram is None:
+        yield
+    else:
+        with histogram.time():
+            yield
+
+
+def demux_logs(data):
+    """ logs of a container without tty are frames of a 8 bytes header,
+    stream type, 3 zero bytes and big endian payload size, and the payload.
+    Logs of a container with tty are raw """
+    if len(data) < 8 or data[0] not in (0, 1, 2) or data[1:4] != b"\0\0\0":
+        return data
+
+    frames = []
+    i = 0
+    while i + 8 <= len(data):
+        size = struct.unpack(">I", data[i + 4:i + 8])[0]
+        frames.append(data[i + 8:i + 8 + size])
+        i += 8 + size
+    return b"".join(frames)
@@ -19,9 +19,11 @@
 import subprocess
 import json
 import sys
+import socket
 import logging
 
 import utils
+import docker_api
 
 logger = logging.getLogger(__name__)
 
@@ -97,16 +99,20 @@ def select_value_with_key(m, keys):
 
 def parse_docker_inspect(inspect_output):
     obj = json.loads(inspect_output)
+    return parse_inspect_obj(utils.walk_json_field_safe(obj, 0))
 
+
+def parse_inspect_obj(obj):
+    """ parse one container in docker inspect result """
     m = {}
 
-    obj_labels = utils.walk_json_field_safe(obj, 0, "Config", "Labels")
+    obj_labels = utils.walk_json_field_safe(obj, "Config", "Labels")
     if obj_labels is not None:
         for k, v in obj_labels.items():
             if k in keys:
                 m[k] = v
 
-    obj_env = utils.walk_json_field_safe(obj, 0, "Config", "Env")
+    obj_env = utils.walk_json_field_safe(obj, "Config", "Env")
     if obj_env:
         for env in obj_env:
             k, v = env.split("=", 1)
@@ -119,7 +125,7 @@ def parse_docker_inspect(inspect_output):
             elif k == "NVIDIA_VISIBLE_DEVICES" and v != "all" and v != "void":
                 m["GPU_ID"] = v
 
-    pid = utils.walk_json_field_safe(obj, 0, "State", "Pid")
+    pid = utils.walk_json_field_safe(obj, "State", "Pid")
     logger.info("m is %s", m)
 
     return InspectResult(
@@ -157,3 +163,97 @@ def inspect(container_id, histogram, timeout):
         logger.warning("docker inspect timeout")
     except Exception:
         logger.exception("exec docker inspect error")
+
+
+def inspect_many(container_ids, histogram, timeout):
+    """ inspect containers in one docker inspect call, returns map of container
+    id to InspectResult, containers which no longer exist are left out """
+    if not container_ids:
+        return {}
+
+    try:
+        output = utils.exec_cmd(["docker", "inspect"] + list(container_ids),
+                                histogram=histogram,
+                                timeout=timeout)
+    except subprocess.CalledProcessError as e:
+        # docker inspect fails if any container no longer exists, the others
+        # are still in output
+        logger.debug("command '%s' return with error (code %d)", e.cmd,
+                     e.returncode)
+        output = e.output.decode("utf-8") if e.output else ""
+    except subprocess.TimeoutExpired:
+        logger.warning("docker inspect timeout")
+        return {}
+    except Exception:
+        logger.exception("exec docker inspect error")
+        return {}
+
+    try:
+        objs = json.loads(output) if output.strip() else []
+    except ValueError:
+        logger.exception("failed to parse docker inspect output")
+        return {}
+
+    result = {}
+    for obj in objs:
+        full_id = obj.get("Id", "")
+        for container_id in container_ids:
+            if full_id.startswith(container_id):
+                result[container_id] = parse_inspect_obj(obj)
+                break
+    return result
+
+
+def inspect_many_api(client, container_ids, histogram, timeout):
+    """ inspect containers concurrently through Docker Engine API, returns map
+    of container id to InspectResult, containers which no longer exist are
+    left out """
+    def inspect_one(container_id):
+        try:
+            return parse_inspect_obj(client.inspect(container_id,
+                                                    timeout=timeout))
+        except docker_api.DockerAPIError as e:
+            logger.debug("docker inspect of %s returns %s", container_id, e)
+        except socket.timeout:
+            logger.warning("docker inspect timeout")
+        except Exception:
+            logger.exception("docker inspect of %s error", container_id)
+
+    with docker_api.timer(histogram):
+        results = client.map(inspect_one, container_ids)
+    return {
+        container_id: result
+        for container_id, result in zip(container_ids, results)
+        if result is not None
+    }
+
+
+class InspectCache(object):
+    """ InspectResult of running containers keyed by container id. Labels, env
+    and pid of a container do not change in its lifetime, k8s creates a new
+    container instead of restarting one, so a container is inspected once, in
+    a batch with other new containers, and evicted once it is gone. Inspects
+    through Docker Engine API if client is given, else docker CLI """
+    def __init__(self, histogram, timeout, client=None):
+        self.histogram = histogram
+        self.timeout = timeout
+        self.client = client
+        self.results = {}
+
+    def update(self, container_ids):
+        """ returns map of container id to InspectResult of container_ids,
+        containers which can not be inspected are left out """
+        container_ids = set(container_ids)
+        for container_id in list(self.results.keys()):
+            if container_id not in container_ids:
+                self.results.pop(container_id)
+
+        new_ids = sorted(container_ids - set(self.results.keys()))
+        if new_ids and self.client is not None:
+            self.results.update(
+                inspect_many_api(self.client, new_ids, self.histogram,
+                                 self.timeout))
+        elif new_ids:
+            self.results.update(
+                inspect_many(new_ids, self.histogram, self.timeout))
+        return dict(self.results)
@@ -20,6 +20,9 @@ import subprocess
 import sys
 import re
 import logging
+import socket
+
+import docker_api
 
 import utils
 
@@ -97,3 +100,105 @@ def stats(histogram, timeout):
         logger.warning("docker stats timeout")
     except Exception:
         logger.exception("exec docker stats error")
+
+
+def parse_api_stats(obj, previous=None):
+    """ parse stats of a container from Docker Engine API as parse_docker_stats,
+    returns (container info, cpu sample). CPU percent is computed as docker
+    CLI does, against precpu_stats if docker daemon filled it, else against
+    previous, the cpu sample of last call """
+    cpu_stats = obj.get("cpu_stats") or {}
+    precpu_stats = obj.get("precpu_stats") or {}
+    sample = (utils.walk_json_field_safe(cpu_stats, "cpu_usage", "total_usage") or 0,
+              cpu_stats.get("system_cpu_usage") or 0)
+    if precpu_stats.get("system_cpu_usage"):
+        previous = (utils.walk_json_field_safe(precpu_stats, "cpu_usage", "total_usage") or 0,
+                    precpu_stats["system_cpu_usage"])
+
+    cpu_percent = 0.0
+    if previous is not None:
+        online_cpus = cpu_stats.get("online_cpus") or \
+                len(utils.walk_json_field_safe(cpu_stats, "cpu_usage", "percpu_usage") or []) or 1
+        cpu_delta = sample[0] - previous[0]
+        system_delta = sample[1] - previous[1]
+        if cpu_delta >= 0 and system_delta > 0:
+            cpu_percent = cpu_delta / system_delta * online_cpus * 100.0
+
+    memory_stats = obj.get("memory_stats") or {}
+    usage = memory_stats.get("usage") or 0
+    # page cache which can be reclaimed is not counted, cgroup v1 then v2
+    for key in ["total_inactive_file", "inactive_file"]:
+        inactive = (memory_stats.get("stats") or {}).get(key)
+        if inactive is not None:
+            if inactive < usage:
+                usage -= inactive
+            break
+    limit = memory_stats.get("limit") or 0
+
+    net_in = net_out = 0
+    for network in (obj.get("networks") or {}).values():
+        net_in += network.get("rx_bytes", 0)
+        net_out += network.get("tx_bytes", 0)
+
+    block_in = block_out = 0
+    for entry in utils.walk_json_field_safe(
+            obj, "blkio_stats", "io_service_bytes_recursive") or []:
+        op = entry.get("op", "").lower()
+        if op == "read":
+            block_in += entry.get("value", 0)
+        elif op == "write":
+            block_out += entry.get("value", 0)
+
+    containerInfo = {
+        "id": obj.get("id", "")[:12],
+        "name": obj.get("name", "").lstrip("/"),
+        "CPUPerc": cpu_percent,
+        "MemUsage_Limit": {"usage": usage, "limit": limit},
+        "NetIO": {"in": net_in, "out": net_out},
+        "BlockIO": {"in": block_in, "out": block_out},
+        "MemPerc": usage / limit * 100.0 if limit else 0.0,
+    }
+    return containerInfo, sample
+
+class APIStats(object):
+    """ docker stats of running containers through Docker Engine API, stats of
+    containers are requested concurrently. Keeps the last cpu sample of each
+    container for daemons which return stats at once without precpu_stats """
+    def __init__(self, client):
+        self.client = client
+        self.cpu_samples = {}
+
+    def stats_one(self, container_id, timeout):
+        try:
+            return self.client.stats(container_id, timeout=timeout)
+        except docker_api.DockerAPIError as e:
+            # container stopped after it was listed
+            logger.debug("docker stats of %s returns %s", container_id, e)
+        except Exception:
+            logger.exception("docker stats of %s error", container_id)
+
+    def stats(self, histogram, timeout):
+        try:
+            with docker_api.timer(histogram):
+                containers = self.client.containers(timeout=timeout)
+                ids = [container["Id"][:12] for container in containers]
+                objs = self.client.map(
+                    lambda container_id: self.stats_one(container_id, timeout),
+                    ids)
+        except socket.timeout:
+            logger.warning("docker stats timeout")
+            return None
+        except Exception:
+            logger.exception("docker stats error")
+            return None
+
+        container_stats = {}
+        cpu_samples = {}
+        for container_id, obj in zip(ids, objs):
+            if obj is None:
+                continue
+            containerInfo, cpu_samples[container_id] = parse_api_stats(
+                obj, self.cpu_samples.get(container_id))
+            container_stats[container_id] = containerInfo
+        self.cpu_samples = cpu_samples
+        return container_stats
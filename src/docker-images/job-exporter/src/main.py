@@ -21,6 +21,7 @@ from twisted.web.resource import Resource
 from twisted.internet import reactor
 
 import collector
+import docker_api
 
 logger = logging.getLogger(__name__)
 
@@ -146,21 +147,27 @@ def main(args):
     # used to exchange ipoib info between IPoIBCollector and ContainerCollector
     ipoib_info_ref = collector.AtomicRef(decay_time)
 
+    # None to call docker CLI
+    docker_client = None
+    if not args.docker_cli:
+        docker_client = docker_api.DockerClient()
+
     interval = args.interval
     # Because all collector except container_collector will spent little time in calling
     # external command to get metrics, so they need to sleep 30s to align with prometheus
-    # scrape interval. The 99th latency of container_collector loop is around 20s, so it
-    # should only sleep 10s to adapt to scrape interval
+    # scrape interval. container_collector inspects only new containers, its loop is
+    # dominated by iftop (99th latency 7.4s) and docker stats, so it sleeps 10s less
     collector_args = [
         ("docker_daemon_collector", interval, decay_time,
-         collector.DockerCollector),
+         collector.DockerCollector, docker_client),
         ("gpu_collector", interval, decay_time, collector.GpuCollector,
          nvidia_info_ref, zombie_info_ref, args.threshold),
-        ("container_collector", max(0, interval - 18), decay_time,
+        ("container_collector", max(0, interval - 10), decay_time,
          collector.ContainerCollector, nvidia_info_ref, stats_info_ref,
-         args.interface, dcgm_info_ref, infiniband_info_ref, ipoib_info_ref),
+         args.interface, dcgm_info_ref, infiniband_info_ref, ipoib_info_ref,
+         docker_client),
         ("zombie_collector", interval, decay_time, collector.ZombieCollector,
-         stats_info_ref, zombie_info_ref),
+         stats_info_ref, zombie_info_ref, docker_client),
         ("process_collector", interval, decay_time, collector.ProcessCollector),
         ("dcgm_collector", interval, decay_time, collector.DCGMCollector,
          dcgm_info_ref),
@@ -211,6 +218,10 @@ if __name__ == "__main__":
                         help="memory threshold to consider gpu memory leak",
                         type=int,
                         default=20 * 1024 * 1024)
+    parser.add_argument("--docker-cli",
+                        help="call docker CLI instead of Docker Engine API on %s" %
+                        docker_api.DOCKER_SOCKET,
+                        action="store_true")
     args = parser.parse_args()
 
     def get_logging_level():
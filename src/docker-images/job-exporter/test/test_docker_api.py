@@ -0,0 +1,167 @@
+# Copyright (c) Microsoft Corporation
+# All rights reserved.
+#
+# MIT License
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and
+# to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED *AS IS*, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING
+# BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import os
+import sys
+import json
+import shutil
+import struct
+import tempfile
+import threading
+import unittest
+import http.server
+import socketserver
+
+import base
+
+sys.path.append(os.path.abspath("../src/"))
+
+from docker_api import DockerClient, DockerAPIError, demux_logs
+from docker_inspect import InspectCache
+from docker_stats import APIStats
+
+CONTAINER_ID = "e1a9cf8a0ad0"
+
+
+class FakeDockerHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        http.server.BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def address_string(self):
+        return "docker.sock"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.server.paths.append(self.path)
+        path = self.path.split("?")[0]
+        response = self.server.responses.get(path)
+        if response is None:
+            self.send(404, {"message": "No such container"})
+        else:
+            self.send(200, response)
+
+    def send(self, status, body):
+        if isinstance(body, bytes):
+            content_type = "application/vnd.docker.raw-stream"
+        else:
+            content_type = "application/json"
+            body = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeDockerDaemon(socketserver.ThreadingMixIn,
+                       socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path):
+        socketserver.UnixStreamServer.__init__(self, path, FakeDockerHandler)
+        self.connections = 0
+        self.paths = []
+        self.responses = {}
+
+
+def log_frame(stream, data):
+    return struct.pack(">BxxxI", stream, len(data)) + data
+
+
+class TestDockerClient(base.TestBase):
+    """
+    Test DockerClient in docker_api.py against a fake docker daemon
+    """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        path = os.path.join(self.dir, "docker.sock")
+
+        self.daemon = FakeDockerDaemon(path)
+        thread = threading.Thread(target=self.daemon.serve_forever,
+                                  daemon=True)
+        thread.start()
+        self.addCleanup(self.daemon.server_close)
+        self.addCleanup(self.daemon.shutdown)
+
+        with open("data/dlts_docker_inspect.json", "r") as f:
+            inspect = json.load(f)[0]
+        with open("data/docker_api_stats_sample.json", "r") as f:
+            stats = json.load(f)
+        stats["id"] = inspect["Id"]
+        self.daemon.responses = {
+            "/info": {"ID": "daemon"},
+            "/containers/json": [{"Id": inspect["Id"]}],
+            "/containers/%s/json" % CONTAINER_ID: inspect,
+            "/containers/%s/stats" % CONTAINER_ID: stats,
+        }
+
+        self.client = DockerClient(path, max_connections=4)
+        self.addCleanup(self.client.executor.shutdown)
+
+    def test_connection_is_reused(self):
+        for _ in range(3):
+            self.assertEqual({"ID": "daemon"}, self.client.info())
+        self.assertEqual(1, self.daemon.connections)
+
+    def test_error_status(self):
+        with self.assertRaises(DockerAPIError) as context:
+            self.client.inspect("000000000000")
+        self.assertEqual(404, context.exception.status)
+        self.assertEqual("No such container", context.exception.message)
+
+        # connection is still reused after an error
+        self.client.info()
+        self.assertEqual(1, self.daemon.connections)
+
+    def test_logs_are_demultiplexed(self):
+        self.daemon.responses["/containers/%s/logs" % CONTAINER_ID] = \
+                log_frame(1, b"step 1\n") + log_frame(2, b"USER COMMAND END\n")
+
+        self.assertEqual("step 1\nUSER COMMAND END\n",
+                         self.client.logs(CONTAINER_ID, tail=50))
+        self.assertEqual(
+            "/containers/%s/logs?stdout=1&stderr=1&tail=50" % CONTAINER_ID,
+            self.daemon.paths[-1])
+
+    def test_demux_raw_logs(self):
+        self.assertEqual(b"tty output\n", demux_logs(b"tty output\n"))
+
+    def test_api_stats(self):
+        stats = APIStats(self.client).stats(None, 10)
+
+        self.assertEqual([CONTAINER_ID], list(stats.keys()))
+        self.assertEqual(40.0, stats[CONTAINER_ID]["CPUPerc"])
+        self.assertEqual({"in": 1600000, "out": 500000},
+                         stats[CONTAINER_ID]["NetIO"])
+
+    def test_inspect_cache(self):
+        cache = InspectCache(None, 10, self.client)
+
+        infos = cache.update([CONTAINER_ID, "000000000000"])
+        self.assertEqual([CONTAINER_ID], list(infos.keys()))
+        self.assertEqual("dixu", infos[CONTAINER_ID].username)
+        self.assertEqual(3533, infos[CONTAINER_ID].pid)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -17,13 +17,17 @@
 
 import sys
 import os
+import json
+import subprocess
 import unittest
+from unittest.mock import patch
 
 import base
 
 sys.path.append(os.path.abspath("../src/"))
 
-from docker_inspect import parse_docker_inspect, InspectResult
+import docker_inspect
+from docker_inspect import parse_docker_inspect, InspectResult, InspectCache
 
 
 class TestDockerInspect(base.TestBase):
@@ -116,5 +120,64 @@ class TestDockerInspect(base.TestBase):
         self.assertEqual(target_inspect_info, inspect_info)
 
 
+class TestInspectCache(base.TestBase):
+    """
+    Test InspectCache in docker_inspect.py
+    """
+    def setUp(self):
+        self.containers = {}
+        for path in ["data/dlts_docker_inspect.json",
+                     "data/docker_inspect_sample.json"]:
+            with open(path, "r") as f:
+                obj = json.load(f)[0]
+            self.containers[obj["Id"][:12]] = obj
+        self.calls = []
+
+        def exec_cmd(cmd, histogram=None, timeout=None):
+            self.calls.append(cmd[2:])
+            found = [self.containers[c] for c in cmd[2:]
+                     if c in self.containers]
+            output = json.dumps(found)
+            if len(found) < len(cmd) - 2:
+                raise subprocess.CalledProcessError(1, cmd,
+                                                    output.encode("utf-8"))
+            return output
+
+        patcher = patch.object(docker_inspect.utils, "exec_cmd", exec_cmd)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_new_containers_are_inspected_in_one_call(self):
+        cache = InspectCache(None, 10)
+
+        infos = cache.update(["e1a9cf8a0ad0", "8c3f365e97e0"])
+        self.assertEqual([["8c3f365e97e0", "e1a9cf8a0ad0"]], self.calls)
+        self.assertEqual("dixu", infos["e1a9cf8a0ad0"].username)
+        self.assertEqual("openmindstudio", infos["8c3f365e97e0"].username)
+
+        infos = cache.update(["e1a9cf8a0ad0", "8c3f365e97e0"])
+        self.assertEqual(1, len(self.calls))
+        self.assertEqual(2, len(infos))
+
+    def test_gone_containers_are_evicted(self):
+        cache = InspectCache(None, 10)
+        cache.update(["e1a9cf8a0ad0", "8c3f365e97e0"])
+
+        infos = cache.update(["e1a9cf8a0ad0"])
+        self.assertEqual(["e1a9cf8a0ad0"], list(infos.keys()))
+
+        cache.update(["e1a9cf8a0ad0", "8c3f365e97e0"])
+        self.assertEqual(["8c3f365e97e0"], self.calls[-1])
+
+    def test_containers_killed_before_inspect_are_left_out(self):
+        cache = InspectCache(None, 10)
+
+        infos = cache.update(["e1a9cf8a0ad0", "000000000000"])
+        self.assertEqual(["e1a9cf8a0ad0"], list(infos.keys()))
+
+        cache.update(["e1a9cf8a0ad0", "000000000000"])
+        self.assertEqual(["000000000000"], self.calls[-1])
+
+
 if __name__ == '__main__':
     unittest.main()
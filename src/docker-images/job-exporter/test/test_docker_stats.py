@@ -17,6 +17,7 @@
 
 import os
 import sys
+import json
 import unittest
 
 import base
@@ -28,6 +29,7 @@ from docker_stats import convert_to_byte
 from docker_stats import parse_usage_limit
 from docker_stats import parse_io
 from docker_stats import parse_percentile
+from docker_stats import parse_api_stats
 
 class TestDockerStats(base.TestBase):
     """
@@ -65,5 +67,37 @@ class TestDockerStats(base.TestBase):
         target = 24.45
         self.assertEqual(target, result)
 
+    def test_parse_api_stats(self):
+        sample_path = "data/docker_api_stats_sample.json"
+        with open(sample_path, "r") as f:
+            obj = json.load(f)
+
+        stats_info, cpu_sample = parse_api_stats(obj)
+        target_stats_info = {
+            "id": "722dac0a62cf",
+            "name": "k8s_alert-manager_alert-manager-7b8c9d_default_0a32e30a_0",
+            "CPUPerc": 40.0,
+            "MemUsage_Limit": {"usage": 111149056, "limit": 1073741824},
+            "NetIO": {"in": 1600000, "out": 500000},
+            "BlockIO": {"in": 28600000, "out": 156000000},
+            "MemPerc": 111149056 / 1073741824 * 100.0,
+        }
+        self.assertEqual(target_stats_info, stats_info)
+        self.assertEqual((100400000000, 4004000000000), cpu_sample)
+
+    def test_parse_api_stats_one_shot(self):
+        sample_path = "data/docker_api_stats_sample.json"
+        with open(sample_path, "r") as f:
+            obj = json.load(f)
+        # one-shot stats have no precpu_stats
+        obj["precpu_stats"] = {"cpu_usage": {"total_usage": 0},
+                               "throttling_data": {}}
+
+        stats_info, _ = parse_api_stats(obj)
+        self.assertEqual(0.0, stats_info["CPUPerc"])
+
+        stats_info, _ = parse_api_stats(obj, (100300000000, 4002000000000))
+        self.assertEqual(20.0, stats_info["CPUPerc"])
+
 if __name__ == '__main__':
     unittest.main()
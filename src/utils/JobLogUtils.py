@@ -1,14 +1,31 @@
+import collections
+import concurrent.futures
+import datetime
 import logging
+import re
+import threading
 
 from itertools import groupby
 from json import loads
 from json.decoder import JSONDecodeError
 
 from config import config
+from job_log_tail import timestamp_key
 
 logger = logging.getLogger(__name__)
 
 
+# Matches returned by one SearchJobLog by default and at most
+SEARCH_LIMIT = 100
+MAX_SEARCH_LIMIT = 1000
+MAX_SEARCH_CONTEXT = 10
+# Lines read at most after the last match to complete its context
+MAX_TRAILING_LINES = 1000
+
+_REGEX_SPECIAL = set(".^$*+?{}[]\\|()")
+_RFC3339_UTC = re.compile(r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d+)?Z$")
+
+
 def TryParseCursor(cursor):
     try:
         return list(int(s) for s in cursor.split('.', 2))
@@ -17,17 +34,147 @@ def TryParseCursor(cursor):
         return None
 
 
+class LogQuery(object):
+    """Search of job log lines matching pattern, a regular expression, in
+    pods and from start_time to end_time, RFC 3339 UTC timestamps. Each match
+    comes with up to context lines of the same pod before and after it, at
+    most limit matches are returned, SEARCH_LIMIT by default.
+
+    Raises ValueError for an invalid pattern or time.
+    """
+    def __init__(self,
+                 pattern,
+                 pods=None,
+                 start_time=None,
+                 end_time=None,
+                 context=0,
+                 limit=None,
+                 ignore_case=False):
+        try:
+            self.regex = re.compile(pattern,
+                                    re.IGNORECASE if ignore_case else 0)
+        except re.error as e:
+            raise ValueError("invalid pattern: %s" % e)
+        for time in (start_time, end_time):
+            if time is not None and not _RFC3339_UTC.match(time):
+                raise ValueError("invalid time: %s" % time)
+        self.pattern = pattern
+        self.pods = set(pods) if pods else None
+        self.start_time = start_time
+        self.end_time = end_time
+        self.context = max(0, min(context, MAX_SEARCH_CONTEXT))
+        if limit is None:
+            limit = SEARCH_LIMIT
+        self.limit = max(1, min(limit, MAX_SEARCH_LIMIT))
+
+    def is_literal(self):
+        """Whether pattern matches itself only, so that backends can search
+        for it."""
+        return len(self.pattern.strip()) > 0 and \
+            not any(c in _REGEX_SPECIAL for c in self.pattern)
+
+    def selects(self, pod, time):
+        """Whether a line of pod at time is searched. Lines of unknown pod or
+        time are."""
+        if self.pods is not None and pod is not None and pod not in self.pods:
+            return False
+        if not isinstance(time, str):
+            return True
+        key = timestamp_key(time)
+        if self.start_time is not None and key < timestamp_key(
+                self.start_time):
+            return False
+        if self.end_time is not None and key > timestamp_key(self.end_time):
+            return False
+        return True
+
+    def filter(self, records, context=True):
+        """Returns (matches, cursor) of records (cursor, pod, time, line) in
+        log order. cursor is the one of the last match if there may be more
+        matches after it, None otherwise. Context lines are only collected
+        if context.
+        """
+        context = self.context if context else 0
+        matches = []
+        # pod -> last lines
+        before = {}
+        # matches of which after context is not complete
+        pending = []
+        more = False
+        trailing = 0
+        for (cursor, pod, time, line) in records:
+            if not self.selects(pod, time):
+                continue
+            line = line.rstrip("\n")
+
+            if len(matches) >= self.limit:
+                more = more or self.regex.search(line) is not None
+                trailing += 1
+                if (more and not pending) or trailing > MAX_TRAILING_LINES:
+                    return (matches, matches[-1]["cursor"])
+
+            if pending:
+                for match in pending:
+                    if match["pod"] == pod:
+                        match["after"].append(line)
+                pending = [
+                    match for match in pending
+                    if len(match["after"]) < context
+                ]
+
+            if len(matches) < self.limit and self.regex.search(line):
+                match = {
+                    "cursor": cursor,
+                    "pod": pod,
+                    "time": time,
+                    "line": line,
+                    "before": list(before.get(pod, ())),
+                    "after": [],
+                }
+                matches.append(match)
+                if context > 0:
+                    pending.append(match)
+
+            if context > 0:
+                lines = before.get(pod)
+                if lines is None:
+                    lines = before[pod] = collections.deque(maxlen=context)
+                lines.append(line)
+
+        return (matches, matches[-1]["cursor"] if more else None)
+
+
+
 if config.get("logging") == 'azure_blob':
     logger.info('Azure Blob log backend is enabled.')
 
     from azure.storage.blob import AppendBlobService
     from azure.common import AzureHttpError
 
+    from cache import Cache
+
     append_blob_service = AppendBlobService(
         connection_string=config['azure_blob_log']['connection_string'])
     container_name = config['azure_blob_log']['container_name']
 
     CHUNK_SIZE = 1024 * 1024  # Assume each line in log is no more then 1MB
+    # Bytes read at most by one GetJobLog after a cursor
+    MAX_TAIL_SIZE = 4 * CHUNK_SIZE
+    # Seconds the blob list of a job is used before it is listed again. Tail
+    # reads after a cursor only need it when the current blob has no more
+    # bytes, to find the next one.
+    MANIFEST_TTL = 10
+    MANIFEST_MAXSIZE = 4096
+    # Chunks downloaded concurrently by one GetJobRawLog
+    RAW_LOG_PARALLELISM = 8
+
+    # jobId -> list of (index, name, content_length, etag) sorted by index
+    blob_manifests = Cache("azure_blob_manifest",
+                           maxsize=MANIFEST_MAXSIZE,
+                           ttl=MANIFEST_TTL,
+                           max_stale=0)
+    download_executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers=2 * RAW_LOG_PARALLELISM)
 
     def _get_blob_index(blob):
         try:
@@ -35,29 +182,98 @@ if config.get("logging") == 'azure_blob':
         except (IndexError, ValueError):
             return 0
 
+    def _get_blob_name(jobId, index):
+        prefix = 'jobs.' + jobId
+        return prefix if index == 0 else '{}.{}'.format(prefix, index)
+
+    def _list_blobs(jobId):
+        prefix = 'jobs.' + jobId
+        blobs = append_blob_service.list_blobs(container_name=container_name,
+                                               prefix=prefix)
+        # The prefix also matches jobs whose id starts with jobId
+        return sorted((_get_blob_index(blob), blob.name,
+                       blob.properties.content_length, blob.properties.etag)
+                      for blob in blobs if blob.name == prefix or
+                      blob.name.startswith(prefix + '.'))
+
+    def get_blob_manifest(jobId, refresh=False):
+        """Returns the cached blobs of job, listed again if refresh."""
+        if refresh:
+            blob_manifests.invalidate(jobId)
+        return blob_manifests.get(jobId, lambda: _list_blobs(jobId))
+
+    def _parse_position(cursor):
+        """Returns (blob index, offset) of cursor, None if it is not one."""
+        if cursor is None:
+            return None
+        position = TryParseCursor(cursor)
+        if position is None or len(position) != 2:
+            return None
+        return position
+
+    def _complete_lines(content, start_range):
+        """Returns the complete lines at the start of content and the blob
+        offset after them."""
+        end = content.rfind(b'\n') + 1
+        if end == 0 and len(content) >= MAX_TAIL_SIZE:
+            # A line longer than MAX_TAIL_SIZE, skip it
+            end = len(content)
+        return content[:end], start_range + end
+
+    def _read_after_cursor(jobId, position):
+        """Returns (blob index, start offset, content) of the bytes appended
+        after position, moving on to the next blob when the current one has
+        no more bytes. None if there are none."""
+        (index, start_range) = position
+        while True:
+            try:
+                chunk = append_blob_service.get_blob_to_bytes(
+                    container_name=container_name,
+                    blob_name=_get_blob_name(jobId, index),
+                    start_range=start_range,
+                    end_range=start_range + MAX_TAIL_SIZE - 1)
+                if len(chunk.content) > 0:
+                    return (index, start_range, chunk.content)
+            except AzureHttpError as error:
+                if error.status_code not in (404, 416):
+                    raise
+
+            later = [blob[0] for blob in get_blob_manifest(jobId)
+                     if blob[0] > index]
+            if len(later) == 0:
+                return None
+            (index, start_range) = (min(later), 0)
+
     def GetJobLog(jobId, cursor=None, size=None):
+        """Returns logs of job by pod and the cursor after them. Without a
+        cursor these are the logs in the last CHUNK_SIZE bytes. The cursor is
+        the blob index and the offset in the blob."""
         try:
-            prefix = 'jobs.' + jobId
-
             lines = []
 
             try:
-                blobs = append_blob_service.list_blobs(
-                    container_name=container_name,
-                    prefix=prefix)
-                blobs = list(blobs)
-
-                if len(blobs) == 0:
-                    return ({}, None)
+                position = _parse_position(cursor)
+                if position is None:
+                    blobs = get_blob_manifest(jobId)
+                    if len(blobs) == 0:
+                        return ({}, None)
+
+                    (index, name, content_length, _) = blobs[-1]
+                    start_range = max(0, content_length - CHUNK_SIZE)
+                    chunk = append_blob_service.get_blob_to_bytes(
+                        container_name=container_name,
+                        blob_name=name,
+                        start_range=start_range)
+                    content = chunk.content
+                else:
+                    read = _read_after_cursor(jobId, position)
+                    if read is None:
+                        return ({}, cursor)
+                    (index, start_range, content) = read
 
-                blob = max(blobs, key=_get_blob_index)
-                start_range = max(0, blob.properties.content_length - CHUNK_SIZE)
-                chunk = append_blob_service.get_blob_to_bytes(
-                    container_name=container_name,
-                    blob_name=blob.name,
-                    start_range=start_range)
-                content = chunk.content.decode(
-                    encoding='utf-8', errors='ignore')
+                (content, end_range) = _complete_lines(content, start_range)
+                cursor = '{}.{}'.format(index, end_range)
+                content = content.decode(encoding='utf-8', errors='ignore')
 
                 content_lines = content.splitlines()
                 for i, content_line in enumerate(content_lines, 1):
@@ -65,7 +281,7 @@ if config.get("logging") == 'azure_blob':
                         line = loads(content_line)
                         lines.append(line)
                     except JSONDecodeError:
-                        if i == 1:
+                        if i == 1 and position is None:
                             # Normal case, invalid JSON at the start of the log:
                             #     Directly continue to next line
                             continue
@@ -91,71 +307,286 @@ if config.get("logging") == 'azure_blob':
                 pod_logs[pod_name] = ''.join(
                     pod_line['log'] for pod_line in pod_lines)
 
-            return (pod_logs, None)
+            return (pod_logs, cursor)
         except Exception:
             logger.exception(
                 "Failed to request logs of job {} from azure blob".format(
                     jobId))
             return ({}, None)
 
-    def GetJobRawLog(jobId):
+    def _download_range(name, start_range, end_range):
+        return append_blob_service.get_blob_to_bytes(
+            container_name, name, start_range=start_range,
+            end_range=end_range).content
+
+    def iter_chunks(blobs, start=None):
+        """Yields (blob index, start offset, future of bytes) of the
+        CHUNK_SIZE ranges of blobs in order, from start (blob index, offset)
+        if given. Up to RAW_LOG_PARALLELISM ranges are downloaded ahead of
+        the caller."""
+        (start_index, start_offset) = start or (0, 0)
+        pending = collections.deque()
         try:
-            prefix = 'jobs.' + jobId
-
-            blobs = append_blob_service.list_blobs(container_name, prefix)
-            blobs = list(blobs)
-
-            if len(blobs) == 0:
-                return None
-                yield
-
-            blobs = sorted(blobs, key=_get_blob_index)
-
-            for blob in blobs:
+            for (index, name, content_length, _) in blobs:
+                if index < start_index:
+                    continue
+                offset = start_offset if index == start_index else 0
+                for start_range in range(offset, content_length, CHUNK_SIZE):
+                    end_range = min(start_range + CHUNK_SIZE,
+                                    content_length) - 1
+                    pending.append((index, start_range,
+                                    download_executor.submit(
+                                        _download_range, name, start_range,
+                                        end_range)))
+                    if len(pending) >= RAW_LOG_PARALLELISM:
+                        yield pending.popleft()
+            while pending:
+                yield pending.popleft()
+        finally:
+            for (_, _, future) in pending:
+                future.cancel()
+
+    def iter_lines(jobId, start=None, skip_failed=True):
+        """Yields (cursor, line) of the parsed log lines of job, from start
+        (blob index, offset) if given. The cursor "<blob index>.<offset>" is
+        the position after the line. A blob failing to download is skipped if
+        skip_failed, else the error is raised."""
+        blobs = get_blob_manifest(jobId, refresh=True)
+
+        buffer = b''
+        offset = 0
+        current = failed = None
+        for (index, start_range, future) in iter_chunks(blobs, start):
+            if index != current:
+                # A partial line at the end of a blob is dropped
+                (current, buffer, offset) = (index, b'', start_range)
+            if index == failed:
+                continue
+            try:
+                buffer += future.result()
+            except Exception:
+                if not skip_failed:
+                    raise
+                logger.exception('Failed to process blob {} of job {}'.format(
+                    index, jobId))
+                failed = index
+                continue
+
+            heads = buffer.split(b'\n')
+            buffer = heads.pop()
+            for head in heads:
+                offset += len(head) + 1
+                if len(head.strip()) == 0:
+                    continue
                 try:
-                    buffer = b''
-                    start_range = 0
-                    content_length = blob.properties.content_length
-                    while start_range < content_length:
-                        end_range = min(
-                            start_range + CHUNK_SIZE - 1,
-                            content_length - 1)
-                        blob = append_blob_service.get_blob_to_bytes(
-                            container_name, blob.name,
-                            start_range=start_range,
-                            end_range=end_range)
-                        buffer += blob.content
-                        start_range = end_range + 1
-
-                        while len(buffer) > 0:
-                            try:
-                                [head, buffer] = buffer.split(b'\n', 1)
-                            except ValueError:  # no '\n' in buffer so no enough items in returned list.
-                                break
-
-                            try:
-                                line = loads(head.decode('utf-8', errors='ignore'))
-                                yield line['log']
-                            except Exception:
-                                logger.exception('Failed to process log line {}'.format(repr(head)))
-
+                    line = loads(head.decode('utf-8', errors='ignore'))
                 except Exception:
-                    logger.exception('Failed to process blob {}'.format(blob.name))
+                    logger.exception('Failed to process log line {}'.format(repr(head)))
+                    continue
+                yield ('{}.{}'.format(index, offset), line)
+
+    def iter_raw_log(jobId,
+                     cursor=None,
+                     start_time=None,
+                     end_time=None,
+                     skip_failed=False):
+        """Yields (cursor, log) of the lines of job, after cursor if given.
+        Download errors are raised unless skip_failed, skipped lines would
+        shift the byte offsets of job_log_range."""
+        for (line_cursor, line) in iter_lines(jobId, _parse_position(cursor),
+                                              skip_failed):
+            try:
+                yield (line_cursor, line['log'])
+            except Exception:
+                logger.exception('Failed to process log line {}'.format(repr(line)))
+
+    def GetJobRawLog(jobId, start_time=None, end_time=None):
+        try:
+            for (_, log) in iter_raw_log(jobId, skip_failed=True):
+                yield log
 
         except Exception:
             logger.exception("Failed to request logs of job {} from azure blob".format(jobId))
             return None
             yield
 
+    def SearchJobLog(jobId, query, cursor=None, job_time=None):
+        """Returns (matches, cursor) of LogQuery query in the log of job,
+        after cursor if given. Lines are filtered while they are
+        downloaded. None if the log can not be read."""
+        try:
+            lines = iter_lines(jobId, _parse_position(cursor))
+
+            def records():
+                for (line_cursor, line) in lines:
+                    if not isinstance(line, dict):
+                        continue
+                    kubernetes = line.get('kubernetes') or {}
+                    yield (line_cursor, kubernetes.get('pod_name'),
+                           line.get('time'), line.get('log', ''))
+
+            try:
+                return query.filter(records())
+            finally:
+                # Stops downloads ahead of the last line read
+                lines.close()
+        except Exception:
+            logger.exception(
+                "Failed to search logs of job {} in azure blob".format(jobId))
+            return None
+
 
 elif config.get("logging") == 'elasticsearch':
     logger.info('Elasticsearch log backend is enabled.')
 
     from elasticsearch import Elasticsearch
 
+    # Max connections kept per Elasticsearch node
+    ELASTICSEARCH_MAXSIZE = 25
+    INDEX_PREFIX = "logstash-"
+    # Jobs spanning more days than this search all indices
+    MAX_INDEX_DAYS = 31
+    RAW_LOG_PAGE_SIZE = 1000
+    POINT_IN_TIME_KEEP_ALIVE = "1m"
+
+    # Log order, with nanoseconds of lines in the same millisecond. It is not
+    # unique: without a point in time, whose implicit tiebreaker makes it so,
+    # search_after pages and cursors skip lines sorting equal to the last one.
+    LOG_SORT = [
+        "@timestamp",
+        {
+            "time_nsec": {
+                "unmapped_type": "long",
+                "missing": 0
+            }
+        },
+    ]
+    REVERSE_LOG_SORT = [
+        {
+            "@timestamp": "desc"
+        },
+        {
+            "time_nsec": {
+                "order": "desc",
+                "unmapped_type": "long",
+                "missing": 0
+            }
+        },
+    ]
+
+    elasticsearch_client = None
+    elasticsearch_lock = threading.Lock()
+    # Fetches next pages of iter_documents
+    prefetch_executor = concurrent.futures.ThreadPoolExecutor(max_workers=8)
+
+    def get_elasticsearch():
+        """Returns the Elasticsearch client shared by all threads. It keeps
+        a pool of connections to the cluster."""
+        global elasticsearch_client
+        with elasticsearch_lock:
+            if elasticsearch_client is None:
+                elasticsearch_client = Elasticsearch(
+                    config['elasticsearch'], maxsize=ELASTICSEARCH_MAXSIZE)
+            return elasticsearch_client
+
+    def get_indices(start_time=None, end_time=None):
+        """Returns the daily logstash indices of logs from start_time to
+        end_time, with a day of margin for time zones. All indices if
+        start_time is not known or there are too many days."""
+        if not isinstance(start_time, datetime.datetime):
+            return INDEX_PREFIX + "*"
+        if end_time is None:
+            end_time = datetime.datetime.utcnow()
+        start = (start_time - datetime.timedelta(days=1)).date()
+        end = (end_time + datetime.timedelta(days=1)).date()
+        days = (end - start).days + 1
+        if days <= 0 or days > MAX_INDEX_DAYS:
+            return INDEX_PREFIX + "*"
+        return ",".join(
+            INDEX_PREFIX +
+            (start + datetime.timedelta(days=i)).strftime("%Y.%m.%d")
+            for i in range(days))
+
+    def open_point_in_time(elasticsearch, index):
+        """Returns the id of a point in time of index, None if it is not
+        supported. Point in time is new in Elasticsearch 7.10, the client of
+        Elasticsearch 6 has no open_point_in_time."""
+        if not hasattr(elasticsearch, "open_point_in_time"):
+            return None
+        try:
+            return elasticsearch.open_point_in_time(
+                index=index,
+                keep_alive=POINT_IN_TIME_KEEP_ALIVE,
+                ignore_unavailable=True)["id"]
+        except Exception as e:
+            # Elasticsearch server before 7.10
+            logger.warning("Point in time is not available for %s: %s",
+                           index, e)
+            return None
+
+    def iter_documents(body, index, page_size=None, prefetch=True):
+        """Yields all documents of search body in its sort order, paging with
+        search_after in a point in time of index. The next page is fetched
+        while the current one is consumed if prefetch is True.
+
+        Without point in time support, pages are searched in index as is.
+        """
+        if page_size is None:
+            page_size = RAW_LOG_PAGE_SIZE
+        elasticsearch = get_elasticsearch()
+        pit_id = open_point_in_time(elasticsearch, index)
+
+        def search(pit_id, search_after):
+            request_json = dict(body, size=page_size)
+            if search_after is not None:
+                request_json["search_after"] = search_after
+            if pit_id is not None:
+                request_json["pit"] = {
+                    "id": pit_id,
+                    "keep_alive": POINT_IN_TIME_KEEP_ALIVE
+                }
+                return elasticsearch.search(body=request_json)
+            return elasticsearch.search(index=index,
+                                        body=request_json,
+                                        ignore_unavailable=True)
+
+        next_page = None
+        try:
+            response_json = search(pit_id, None)
+            while True:
+                # Point in time id may change between pages
+                pit_id = response_json.get("pit_id", pit_id)
+                documents = response_json["hits"]["hits"]
+                last_page = len(documents) < page_size
+                if not last_page:
+                    search_after = documents[-1]["sort"]
+                    if prefetch:
+                        next_page = prefetch_executor.submit(
+                            search, pit_id, search_after)
+
+                for document in documents:
+                    yield document
+
+                if last_page:
+                    break
+                if next_page is not None:
+                    response_json = next_page.result()
+                    next_page = None
+                else:
+                    response_json = search(pit_id, search_after)
+        finally:
+            if next_page is not None:
+                next_page.cancel()
+            if pit_id is not None:
+                try:
+                    elasticsearch.close_point_in_time(body={"id": pit_id})
+                except Exception:
+                    logger.warning("Failed to close point in time",
+                                   exc_info=True)
+
     def GetJobLog(jobId, cursor=None, size=None):
         try:
-            elasticsearch = Elasticsearch(config['elasticsearch'])
+            elasticsearch = get_elasticsearch()
 
             request_json = {
                 "query": {
@@ -163,15 +594,7 @@ elif config.get("logging") == 'elasticsearch':
                         "kubernetes.labels.jobId": jobId
                     }
                 },
-                "sort": [
-                    "@timestamp",
-                    {
-                        "time_nsec": {
-                            "unmapped_type": "long",
-                            "missing": 0
-                        }
-                    },
-                ],
+                "sort": LOG_SORT,
                 "_source": [
                     "docker.container_id", "kubernetes.pod_name", "stream",
                     "log"
@@ -207,50 +630,173 @@ elif config.get("logging") == 'elasticsearch':
                     jobId))
             return ({}, None)
 
-    def GetJobRawLog(jobId):
+    def iter_raw_log(jobId, cursor=None, start_time=None, end_time=None):
+        """Yields (cursor, log) of the lines of job, after cursor if given.
+        start_time and end_time, if given, narrow down the indices searched
+        to the days of the job."""
+        body = {
+            "query": {
+                "match_phrase": {
+                    "kubernetes.labels.jobId": jobId
+                }
+            },
+            "sort": LOG_SORT,
+            "_source": ["log"],
+        }
+        if cursor is not None:
+            search_after = TryParseCursor(cursor)
+            if search_after is not None:
+                body["search_after"] = search_after
+
+        for document in iter_documents(body,
+                                       get_indices(start_time, end_time)):
+            yield ('.'.join(str(i) for i in document["sort"]),
+                   document["_source"]["log"])
+
+    def GetJobRawLog(jobId, start_time=None, end_time=None):
+        """Yields log lines of a job. start_time and end_time, if given,
+        narrow down the indices searched to the days of the job."""
         try:
-            CHUNK_SIZE = 100
-            elasticsearch = Elasticsearch(config['elasticsearch'])
+            for (_, log) in iter_raw_log(jobId, start_time=start_time,
+                                         end_time=end_time):
+                yield log
 
+        except Exception:
+            logger.exception(
+                "Failed to request logs of job {} from elasticsearch".format(
+                    jobId))
+            return None
+            yield
+
+    def _search_filters(jobId, pods=None, start_time=None, end_time=None):
+        filters = [{"match_phrase": {"kubernetes.labels.jobId": jobId}}]
+        if pods:
+            filters.append({
+                "bool": {
+                    "should": [{
+                        "match_phrase": {
+                            "kubernetes.pod_name": pod
+                        }
+                    } for pod in sorted(pods)],
+                    "minimum_should_match": 1,
+                }
+            })
+        if start_time is not None or end_time is not None:
+            time_range = {}
+            if start_time is not None:
+                time_range["gte"] = start_time
+            if end_time is not None:
+                time_range["lte"] = end_time
+            filters.append({"range": {"@timestamp": time_range}})
+        return filters
+
+    def _add_context(elasticsearch, index, jobId, query, matches):
+        """Fills before and after of matches with lines of the same pod,
+        two searches per match in one request."""
+        body = []
+        for match in matches:
+            filters = _search_filters(jobId, pods=[match["pod"]])
+            for sort in (REVERSE_LOG_SORT, LOG_SORT):
+                body.append({"index": index, "ignore_unavailable": True})
+                body.append({
+                    "query": {
+                        "bool": {
+                            "filter": filters
+                        }
+                    },
+                    "sort": sort,
+                    "search_after": TryParseCursor(match["cursor"]),
+                    "size": query.context,
+                    "_source": ["log"],
+                })
+        responses = elasticsearch.msearch(body=body)["responses"]
+        for (i, match) in enumerate(matches):
+            (before, after) = responses[2 * i:2 * i + 2]
+            match["before"] = [
+                document["_source"]["log"].rstrip("\n")
+                for document in reversed(before["hits"]["hits"])
+            ]
+            match["after"] = [
+                document["_source"]["log"].rstrip("\n")
+                for document in after["hits"]["hits"]
+            ]
+
+    def SearchJobLog(jobId, query, cursor=None, job_time=None):
+        """Returns (matches, cursor) of LogQuery query in the log of job,
+        after cursor if given. None if the log can not be read.
+
+        Pods and time range are searched by Elasticsearch, so is pattern if
+        it is a literal, then matching whole words. Other patterns are
+        matched here over the lines of the pods and time range.
+        """
+        try:
+            filters = _search_filters(jobId, query.pods, query.start_time,
+                                      query.end_time)
+            literal = query.is_literal()
+            if literal:
+                filters.append({"match_phrase": {"log": query.pattern}})
             body = {
                 "query": {
-                    "match_phrase": {
-                        "kubernetes.labels.jobId": jobId
+                    "bool": {
+                        "filter": filters
                     }
                 },
-                "sort": [
-                    "@timestamp",
-                    {
-                        "time_nsec": {
-                            "unmapped_type": "long",
-                            "missing": 0
-                        }
-                    },
-                ],
-                "size": CHUNK_SIZE,
-                "_source": ["log"],
+                "sort": LOG_SORT,
+                "_source": ["kubernetes.pod_name", "@timestamp", "log"],
             }
+            if cursor is not None:
+                search_after = TryParseCursor(cursor)
+                if search_after is not None:
+                    body["search_after"] = search_after
+
+            index = get_indices(job_time)
+            if literal:
+                # Mostly matches, one more to know if there are more
+                documents = iter_documents(
+                    body,
+                    index,
+                    page_size=min(query.limit + 1, RAW_LOG_PAGE_SIZE),
+                    prefetch=False)
+            else:
+                documents = iter_documents(body, index)
 
-            while True:
-                response_json = elasticsearch.search(index="logstash-*", body=body)
-                documents = response_json["hits"]["hits"]
-
+            def records():
                 for document in documents:
-                    yield document["_source"]["log"]
-                else:
-                    break
-
-                body['search_after'] = documents[-1]["sort"]
+                    source = document["_source"]
+                    kubernetes = source.get("kubernetes") or {}
+                    yield ('.'.join(str(i) for i in document["sort"]),
+                           kubernetes.get("pod_name"),
+                           source.get("@timestamp"), source.get("log", ""))
 
+            try:
+                (matches, next_cursor) = query.filter(records(),
+                                                      context=not literal)
+            finally:
+                documents.close()
+
+            if literal and query.context > 0 and len(matches) > 0:
+                _add_context(get_elasticsearch(), index, jobId, query,
+                             matches)
+            return (matches, next_cursor)
         except Exception:
             logger.exception(
-                "Failed to request logs of job {} from elasticsearch".format(
+                "Failed to search logs of job {} in elasticsearch".format(
                     jobId))
             return None
-            yield
 
 else:
     logger.info('No log backend is configured')
 
     def GetJobLog(jobId, *args, **kwargs):
         return ({}, None)
+
+    def SearchJobLog(jobId, *args, **kwargs):
+        return None
+
+    def iter_raw_log(jobId, *args, **kwargs):
+        return None
+        yield
+
+    def GetJobRawLog(jobId, *args, **kwargs):
+        return None
+        yield
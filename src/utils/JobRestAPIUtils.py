@@ -16,6 +16,7 @@ import pytz
 import base64
 import re
 import logging
+import mysql.connector
 from cachetools import cached, TTLCache
 from threading import Lock
 
@@ -23,6 +24,7 @@ import requests
 
 from config import config
 from DataHandler import DataHandler, DataManager, GlobalDBHandler
+import cluster_status_store
 from authorization import ResourceType, Permission, AuthorizationManager, IdentityManager, ACLManager
 import authorization
 from job_op import KillOp, PauseOp, ResumeOp, ApproveOp
@@ -34,7 +36,9 @@ sys.path.append(
 from common import walk_json
 from job_params_util import make_job_params
 import JobLogUtils
+import job_log_range
 from resource_stat import Gpu, to_byte
+from cache import Cache
 
 DEFAULT_JOB_PRIORITY = 100
 USER_JOB_PRIORITY_RANGE = (100, 200)
@@ -55,10 +59,28 @@ VC = ResourceType.VC
 ADMIN = Permission.Admin
 COLLABORATOR = Permission.Collaborator
 USER = Permission.User
+
+# Fields returned by GetJobDetail without fields=
+JOB_DETAIL_FIELDS = [
+    "jobId", "familyToken", "isParent", "jobName", "userName", "vcName",
+    "jobStatus", "jobStatusDetail", "jobType", "jobDescriptionPath", "jobTime",
+    "endpoints", "jobParams", "errorMsg", "jobMeta", "log"
+]
+
 DEFAULT_EXPIRATION = 24 * 30 * 60
 vc_cache = TTLCache(maxsize=10240, ttl=DEFAULT_EXPIRATION)
 vc_cache_lock = Lock()
 
+# Read-through caches for SubmitJob. Updates through this process invalidate
+# them, updates through other processes show up after the TTL.
+SUBMIT_CACHE_TTL = 60
+vc_meta_cache = Cache("vc_meta", ttl=SUBMIT_CACHE_TTL, max_stale=0)
+public_key_cache = Cache("public_keys", ttl=SUBMIT_CACHE_TTL, max_stale=0)
+
+ADD_JOB_ERROR = "Cannot schedule job. Cannot add job into database."
+# Owner and VC of a job never change
+job_owner_cache = Cache("job_owner", maxsize=10240, ttl=24 * 3600)
+
 
 def is_cluster_admin(username):
     return AuthorizationManager.HasAccess(
@@ -186,16 +208,39 @@ def populate_job_resource(params):
         logger.exception("Failed to populate job resource", exc_info=True)
 
 
-def SubmitJob(jobParamsJsonStr):
-    ret = {}
+def get_vc_metadata(data_handler, vc_name):
+    """Returns metadata of VC through vc_meta_cache, must not be modified."""
+    def load():
+        vc_meta = walk_json(data_handler.GetVC(vc_name), "metadata")
+        return {} if vc_meta is None else json.loads(vc_meta)
 
-    jobParams = LoadJobParams(jobParamsJsonStr)
+    return vc_meta_cache.get(vc_name, load)
+
+
+def get_user_public_keys(username):
+    """Returns public keys of user through public_key_cache, must not be
+    modified."""
+    def load():
+        with GlobalDBHandler(config["global-mysql"]["hostname"],
+                             config["global-mysql"]["username"],
+                             config["global-mysql"]["password"]) as handler:
+            return handler.list_public_keys(username)
+
+    return public_key_cache.get(username, load)
+
+
+def prepare_job(jobParams, dataHandler):
+    """Validates jobParams and fills in defaults for submission.
+
+    Returns:
+        A tuple of (error, jobs_params, job_priorities). error is None if the
+        job can be submitted, in which case jobs_params and job_priorities
+        are to be passed to DataHandler.add_jobs.
+    """
     if "jobName" not in jobParams or len(jobParams["jobName"].strip()) == 0:
-        ret["error"] = "ERROR: Job name cannot be empty"
-        return ret
+        return "ERROR: Job name cannot be empty", None, None
     if "vcName" not in jobParams or len(jobParams["vcName"].strip()) == 0:
-        ret["error"] = "ERROR: VC name cannot be empty"
-        return ret
+        return "ERROR: VC name cannot be empty", None, None
     vc_name = jobParams["vcName"].strip()
     if jobParams.get("jobtrainingtype") == "PSDistJob":
         num_workers = None
@@ -205,8 +250,7 @@ def SubmitJob(jobParamsJsonStr):
             logger.exception("Parsing numpsworker in %s failed", jobParams)
 
         if num_workers is None or num_workers == 0:
-            ret["error"] = "ERROR: Invalid numpsworker value"
-            return ret
+            return "ERROR: Invalid numpsworker value", None, None
 
     if "userId" not in jobParams or len(jobParams["userId"].strip()) == 0:
         jobParams["userId"] = GetUser(jobParams["userName"])["uid"]
@@ -246,8 +290,7 @@ def SubmitJob(jobParamsJsonStr):
 
     if not AuthorizationManager.HasAccess(
             jobParams["userName"], ResourceType.VC, vc_name, Permission.User):
-        ret["error"] = "Access Denied!"
-        return ret
+        return "Access Denied!", None, None
 
     if "cmd" not in jobParams:
         jobParams["cmd"] = ""
@@ -255,17 +298,14 @@ def SubmitJob(jobParamsJsonStr):
     if "jobPath" in jobParams and len(jobParams["jobPath"].strip()) > 0:
         jobPath = jobParams["jobPath"]
         if ".." in jobParams["jobPath"]:
-            ret["error"] = "ERROR: '..' cannot be used in job directory"
-            return ret
+            return "ERROR: '..' cannot be used in job directory", None, None
 
         if "\\." in jobParams["jobPath"]:
-            ret["error"] = "ERROR: invalided job directory"
-            return ret
+            return "ERROR: invalided job directory", None, None
 
         if jobParams["jobPath"].startswith(
                 "/") or jobParams["jobPath"].startswith("\\"):
-            ret["error"] = "ERROR: job directory should not start with '/' or '\\' "
-            return ret
+            return "ERROR: job directory should not start with '/' or '\\' ", None, None
 
         if not jobParams["jobPath"].startswith(userName):
             jobParams["jobPath"] = os.path.join(userName, jobParams["jobPath"])
@@ -279,17 +319,14 @@ def SubmitJob(jobParamsJsonStr):
         jobParams["workPath"] = "."
 
     if ".." in jobParams["workPath"]:
-        ret["error"] = "ERROR: '..' cannot be used in work directory"
-        return ret
+        return "ERROR: '..' cannot be used in work directory", None, None
 
     if "\\." in jobParams["workPath"]:
-        ret["error"] = "ERROR: invalided work directory"
-        return ret
+        return "ERROR: invalided work directory", None, None
 
     if jobParams["workPath"].startswith(
             "/") or jobParams["workPath"].startswith("\\"):
-        ret["error"] = "ERROR: work directory should not start with '/' or '\\' "
-        return ret
+        return "ERROR: work directory should not start with '/' or '\\' ", None, None
 
     if not jobParams["workPath"].startswith(userName):
         jobParams["workPath"] = os.path.join(userName, jobParams["workPath"])
@@ -298,16 +335,13 @@ def SubmitJob(jobParamsJsonStr):
         jobParams["dataPath"] = "."
 
     if ".." in jobParams["dataPath"]:
-        ret["error"] = "ERROR: '..' cannot be used in data directory"
-        return ret
+        return "ERROR: '..' cannot be used in data directory", None, None
 
     if "\\." in jobParams["dataPath"]:
-        ret["error"] = "ERROR: invalided data directory"
-        return ret
+        return "ERROR: invalided data directory", None, None
 
     if jobParams["dataPath"][0] == "/" or jobParams["dataPath"][0] == "\\":
-        ret["error"] = "ERROR: data directory should not start with '/' or '\\' "
-        return ret
+        return "ERROR: data directory should not start with '/' or '\\' ", None, None
 
     jobParams["dataPath"] = jobParams["dataPath"].replace("\\", "/")
     jobParams["workPath"] = jobParams["workPath"].replace("\\", "/")
@@ -319,14 +353,12 @@ def SubmitJob(jobParamsJsonStr):
     jobParams["jobPath"] = os.path.realpath(
         os.path.join("/", jobParams["jobPath"]))[1:]
 
-    dataHandler = DataHandler()
-
-    vc_meta = walk_json(dataHandler.GetVC(vc_name), "metadata")
-    vc_meta = {} if vc_meta is None else json.loads(vc_meta)
+    vc_meta = get_vc_metadata(dataHandler, vc_name)
     max_time = walk_json(vc_meta, "admin", "job_max_time_second")
     if max_time is not None:
         jobParams["maxTimeSec"] = max_time
 
+    jobs_params = []
     if "logDir" in jobParams and len(jobParams["logDir"].strip()) > 0:
         tensorboardParams = jobParams.copy()
 
@@ -354,47 +386,132 @@ def SubmitJob(jobParamsJsonStr):
         tensorboardParams["resourcegpu"] = 0
 
         tensorboardParams["interactivePort"] = "6006"
+        jobs_params.append(tensorboardParams)
+
+    public_keys = get_user_public_keys(jobParams["userName"])
+    if len(public_keys) > 0:
+        user_submitted = jobParams.get("ssh_public_keys", [])
+        user_submitted.extend([obj["public_key"] for obj in public_keys])
+        jobParams["ssh_public_keys"] = user_submitted
+    jobs_params.append(jobParams)
+
+    job_priorities = None
+    if "jobPriority" in jobParams:
+        priority = DEFAULT_JOB_PRIORITY
+        try:
+            priority = int(jobParams["jobPriority"])
+        except Exception as e:
+            pass
 
-        if "error" not in ret:
-            if not dataHandler.AddJob(tensorboardParams):
-                ret["error"] = "Cannot schedule tensorboard job."
+        permission = Permission.User
+        if AuthorizationManager.HasAccess(jobParams["userName"],
+                                          ResourceType.VC, vc_name,
+                                          Permission.Admin):
+            permission = Permission.Admin
 
-    with GlobalDBHandler(config["global-mysql"]["hostname"],
-                         config["global-mysql"]["username"],
-                         config["global-mysql"]["password"]) as global_handler:
-        public_keys = global_handler.list_public_keys(jobParams["userName"])
-        if len(public_keys) > 0:
-            user_submitted = jobParams.get("ssh_public_keys", [])
-            user_submitted.extend([obj["public_key"] for obj in public_keys])
-            jobParams["ssh_public_keys"] = user_submitted
-
-    if "error" not in ret:
-        if dataHandler.AddJob(jobParams):
-            ret["jobId"] = jobParams["jobId"]
-            if "jobPriority" in jobParams:
-                priority = DEFAULT_JOB_PRIORITY
-                try:
-                    priority = int(jobParams["jobPriority"])
-                except Exception as e:
-                    pass
+        priority = adjust_job_priority(priority, permission)
+        job_priorities = {jobParams["jobId"]: priority}
 
-                permission = Permission.User
-                if AuthorizationManager.HasAccess(jobParams["userName"],
-                                                  ResourceType.VC, vc_name,
-                                                  Permission.Admin):
-                    permission = Permission.Admin
+    return None, jobs_params, job_priorities
 
-                priority = adjust_job_priority(priority, permission)
 
-                job_priorities = {jobParams["jobId"]: priority}
-                dataHandler.update_job_priority(job_priorities)
-        else:
-            ret["error"] = "Cannot schedule job. Cannot add job into database."
+def SubmitJob(jobParamsJsonStr):
+    ret = {}
 
-    dataHandler.Close()
+    jobParams = LoadJobParams(jobParamsJsonStr)
+    dataHandler = DataHandler()
+    try:
+        error, jobs_params, job_priorities = prepare_job(
+            jobParams, dataHandler)
+        if error is not None:
+            ret["error"] = error
+        else:
+            # Tensorboard job, job and its priority are added all or nothing
+            ret = add_job(dataHandler, jobParams["jobId"], jobs_params,
+                          job_priorities)
+    finally:
+        dataHandler.Close()
     return ret
 
 
+def add_job(dataHandler, job_id, jobs_params, job_priorities):
+    """Adds jobs_params of one job, returns {"jobId"} or {"error"}."""
+    try:
+        if dataHandler.add_jobs(jobs_params, job_priorities):
+            return {"jobId": job_id}
+    except mysql.connector.errors.IntegrityError:
+        return {"error": "ERROR: Job %s already exists" % job_id}
+    return {"error": ADD_JOB_ERROR}
+
+
+def SubmitJobs(job_params_list):
+    """Submits a list of jobs, e.g. the jobs of a hyperparameter sweep.
+
+    Jobs are validated one by one, lookups shared by the jobs are cached.
+    Valid jobs are then added into database in one transaction. If a jobId
+    already exists in database, jobs are added one by one instead, so that
+    only the jobs with existing jobIds fail.
+
+    Args:
+        job_params_list: A list of job params dicts.
+
+    Returns:
+        A list of {"jobId": jobId} or {"error": error}, one per job in
+        job_params_list.
+    """
+    results = [None] * len(job_params_list)
+    all_jobs_params = []
+    all_job_priorities = {}
+    # (index, jobId, jobs_params, job_priorities) of valid jobs
+    submitted = []
+    job_ids = set()
+
+    dataHandler = DataHandler()
+    try:
+        for i, jobParams in enumerate(job_params_list):
+            if not isinstance(jobParams, dict):
+                results[i] = {"error": "ERROR: Job params must be an object"}
+                continue
+            jobParams = copy.deepcopy(jobParams)
+            try:
+                error, jobs_params, job_priorities = prepare_job(
+                    jobParams, dataHandler)
+            except Exception:
+                logger.exception("Failed to prepare job %s", jobParams)
+                error = "ERROR: Invalid job params"
+            if error is not None:
+                results[i] = {"error": error}
+                continue
+            duplicates = [
+                p["jobId"] for p in jobs_params if p["jobId"] in job_ids
+            ]
+            if duplicates:
+                results[i] = {
+                    "error": "ERROR: Duplicate jobId %s" % duplicates[0]
+                }
+                continue
+            job_ids.update(p["jobId"] for p in jobs_params)
+            all_jobs_params.extend(jobs_params)
+            all_job_priorities.update(job_priorities or {})
+            submitted.append(
+                (i, jobParams["jobId"], jobs_params, job_priorities))
+
+        if submitted:
+            try:
+                added = dataHandler.add_jobs(all_jobs_params,
+                                             all_job_priorities)
+                for i, job_id, _, _ in submitted:
+                    results[i] = {"jobId": job_id} if added \
+                        else {"error": ADD_JOB_ERROR}
+            except mysql.connector.errors.IntegrityError:
+                for i, job_id, jobs_params, job_priorities in submitted:
+                    results[i] = add_job(dataHandler, job_id, jobs_params,
+                                         job_priorities)
+    finally:
+        dataHandler.Close()
+    return results
+
+
 def get_job_list(username, vc_name, job_owner, num=20):
     try:
         with DataHandler() as data_handler:
@@ -415,16 +532,16 @@ def get_job_list(username, vc_name, job_owner, num=20):
     return jobs
 
 
-def get_job_list_v2(username, vc_name, job_owner, num=None):
+def get_job_list_v2(username, vc_name, job_owner, num=None, fields=None):
     try:
         with DataHandler() as data_handler:
             if job_owner == "all" and \
                     has_access(username, VC, vc_name, COLLABORATOR):
                 jobs = data_handler.get_union_job_list_v2(
-                    "all", vc_name, num, ACTIVE_STATUS)
+                    "all", vc_name, num, ACTIVE_STATUS, fields)
             else:
                 jobs = data_handler.get_union_job_list_v2(
-                    username, vc_name, num, ACTIVE_STATUS)
+                    username, vc_name, num, ACTIVE_STATUS, fields)
     except:
         logger.exception("Exception in getting job list v2 for username %s",
                          username)
@@ -433,6 +550,71 @@ def get_job_list_v2(username, vc_name, job_owner, num=None):
     return jobs
 
 
+def get_job_list_version(username, vc_name, job_owner):
+    """Returns a version of the jobs listed by get_job_list_v2."""
+    try:
+        with DataHandler() as data_handler:
+            if job_owner == "all" and \
+                    has_access(username, VC, vc_name, COLLABORATOR):
+                return data_handler.get_job_watermark("all", vc_name)
+            return data_handler.get_job_watermark(username, vc_name)
+    except:
+        logger.exception("Exception in getting job list version for %s",
+                         username)
+        return None
+
+
+def get_job_version(job_id):
+    """Returns a version of the job returned by GetJobDetailV2."""
+    try:
+        with DataHandler() as data_handler:
+            return data_handler.get_job_watermark(job_id=job_id)
+    except:
+        logger.exception("Exception in getting job version for %s", job_id)
+        return None
+
+
+def get_job_owner(job_id):
+    """Returns (userName, vcName) of job, raises KeyError if not found."""
+    def load():
+        with DataHandler() as data_handler:
+            job = data_handler.GetJobTextFields(job_id, ["userName", "vcName"])
+        if job is None:
+            raise KeyError(job_id)
+        return job["userName"], job["vcName"]
+
+    return job_owner_cache.get(job_id, load)
+
+
+def get_job_event_filter(username, vc_name, job_owner, job_id=None):
+    """Returns a function telling whether a job event can be sent to username.
+
+    Like get_job_list_v2 and GetJobDetailV2, users see events of their own
+    jobs, and of other jobs in VCs they are collaborators of if job_owner is
+    "all" or job_id is given. Events published without userName and vcName
+    get them filled in.
+    """
+    def match(event):
+        if job_id is not None and event["jobId"] != job_id:
+            return False
+        if "userName" not in event or "vcName" not in event:
+            try:
+                event["userName"], event["vcName"] = \
+                    get_job_owner(event["jobId"])
+            except Exception:
+                # Logged by the cache
+                return False
+        if vc_name != "all" and event["vcName"] != vc_name:
+            return False
+        if event["userName"] == username:
+            return True
+        if job_owner != "all" and job_id is None:
+            return False
+        return has_access(username, VC, event["vcName"], COLLABORATOR)
+
+    return match
+
+
 def get_active_job_list():
     try:
         with DataHandler() as data_handler:
@@ -707,26 +889,25 @@ _get_job_log_legacy = config.get('__get_job_log_legacy',
 _get_job_log_fallback = config.get('__get_job_log_fallback', False)
 
 
-def GetJobDetail(userName, jobId):
+def GetJobDetail(userName, jobId, fields=None):
     job = None
+    if fields is None:
+        fields = JOB_DETAIL_FIELDS
+    # jobDescription is never returned
+    fields = [f for f in fields if f != "jobDescription"]
     dataHandler = DataHandler()
-    jobs = dataHandler.GetJob(jobId=jobId)
+    jobs = dataHandler.GetJob(fields=fields + ["userName", "vcName"],
+                              jobId=jobId)
     if len(jobs) == 1:
         if jobs[0]["userName"] == userName or AuthorizationManager.HasAccess(
                 userName, ResourceType.VC, jobs[0]["vcName"],
                 Permission.Collaborator):
             job = jobs[0]
-            job["log"] = ""
-            if "jobDescription" in job:
-                job.pop("jobDescription", None)
-            if _extract_job_log_legacy:
+            if "log" in fields:
+                job["log"] = ""
+            if "log" in fields and _extract_job_log_legacy:
                 try:
-                    log = dataHandler.GetJobTextField(jobId, "jobLog")
-                    try:
-                        if isBase64(log):
-                            log = base64decode(log)
-                    except Exception:
-                        pass
+                    log = dataHandler.get_job_log(jobId)
                     if log is not None:
                         job["log"] = log
                 except Exception:
@@ -735,12 +916,12 @@ def GetJobDetail(userName, jobId):
     return job
 
 
-def GetJobDetailV2(userName, jobId):
+def GetJobDetailV2(userName, jobId, fields=None):
     job = {}
     dataHandler = None
     try:
         dataHandler = DataHandler()
-        jobs = dataHandler.GetJobV2(jobId)
+        jobs = dataHandler.GetJobV2(jobId, fields)
         if len(jobs) == 1:
             if jobs[0]["userName"] == userName or AuthorizationManager.HasAccess(
                     userName, ResourceType.VC, jobs[0]["vcName"],
@@ -767,19 +948,15 @@ def GetJobStatus(jobId):
 
 def GetJobLog(userName, jobId, cursor=None, size=100):
     dataHandler = DataHandler()
-    jobs = dataHandler.GetJob(jobId=jobId)
+    jobs = dataHandler.GetJob(fields=["userName", "vcName"],
+                              jobId=jobId)
     if len(jobs) == 1:
         if jobs[0]["userName"] == userName or AuthorizationManager.HasAccess(
                 userName, ResourceType.VC, jobs[0]["vcName"],
                 Permission.Collaborator):
             if _get_job_log_legacy:
                 try:
-                    log = dataHandler.GetJobTextField(jobId, "jobLog")
-                    try:
-                        if isBase64(log):
-                            log = base64decode(log)
-                    except Exception:
-                        pass
+                    log = dataHandler.get_job_log(jobId)
                     if log is not None:
                         return {
                             "log": log,
@@ -793,12 +970,7 @@ def GetJobLog(userName, jobId, cursor=None, size=100):
                 if _get_job_log_fallback:
                     if pod_logs is None or len(pod_logs.keys()) == 0:
                         try:
-                            log = dataHandler.GetJobTextField(jobId, "jobLog")
-                            try:
-                                if isBase64(log):
-                                    log = base64decode(log)
-                            except Exception:
-                                pass
+                            log = dataHandler.get_job_log(jobId)
                             if log is not None:
                                 return {
                                     "log": log,
@@ -824,24 +996,111 @@ def GetJobLog(userName, jobId, cursor=None, size=100):
 
 
 def GetJobRawLog(userName, jobId):
+    """Returns the job_log_range.RawLog of job, byte ranges of it can be read
+    once the job has finished, or an HTTP status code for errors."""
     dataHandler = DataHandler()
-    jobs = dataHandler.GetJob(jobId=jobId)
+    jobs = dataHandler.GetJob(
+        fields=["userName", "vcName", "jobTime", "jobStatus"], jobId=jobId)
+    dataHandler.Close()
     if len(jobs) == 1:
         if jobs[0]["userName"] == userName or AuthorizationManager.HasAccess(
                 userName, ResourceType.VC, jobs[0]["vcName"],
                 Permission.Collaborator):
-            return JobLogUtils.GetJobRawLog(jobId)
+            job_time = jobs[0]["jobTime"]
+
+            def open_log(cursor):
+                # Logs are written after the job is submitted
+                return JobLogUtils.iter_raw_log(jobId,
+                                                cursor=cursor,
+                                                start_time=job_time)
+
+            return job_log_range.open_raw_log(
+                jobId, open_log,
+                jobs[0]["jobStatus"] in job_log_range.FINISHED_STATUSES)
         else:
             return 403
     else:
         return 404
 
 
+def search_job_log_text(text, query, cursor=None):
+    """Returns (matches, cursor) of query in the log tail text, after
+    cursor, a line number, if given."""
+    try:
+        start = int(cursor) if cursor is not None else 0
+    except ValueError:
+        start = 0
+    lines = text.splitlines()[start:]
+    records = ((str(start + i), None, None, line)
+               for (i, line) in enumerate(lines, 1))
+    return query.filter(records)
+
+
+def SearchJobLog(userName,
+                 jobId,
+                 pattern,
+                 pods=None,
+                 start_time=None,
+                 end_time=None,
+                 context=0,
+                 limit=None,
+                 ignore_case=False,
+                 cursor=None):
+    """Returns {"matches": [...], "cursor": ...} of log lines of job matching
+    pattern, or an HTTP status code for errors."""
+    try:
+        query = JobLogUtils.LogQuery(pattern,
+                                     pods=pods,
+                                     start_time=start_time,
+                                     end_time=end_time,
+                                     context=context,
+                                     limit=limit,
+                                     ignore_case=ignore_case)
+    except ValueError:
+        logger.info("Bad log query of job %s", jobId, exc_info=True)
+        return 400
+
+    dataHandler = DataHandler()
+    try:
+        jobs = dataHandler.GetJob(fields=["userName", "vcName", "jobTime"],
+                                  jobId=jobId)
+        if len(jobs) != 1:
+            return 404
+        if jobs[0]["userName"] != userName and not AuthorizationManager.HasAccess(
+                userName, ResourceType.VC, jobs[0]["vcName"],
+                Permission.Collaborator):
+            return 403
+
+        result = None
+        if _get_job_log_enabled and not _get_job_log_legacy:
+            result = JobLogUtils.SearchJobLog(jobId,
+                                              query,
+                                              cursor=cursor,
+                                              job_time=jobs[0]["jobTime"])
+        else:
+            text = dataHandler.get_job_log(jobId)
+            result = search_job_log_text(text or "", query, cursor)
+    finally:
+        dataHandler.Close()
+
+    if result is None:
+        return 503
+    (matches, cursor) = result
+    return {
+        "matches": matches,
+        "cursor": cursor,
+    }
+
+
 def GetClusterStatus():
-    cluster_status, last_update_time = DataManager.GetClusterStatus()
+    cluster_status, last_update_time = cluster_status_store.get_cluster_status()
     return cluster_status, last_update_time
 
 
+def get_cluster_status_version():
+    return cluster_status_store.get_cluster_status_version()
+
+
 def AddUser(username, uid, gid, groups, public_key, private_key):
     ret = IdentityManager.UpdateIdentityInfo(username, uid, gid, groups,
                                              public_key, private_key)
@@ -935,6 +1194,7 @@ def AddVC(userName, vcName, quota, metadata):
             cacheItem = {"vcName": vcName, "quota": quota, "metadata": metadata}
             with vc_cache_lock:
                 vc_cache[vcName] = cacheItem
+            vc_meta_cache.delete(vcName)
     else:
         ret = "Access Denied!"
     dataHandler.Close()
@@ -975,8 +1235,7 @@ def ListVCs(userName):
 def get_vc(username, vc_name):
     ret = None
     try:
-        with DataHandler() as data_handler:
-            cluster_status, _ = data_handler.GetClusterStatus()
+        cluster_status, _ = cluster_status_store.get_cluster_status()
 
         vc_statuses = cluster_status.get("vc_statuses", {})
         vc_list = get_vc_list()
@@ -1093,6 +1352,7 @@ def patch_vc_meta(username, vc_name, vc_meta):
                                 username, vc_name, json.dumps(origin),
                                 json.dumps(meta))
                     data_handler.UpdateVCMeta(vc_name, json.dumps(meta))
+                    vc_meta_cache.delete(vc_name)
                     return {"error": None}, 200
         else:
             return {
@@ -1434,8 +1694,7 @@ def get_vc_simplified(vc_status):
 def get_vc_v2(username, vc_name):
     vc_status = None
     try:
-        with DataHandler() as data_handler:
-            cluster_status, _ = data_handler.GetClusterStatus()
+        cluster_status, _ = cluster_status_store.get_cluster_status()
 
         vc_statuses = cluster_status.get("vc_statuses", {})
         vc_list = get_vc_list()
@@ -1443,7 +1702,7 @@ def get_vc_v2(username, vc_name):
         for vc in vc_list:
             if vc["vcName"] == vc_name and \
                     has_access(username, VC, vc_name, USER):
-                vc_status = vc_statuses.get(vc_name, {})
+                vc_status = dict(vc_statuses.get(vc_name, {}))
                 vc_status["vc_name"] = vc_name
                 vc_status["node_status"] = cluster_status.get("node_status")
                 break
@@ -1477,6 +1736,7 @@ def add_public_key(username, key_title, public_key):
                          config["global-mysql"]["password"]) as handler:
         try:
             key_id = handler.add_public_key(username, key_title, public_key)
+            public_key_cache.delete(username)
             return {"id": key_id}, 200
         except Exception as e:
             logger.exception("failed to add_public_key %s %s", username,
@@ -1499,6 +1759,7 @@ def delete_public_key(username, key_id):
                 return {"error": "you are not the owner of this key"}, 403
 
             handler.delete_public_key(key_id)
+            public_key_cache.delete(username)
 
             return {"error": None}, 200
         except Exception as e:
@@ -1515,6 +1776,7 @@ def DeleteVC(userName, vcName):
         if ret:
             with vc_cache_lock:
                 vc_cache.pop(vcName, None)
+            vc_meta_cache.delete(vcName)
     else:
         ret = "Access Denied!"
     dataHandler.Close()
@@ -1530,6 +1792,7 @@ def UpdateVC(userName, vcName, quota, metadata):
             cacheItem = {"vcName": vcName, "quota": quota, "metadata": metadata}
             with vc_cache_lock:
                 vc_cache[vcName] = cacheItem
+            vc_meta_cache.delete(vcName)
     else:
         ret = "Access Denied!"
     dataHandler.Close()
@@ -1826,7 +2089,7 @@ def UpdateEndpoints(userName, jobId, requested_endpoints, interactive_ports):
                 interactive_limit = int(interactive_limit)
                 sku = job_params["sku"]
 
-                status, _ = dataHandler.GetClusterStatus()
+                status, _ = cluster_status_store.get_cluster_status()
                 vc_status = walk_json(status, "vc_statuses", job["vcName"])
                 required = Gpu({sku: gpu_request})
                 interactive_used = Gpu(
@@ -4,11 +4,16 @@ import json
 import base64
 import logging
 import functools
+import threading
 import timeit
 
 import mysql.connector
+import mysql.connector.pooling
 from prometheus_client import Histogram
 from vc_quota import vc_value_str
+import job_events
+import request_profile
+from job_log_tail import compress_job_log, decompress_job_log, decode_job_log
 
 from config import config, global_vars
 
@@ -28,12 +33,152 @@ db_connect_histogram = Histogram("db_connect_latency_seconds",
                                  labelnames=("db_name",))
 
 
+# Pooled connections per process, 0 to disable pooling, "pool_size" of mysql
+# in config.yaml. By default a process gets one pooled connection per request
+# thread under mod_wsgi, and DEFAULT_POOL_SIZE otherwise. Requests never wait
+# for the pool, connections beyond the pool size are opened and closed on
+# demand as without pooling.
+DEFAULT_POOL_SIZE = 2
+
+# Rows per multi-row INSERT, keeps statements well below max_allowed_packet
+INSERT_BATCH_SIZE = 100
+
+
+def project_columns(columns, fields, required=()):
+    """Returns the columns to select for the requested fields.
+
+    Args:
+        columns: All columns that can be selected, in select order.
+        fields: Requested fields, None for all columns. Fields that are not
+            in columns are ignored.
+        required: Columns always selected, e.g. for access checks.
+
+    Returns:
+        A list of columns in the order of columns.
+    """
+    if fields is None:
+        return list(columns)
+    fields = set(fields)
+    return [c for c in columns if c in fields or c in required]
+
+# Columns of jobs table returned by GetJob, GetJobV2 and get_union_job_list_v2
+JOB_COLUMNS = ("jobId", "familyToken", "isParent", "jobName", "userName",
+               "vcName", "jobStatus", "jobStatusDetail", "jobType",
+               "jobDescriptionPath", "jobDescription", "jobTime", "endpoints",
+               "jobParams", "errorMsg", "jobMeta")
+JOB_V2_COLUMNS = ("jobId", "jobName", "userName", "vcName", "jobStatus",
+                  "jobStatusDetail", "jobType", "jobTime", "jobParams",
+                  "insight", "repairMessage")
+JOB_LIST_V2_COLUMNS = ("jobId", "jobName", "userName", "vcName", "jobStatus",
+                       "jobStatusDetail", "jobType", "jobTime", "jobParams",
+                       "priority")
+# Columns holding base64 encoded JSON, decoded by GetJobV2
+ENCODED_JSON_COLUMNS = ("jobStatusDetail", "jobParams", "insight",
+                        "repairMessage")
+
+pools = {}
+pools_lock = threading.Lock()
+
+
+def get_pool_size():
+    pool_size = config["mysql"].get("pool_size")
+    if pool_size is not None:
+        return int(pool_size)
+    try:
+        import mod_wsgi
+        return min(int(mod_wsgi.threads_per_process),
+                   mysql.connector.pooling.CNX_POOL_MAXSIZE)
+    except (ImportError, AttributeError):
+        return DEFAULT_POOL_SIZE
+
+
+def connect(database, user, password, host):
+    """Returns a connection to database, from the process-wide pool of the
+    database if pooling is enabled and a pooled connection is available.
+
+    Closing a pooled connection returns it to the pool.
+    """
+    pool_size = get_pool_size()
+    if pool_size > 0:
+        try:
+            with pools_lock:
+                pool = pools.get(database)
+                if pool is None:
+                    pool = mysql.connector.pooling.MySQLConnectionPool(
+                        pool_name=database,
+                        pool_size=pool_size,
+                        user=user,
+                        password=password,
+                        host=host,
+                        database=database)
+                    pools[database] = pool
+            conn = pool.get_connection()
+            request_profile.count("db_connects")
+            return conn
+        except mysql.connector.errors.PoolError:
+            logger.debug("connection pool of %s exhausted", database)
+        except Exception:
+            logger.warning("failed to get pooled connection to %s",
+                           database,
+                           exc_info=True)
+    request_profile.count("db_connects")
+    request_profile.count("db_new_connections")
+    return mysql.connector.connect(user=user,
+                                   password=password,
+                                   host=host,
+                                   database=database)
+
+
+class ProfiledCursor(object):
+    """Cursor counting fetched rows in the profile of the current request."""
+    def __init__(self, cursor, profile):
+        self.cursor = cursor
+        self.profile = profile
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+    def __iter__(self):
+        rows = 0
+        try:
+            for row in self.cursor:
+                rows += 1
+                yield row
+        finally:
+            self.profile.count("db_rows", rows)
+
+    def fetchone(self):
+        row = self.cursor.fetchone()
+        if row is not None:
+            self.profile.count("db_rows")
+        return row
+
+    def fetchall(self):
+        rows = self.cursor.fetchall()
+        self.profile.count("db_rows", len(rows))
+        return rows
+
+
+class ProfiledConnection(object):
+    def __init__(self, conn, profile):
+        self.conn = conn
+        self.profile = profile
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+    def cursor(self, *args, **kwargs):
+        return ProfiledCursor(self.conn.cursor(*args, **kwargs), self.profile)
+
+
 def record(fn):
     @functools.wraps(fn)
     def wrapped(*args, **kwargs):
         start = timeit.default_timer()
+        request_profile.count("datahandler_calls")
         try:
-            return fn(*args, **kwargs)
+            with request_profile.timer("db"):
+                return fn(*args, **kwargs)
         finally:
             elapsed = timeit.default_timer() - start
             data_handler_fn_histogram.labels(fn.__name__).observe(elapsed)
@@ -137,20 +282,23 @@ class DataHandler(object):
         self.jobtablename = "jobs"
         self.identitytablename = "identity"
         self.acltablename = "acl"
+        self.authversiontablename = "authversion"
         self.vctablename = "vc"
         self.storagetablename = "storage"
         self.clusterstatustablename = "clusterstatus"
         self.templatetablename = "templates"
         self.allowlisttablename = "allowlist"
+        self.joblogtablename = "joblogs"
         server = config["mysql"]["hostname"]
         username = config["mysql"]["username"]
         password = config["mysql"]["password"]
 
-        with db_connect_histogram.labels(self.database).time():
-            self.conn = mysql.connector.connect(user=username,
-                                                password=password,
-                                                host=server,
-                                                database=self.database)
+        with db_connect_histogram.labels(self.database).time(), \
+                request_profile.timer("db_connect"):
+            self.conn = connect(self.database, username, password, server)
+        profile = request_profile.current()
+        if profile is not None:
+            self.conn = ProfiledConnection(self.conn, profile)
 
     def __enter__(self):
         return self
@@ -501,6 +649,82 @@ class DataHandler(object):
         cursor.close()
         return ret
 
+    @record
+    def load_auth_tables(self):
+        """Reads acl and identity tables for AuthorizationIndex.
+
+        Tables are read in one transaction, so that they are consistent with
+        the returned version. Exceptions are raised to the caller.
+
+        Returns:
+            A tuple of (version, acl, identity_groups), where acl is a list
+            of access control entries as in GetAcl and identity_groups is a
+            dict of identityName to its list of group ids.
+        """
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute("SELECT `version` FROM `%s` WHERE `id` = 1" %
+                           self.authversiontablename)
+            version = None
+            for (version,) in cursor:
+                pass
+
+            cursor.execute(
+                "SELECT `identityName`,`identityId`,`resource`,`permissions`,`isDeny` FROM `%s`"
+                % self.acltablename)
+            acl = []
+            for (identityName, identityId, resource, permissions,
+                 isDeny) in cursor:
+                acl.append({
+                    "identityName": identityName,
+                    "identityId": identityId,
+                    "resource": resource,
+                    "permissions": permissions,
+                    "isDeny": isDeny,
+                })
+
+            cursor.execute("SELECT `identityName`,`groups` FROM `%s`" %
+                           self.identitytablename)
+            identity_groups = {}
+            for (identity_name, groups) in cursor:
+                identity_groups[identity_name] = json.loads(groups)
+        finally:
+            self.conn.commit()
+            cursor.close()
+        return version, acl, identity_groups
+
+    @record
+    def get_auth_version(self):
+        """Returns the version of acl and identity tables, None if it is not
+        tracked, i.e. authversion table is not created by init_db.py."""
+        cursor = self.conn.cursor()
+        query = "SELECT `version` FROM `%s` WHERE `id` = 1" % (
+            self.authversiontablename)
+        ret = None
+        try:
+            cursor.execute(query)
+            for (version,) in cursor:
+                ret = version
+        except Exception as e:
+            logger.warning("failed to get auth version. Ex: %s", e)
+        self.conn.commit()
+        cursor.close()
+        return ret
+
+    @record
+    def bump_auth_version(self):
+        try:
+            cursor = self.conn.cursor()
+            sql = "UPDATE `%s` SET `version` = `version` + 1 WHERE `id` = 1" % (
+                self.authversiontablename)
+            cursor.execute(sql)
+            self.conn.commit()
+            cursor.close()
+            return True
+        except Exception as e:
+            logger.warning("failed to bump auth version. Ex: %s", e)
+            return False
+
     @record
     def GetResourceAcl(self, resource):
         cursor = self.conn.cursor()
@@ -524,23 +748,113 @@ class DataHandler(object):
         cursor.close()
         return ret
 
+    def insert_jobs(self, cursor, jobs_params):
+        """Inserts jobs with multi-row INSERTs of up to INSERT_BATCH_SIZE
+        rows each."""
+        columns = "(jobId, familyToken, isParent, jobName, userName, vcName, jobType,jobParams )"
+        placeholders = "(%s,%s,%s,%s,%s,%s,%s,%s)"
+        for i in range(0, len(jobs_params), INSERT_BATCH_SIZE):
+            batch = jobs_params[i:i + INSERT_BATCH_SIZE]
+            sql = "INSERT INTO `" + self.jobtablename + "` " + columns + \
+                " VALUES " + ",".join([placeholders] * len(batch))
+            params = []
+            for jobParams in batch:
+                jobParam = base64encode(json.dumps(jobParams))
+                params.extend([
+                    jobParams["jobId"], jobParams["familyToken"],
+                    jobParams["isParent"], jobParams["jobName"],
+                    jobParams["userName"], jobParams["vcName"],
+                    jobParams["jobType"], jobParam
+                ])
+            cursor.execute(sql, params)
+
+    def update_job_column(self, cursor, column, values):
+        """Sets column of jobs to values, jobId -> value, with UPDATEs of up
+        to INSERT_BATCH_SIZE jobs each."""
+        items = list(values.items())
+        for i in range(0, len(items), INSERT_BATCH_SIZE):
+            batch = items[i:i + INSERT_BATCH_SIZE]
+            sql = "UPDATE `" + self.jobtablename + \
+                "` SET `" + column + "` = CASE jobId " + \
+                " ".join(["WHEN %s THEN %s"] * len(batch)) + \
+                " END WHERE jobId IN (" + ",".join(["%s"] * len(batch)) + ")"
+            params = []
+            for job_id, value in batch:
+                params.extend([job_id, value])
+            params.extend([job_id for job_id, _ in batch])
+            cursor.execute(sql, params)
+
+    def update_job_priorities(self, cursor, job_priorities):
+        """Sets priorities of jobs, jobId -> priority."""
+        self.update_job_column(
+            cursor, "priority", {
+                job_id: int(priority)
+                for job_id, priority in job_priorities.items()
+            })
+
+    def publish_new_job_event(self, jobParams):
+        job_events.publish_job_event(
+            job_events.new_status_event(jobParams["jobId"],
+                                        jobParams["userName"],
+                                        jobParams["vcName"], "unapproved"))
+
     @record
     def AddJob(self, jobParams):
         try:
-            sql = "INSERT INTO `" + self.jobtablename + "` (jobId, familyToken, isParent, jobName, userName, vcName, jobType,jobParams ) VALUES (%s,%s,%s,%s,%s,%s,%s,%s)"
             cursor = self.conn.cursor()
-            jobParam = base64encode(json.dumps(jobParams))
-            cursor.execute(sql, (jobParams["jobId"], jobParams["familyToken"],
-                                 jobParams["isParent"], jobParams["jobName"],
-                                 jobParams["userName"], jobParams["vcName"],
-                                 jobParams["jobType"], jobParam))
+            self.insert_jobs(cursor, [jobParams])
             self.conn.commit()
             cursor.close()
+            self.publish_new_job_event(jobParams)
             return True
         except Exception as e:
             logger.exception('Exception: %s', str(e))
             return False
 
+    @record
+    def add_jobs(self, jobs_params, job_priorities=None):
+        """Adds jobs and sets their priorities in one transaction.
+
+        Args:
+            jobs_params: A list of job params
+            job_priorities: A dict of jobId to priority, or None
+
+        Returns:
+            True if all jobs are added, False if none is added.
+
+        Raises:
+            mysql.connector.errors.IntegrityError: If a jobId already exists,
+                none is added.
+        """
+        cursor = None
+        try:
+            cursor = self.conn.cursor()
+            self.insert_jobs(cursor, jobs_params)
+            if job_priorities:
+                self.update_job_priorities(cursor, job_priorities)
+            self.conn.commit()
+        except Exception as e:
+            if isinstance(e, mysql.connector.errors.IntegrityError):
+                logger.warning("Duplicate jobId in jobs %s: %s",
+                               [p.get("jobId") for p in jobs_params], e)
+            else:
+                logger.exception("Exception in adding jobs %s",
+                                 [p.get("jobId") for p in jobs_params])
+            try:
+                self.conn.rollback()
+            except:
+                logger.exception("Exception in rolling back")
+            if isinstance(e, mysql.connector.errors.IntegrityError):
+                raise
+            return False
+        finally:
+            if cursor is not None:
+                cursor.close()
+
+        for jobParams in jobs_params:
+            self.publish_new_job_event(jobParams)
+        return True
+
     @record
     def GetJobList(self,
                    userName,
@@ -794,7 +1108,12 @@ class DataHandler(object):
         return ret
 
     @record
-    def get_union_job_list_v2(self, username, vc_name, num, status):
+    def get_union_job_list_v2(self,
+                              username,
+                              vc_name,
+                              num,
+                              status,
+                              fields=None):
         """Get jobs in status and the latest num jobs that are not in status.
 
         Args:
@@ -802,6 +1121,8 @@ class DataHandler(object):
             vc_name: VC name for jobs
             num: Number of the latest jobs that are not in status
             status: Job status
+            fields: Job fields to return, None for all. jobId, jobStatus and
+                jobType are always returned.
 
         Returns:
             A list of jobs including all jobs in status and the latest num
@@ -855,18 +1176,9 @@ class DataHandler(object):
         try:
             jobs = self.jobtablename
 
-            cols = [
-                "jobId",
-                "jobName",
-                "userName",
-                "vcName",
-                "jobStatus",
-                "jobStatusDetail",
-                "jobType",
-                "jobTime",
-                "jobParams",
-                "priority",
-            ]
+            cols = project_columns(JOB_LIST_V2_COLUMNS,
+                                   fields,
+                                   required=("jobId", "jobStatus", "jobType"))
             query_prefix = "SELECT %s FROM %s WHERE 1" % (",".join(cols), jobs)
 
             if username != "all":
@@ -896,8 +1208,8 @@ class DataHandler(object):
             data = cursor.fetchall()
             for item in data:
                 rec = dict(list(zip(columns, item)))
-                j_detail = rec["jobStatusDetail"]
-                j_params = rec["jobParams"]
+                j_detail = rec.get("jobStatusDetail")
+                j_params = rec.get("jobParams")
                 j_status = rec["jobStatus"]
                 j_type = rec["jobType"]
 
@@ -938,6 +1250,50 @@ class DataHandler(object):
 
         return ret
 
+    @record
+    def get_job_watermark(self, username="all", vc_name="all", job_id=None):
+        """Get a cheap version of jobs for detecting changes.
+
+        Only reads indexed columns and lastUpdated, so it is much cheaper than
+        reading the jobs themselves. Changes that do not touch lastUpdated
+        are not reflected.
+
+        Args:
+            username: Username for jobs, "all" for all users
+            vc_name: VC name for jobs, "all" for all VCs
+            job_id: Only look at this job if not None
+
+        Returns:
+            A string "<max lastUpdated>/<number of jobs>", None on error.
+        """
+        cursor = None
+        ret = None
+        try:
+            query = "SELECT MAX(lastUpdated), COUNT(*) FROM %s WHERE 1" % \
+                self.jobtablename
+            params = []
+            if username != "all":
+                query += " AND userName = %s"
+                params.append(username)
+            if vc_name != "all":
+                query += " AND vcName = %s"
+                params.append(vc_name)
+            if job_id is not None:
+                query += " AND jobId = %s"
+                params.append(job_id)
+
+            cursor = self.conn.cursor()
+            cursor.execute(query, tuple(params))
+            for last_updated, count in cursor:
+                ret = "%s/%s" % (last_updated, count)
+            self.conn.commit()
+        except:
+            logger.exception("Exception in getting job watermark")
+        finally:
+            if cursor is not None:
+                cursor.close()
+        return ret
+
     @record
     def GetActiveJobList(self):
         ret = []
@@ -966,7 +1322,12 @@ class DataHandler(object):
         return ret
 
     @record
-    def GetJob(self, **kwargs):
+    def GetJob(self, fields=None, **kwargs):
+        """Gets jobs with the given value of one key, e.g. GetJob(jobId=id).
+
+        Only columns in fields are selected if fields is given, jobId is
+        always selected.
+        """
         valid_keys = [
             "jobId", "familyToken", "isParent", "jobName", "userName", "vcName",
             "jobStatus", "jobType", "jobTime"
@@ -978,8 +1339,10 @@ class DataHandler(object):
             logger.error("DataHandler_GetJob: key is not in valid keys list...")
             return []
         cursor = self.conn.cursor()
-        query = "SELECT `jobId`,`familyToken`,`isParent`,`jobName`,`userName`, `vcName`, `jobStatus`, `jobStatusDetail`, `jobType`, `jobDescriptionPath`, `jobDescription`, `jobTime`, `endpoints`, `jobParams`,`errorMsg` ,`jobMeta`  FROM `%s` where `%s` = '%s' " % (
-            self.jobtablename, key, expected)
+        cols = project_columns(JOB_COLUMNS, fields, required=("jobId",))
+        query = "SELECT %s FROM `%s` where `%s` = '%s' " % (
+            ",".join("`%s`" % c for c in cols), self.jobtablename, key,
+            expected)
         cursor.execute(query)
         columns = [column[0] for column in cursor.description]
         ret = [dict(list(zip(columns, row))) for row in cursor.fetchall()]
@@ -988,31 +1351,30 @@ class DataHandler(object):
         return ret
 
     @record
-    def GetJobV2(self, jobId):
+    def GetJobV2(self, jobId, fields=None):
+        """Gets a job with base64 encoded JSON columns decoded.
+
+        Only columns in fields are selected and decoded if fields is given,
+        jobId, userName and vcName are always selected.
+        """
         ret = []
         cursor = None
         try:
             cursor = self.conn.cursor()
-            query = "SELECT `jobId`, `jobName`, `userName`, `vcName`, `jobStatus`, `jobStatusDetail`, `jobType`, `jobTime`, `jobParams`, `insight`, `repairMessage` FROM `%s` where `jobId` = '%s' " % (
-                self.jobtablename, jobId)
+            cols = project_columns(JOB_V2_COLUMNS,
+                                   fields,
+                                   required=("jobId", "userName", "vcName"))
+            query = "SELECT %s FROM `%s` where `jobId` = '%s' " % (
+                ",".join("`%s`" % c for c in cols), self.jobtablename, jobId)
             cursor.execute(query)
 
             columns = [column[0] for column in cursor.description]
             data = cursor.fetchall()
             for item in data:
                 record = dict(list(zip(columns, item)))
-                if record["jobStatusDetail"] is not None:
-                    record["jobStatusDetail"] = self.load_json(
-                        base64decode(record["jobStatusDetail"]))
-                if record["jobParams"] is not None:
-                    record["jobParams"] = self.load_json(
-                        base64decode(record["jobParams"]))
-                if record["insight"] is not None:
-                    record["insight"] = self.load_json(
-                        base64decode(record["insight"]))
-                if record["repairMessage"] is not None:
-                    record["repairMessage"] = self.load_json(
-                        base64decode(record["repairMessage"]))
+                for col in ENCODED_JSON_COLUMNS:
+                    if record.get(col) is not None:
+                        record[col] = self.load_json(base64decode(record[col]))
                 ret.append(record)
             self.conn.commit()
         except Exception as e:
@@ -1022,6 +1384,16 @@ class DataHandler(object):
                 cursor.close()
         return ret
 
+    def publish_job_status_events(self, job_ids, job_status):
+        """Publishes status changes of jobs to the job change feed. Best
+        effort, failures are only logged. Events only carry what the caller
+        has, readers look up the owner and VC of jobs."""
+        for job_id in job_ids:
+            if not job_events.is_publishing():
+                return
+            job_events.publish_job_event(
+                job_events.new_status_event(job_id, None, None, job_status))
+
     def load_json(self, raw_str):
         if raw_str is None:
             return {}
@@ -1126,6 +1498,10 @@ class DataHandler(object):
             cursor.execute(sql, (json.dumps(job_endpoints), endpoint["jobId"]))
             self.conn.commit()
             cursor.close()
+            job_events.publish_job_event(
+                job_events.new_endpoint_event(endpoint["jobId"], None, None,
+                                              endpoint["id"],
+                                              endpoint.get("status")))
             return True
         except Exception as e:
             logger.exception(
@@ -1212,6 +1588,10 @@ class DataHandler(object):
         finally:
             if cursor is not None:
                 cursor.close()
+
+        if ret and "jobStatus" in dataFields and "jobId" in conditionFields:
+            self.publish_job_status_events([conditionFields["jobId"]],
+                                           dataFields["jobStatus"])
         return ret
 
     @record
@@ -1230,6 +1610,49 @@ class DataHandler(object):
         cursor.close()
         return ret
 
+    @record
+    def update_job_log(self, jobId, log):
+        """Stores the log tail text of job in the joblogs table. Returns True
+        on success."""
+        cursor = None
+        ret = False
+        try:
+            sql = "INSERT INTO `%s` (`jobId`, `log`) VALUES (%%s, %%s) " \
+                "ON DUPLICATE KEY UPDATE `log` = VALUES(`log`)" % (
+                    self.joblogtablename)
+            cursor = self.conn.cursor()
+            cursor.execute(sql, (jobId, compress_job_log(log)))
+            self.conn.commit()
+            ret = True
+        except Exception:
+            logger.exception("Exception in updating log of job %s", jobId)
+        finally:
+            if cursor is not None:
+                cursor.close()
+        return ret
+
+    @record
+    def get_job_log(self, jobId):
+        """Returns the log tail text of job, from the jobLog field if it has
+        not been moved to the joblogs table, None if there is none."""
+        cursor = None
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                "SELECT `log` FROM `%s` WHERE `jobId` = %%s" %
+                self.joblogtablename, (jobId,))
+            rows = cursor.fetchall()
+            self.conn.commit()
+            if len(rows) > 0:
+                return decompress_job_log(rows[0][0])
+        except Exception:
+            logger.exception("Exception in getting log of job %s", jobId)
+            return None
+        finally:
+            if cursor is not None:
+                cursor.close()
+        return decode_job_log(self.GetJobTextField(jobId, "jobLog"))
+
     @record
     def GetJobTextFields(self, jobId, fields):
         cursor = None
@@ -1278,10 +1701,11 @@ class DataHandler(object):
         return ret
 
     @record
-    def UpdateClusterStatus(self, clusterStatus):
+    def UpdateClusterStatus(self, clusterStatus, serialized=None):
         try:
-            status = base64encode(
-                json.dumps(clusterStatus, separators=(",", ":")))
+            if serialized is None:
+                serialized = json.dumps(clusterStatus, separators=(",", ":"))
+            status = base64encode(serialized)
 
             sql = "INSERT INTO `%s` (status) VALUES ('%s')" % (
                 self.clusterstatustablename, status)
@@ -1468,6 +1892,32 @@ class DataHandler(object):
                 cursor.close()
         return ret
 
+    @record
+    def update_job_log_cursors(self, cursors):
+        """Sets jobLogCursor of jobs, jobId -> cursor, in one transaction.
+        Returns True on success."""
+        if not cursors:
+            return True
+
+        cursor = None
+        ret = False
+        try:
+            cursor = self.conn.cursor()
+            self.update_job_column(cursor, "jobLogCursor", cursors)
+            self.conn.commit()
+            ret = True
+        except Exception:
+            logger.exception("Exception in updating log cursors of jobs %s",
+                             list(cursors.keys()))
+            try:
+                self.conn.rollback()
+            except Exception:
+                logger.exception("Exception in rolling back")
+        finally:
+            if cursor is not None:
+                cursor.close()
+        return ret
+
     @record
     def update_text_fields_for_jobs(self, job_ids, fields):
         cursor = None
@@ -1510,6 +1960,9 @@ class DataHandler(object):
         finally:
             if cursor is not None:
                 cursor.close()
+
+        if ret and "jobStatus" in fields:
+            self.publish_job_status_events(job_ids, fields["jobStatus"])
         return ret
 
     @record
@@ -1620,6 +2073,8 @@ class DataHandler(object):
         for jid in jids:
             sql = "DELETE FROM jobs WHERE jobId = %s"
             cursor.execute(sql, (jid,))
+            sql = "DELETE FROM joblogs WHERE jobId = %s"
+            cursor.execute(sql, (jid,))
         self.conn.commit()
         cursor.close()
 
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""Per-user admission control and coalescing of REST API requests.
+
+Requests are rate limited per (user, endpoint class) by token buckets, so that
+a script polling one endpoint in a tight loop is slowed down without affecting
+other users or its own other requests. A rejected request gets 429 Too Many
+Requests with Retry-After. Requests without userName are not limited.
+
+Buckets are kept per process. Under mod_wsgi with N processes, a user can get
+up to N times the configured rate.
+
+Identical read requests in flight at the same time are coalesced by the
+coalesced decorator: the first one runs the handler, the others wait for it
+and answer with its result.
+
+Settings are under "admission" in config.yaml, rate in requests per second and
+burst in requests:
+
+    admission:
+      enabled: false
+      exempt_users: []
+      classes:
+        list:
+          rate: 2
+          burst: 20
+"""
+
+import collections
+import concurrent.futures
+import logging
+import math
+import threading
+import time
+from functools import wraps
+
+from prometheus_client import Counter
+
+from cache import freeze
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# Max number of token buckets kept, least recently used are dropped first
+DEFAULT_MAX_BUCKETS = 100000
+# Max Retry-After in seconds, e.g. for classes with rate 0
+MAX_RETRY_AFTER = 3600
+
+DEFAULT_CLASSES = {
+    "list": {
+        "rate": 2,
+        "burst": 20
+    },
+    "log": {
+        "rate": 2,
+        "burst": 10
+    },
+    "read": {
+        "rate": 20,
+        "burst": 100
+    },
+    "write": {
+        "rate": 10,
+        "burst": 50
+    },
+}
+
+# Endpoint -> class, other endpoints are "read" for GET and "write" otherwise
+ENDPOINT_CLASSES = {
+    "listjobs": "list",
+    "listjobsv2": "list",
+    "listactivejobs": "list",
+    "getjoblog": "log",
+    "GetJobRawLog": "log",
+    "searchjoblog": "log",
+    "postjob": "write",
+    "postjobs": "write",
+    "killjob": "write",
+    "killjobs": "write",
+    "pausejob": "write",
+    "pausejobs": "write",
+    "resumejob": "write",
+    "resumejobs": "write",
+    "approvejob": "write",
+    "approvejobs": "write",
+}
+
+# Not limited
+EXEMPT_ENDPOINTS = {"metrics", "static"}
+
+rejected_counter = Counter("restfulapi_rejected_request_count",
+                           "count of requests rejected by admission control",
+                           labelnames=("endpoint", "class"))
+
+coalesced_counter = Counter(
+    "restfulapi_coalesced_request_count",
+    "count of requests answered with the result of an identical request",
+    labelnames=("endpoint",))
+
+
+class TokenBucket(object):
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now):
+        """Takes a token. Returns 0 if there was one, otherwise seconds until
+        there is one."""
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        if self.rate <= 0:
+            return float("inf")
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter(object):
+    """Token buckets per (user, class).
+
+    Args:
+        classes: class -> {"rate": requests/sec, "burst": requests}. Classes
+            not in it are not limited.
+    """
+    def __init__(self,
+                 classes,
+                 maxsize=DEFAULT_MAX_BUCKETS,
+                 clock=time.monotonic):
+        self.classes = classes
+        self.maxsize = maxsize
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.buckets = collections.OrderedDict()
+
+    def admit(self, user, klass):
+        """Returns 0 if the request of user is admitted, otherwise seconds
+        after which it would be."""
+        setting = self.classes.get(klass)
+        if setting is None:
+            return 0
+
+        key = (user, klass)
+        with self.lock:
+            now = self.clock()
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(setting.get("rate", 0),
+                                     setting.get("burst", 1), now)
+                self.buckets[key] = bucket
+                while len(self.buckets) > self.maxsize:
+                    self.buckets.popitem(last=False)
+            else:
+                self.buckets.move_to_end(key)
+            return bucket.take(now)
+
+
+class Coalescer(object):
+    """Merges concurrent calls with the same key into one.
+
+    Results are frozen, see cache.freeze, as they are shared by callers.
+    Exceptions are raised to all callers of the call.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        # key -> concurrent.futures.Future of in-flight call
+        self.calls = {}
+
+    def do(self, key, func, endpoint=""):
+        with self.lock:
+            future = self.calls.get(key)
+            owner = future is None
+            if owner:
+                future = concurrent.futures.Future()
+                self.calls[key] = future
+
+        if not owner:
+            coalesced_counter.labels(endpoint).inc()
+            return future.result()
+
+        try:
+            value = freeze(func())
+        except Exception as e:
+            with self.lock:
+                self.calls.pop(key, None)
+            future.set_exception(e)
+            raise
+        with self.lock:
+            self.calls.pop(key, None)
+        future.set_result(value)
+        return value
+
+
+coalescer = Coalescer()
+
+
+class ResponseSnapshot(object):
+    """Immutable copy of a flask Response, shared by coalesced requests."""
+    __slots__ = ("body", "status", "headers")
+
+    def __init__(self, resp):
+        self.body = resp.get_data()
+        self.status = resp.status_code
+        self.headers = tuple(resp.headers.items())
+
+    def to_response(self):
+        from flask import Response
+        return Response(self.body, status=self.status, headers=self.headers)
+
+
+def coalesced(func):
+    """Decorator coalescing concurrent GETs with the same path and query of a
+    handler.
+
+    The handler may return a flask Response or JSON serializable data, data
+    is frozen and must not be modified afterwards.
+    """
+    @wraps(func)
+    def wrapped(*args, **kwargs):
+        from flask import Response, request
+
+        def call():
+            resp = func(*args, **kwargs)
+            if isinstance(resp, Response):
+                return ResponseSnapshot(resp)
+            return resp
+
+        key = (request.method, request.path,
+               tuple(sorted(request.args.items(multi=True))))
+        value = coalescer.do(key, call, request.endpoint or "none")
+        if isinstance(value, ResponseSnapshot):
+            return value.to_response()
+        return value
+
+    return wrapped
+
+
+def get_settings():
+    return config.get("admission") or {}
+
+
+def get_class(endpoint, method):
+    klass = ENDPOINT_CLASSES.get(endpoint)
+    if klass is not None:
+        return klass
+    return "read" if method in ("GET", "HEAD") else "write"
+
+
+def get_username(request):
+    username = request.args.get("userName")
+    if username is None and request.method in ("POST", "PUT"):
+        body = request.get_json(force=True, silent=True)
+        if isinstance(body, dict):
+            username = body.get("userName")
+    return username
+
+
+class AdmissionController(object):
+    def __init__(self, settings):
+        classes = dict(DEFAULT_CLASSES)
+        classes.update(settings.get("classes") or {})
+        self.enabled = settings.get("enabled", False)
+        self.exempt_users = set(settings.get("exempt_users") or [])
+        self.limiter = RateLimiter(classes)
+
+    def check(self):
+        """before_request hook, returns 429 response if the request is
+        rejected."""
+        if not self.enabled:
+            return None
+
+        from flask import jsonify, request
+
+        endpoint = request.endpoint
+        if endpoint is None or endpoint in EXEMPT_ENDPOINTS or \
+                request.method == "OPTIONS":
+            return None
+        username = get_username(request)
+        if not username or username in self.exempt_users:
+            return None
+
+        klass = get_class(endpoint, request.method)
+        retry_after = self.limiter.admit(username, klass)
+        if retry_after == 0:
+            return None
+
+        retry_after = min(retry_after, MAX_RETRY_AFTER)
+        rejected_counter.labels(endpoint, klass).inc()
+        logger.debug("Rejected %s %s of %s, retry after %.1fs", request.method,
+                     request.full_path, username, retry_after)
+        resp = jsonify({
+            "error":
+                "Too many %s requests, retry after %.1f seconds" %
+                (klass, retry_after)
+        })
+        resp.status_code = 429
+        resp.headers["Retry-After"] = str(int(math.ceil(retry_after)))
+        return resp
+
+
+def install(app, settings=None):
+    """Admits requests of app by settings, "admission" in config.yaml by
+    default."""
+    controller = AdmissionController(
+        get_settings() if settings is None else settings)
+    app.before_request(controller.check)
+    return controller
@@ -9,6 +9,8 @@ import threading
 from DataHandler import DataHandler, DataManager
 from config import config
 from cachetools import cached, TTLCache
+from cache import Cache
+import request_profile
 
 logger = logging.getLogger(__name__)
 
@@ -38,6 +40,140 @@ IDENTITY_KEY_PREFIX = "i/"
 id_cache = TTLCache(maxsize=DEFAULT_CACHE_SIZE, ttl=DEFAULT_CACHE_EXPIRATION)
 id_cache_lock = threading.Lock()
 
+# AuthorizationIndex is checked against authversion table at most this often,
+# in the background
+AUTH_INDEX_TTL = 5
+# Beyond this, callers wait for the check instead
+AUTH_INDEX_MAX_STALE = 60
+AUTH_INDEX_KEY = "index"
+auth_index_cache = Cache("auth_index",
+                         maxsize=1,
+                         ttl=AUTH_INDEX_TTL,
+                         max_stale=AUTH_INDEX_MAX_STALE)
+auth_index_lock = threading.Lock()
+last_auth_index = None
+
+
+def index_ace(table, key, ace):
+    paths = table.setdefault(key, {})
+    perms = paths.get(ace["resource"], ())
+    if ace["permissions"] not in perms:
+        paths[ace["resource"]] = perms + (ace["permissions"],)
+
+
+class AuthorizationIndex(object):
+    """Permissions of users and groups on resource paths, built from all of
+    acl and identity tables.
+
+    A user has a permission on a resource if an access control entry of the
+    user, or of one of the groups of the user, on the resource or one of its
+    ancestors grants all of the permission.
+    """
+    def __init__(self, version, acl, identity_groups):
+        self.version = version
+        # identityName -> resource path -> tuple of granted permissions
+        self.by_name = {}
+        # group id -> resource path -> tuple of granted permissions
+        self.by_group = {}
+        for ace in acl:
+            index_ace(self.by_name, ace["identityName"], ace)
+            ace_id = int(ace["identityId"])
+            if ace_id < INVALID_RANGE_START:
+                index_ace(self.by_group, ace_id, ace)
+
+        # identityName -> tuple of group ids
+        self.groups = {}
+        for name, groups in identity_groups.items():
+            try:
+                self.groups[name] = tuple(set(int(x) for x in groups))
+            except Exception as e:
+                logger.warning("Invalid group id list of %s. Ex: %s", name,
+                               e)
+
+    def has_access(self, name, resource, perm):
+        tables = [self.by_name.get(name)]
+        tables.extend(
+            self.by_group.get(gid) for gid in self.groups.get(name, ()))
+        tables = [table for table in tables if table]
+
+        acl_path = resource
+        while acl_path:
+            for table in tables:
+                for granted in table.get(acl_path, ()):
+                    if not (perm & (~granted)):
+                        return True
+            acl_path = get_parent_path(acl_path)
+        return False
+
+
+def load_auth_index():
+    global last_auth_index
+    data_handler = DataHandler()
+    try:
+        version = data_handler.get_auth_version()
+        if version is None:
+            return None
+
+        with auth_index_lock:
+            index = last_auth_index
+        if index is not None and index.version == version:
+            return index
+
+        start_time = time.time()
+        version, acl, identity_groups = data_handler.load_auth_tables()
+        index = AuthorizationIndex(version, acl, identity_groups)
+        logger.info("Loaded authorization index of version %s in time %s",
+                    version,
+                    time.time() - start_time)
+        with auth_index_lock:
+            last_auth_index = index
+        return index
+    finally:
+        data_handler.Close()
+
+
+def get_auth_index():
+    """Returns the current AuthorizationIndex, None if it is not available,
+    e.g. authversion table does not exist."""
+    try:
+        return auth_index_cache.get(AUTH_INDEX_KEY, load_auth_index)
+    except Exception as e:
+        logger.warning("Failed to get authorization index. Ex: %s", e)
+        return None
+
+
+def group_ids(groups):
+    if isinstance(groups, str):
+        groups = json.loads(groups)
+    return sorted(str(gid) for gid in groups)
+
+
+def identity_changed(identities, uid, groups):
+    """Returns whether uid or groups differ from those of the identity in
+    identities, a GetIdentityInfo result."""
+    if not identities:
+        return True
+    try:
+        identity = identities[0]
+        return str(identity["uid"]) != str(uid) or \
+            group_ids(identity["groups"]) != group_ids(groups)
+    except Exception:
+        return True
+
+
+def on_auth_change(data_handler):
+    # Processes reload their index once they see the new version, this
+    # process reloads on next access check
+    data_handler.bump_auth_version()
+    auth_index_cache.delete(AUTH_INDEX_KEY)
+
+
+def get_parent_path(acl_path):
+    if AuthorizationManager.ACL_DELIMITER in acl_path:
+        return acl_path.rsplit(AuthorizationManager.ACL_DELIMITER, 1)[0]
+    else:
+        return ""
+
 
 class AuthorizationManager:
 
@@ -49,6 +185,15 @@ class AuthorizationManager:
     def _has_access(name, resource, perm):
         # Check if user has requested access (based on effective ACL) on the
         # specified resource.
+        with request_profile.timer("auth"):
+            return AuthorizationManager.__has_access(name, resource, perm)
+
+    @staticmethod
+    def __has_access(name, resource, perm):
+        index = get_auth_index()
+        if index is not None:
+            return index.has_access(name, resource, perm)
+
         start_time = time.time()
         request = "%s;%s;%s" % (name, resource, perm)
         try:
@@ -76,7 +221,7 @@ class AuthorizationManager:
                                         duration)
                             return True
 
-                acl_path = AuthorizationManager.__get_parent_path(acl_path)
+                acl_path = get_parent_path(acl_path)
 
             duration = time.time() - start_time
             logger.info("No for %s in time %s", request, duration)
@@ -118,13 +263,6 @@ class AuthorizationManager:
         return AuthorizationManager._has_access(
             name, AuthorizationManager.CLUSTER_ACL_PATH, Permission.Admin)
 
-    @staticmethod
-    def __get_parent_path(acl_path):
-        if AuthorizationManager.ACL_DELIMITER in acl_path:
-            return acl_path.rsplit(AuthorizationManager.ACL_DELIMITER, 1)[0]
-        else:
-            return ""
-
     @staticmethod
     def GetResourceAclPath(resource_identifier, resource_type):
         if resource_type == ResourceType.VC:
@@ -152,6 +290,8 @@ class ACLManager:
                 info = IdentityManager.GetIdentityInfoFromDB(name)
                 uid = info["uid"]
             ret = data_handler.UpdateAce(name, uid, resource, perm, is_deny)
+            if ret:
+                on_auth_change(data_handler)
 
             with acl_cache_lock:
                 acl_cache.pop(RESOURCE_KEY_PREFIX + resource, None)
@@ -171,6 +311,8 @@ class ACLManager:
         try:
             data_handler = DataHandler()
             ret = data_handler.DeleteAce(name, resource)
+            if ret:
+                on_auth_change(data_handler)
 
             with acl_cache_lock:
                 acl_cache.pop(RESOURCE_KEY_PREFIX + resource, None)
@@ -191,6 +333,8 @@ class ACLManager:
         try:
             data_handler = DataHandler()
             ret = data_handler.DeleteResourceAcl(resource)
+            if ret:
+                on_auth_change(data_handler)
 
             with acl_cache_lock:
                 res_key = RESOURCE_KEY_PREFIX + resource
@@ -292,6 +436,8 @@ class ACLManager:
         try:
             data_handler = DataHandler()
             ret = data_handler.UpdateAclIdentityId(name, identity_id)
+            if ret:
+                on_auth_change(data_handler)
 
             with acl_cache_lock:
                 id_key = IDENTITY_KEY_PREFIX + name
@@ -326,8 +472,13 @@ class IdentityManager:
         data_handler = None
         try:
             data_handler = DataHandler()
+            # Users are added again on every sync, processes only reload
+            # their index if the identity has changed
+            identities = data_handler.GetIdentityInfo(name)
             ret = data_handler.UpdateIdentityInfo(name, uid, gid, groups,
                                                   public_key, private_key)
+            if ret and identity_changed(identities, uid, groups):
+                on_auth_change(data_handler)
             with id_cache_lock:
                 id_cache.pop(name, None)
         except Exception as e:
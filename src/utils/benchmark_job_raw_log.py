@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""Benchmarks raw job log download, JobLogUtils.GetJobRawLog.
+
+With --backend elasticsearch, runs against an in-process Elasticsearch
+stand-in which sleeps for a given time per new client connection, per search
+round trip and per document returned. Compares the previous way of reading, a
+new client per download and sequential pages of 100, with the shared client
+and prefetched pages.
+
+With --backend azure_blob, runs against an in-process Azure append blob
+stand-in which sleeps for a given time per ranged read and per MB returned.
+Compares sequential ranged reads with concurrent ones.
+
+Usage: python3 benchmark_job_raw_log.py [--backend elasticsearch]
+           [--downloads 20] [--lines 20000] [--connect-ms 20] [--rtt-ms 5]
+           [--doc-us 20] [--consume-us 5] [--mb-ms 25] [--blob-mb 4]
+"""
+
+import argparse
+import json
+import time
+from unittest.mock import patch
+
+from config import config
+
+
+class StandInElasticsearch(object):
+    def __init__(self, args):
+        self.args = args
+        self.connected = False
+
+    def round_trip(self, documents=0):
+        if not self.connected:
+            time.sleep(self.args.connect_ms / 1000)
+            self.connected = True
+        time.sleep(self.args.rtt_ms / 1000 +
+                   documents * self.args.doc_us / 1000000)
+
+    def open_point_in_time(self, index, keep_alive, ignore_unavailable):
+        self.round_trip()
+        return {"id": "pit"}
+
+    def close_point_in_time(self, body):
+        self.round_trip()
+
+    def search(self, body, index=None, ignore_unavailable=None):
+        start = body["search_after"][0] + 1 if "search_after" in body else 0
+        end = min(start + body["size"], self.args.lines)
+        self.round_trip(end - start)
+        return {
+            "hits": {
+                "hits": [{
+                    "_source": {
+                        "log": "line %d\n" % i
+                    },
+                    "sort": [i]
+                } for i in range(start, end)]
+            }
+        }
+
+
+class StandInBlob(object):
+    class Properties(object):
+        def __init__(self, content_length):
+            self.content_length = content_length
+            self.etag = None
+
+    def __init__(self, name, content=b"", content_length=0):
+        self.name = name
+        self.content = content
+        self.properties = StandInBlob.Properties(content_length)
+
+
+class StandInAppendBlobService(object):
+    """Blobs of a job, in blobs of up to --blob-mb MB of JSON lines."""
+    def __init__(self, args):
+        self.args = args
+        # Lines as written by fluentd, with the metadata of the pod
+        lines = [
+            json.dumps({
+                "kubernetes": {
+                    "pod_name": "job1-master",
+                    "namespace_name": "default",
+                    "container_name": "job1",
+                    "host": "worker-1",
+                },
+                "time": "2020-01-01T00:00:00.%06dZ" % (i % 1000000),
+                "stream": "stdout",
+                "log": "line %d of the job log\n" % i,
+            }).encode("utf-8") + b"\n" for i in range(args.lines)
+        ]
+        size = int(args.blob_mb * 1024 * 1024)
+        self.blobs = {}
+        blob = []
+        blob_size = 0
+        for line in lines:
+            blob.append(line)
+            blob_size += len(line)
+            if blob_size >= size:
+                self.add_blob(b"".join(blob))
+                blob = []
+                blob_size = 0
+        if blob:
+            self.add_blob(b"".join(blob))
+
+    def add_blob(self, content):
+        i = len(self.blobs)
+        name = "jobs.job1" if i == 0 else "jobs.job1.%d" % i
+        self.blobs[name] = content
+
+    def list_blobs(self, container_name, prefix):
+        time.sleep(self.args.rtt_ms / 1000)
+        return [
+            StandInBlob(name, content_length=len(content))
+            for name, content in self.blobs.items()
+        ]
+
+    def get_blob_to_bytes(self, container_name, blob_name, start_range,
+                          end_range):
+        content = self.blobs[blob_name][start_range:end_range + 1]
+        time.sleep(self.args.rtt_ms / 1000 +
+                   len(content) / 1024 / 1024 * self.args.mb_ms / 1000)
+        return StandInBlob(blob_name, content=content)
+
+
+def consume(lines, args):
+    count = 0
+    for _ in lines:
+        count += 1
+        if args.consume_us > 0:
+            time.sleep(args.consume_us / 1000000)
+    return count
+
+
+def benchmark_azure_blob(args):
+    config["logging"] = "azure_blob"
+    config["azure_blob_log"] = {
+        "connection_string": "UseDevelopmentStorage=true",
+        "container_name": "logs",
+    }
+    import JobLogUtils
+    JobLogUtils.append_blob_service = StandInAppendBlobService(args)
+
+    for name, parallelism in [
+        ("sequential ranged reads", 1),
+        ("concurrent ranged reads", JobLogUtils.RAW_LOG_PARALLELISM),
+    ]:
+        with patch.object(JobLogUtils, "RAW_LOG_PARALLELISM", parallelism):
+            start = time.time()
+            lines = sum(
+                consume(JobLogUtils.GetJobRawLog("job1"), args)
+                for _ in range(args.downloads))
+            elapsed = time.time() - start
+        print("%-40s %10.0f lines/sec" % (name, lines / elapsed))
+
+
+def download(JobLogUtils, args, new_client, page_size, prefetch):
+    if new_client:
+        JobLogUtils.elasticsearch_client = StandInElasticsearch(args)
+    lines = 0
+    for document in JobLogUtils.iter_documents({}, "logstash-*",
+                                               page_size=page_size,
+                                               prefetch=prefetch):
+        lines += 1
+        if args.consume_us > 0:
+            time.sleep(args.consume_us / 1000000)
+    return lines
+
+
+def benchmark_elasticsearch(args):
+    config["logging"] = "elasticsearch"
+    config["elasticsearch"] = ["http://localhost:9200"]
+    import JobLogUtils
+    JobLogUtils.elasticsearch_client = StandInElasticsearch(args)
+
+    for name, new_client, page_size, prefetch in [
+        ("new client, pages of 100", True, 100, False),
+        ("shared client, pages of 1000", False, 1000, False),
+        ("shared client, pages of 1000, prefetch", False, 1000, True),
+    ]:
+        start = time.time()
+        lines = sum(
+            download(JobLogUtils, args, new_client, page_size, prefetch)
+            for _ in range(args.downloads))
+        elapsed = time.time() - start
+        print("%-40s %10.0f lines/sec" % (name, lines / elapsed))
+
+
+def main(args):
+    if args.backend == "azure_blob":
+        benchmark_azure_blob(args)
+    else:
+        benchmark_elasticsearch(args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend",
+                        choices=("elasticsearch", "azure_blob"),
+                        default="elasticsearch")
+    parser.add_argument("--downloads", type=int, default=20)
+    parser.add_argument("--lines", type=int, default=20000)
+    parser.add_argument("--connect-ms", type=float, default=20)
+    parser.add_argument("--rtt-ms", type=float, default=5)
+    parser.add_argument("--doc-us",
+                        type=float,
+                        default=20,
+                        help="search time per document returned")
+    parser.add_argument("--consume-us",
+                        type=float,
+                        default=5,
+                        help="time to send a line to the client")
+    parser.add_argument("--mb-ms",
+                        type=float,
+                        default=25,
+                        help="azure_blob transfer time per MB and connection")
+    parser.add_argument("--blob-mb",
+                        type=float,
+                        default=4,
+                        help="azure_blob size of each blob")
+    main(parser.parse_args())
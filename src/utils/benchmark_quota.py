@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""Benchmarks quota.calculate_vc_resources.
+
+Usage: python3 benchmark_quota.py [--vcs 200] [--skus 20] [--rounds 10]
+"""
+
+import argparse
+import logging
+import random
+import timeit
+
+from cluster_resource import ClusterResource
+from quota import calculate_vc_resources
+
+
+def random_resource(skus, scale):
+    return ClusterResource(
+        params={
+            "cpu": {sku: random.randint(0, 64 * scale) for sku in skus},
+            "memory": {
+                sku: "%dGi" % random.randint(0, 512 * scale) for sku in skus
+            },
+            "gpu": {sku: random.randint(0, 8 * scale) for sku in skus},
+        })
+
+
+def make_inputs(num_vcs, num_skus):
+    skus = ["sku%d" % i for i in range(num_skus)]
+    vc_names = ["vc%d" % i for i in range(num_vcs)]
+    capacity = random_resource(skus, num_vcs * 4)
+    avail = random_resource(skus, num_vcs)
+    reserved = random_resource(skus, num_vcs // 10 + 1)
+    vc_info = {vc_name: random_resource(skus, 4) for vc_name in vc_names}
+    vc_usage = {vc_name: random_resource(skus, 2) for vc_name in vc_names}
+    return capacity, avail, reserved, vc_info, vc_usage
+
+
+def main(args):
+    logging.disable(logging.WARNING)
+    random.seed(0)
+    inputs = make_inputs(args.vcs, args.skus)
+
+    elapsed = timeit.timeit(lambda: calculate_vc_resources(*inputs),
+                            number=args.rounds)
+    print("calculate_vc_resources with %d VCs x %d SKUs: %.2f ms per call" %
+          (args.vcs, args.skus, elapsed / args.rounds * 1000))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vcs", type=int, default=200)
+    parser.add_argument("--skus", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=10)
+    main(parser.parse_args())
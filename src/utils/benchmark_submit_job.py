@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""Benchmarks JobRestAPIUtils.SubmitJob and SubmitJobs throughput.
+
+By default, runs against an in-process MySQL stand-in which sleeps for a given
+time per connect and per round trip, and grants every access check. With
+--mysql, runs against the MySQL in config.yaml instead, which has to be
+initialized by ClusterManager/init_db.py.
+
+Usage: python3 benchmark_submit_job.py [--jobs 200] [--threads 4]
+           [--connect-ms 5] [--rtt-ms 0.5] [--pool-size 2] [--no-cache]
+           [--batch 1]
+"""
+
+import argparse
+import concurrent.futures
+import json
+import logging
+import queue
+import threading
+import time
+
+import mysql.connector
+import mysql.connector.pooling
+
+from config import config
+
+
+class Stats(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connects = 0
+        self.round_trips = 0
+
+    def add(self, connects=0, round_trips=0):
+        with self.lock:
+            self.connects += connects
+            self.round_trips += round_trips
+
+
+class StandInCursor(object):
+    def __init__(self, conn):
+        self.conn = conn
+        self.description = []
+
+    def execute(self, query, params=None):
+        self.conn.round_trip()
+
+    def fetchall(self):
+        return []
+
+    def __iter__(self):
+        return iter([])
+
+    def close(self):
+        pass
+
+
+class StandInConnection(object):
+    def __init__(self, stats, connect_latency, rtt):
+        self.stats = stats
+        self.rtt = rtt
+        stats.add(connects=1)
+        time.sleep(connect_latency)
+
+    def round_trip(self):
+        self.stats.add(round_trips=1)
+        time.sleep(self.rtt)
+
+    def cursor(self):
+        return StandInCursor(self)
+
+    def commit(self):
+        self.round_trip()
+
+    def rollback(self):
+        self.round_trip()
+
+    def close(self):
+        pass
+
+
+class StandInPooledConnection(object):
+    def __init__(self, pool, conn):
+        self.pool = pool
+        self.conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+    def close(self):
+        # Session is reset before the connection goes back to the pool
+        self.conn.round_trip()
+        self.pool.idle.put(self.conn)
+
+
+def install_stand_in(stats, connect_latency, rtt):
+    def connect(**kwargs):
+        return StandInConnection(stats, connect_latency, rtt)
+
+    class StandInPool(object):
+        def __init__(self, pool_size, **kwargs):
+            self.idle = queue.Queue()
+            for _ in range(pool_size):
+                self.idle.put(connect())
+
+        def get_connection(self):
+            try:
+                conn = self.idle.get_nowait()
+            except queue.Empty:
+                raise mysql.connector.errors.PoolError("pool exhausted")
+            # Connection is checked before being handed out
+            conn.round_trip()
+            return StandInPooledConnection(self, conn)
+
+    mysql.connector.connect = connect
+    mysql.connector.pooling.MySQLConnectionPool = StandInPool
+
+    config["datasource"] = "MySQL"
+    config["clusterId"] = "benchmark"
+    config["mysql"] = {"hostname": "", "username": "", "password": ""}
+    config["global-mysql"] = config["mysql"]
+
+
+def make_job_params(i):
+    return {
+        "jobName": "benchmark-%d" % i,
+        "vcName": "platform",
+        "userName": "benchmark@example.com",
+        "userId": "10000",
+        "jobtrainingtype": "RegularJob",
+        "jobType": "training",
+        "image": "ubuntu:18.04",
+        "cmd": "sleep infinity",
+        "resourcegpu": 0,
+        "jobPriority": 100,
+    }
+
+
+def main(args):
+    logging.disable(logging.WARNING)
+    stats = Stats()
+    if not args.mysql:
+        install_stand_in(stats, args.connect_ms / 1000, args.rtt_ms / 1000)
+    config["mysql"]["pool_size"] = args.pool_size
+
+    import JobRestAPIUtils
+    from authorization import AuthorizationManager
+    if not args.mysql:
+        JobRestAPIUtils.has_access = lambda *args: True
+        AuthorizationManager.HasAccess = staticmethod(lambda *args: True)
+
+    def submit(i):
+        if args.no_cache:
+            JobRestAPIUtils.vc_meta_cache.clear()
+            JobRestAPIUtils.public_key_cache.clear()
+        ret = JobRestAPIUtils.SubmitJob(json.dumps(make_job_params(i)))
+        if "error" in ret:
+            raise RuntimeError(ret["error"])
+
+    def submit_batch(start):
+        if args.no_cache:
+            JobRestAPIUtils.vc_meta_cache.clear()
+            JobRestAPIUtils.public_key_cache.clear()
+        end = min(start + args.batch, args.jobs + 1)
+        ret = JobRestAPIUtils.SubmitJobs(
+            [make_job_params(i) for i in range(start, end)])
+        for result in ret:
+            if "error" in result:
+                raise RuntimeError(result["error"])
+
+    # Warm up caches and connection pools
+    submit(0)
+    stats.connects = stats.round_trips = 0
+
+    start = time.time()
+    with concurrent.futures.ThreadPoolExecutor(args.threads) as executor:
+        if args.batch > 1:
+            list(
+                executor.map(submit_batch,
+                             range(1, args.jobs + 1, args.batch)))
+        else:
+            list(executor.map(submit, range(1, args.jobs + 1)))
+    elapsed = time.time() - start
+
+    if args.batch > 1:
+        print("SubmitJobs x %d in batches of %d with %d threads: "
+              "%.1f jobs/sec" %
+              (args.jobs, args.batch, args.threads, args.jobs / elapsed))
+    else:
+        print("SubmitJob x %d with %d threads: %.1f jobs/sec" %
+              (args.jobs, args.threads, args.jobs / elapsed))
+    if not args.mysql:
+        print("per job: %.2f connects, %.2f round trips" %
+              (stats.connects / args.jobs, stats.round_trips / args.jobs))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--connect-ms", type=float, default=5)
+    parser.add_argument("--rtt-ms", type=float, default=0.5)
+    parser.add_argument("--pool-size", type=int, default=2)
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--batch",
+                        type=int,
+                        default=1,
+                        help="jobs per SubmitJobs call, 1 for SubmitJob")
+    parser.add_argument("--mysql",
+                        action="store_true",
+                        help="use MySQL in config.yaml instead of stand-in")
+    main(parser.parse_args())
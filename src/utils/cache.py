@@ -1,106 +1,263 @@
 #!/usr/bin/env python3
 
-from functools import wraps
+import collections
+import concurrent.futures
+import logging
 import threading
-from datetime import datetime
-from datetime import timedelta
 import time
-import queue
-import copy
-import logging
+from functools import wraps
+
+from prometheus_client import Counter, Histogram
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_TTL = 30
+DEFAULT_MAXSIZE = 1024
+REFRESH_WORKERS = 4
 
-# decorator (with different TTL for each function)
-# No removal of entries (designed for small number of entries to be always kept in memory)
-# option to invalidate specific entries
-# non-blocking (updates done by background thread; stale data returned while fetching in progress) : avoids thundering herd for data source
-def fcache(TTLInSec=30):
-    def fcache_decorator(func):
-        @wraps(func)
-        def wrapped_function(*args, **kwargs):
-            val = CacheManager.GetValue(func, TTLInSec, args)
-            if (None == val):
-                return func(*args)
-            return copy.deepcopy(val[0])
+cache_request_counter = Counter("cache_request_count",
+                                "count of cache requests by result",
+                                labelnames=("name", "result"))
 
-        return wrapped_function
+cache_refresh_histogram = Histogram(
+    "cache_refresh_latency_seconds",
+    "latency for loading a value into cache (seconds)",
+    buckets=(.005, .01, .025, .05, .075, .1, .25, .5, .75, 1.0, 2.5, 5.0, 7.5,
+             10.0, float("inf")),
+    labelnames=("name",))
 
-    return fcache_decorator
+# Shared by all caches in the process, refreshes are short and infrequent.
+refresh_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=REFRESH_WORKERS)
+
+
+def _immutable(*args, **kwargs):
+    raise TypeError("cached value is immutable")
+
+
+class FrozenDict(dict):
+    """dict that can not be modified. Still JSON serializable as a dict."""
+    __setitem__ = __delitem__ = _immutable
+    clear = pop = popitem = setdefault = update = _immutable
+    __ior__ = _immutable
 
+    def __copy__(self):
+        return self
 
-class CacheManager(object):
-    data = {}
-    taskQueue = queue.Queue()
-    pendingTasks = set()
-
-    @staticmethod
-    def Invalidate(funcName, *args):
-        key = CacheManager._GetKey(funcName, args)
-        if key in CacheManager.data:
-            val = CacheManager.data[key]
-            CacheManager.data[key] = [val[0], datetime.now()]
-            logger.info("Cache invalidated %s", key)
-
-    @staticmethod
-    def GetValue(func, ttl, args):
-        val = None
-        key = CacheManager._GetKey(func.__name__, args)
-        needUpdate = False
-        if key not in CacheManager.data:
-            logger.info("Cache miss %s", key)
-            needUpdate = True
-        else:
-            val = CacheManager.data[key]
-            logger.info("Cache hit %s %s %s %s", key, str(val[1]),
-                        str(len(CacheManager.data)),
-                        str(CacheManager.taskQueue.qsize()))
-            if CacheManager._Invalid(val):
-                needUpdate = True
-
-        if needUpdate and key not in CacheManager.pendingTasks:
-            CacheManager.taskQueue.put((func, ttl, args))
-            CacheManager.pendingTasks.add(key)
+    def __deepcopy__(self, memo):
+        return thaw(self)
 
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+
+class FrozenList(list):
+    """list that can not be modified. Still JSON serializable as a list."""
+    __setitem__ = __delitem__ = _immutable
+    append = extend = insert = remove = pop = clear = _immutable
+    sort = reverse = _immutable
+    __iadd__ = __imul__ = _immutable
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return thaw(self)
+
+    def __reduce__(self):
+        return (FrozenList, (list(self),))
+
+
+def freeze(val):
+    """Returns an immutable deep copy of val made of FrozenDict, FrozenList,
+    tuple and frozenset, so that it can be shared without copying."""
+    if isinstance(val, (FrozenDict, FrozenList)):
         return val
+    if isinstance(val, dict):
+        return FrozenDict((k, freeze(v)) for k, v in val.items())
+    if isinstance(val, list):
+        return FrozenList(freeze(v) for v in val)
+    if isinstance(val, tuple):
+        return tuple(freeze(v) for v in val)
+    if isinstance(val, set):
+        return frozenset(val)
+    return val
+
+
+def thaw(val):
+    """Returns a mutable deep copy of a value returned by freeze."""
+    if isinstance(val, dict):
+        return {k: thaw(v) for k, v in val.items()}
+    if isinstance(val, list):
+        return [thaw(v) for v in val]
+    if isinstance(val, tuple):
+        return tuple(thaw(v) for v in val)
+    if isinstance(val, frozenset):
+        return set(val)
+    return val
+
+
+class CacheEntry(object):
+    __slots__ = ("value", "expire_at")
+
+    def __init__(self, value, expire_at):
+        self.value = value
+        self.expire_at = expire_at
+
+
+class Cache(object):
+    """Bounded LRU cache with TTL and stale-while-revalidate.
 
-    @staticmethod
-    def _GetKey(funcName, args):
-        key = funcName
-        for arg in args:
-            key += "__"
-            key += str(arg)
-        return key
-
-    @staticmethod
-    def _Invalid(value):
-        if value[1] < datetime.now():
-            return True
-        return False
-
-    @staticmethod
-    def _WorkerThreadFunc():
-        while (True):
-            try:
-                while not CacheManager.taskQueue.empty():
-                    task = CacheManager.taskQueue.get()
-                    key = CacheManager._GetKey(task[0].__name__, task[2])
-                    if key in CacheManager.pendingTasks:
-                        if key not in CacheManager.data or CacheManager._Invalid(
-                                CacheManager.data[key]):
-                            result = task[0](*(task[2]))
-                            CacheManager.data[key] = [
-                                result,
-                                datetime.now() + timedelta(seconds=int(task[1]))
-                            ]
-                            logger.info("Cache inserted %s", key)
-                        CacheManager.pendingTasks.remove(key)
-                time.sleep(0.001)
-            except Exception as e:
-                logger.warning('cache exception: %s', str(e))
-
-
-workerThread = threading.Thread(target=CacheManager._WorkerThreadFunc, args=())
-workerThread.daemon = True
-workerThread.start()
+    A value older than ttl is returned as is while one refresh per key runs on
+    the shared thread pool. A value older than ttl + max_stale is not returned
+    and the caller waits for the load instead. Such values are dropped when
+    they are hit, and from the least recently used end on insert. Concurrent
+    loads of the same key are merged into one.
+
+    Values are frozen on insert and returned without copying, callers get
+    FrozenDict/FrozenList instead of dict/list and need thaw() to modify them.
+    """
+    def __init__(self,
+                 name,
+                 maxsize=DEFAULT_MAXSIZE,
+                 ttl=DEFAULT_TTL,
+                 max_stale=None,
+                 clock=time.monotonic):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.clock = clock
+
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+        # key -> concurrent.futures.Future of in-flight load
+        self.loading = {}
+
+        self.hit_counter = cache_request_counter.labels(name, "hit")
+        self.miss_counter = cache_request_counter.labels(name, "miss")
+        self.stale_counter = cache_request_counter.labels(name, "stale")
+        # Misses waiting for the load of another caller
+        self.coalesced_counter = cache_request_counter.labels(
+            name, "coalesced")
+        self.refresh_histogram = cache_refresh_histogram.labels(name)
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+
+    def get(self, key, loader):
+        """Returns the cached value of key, calling loader() to load it.
+
+        Exceptions from loader() are raised to callers waiting for the load,
+        and only logged for background refreshes.
+        """
+        with self.lock:
+            now = self.clock()
+            entry = self.entries.get(key)
+            if entry is not None and self.__too_stale(entry, now):
+                del self.entries[key]
+            elif entry is not None:
+                self.entries.move_to_end(key)
+                if now < entry.expire_at:
+                    self.hit_counter.inc()
+                else:
+                    self.stale_counter.inc()
+                    if key not in self.loading:
+                        future = concurrent.futures.Future()
+                        self.loading[key] = future
+                        refresh_executor.submit(self.__load, key, loader,
+                                                future)
+                return entry.value
+
+            future = self.loading.get(key)
+            owner = future is None
+            if owner:
+                self.miss_counter.inc()
+                future = concurrent.futures.Future()
+                self.loading[key] = future
+            else:
+                self.coalesced_counter.inc()
+
+        if owner:
+            self.__load(key, loader, future)
+        return future.result()
+
+    def invalidate(self, key):
+        """Marks the value of key stale, it is refreshed on next get."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                entry.expire_at = self.clock()
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __too_stale(self, entry, now):
+        return self.max_stale is not None and \
+            now >= entry.expire_at + self.max_stale
+
+    def __evict(self, now):
+        """Drops least recently used entries over maxsize or too stale."""
+        while len(self.entries) > 1:
+            oldest = next(iter(self.entries.values()))
+            if len(self.entries) <= self.maxsize and \
+                    not self.__too_stale(oldest, now):
+                break
+            self.entries.popitem(last=False)
+
+    def __load(self, key, loader, future):
+        start = time.time()
+        try:
+            value = freeze(loader())
+        except Exception as e:
+            logger.warning("Failed to load %s into cache %s", key, self.name,
+                           exc_info=True)
+            with self.lock:
+                self.loading.pop(key, None)
+            future.set_exception(e)
+            return
+        finally:
+            self.refresh_histogram.observe(time.time() - start)
+
+        with self.lock:
+            now = self.clock()
+            self.entries[key] = CacheEntry(value, now + self.ttl)
+            self.entries.move_to_end(key)
+            self.__evict(now)
+            self.loading.pop(key, None)
+        future.set_result(value)
+
+
+def fcache(TTLInSec=DEFAULT_TTL, maxsize=DEFAULT_MAXSIZE, max_stale=None):
+    """Decorator caching results of a function by its arguments.
+
+    See Cache for refresh behavior. The returned values are frozen and must
+    not be modified. The cache is available as the cache attribute of the
+    decorated function, wrapped.invalidate(*args) marks one result stale.
+    """
+    def fcache_decorator(func):
+        cache = Cache(func.__name__,
+                      maxsize=maxsize,
+                      ttl=TTLInSec,
+                      max_stale=max_stale)
+
+        def to_key(args, kwargs):
+            return args + tuple(sorted(kwargs.items()))
+
+        @wraps(func)
+        def wrapped_function(*args, **kwargs):
+            return cache.get(to_key(args, kwargs),
+                             lambda: func(*args, **kwargs))
+
+        wrapped_function.cache = cache
+        wrapped_function.invalidate = \
+            lambda *args, **kwargs: cache.invalidate(to_key(args, kwargs))
+        return wrapped_function
+
+    return fcache_decorator
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+
+import datetime
+import json
+import logging
+import threading
+import time
+
+from DataHandler import DataManager
+from redis_utils import get_redis_conn, to_str, REDIS_SOCKET_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+CLUSTER_STATUS_KEY = "cluster_status"
+CLUSTER_STATUS_VERSION_KEY = "cluster_status_version"
+CLUSTER_STATUS_TIME_KEY = "cluster_status_time"
+CLUSTER_STATUS_CHANNEL = "cluster_status_updates"
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Upper bound of how long the in-process copy is trusted without asking Redis
+# for the latest version, in case the subscription silently stops delivering.
+MAX_UNVERIFIED_SECONDS = 30
+# After a failure, readers use MySQL for this long before trying Redis again
+REDIS_RETRY_INTERVAL = 30
+
+
+def publish_cluster_status(redis_conn, serialized, version, update_time=None):
+    """Publishes serialized cluster status and its version to Redis.
+
+    Status, version and update time are written in one transaction and the
+    version is announced on CLUSTER_STATUS_CHANNEL afterwards.
+
+    Args:
+        redis_conn: Redis connection.
+        serialized: Cluster status serialized as JSON.
+        version: Version of the cluster status.
+        update_time: datetime of the update, defaults to now in UTC.
+
+    Returns:
+        True if published successfully, False otherwise.
+    """
+    if update_time is None:
+        update_time = datetime.datetime.utcnow()
+    try:
+        pipe = redis_conn.pipeline(transaction=True)
+        pipe.mset({
+            CLUSTER_STATUS_KEY: serialized,
+            CLUSTER_STATUS_VERSION_KEY: version,
+            CLUSTER_STATUS_TIME_KEY: update_time.strftime(TIME_FORMAT),
+        })
+        pipe.publish(CLUSTER_STATUS_CHANNEL, version)
+        pipe.execute()
+        return True
+    except Exception:
+        logger.exception("Failed to publish cluster status %s to redis",
+                         version)
+        return False
+
+
+class ClusterStatusReader(object):
+    """Reads the latest cluster status published by node_manager.
+
+    Decoded cluster status is kept in process and only re-read from Redis when
+    the published version changes. New versions are learned from the Redis
+    subscription, or by polling the version key when there is no trustworthy
+    notification. Falls back to the latest snapshot in MySQL when Redis is not
+    available.
+
+    The returned cluster status is shared between callers and must not be
+    modified.
+    """
+    def __init__(self, redis_conn=None, subscribe=True):
+        self.redis_conn = redis_conn if redis_conn is not None \
+            else get_redis_conn()
+        self.lock = threading.Lock()
+
+        self.version = None
+        self.cluster_status = None
+        self.update_time = None
+        self.verified_at = 0
+
+        # Latest version announced through subscription, None if unknown
+        self.notified_version = None
+        self.redis_disabled_until = 0
+
+        if subscribe:
+            t = threading.Thread(target=self.__subscribe,
+                                 name="cluster_status_subscriber")
+            t.daemon = True
+            t.start()
+
+    def __subscribe(self):
+        while True:
+            try:
+                pubsub = self.redis_conn.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(CLUSTER_STATUS_CHANNEL)
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is None:
+                        continue
+                    with self.lock:
+                        self.notified_version = to_str(message["data"])
+            except Exception:
+                logger.warning("cluster status subscription failed",
+                               exc_info=True)
+            with self.lock:
+                self.notified_version = None
+            time.sleep(REDIS_SOCKET_TIMEOUT)
+
+    def __get_cached(self):
+        with self.lock:
+            if self.cluster_status is None:
+                return None
+            if self.notified_version == self.version and \
+                    time.time() - self.verified_at < MAX_UNVERIFIED_SECONDS:
+                return self.cluster_status, self.update_time
+        return None
+
+    def __load_from_redis(self):
+        version = to_str(self.redis_conn.get(CLUSTER_STATUS_VERSION_KEY))
+        if version is None:
+            return None
+
+        with self.lock:
+            if version == self.version:
+                self.verified_at = time.time()
+                return self.cluster_status, self.update_time
+
+        serialized, version, update_time = self.redis_conn.mget(
+            CLUSTER_STATUS_KEY, CLUSTER_STATUS_VERSION_KEY,
+            CLUSTER_STATUS_TIME_KEY)
+        if serialized is None:
+            return None
+
+        cluster_status = json.loads(to_str(serialized))
+        update_time = datetime.datetime.strptime(to_str(update_time),
+                                                 TIME_FORMAT)
+        with self.lock:
+            self.version = to_str(version)
+            self.cluster_status = cluster_status
+            self.update_time = update_time
+            self.verified_at = time.time()
+        return cluster_status, update_time
+
+    def get(self):
+        """Returns the latest cluster status.
+
+        Returns:
+            A tuple of (cluster status, last updated time).
+        """
+        cached = self.__get_cached()
+        if cached is not None:
+            return cached
+
+        if time.time() >= self.redis_disabled_until:
+            try:
+                ret = self.__load_from_redis()
+                if ret is not None:
+                    return ret
+            except Exception:
+                logger.warning("Failed to get cluster status from redis",
+                               exc_info=True)
+                self.redis_disabled_until = time.time() + \
+                    REDIS_RETRY_INTERVAL
+
+        logger.info("Falling back to cluster status in DB")
+        return DataManager.GetClusterStatus()
+
+    def get_version(self):
+        """Returns the version of the latest cluster status.
+
+        The snapshot in MySQL has no version, its update time is used instead.
+        """
+        cluster_status, update_time = self.get()
+        with self.lock:
+            if cluster_status is self.cluster_status:
+                return self.version
+        return str(update_time)
+
+
+reader = None
+reader_lock = threading.Lock()
+
+
+def get_reader():
+    global reader
+    if reader is None:
+        with reader_lock:
+            if reader is None:
+                reader = ClusterStatusReader()
+    return reader
+
+
+def get_cluster_status():
+    """Returns the latest cluster status through the process-wide reader.
+
+    Returns:
+        A tuple of (cluster status, last updated time). The cluster status must
+        not be modified.
+    """
+    return get_reader().get()
+
+
+def get_cluster_status_version():
+    """Returns the version of the latest cluster status through the
+    process-wide reader."""
+    return get_reader().get_version()
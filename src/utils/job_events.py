@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""Change feed of job status and job endpoints.
+
+Whoever changes the status or endpoints of a job in DB appends an event to a
+Redis stream, the REST API reads the stream and pushes events to watchers as
+server-sent events. Stream entry ids are used as event ids, so watchers can
+resume from the last event they have seen with Last-Event-ID.
+
+The stream lives in the jobmanager Redis, which evicts keys under memory
+pressure. When events after the last seen one may be gone, trimmed or evicted
+with the stream, watchers get a reset event and reload, e.g. by polling the
+job list, before using events again.
+
+Each stream holds a server thread, so a process serves at most max_streams
+streams at a time, "job_events" in config.yaml:
+
+    job_events:
+      max_streams: 8
+"""
+
+import json
+import logging
+import threading
+import time
+
+from config import config
+from redis_utils import get_redis_conn, to_str, REDIS_SOCKET_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+JOB_EVENTS_STREAM = "job_events"
+# Approximate number of events kept, older events are trimmed. An event takes
+# about 200 bytes, a few MB of the 100 MB of the jobmanager Redis.
+JOB_EVENTS_MAXLEN = 10000
+# Id to read a stream from its first event
+START_EVENT_ID = "0-0"
+
+STATUS_EVENT = "status"
+ENDPOINT_EVENT = "endpoint"
+# Tells watchers that events may have been missed and they need to reload
+RESET_EVENT = "reset"
+
+# Publishing is best effort. After a failure, publishing is skipped for a
+# while so that DB updates are not slowed down by an unavailable Redis.
+PUBLISH_RETRY_INTERVAL = 60
+PUBLISH_SOCKET_TIMEOUT = 1
+
+READ_BLOCK_MS = 15000
+READ_COUNT = 1000
+# Streams are closed after a while and watchers reconnect, so that a long
+# lived connection does not hold a server worker forever.
+MAX_STREAM_SECONDS = 300
+RECONNECT_MS = 1000
+
+# Concurrent streams per process, out of the 25 threads of the REST API
+DEFAULT_MAX_STREAMS = 8
+# Seconds watchers wait, or poll instead, when there are too many streams
+STREAM_RETRY_AFTER = 30
+
+
+def new_status_event(job_id, username, vc_name, job_status):
+    return {
+        "type": STATUS_EVENT,
+        "jobId": job_id,
+        "userName": username,
+        "vcName": vc_name,
+        "jobStatus": job_status,
+    }
+
+
+def new_endpoint_event(job_id, username, vc_name, endpoint_id,
+                       endpoint_status):
+    return {
+        "type": ENDPOINT_EVENT,
+        "jobId": job_id,
+        "userName": username,
+        "vcName": vc_name,
+        "endpointId": endpoint_id,
+        "endpointStatus": endpoint_status,
+    }
+
+
+class JobEventPublisher(object):
+    def __init__(self, redis_conn=None):
+        self.redis_conn = redis_conn if redis_conn is not None \
+            else get_redis_conn(socket_timeout=PUBLISH_SOCKET_TIMEOUT)
+        self.disabled_until = 0
+
+    def publish(self, event):
+        """Appends event to the stream.
+
+        Returns:
+            Id of the event, None if not published.
+        """
+        if time.time() < self.disabled_until:
+            return None
+        try:
+            fields = {k: v for k, v in event.items() if v is not None}
+            return to_str(
+                self.redis_conn.xadd(JOB_EVENTS_STREAM,
+                                     fields,
+                                     maxlen=JOB_EVENTS_MAXLEN,
+                                     approximate=True))
+        except Exception:
+            logger.warning("Failed to publish job event %s", event,
+                           exc_info=True)
+            self.disabled_until = time.time() + PUBLISH_RETRY_INTERVAL
+            return None
+
+
+publisher = None
+publisher_lock = threading.Lock()
+
+
+def get_publisher():
+    global publisher
+    if publisher is None:
+        with publisher_lock:
+            if publisher is None:
+                publisher = JobEventPublisher()
+    return publisher
+
+
+def is_publishing():
+    """Returns False if publishing is skipped after a recent failure."""
+    return time.time() >= get_publisher().disabled_until
+
+
+def publish_job_event(event):
+    return get_publisher().publish(event)
+
+
+def parse_event_id(event_id):
+    """Parses a stream entry id "<ms>-<seq>" into a tuple, None if invalid."""
+    try:
+        ms, seq = event_id.split("-")
+        return int(ms), int(seq)
+    except (AttributeError, ValueError):
+        return None
+
+
+class JobEventReader(object):
+    """Reads job events after a given event id.
+
+    Without a valid last event id, reading starts from the latest event.
+    needs_reset is True if events after last_event_id may be gone, trimmed
+    from the stream or evicted with it, or the id is invalid. reset() then
+    moves to the latest event.
+    """
+    def __init__(self, redis_conn, last_event_id=None):
+        self.redis_conn = redis_conn
+        self.needs_reset = False
+
+        if parse_event_id(last_event_id) is not None:
+            self.last_event_id = last_event_id
+            self.needs_reset = self.has_gap()
+        else:
+            self.needs_reset = last_event_id is not None
+            self.last_event_id = self.get_latest_event_id()
+
+    def get_latest_event_id(self):
+        latest = self.redis_conn.xrevrange(JOB_EVENTS_STREAM, count=1)
+        return to_str(latest[0][0]) if latest else START_EVENT_ID
+
+    def has_gap(self):
+        """Returns True if events after last_event_id may be gone.
+
+        Trimming and eviction drop the oldest events, so events are missing
+        if the stream now starts after last_event_id, or is gone.
+        """
+        if self.last_event_id == START_EVENT_ID:
+            return False
+        first = self.redis_conn.xrange(JOB_EVENTS_STREAM, count=1)
+        if not first:
+            return True
+        return parse_event_id(to_str(first[0][0])) > \
+            parse_event_id(self.last_event_id)
+
+    def reset(self):
+        self.last_event_id = self.get_latest_event_id()
+        self.needs_reset = False
+
+    def read(self, block_ms=READ_BLOCK_MS):
+        """Returns a list of (event id, event) after the last read event,
+        waiting at most block_ms for new events. Returns an empty list and
+        sets needs_reset if events may have been missed."""
+        resp = self.redis_conn.xread({JOB_EVENTS_STREAM: self.last_event_id},
+                                     count=READ_COUNT,
+                                     block=block_ms)
+        if self.has_gap():
+            self.needs_reset = True
+            return []
+
+        events = []
+        for _, entries in resp or []:
+            for entry_id, fields in entries:
+                event = {to_str(k): to_str(v) for k, v in fields.items()}
+                events.append((to_str(entry_id), event))
+        if events:
+            self.last_event_id = events[-1][0]
+        return events
+
+
+def format_sse(event_id, event_type, data):
+    return "id: %s\nevent: %s\ndata: %s\n\n" % (event_id, event_type,
+                                                 json.dumps(data))
+
+
+def generate_sse(reader,
+                 match,
+                 max_seconds=MAX_STREAM_SECONDS,
+                 block_ms=READ_BLOCK_MS):
+    """Generates server-sent events of events matched by match(event).
+
+    Events not matched are skipped, but watchers are still told their ids so
+    that they resume after them. Watchers get a reset event, with the id to
+    resume from, when events may have been missed.
+    """
+    yield "retry: %d\n\n" % RECONNECT_MS
+
+    deadline = time.time() + max_seconds
+    while True:
+        if reader.needs_reset:
+            reader.reset()
+            yield format_sse(reader.last_event_id, RESET_EVENT, {})
+        if time.time() >= deadline:
+            break
+
+        events = reader.read(block_ms)
+        if reader.needs_reset:
+            continue
+        if not events:
+            yield ": keepalive\n\n"
+            continue
+        sent_id = None
+        for event_id, event in events:
+            if match(event):
+                sent_id = event_id
+                yield format_sse(event_id, event["type"], event)
+        if sent_id != reader.last_event_id:
+            yield "id: %s\n\n" % reader.last_event_id
+
+
+class StreamLimiter(object):
+    """Counts streams of the process, up to max_streams at a time."""
+    def __init__(self, max_streams=None):
+        self.max_streams = max_streams
+        self.streams = 0
+        self.lock = threading.Lock()
+
+    def get_max_streams(self):
+        if self.max_streams is not None:
+            return self.max_streams
+        settings = config.get("job_events") or {}
+        return settings.get("max_streams", DEFAULT_MAX_STREAMS)
+
+    def acquire(self):
+        """Returns True if a new stream can be served, call release() when
+        it ends."""
+        with self.lock:
+            if self.streams >= self.get_max_streams():
+                return False
+            self.streams += 1
+            return True
+
+    def release(self):
+        with self.lock:
+            self.streams -= 1
+
+
+stream_limiter = StreamLimiter()
+
+reader_conn = None
+reader_conn_lock = threading.Lock()
+
+
+def get_job_event_reader(last_event_id=None):
+    """Returns a JobEventReader sharing the process-wide connection pool."""
+    global reader_conn
+    if reader_conn is None:
+        with reader_conn_lock:
+            if reader_conn is None:
+                reader_conn = get_redis_conn(
+                    socket_timeout=REDIS_SOCKET_TIMEOUT +
+                    READ_BLOCK_MS / 1000)
+    return JobEventReader(reader_conn, last_event_id)
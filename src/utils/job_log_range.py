@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""Byte ranges of raw job logs.
+
+Raw logs are read from the log backend, which resumes after a cursor of a
+line but knows nothing of byte offsets in the log. LogIndex maps offsets to
+cursors, a checkpoint every CHECKPOINT_SIZE bytes, as logs are read, so that
+a range is read from the checkpoint before its start instead of from the
+start of the log. The log of a job which has not finished can still change,
+it is always read in full and not indexed.
+"""
+
+import bisect
+import collections
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_SIZE = 1024 * 1024
+# Jobs whose index is kept
+MAX_INDEXES = 1024
+
+FINISHED_STATUSES = ("finished", "failed", "killed", "error")
+
+
+class LogIndex(object):
+    """Checkpoints (offset, cursor) of a log and its size once it is read to
+    the end. Cursor None is the start of the log."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.offsets = [0]
+        self.cursors = [None]
+        self.size = None
+
+    def locate(self, offset):
+        """Returns the last checkpoint (offset, cursor) at or before
+        offset."""
+        with self.lock:
+            i = bisect.bisect_right(self.offsets, offset) - 1
+            return (self.offsets[i], self.cursors[i])
+
+    def last(self):
+        with self.lock:
+            return (self.offsets[-1], self.cursors[-1])
+
+    def add(self, offset, cursor):
+        """Adds checkpoint (offset, cursor) if it is CHECKPOINT_SIZE after
+        the last one."""
+        with self.lock:
+            if offset >= self.offsets[-1] + CHECKPOINT_SIZE:
+                self.offsets.append(offset)
+                self.cursors.append(cursor)
+
+    def complete(self, size):
+        with self.lock:
+            self.size = size
+
+
+class LogIndexes(object):
+    """LogIndex of the last maxsize jobs read."""
+    def __init__(self, maxsize=MAX_INDEXES):
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.indexes = collections.OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            index = self.indexes.get(key)
+            if index is None:
+                index = self.indexes[key] = LogIndex()
+                while len(self.indexes) > self.maxsize:
+                    self.indexes.popitem(last=False)
+            else:
+                self.indexes.move_to_end(key)
+            return index
+
+
+indexes = LogIndexes()
+
+
+class RawLog(object):
+    """Raw log read with open_log(cursor), which yields (cursor, text) of
+    the lines after cursor. open_log must raise if it fails to read lines
+    instead of skipping them, or the offsets in the index would be wrong.
+    Byte ranges can be read if there is an index."""
+    def __init__(self, open_log, index=None):
+        self.open_log = open_log
+        self.index = index
+
+    def seekable(self):
+        return self.index is not None
+
+    def size(self):
+        """Returns the size of the log if it is known."""
+        return self.index.size if self.index is not None else None
+
+    def get_size(self):
+        """Returns the size of the log, reading it from the last checkpoint
+        to the end if it is not known."""
+        if self.index.size is None:
+            (offset, _) = self.index.last()
+            for _ in self.read(offset):
+                pass
+        return self.index.size
+
+    def read(self, start=0, end=None):
+        """Yields the bytes of the log from start to end, inclusive, or to the
+        end of the log. Stops early if the backend fails, so that the client
+        gets less than the length announced and can resume."""
+        if self.index is None:
+            (offset, cursor) = (0, None)
+        else:
+            (offset, cursor) = self.index.locate(start)
+        lines = self.open_log(cursor)
+        try:
+            for (cursor, text) in lines:
+                data = text.encode("utf-8")
+                if offset + len(data) > start:
+                    stop = len(data) if end is None else end + 1 - offset
+                    yield data[max(0, start - offset):stop]
+                offset += len(data)
+                if self.index is not None:
+                    self.index.add(offset, cursor)
+                if end is not None and offset > end:
+                    return
+            if self.index is not None:
+                self.index.complete(offset)
+        except Exception:
+            logger.exception("Failed to read log at offset %d", offset)
+        finally:
+            lines.close()
+
+
+def open_raw_log(key, open_log, finished):
+    """Returns the RawLog of job key, indexed if the job has finished."""
+    if not finished:
+        return RawLog(open_log)
+    return RawLog(open_log, indexes.get(key))
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""Bounded tails of job logs and their storage.
+
+Logs can be many GB, only their last lines are kept in memory, in LogTail, and
+shown in the web page. The trimmed text is stored zlib compressed in the
+joblogs table. Jobs whose tail has not been moved there yet still have it in
+the jobLog field of the jobs table, zlib compressed and base64 encoded with
+ENCODED_PREFIX, or plain base64 text for older jobs.
+"""
+
+import base64
+import collections
+import os
+import zlib
+
+ENCODED_PREFIX = "zlib:"
+
+# Logs with fewer lines are shown in full, longer ones are trimmed to
+# TRIMMED_LINES.
+MAX_FULL_LINES = 3000
+TRIMMED_LINES = 2000
+
+# Bytes read at a time when reading a file backwards
+READ_BLOCK_SIZE = 64 * 1024
+
+
+class LogTail(object):
+    """Last max_lines lines of a log, and the number of lines in the log."""
+    def __init__(self, max_lines=MAX_FULL_LINES, lines=(), total=None):
+        self.lines = collections.deque(lines, maxlen=max_lines)
+        self.total = len(self.lines) if total is None else total
+
+    def append(self, line):
+        self.lines.append(line)
+        self.total += 1
+
+    def is_trimmed(self):
+        return self.total >= MAX_FULL_LINES
+
+    def text(self):
+        lines = self.lines
+        if self.is_trimmed():
+            lines = list(lines)[-TRIMMED_LINES:]
+        return "".join(lines)
+
+
+def read_file_tail(path, max_lines):
+    """Returns the last max_lines lines of a file, with line endings, reading
+    only as much of the file as needed."""
+    if not os.path.exists(path):
+        return []
+
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        data = b""
+        # One more newline than lines, the last line may end with one
+        while pos > 0 and data.count(b"\n") <= max_lines:
+            size = min(READ_BLOCK_SIZE, pos)
+            pos -= size
+            f.seek(pos)
+            data = f.read(size) + data
+
+    # If not at the start of the file, the first line is partial and there
+    # are more than max_lines lines
+    lines = data.decode("utf-8", errors="ignore").splitlines(keepends=True)
+    return lines[-max_lines:]
+
+
+def timestamp_key(timestamp):
+    """Returns a key ordering RFC3339 UTC timestamps as of
+    kubectl logs --timestamps, which have 0 to 9 fraction digits."""
+    timestamp = timestamp.rstrip("Z")
+    seconds, _, fraction = timestamp.partition(".")
+    return seconds + "." + fraction.ljust(9, "0")
+
+
+def compress_job_log(text):
+    return zlib.compress(text.encode("utf-8"))
+
+
+def decompress_job_log(data):
+    """Returns the text of a joblogs row, None if there is none."""
+    if data is None:
+        return None
+    return zlib.decompress(bytes(data)).decode("utf-8")
+
+
+def encode_job_log(text):
+    compressed = zlib.compress(text.encode("utf-8"))
+    return ENCODED_PREFIX + base64.b64encode(compressed).decode("utf-8")
+
+
+def decode_job_log(value):
+    """Returns the text of a jobLog field value, None if there is none."""
+    if value is None:
+        return None
+    if value.startswith(ENCODED_PREFIX):
+        compressed = base64.b64decode(value[len(ENCODED_PREFIX):])
+        return zlib.decompress(compressed).decode("utf-8")
+    try:
+        decoded = base64.b64decode(value.encode("utf-8"), validate=True)
+        return decoded.decode("utf-8")
+    except Exception:
+        return value
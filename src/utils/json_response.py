@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""JSON serialization, streaming and compression of REST API responses.
+
+orjson and brotli are optional. Without orjson, responses are serialized by
+the json module, without brotli only gzip is offered.
+"""
+
+import datetime
+import decimal
+import json
+import time
+import uuid
+import zlib
+
+from flask import Response, has_request_context, request
+from prometheus_client import Histogram
+from werkzeug.http import http_date
+
+import request_profile
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from flask.json.provider import DefaultJSONProvider
+except ImportError:  # Flask < 2.2
+    DefaultJSONProvider = None
+
+# Responses smaller than this are not worth compressing
+MIN_COMPRESS_SIZE = 1024
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+# Number of list items serialized into one chunk of a streamed response
+STREAM_BATCH_SIZE = 100
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SORT_KEYS | \
+        orjson.OPT_PASSTHROUGH_DATETIME
+
+response_size_histogram = Histogram(
+    "restfulapi_response_size_bytes",
+    "size of response bodies sent (bytes)",
+    buckets=(1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216,
+             float("inf")),
+    labelnames=("endpoint", "encoding"))
+
+serialize_histogram = Histogram(
+    "restfulapi_json_serialize_latency_seconds",
+    "latency for serializing responses to JSON (seconds)",
+    buckets=(.001, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0,
+             float("inf")),
+    labelnames=("endpoint",))
+
+
+def current_endpoint():
+    if has_request_context() and request.endpoint is not None:
+        return request.endpoint
+    return "none"
+
+
+def default(o):
+    """Serializes types not supported by JSON the same way as Flask."""
+    if isinstance(o, datetime.date):
+        return http_date(o)
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+    if hasattr(o, "__html__"):
+        return str(o.__html__())
+    raise TypeError("Object of type %s is not JSON serializable" %
+                    type(o).__name__)
+
+
+def json_key(key):
+    """Returns key as the string the json module writes for it."""
+    if isinstance(key, str):
+        return key
+    if key is None or isinstance(key, (bool, int, float)):
+        return json.dumps(key)
+    raise TypeError("keys must be str, int, float, bool or None, not %s" %
+                    type(key).__name__)
+
+
+def with_str_keys(obj):
+    """Returns obj with all dict keys converted to strings, so that keys of
+    mixed types can be sorted."""
+    if isinstance(obj, dict):
+        return {json_key(k): with_str_keys(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [with_str_keys(item) for item in obj]
+    return obj
+
+
+def json_dumps(obj):
+    return json.dumps(obj,
+                      default=default,
+                      sort_keys=True,
+                      separators=(",", ":")).encode("utf-8")
+
+
+def serialize(obj):
+    """Returns obj serialized as compact JSON bytes with sorted keys."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=default, option=ORJSON_OPTIONS)
+        except TypeError:
+            # e.g. integers over 64 bits, let json module try
+            pass
+    try:
+        return json_dumps(obj)
+    except TypeError:
+        # Keys of mixed types cannot be sorted, non str keys are converted
+        # like orjson does with OPT_NON_STR_KEYS
+        return json_dumps(with_str_keys(obj))
+
+
+def dumps(obj):
+    """serialize() with serialization time recorded for the endpoint."""
+    start = time.time()
+    try:
+        return serialize(obj)
+    finally:
+        elapsed = time.time() - start
+        serialize_histogram.labels(current_endpoint()).observe(elapsed)
+        request_profile.add_time("serialize", elapsed)
+
+
+if DefaultJSONProvider is not None:
+
+    class JSONProvider(DefaultJSONProvider):
+        def dumps(self, obj, **kwargs):
+            return dumps(obj).decode("utf-8")
+else:
+    from flask.json import JSONEncoder
+
+    class JSONProvider(JSONEncoder):
+        def encode(self, o):
+            return dumps(o).decode("utf-8")
+
+
+def iter_json_list(items):
+    yield b"["
+    for i in range(0, len(items), STREAM_BATCH_SIZE):
+        chunk = b",".join(
+            serialize(item) for item in items[i:i + STREAM_BATCH_SIZE])
+        yield chunk if i == 0 else b"," + chunk
+    yield b"]"
+
+
+def iter_json(obj):
+    """Yields obj serialized as JSON in chunks.
+
+    Lists at top level or in a top level dict are serialized a batch of items
+    at a time, so that the full JSON document is never built in memory.
+    """
+    if isinstance(obj, list):
+        yield from iter_json_list(obj)
+    elif isinstance(obj, dict):
+        yield b"{"
+        items = sorted(obj.items(), key=lambda item: str(item[0]))
+        for i, (key, val) in enumerate(items):
+            prefix = b"," if i > 0 else b""
+            yield prefix + serialize(str(key)) + b":"
+            if isinstance(val, list):
+                yield from iter_json_list(val)
+            else:
+                yield serialize(val)
+        yield b"}"
+    else:
+        yield serialize(obj)
+
+
+def stream_json(obj):
+    """Returns a streamed JSON response of obj."""
+    endpoint = current_endpoint()
+
+    def generate():
+        elapsed = 0
+        chunks = iter_json(obj)
+        while True:
+            start = time.time()
+            chunk = next(chunks, None)
+            elapsed += time.time() - start
+            if chunk is None:
+                break
+            yield chunk
+        serialize_histogram.labels(endpoint).observe(elapsed)
+
+    return Response(generate(), mimetype="application/json")
+
+
+def choose_encoding():
+    """Returns the best content encoding accepted by the request, None for
+    no compression."""
+    offered = ["br", "gzip"] if brotli is not None else ["gzip"]
+    return request.accept_encodings.best_match(offered)
+
+
+def compress(data, encoding):
+    if encoding == "gzip":
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+    return brotli.compress(data, quality=BROTLI_QUALITY)
+
+
+def iter_compress(chunks, encoding):
+    if encoding == "gzip":
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        process, finish = compressor.compress, compressor.flush
+    else:
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        process, finish = compressor.process, compressor.finish
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        data = process(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+def iter_record_size(chunks, endpoint, encoding):
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        yield chunk
+    response_size_histogram.labels(endpoint, encoding).observe(size)
+
+
+def set_content_encoding(response, encoding):
+    response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    # Compressed body is not byte-for-byte identical anymore
+    etag, weak = response.get_etag()
+    if etag is not None and not weak:
+        response.set_etag(etag, weak=True)
+
+
+def compress_response(response):
+    """after_request hook compressing responses and recording their sizes.
+
+    Server-sent events and responses already encoded are left as they are.
+    """
+    if response.direct_passthrough:
+        return response
+
+    endpoint = current_endpoint()
+    encoding = None
+    if response.status_code == 200 and \
+            "Content-Encoding" not in response.headers and \
+            response.mimetype != "text/event-stream":
+        encoding = choose_encoding()
+
+    if response.is_streamed:
+        if encoding is not None:
+            response.response = iter_compress(response.response, encoding)
+            response.headers.pop("Content-Length", None)
+            set_content_encoding(response, encoding)
+        else:
+            encoding = response.headers.get("Content-Encoding", "identity")
+        response.response = iter_record_size(response.response, endpoint,
+                                             encoding)
+        return response
+
+    data = response.get_data()
+    if encoding is not None and len(data) >= MIN_COMPRESS_SIZE:
+        data = compress(data, encoding)
+        response.set_data(data)
+        set_content_encoding(response, encoding)
+    else:
+        encoding = response.headers.get("Content-Encoding", "identity")
+    response_size_histogram.labels(endpoint, encoding).observe(len(data))
+    return response
+
+
+def install(app):
+    """Serializes JSON responses of app with serialize() and compresses
+    responses when clients accept it."""
+    if DefaultJSONProvider is not None:
+        app.json = JSONProvider(app)
+    else:
+        app.json_encoder = JSONProvider
+    app.after_request(compress_response)
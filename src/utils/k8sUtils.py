@@ -7,6 +7,7 @@ from datetime import datetime
 import logging
 import yaml
 import subprocess
+import shlex
 
 from kubernetes import client, config as k8s_config
 from kubernetes.client.rest import ApiException
@@ -185,6 +186,45 @@ def GetLog(jobId, tail=None):
     return logs
 
 
+def get_job_containers(jobId):
+    """Returns (podName, containerID) of the first container of pods of the
+    job."""
+    podInfo = GetPod("jobId=" + jobId)
+    containers = []
+    if podInfo is not None and "items" in podInfo:
+        for item in podInfo["items"]:
+            try:
+                containerID = item["status"]["containerStatuses"][0][
+                    "containerID"].replace("docker://", "")
+                containers.append((item["metadata"]["name"], containerID))
+            except (KeyError, IndexError, TypeError):
+                pass
+    return containers
+
+
+def stream_log(podName, since_time=None):
+    """Yields (timestamp, line) of the log of a pod, from since_time on if
+    given, without reading the whole log into memory. timestamp is RFC3339
+    of when the line is logged, and since_time is one of them. Lines keep
+    their line endings."""
+    params = " logs --timestamps " + shlex.quote(podName)
+    if since_time is not None:
+        params += " --since-time=" + shlex.quote(since_time)
+    proc = subprocess.Popen(["bash", "-c", config["kubelet-path"] + params],
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL)
+    try:
+        for raw_line in proc.stdout:
+            line = raw_line.decode("utf-8", errors="replace")
+            timestamp, _, text = line.partition(" ")
+            yield timestamp, text
+    finally:
+        proc.stdout.close()
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+
+
 def check_pod_status(pod):
 
     try:
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""Lightweight access to raw (JSON) Kubernetes API objects.
+
+Deserializing API responses into kubernetes.client models is expensive for
+large lists. Callers that only read a few fields can keep the raw JSON, drop
+everything except those fields with project(), and read it through RawObject
+with the same attribute names as the client models, e.g. pod.spec.node_name.
+
+Fields are described by a nested dictionary keyed by JSON (camelCase) field
+names. A None value keeps the field as it is, which is what maps like labels
+or resource requests need. A dictionary value descends into the object, or
+into each element if the field is a list.
+"""
+
+
+def project(raw, fields):
+    """Keeps only the given fields of a raw Kubernetes API object.
+
+    Args:
+        raw: Raw API object parsed from JSON.
+        fields: Nested dictionary describing fields to keep.
+
+    Returns:
+        A copy of raw with only the fields in fields.
+    """
+    if fields is None or raw is None:
+        return raw
+    if isinstance(raw, list):
+        return [project(item, fields) for item in raw]
+    if not isinstance(raw, dict):
+        return raw
+    return {
+        name: project(raw[name], sub_fields)
+        for name, sub_fields in fields.items()
+        if name in raw
+    }
+
+
+def to_camel_case(name):
+    head, *tail = name.split("_")
+    return head + "".join(word.title() for word in tail)
+
+
+class RawObject(object):
+    """Read-only attribute view of a raw Kubernetes API object.
+
+    Missing fields read as None, like unset fields of the client models.
+    """
+    __slots__ = ("raw", "fields")
+
+    def __init__(self, raw, fields):
+        self.raw = raw
+        self.fields = fields
+
+    def __getattr__(self, name):
+        key = to_camel_case(name)
+        val = self.raw.get(key)
+        sub_fields = self.fields.get(key)
+        if val is None or sub_fields is None:
+            return val
+        if isinstance(val, list):
+            return [
+                RawObject(item, sub_fields) if isinstance(item, dict) else item
+                for item in val
+            ]
+        if isinstance(val, dict):
+            return RawObject(val, sub_fields)
+        return val
+
+    def __repr__(self):
+        return "RawObject(%s)" % self.raw
@@ -1,10 +1,13 @@
 #!/usr/bin/env python3
 
+import json
 import logging
 
 from kubernetes import client, config as k8s_config
 from kubernetes.client.rest import ApiException
 
+from k8s_raw import project, RawObject
+
 logger = logging.getLogger(__name__)
 
 # The config will be loaded from default location.
@@ -12,6 +15,8 @@ k8s_config.load_kube_config()
 k8s_core_api = client.CoreV1Api()
 k8s_app_api = client.AppsV1Api()
 
+DEFAULT_PAGE_SIZE = 500
+
 
 class K8sUtil(object):
     def __init__(self, timeout_seconds=0):
@@ -42,36 +47,85 @@ class K8sUtil(object):
             logger.warning(msg, exc_info=True)
         return pods
 
-    def get_all_pods(self):
+    def get_all_pods(self, limit=DEFAULT_PAGE_SIZE, raw_fields=None):
         """Finds all pods in all Kubernetes namespaces.
 
-        Returns:
-            A list of pods in all Kubernetes namespaces.
+        Pods are listed page by page so that only one page is in memory at a
+        time.
+
+        Args:
+            limit: Maximum number of pods in one page.
+            raw_fields: If not None, skips deserialization into V1Pod and
+                yields RawObject with only these fields of the raw JSON.
+
+        Yields:
+            Pods in all Kubernetes namespaces.
+
+        Raises:
+            ApiException: If listing any page fails.
         """
-        pods = []
-        try:
-            resp = self.core_api.list_pod_for_all_namespaces(
-                pretty=self.pretty, timeout_seconds=self.timeout_seconds)
-            logger.debug("All pods: %s", resp)
-            pods = resp.items
-        except ApiException:
-            msg = "Error getting all pods"
-            logger.warning(msg, exc_info=True)
-        return pods
+        return self.__list_all(self.core_api.list_pod_for_all_namespaces,
+                               "pods", limit, raw_fields)
 
-    def get_all_nodes(self):
+    def get_all_nodes(self, limit=DEFAULT_PAGE_SIZE, raw_fields=None):
         """Finds all Kubernetes nodes.
 
-        Returns:
-            A list of all Kubernetes nodes.
+        Nodes are listed page by page so that only one page is in memory at a
+        time.
+
+        Args:
+            limit: Maximum number of nodes in one page.
+            raw_fields: If not None, skips deserialization into V1Node and
+                yields RawObject with only these fields of the raw JSON.
+
+        Yields:
+            All Kubernetes nodes.
+
+        Raises:
+            ApiException: If listing any page fails.
         """
-        nodes = []
-        try:
-            resp = self.core_api.list_node(pretty=self.pretty,
-                                           timeout_seconds=self.timeout_seconds)
-            logger.debug("All nodes: %s", resp)
-            nodes = resp.items
-        except ApiException:
-            msg = "Error getting all nodes"
-            logger.warning(msg, exc_info=True)
-        return nodes
+        return self.__list_all(self.core_api.list_node, "nodes", limit,
+                               raw_fields)
+
+    def __list_all(self, list_fn, kind, limit, raw_fields):
+        # A failed page, e.g. 410 Gone for an expired continue token, is
+        # raised instead of ending the list early, so that callers never
+        # take a partial list for the complete one.
+        _continue = None
+        while True:
+            kwargs = {
+                "limit": limit,
+                "timeout_seconds": self.timeout_seconds,
+            }
+            if _continue:
+                kwargs["_continue"] = _continue
+
+            try:
+                if raw_fields is None:
+                    resp = list_fn(pretty=self.pretty, **kwargs)
+                    logger.debug("Page of %s: %s", kind, resp)
+                    items = resp.items
+                    _continue = resp.metadata._continue
+                else:
+                    resp = list_fn(_preload_content=False, **kwargs)
+                    try:
+                        page = json.loads(resp.data.decode("utf-8"))
+                    finally:
+                        resp.release_conn()
+                    items = [
+                        RawObject(project(item, raw_fields), raw_fields)
+                        for item in page.get("items") or []
+                    ]
+                    _continue = page.get("metadata", {}).get("continue")
+                    del page
+            except ApiException:
+                msg = "Error getting all %s" % kind
+                logger.warning(msg, exc_info=True)
+                raise
+
+            for item in items:
+                yield item
+            del items
+
+            if not _continue:
+                break
@@ -133,6 +133,71 @@ def __get_valid_vc_usage(vc_info, vc_usage):
     return valid_vc_usage
 
 
+def __to_matrix(resources, r_type, skus):
+    """Returns rows of resource values of r_type, one column per sku."""
+    matrix = []
+    for resource in resources:
+        res = resource.__dict__[r_type].res
+        matrix.append([res.get(sku, 0) for sku in skus])
+    return matrix
+
+
+def __to_resource_params(matrix, skus):
+    # Same value types as ResourceStat.normalize gives
+    return [{sku: float(v) if v > 0 else 0
+             for sku, v in zip(skus, row)}
+            for row in matrix]
+
+
+def __to_cluster_resource(params):
+    # Values are already converted, skip conversion in ClusterResource(params)
+    resource = ClusterResource()
+    for r_type, res in params.items():
+        resource.__dict__[r_type].res = res
+    return resource
+
+
+def __calculate_vc_resource_matrices(avail, reserved, quotas, usages, skus):
+    """Computes vc avail and unschedulable of one resource type.
+
+    All operands are VC x SKU matrices (lists of rows) or SKU vectors of the
+    same resource type. Every step is clamped at 0, the same as arithmetic on
+    ResourceStat.
+    """
+    quota_sum = [sum(col) for col in zip(*quotas)] if quotas else \
+        [0] * len(skus)
+
+    # Qi' = Qi - R * (Qi / sum(Qi)), over-reserve
+    # Qi'' = max(Qi' - Ui, 0)
+    ratios = []
+    for quota, used in zip(quotas, usages):
+        ratio = []
+        for q, u, r, q_sum in zip(quota, used, reserved, quota_sum):
+            r_reserved = math.ceil(r * q / q_sum) if q_sum != 0 else 0
+            ratio.append(max(0, max(0, q - r_reserved) - u))
+        ratios.append(ratio)
+
+    ratio_sum = [sum(col) for col in zip(*ratios)] if ratios else \
+        [0] * len(skus)
+
+    # Ai = A * (Qi'' / sum(Qi'')), under-avail
+    # max(Qi - Ui - Ai, 0)
+    avails = []
+    unschedulables = []
+    for quota, used, ratio in zip(quotas, usages, ratios):
+        vc_avail = [
+            math.floor(a * r / r_sum) if r_sum != 0 else 0
+            for a, r, r_sum in zip(avail, ratio, ratio_sum)
+        ]
+        avails.append(vc_avail)
+        unschedulables.append([
+            max(0, max(0, q - u) - a)
+            for q, u, a in zip(quota, used, vc_avail)
+        ])
+
+    return avails, unschedulables
+
+
 def calculate_vc_resources(cluster_capacity, cluster_avail, cluster_reserved,
                            vc_info, vc_usage):
     """Calculates vc resources based on cluster resources and vc info.
@@ -171,41 +236,42 @@ def calculate_vc_resources(cluster_capacity, cluster_avail, cluster_reserved,
     vc_avail = collections.defaultdict(lambda: ClusterResource())
     vc_unschedulable = collections.defaultdict(lambda: ClusterResource())
 
-    # vc total == assigned quota
-    for vc_name, quota in vc_info.items():
-        vc_total[vc_name] = copy.deepcopy(quota)
-
-    quota_sum = ClusterResource()
-    for vc_name, quota in vc_info.items():
-        quota_sum += quota
-
-    # ratios for calculating vc avail
-    #   Qi' = Qi - R * (Qi / sum(Qi))
-    #   Qi'' = max(Qi' - Ui, 0)
-    ratios = collections.defaultdict(lambda: ClusterResource())
-    for vc_name, quota in vc_info.items():
-        reserved = (cluster_reserved * quota / quota_sum).ceil # over-reserve
-        used = vc_usage.get(vc_name, ClusterResource())
-        ratio = quota - reserved
-        ratios[vc_name] = ratio - used
-
-    ratio_sum = ClusterResource()
-    for vc_name, ratio in ratios.items():
-        ratio_sum += ratio
-
-    logger.debug("ratios %s, ratio_sum %s", ratios, ratio_sum)
-
-    # calculate avail and unschedulable
-    # Ai = A * (Qi'' / sum(Qi''))
-    # max(Qi - Ui - Ai, 0)
-    for vc_name, ratio in ratios.items():
-        used = copy.deepcopy(vc_usage.get(vc_name, ClusterResource()))
-        avail = (cluster_avail * ratio / ratio_sum).floor # under-avail
-        quota = vc_total.get(vc_name, ClusterResource())
-
-        vc_used[vc_name] = used
-        vc_avail[vc_name] = avail
-        vc_unschedulable[vc_name] = quota - used - avail
+    vc_names = list(vc_info.keys())
+    quotas = [vc_info[vc_name] for vc_name in vc_names]
+    usages = [
+        vc_usage.get(vc_name, ClusterResource()) for vc_name in vc_names
+    ]
+
+    # Each resource type is computed on a VC x SKU matrix of plain numbers,
+    # instead of ClusterResource arithmetic which copies on every operation.
+    avail_params = [{} for _ in vc_names]
+    unschedulable_params = [{} for _ in vc_names]
+    for r_type in ClusterResource().__dict__:
+        skus = set()
+        for resource in [cluster_avail, cluster_reserved] + quotas + usages:
+            skus.update(resource.__dict__[r_type].res.keys())
+        skus = sorted(skus)
+
+        avails, unschedulables = __calculate_vc_resource_matrices(
+            __to_matrix([cluster_avail], r_type, skus)[0],
+            __to_matrix([cluster_reserved], r_type, skus)[0],
+            __to_matrix(quotas, r_type, skus),
+            __to_matrix(usages, r_type, skus), skus)
+
+        for params, row in zip(avail_params,
+                               __to_resource_params(avails, skus)):
+            params[r_type] = row
+        for params, row in zip(unschedulable_params,
+                               __to_resource_params(unschedulables, skus)):
+            params[r_type] = row
+
+    for i, vc_name in enumerate(vc_names):
+        # vc total == assigned quota
+        vc_total[vc_name] = copy.deepcopy(quotas[i])
+        vc_used[vc_name] = copy.deepcopy(usages[i])
+        vc_avail[vc_name] = __to_cluster_resource(avail_params[i])
+        vc_unschedulable[vc_name] = __to_cluster_resource(
+            unschedulable_params[i])
 
     logger.debug("vc_total %s, vc_used %s, vc_avail %s, vc_unschedulable %s",
                  vc_total, vc_used, vc_avail, vc_unschedulable)
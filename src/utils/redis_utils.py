@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+
+import redis
+
+from config import config
+
+DEFAULT_REDIS_HOST = "localhost"
+DEFAULT_REDIS_PORT = 9300
+REDIS_SOCKET_TIMEOUT = 5
+
+
+def get_redis_conn(port=None, socket_timeout=REDIS_SOCKET_TIMEOUT):
+    redis_config = config.get("redis", {})
+    host = redis_config.get("host", DEFAULT_REDIS_HOST)
+    if port is None:
+        port = redis_config.get("port", DEFAULT_REDIS_PORT)
+    return redis.StrictRedis(host=host,
+                             port=int(port),
+                             db=0,
+                             socket_timeout=socket_timeout)
+
+
+def to_str(val):
+    if isinstance(val, bytes):
+        return val.decode("utf-8")
+    return val
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""Per-request profiling of the REST API.
+
+Every request gets a RequestProfile, kept thread-local while the request is
+handled. Code under utils adds to the profile of the current request, e.g.
+DataHandler calls and DB time, without knowing about Flask:
+
+    with request_profile.timer("auth"):
+        ...
+    request_profile.count("db_rows", len(rows))
+
+Both are no-ops outside of a request. After each request, the latency is
+recorded per endpoint and requests slower than slow_request_seconds are
+logged with the breakdown. The breakdown is only returned to clients in a
+Server-Timing header if server_timing is set, as it exposes internal timings.
+
+A request is also run under cProfile if it is sampled by sample_rate, or has
+the X-DLTS-Profile header and allow_header is set. Its stats are logged.
+
+Settings are under "profiling" in config.yaml:
+
+    profiling:
+      slow_request_seconds: 1.0
+      sample_rate: 0.0
+      allow_header: false
+      server_timing: false
+"""
+
+import cProfile
+import io
+import logging
+import pstats
+import random
+import threading
+import time
+
+from prometheus_client import Histogram
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "X-DLTS-Profile"
+DEFAULT_SLOW_REQUEST_SECONDS = 1.0
+# Number of functions in logged cProfile stats
+PROFILE_STATS_LINES = 40
+
+request_latency_histogram = Histogram(
+    "restfulapi_request_latency_seconds",
+    "latency for handling requests (seconds)",
+    buckets=(.005, .01, .025, .05, .075, .1, .25, .5, .75, 1.0, 2.5, 5.0, 7.5,
+             10.0, float("inf")),
+    labelnames=("endpoint",))
+
+request_db_histogram = Histogram(
+    "restfulapi_request_db_seconds",
+    "time spent in DataHandler calls per request (seconds)",
+    buckets=(.005, .01, .025, .05, .075, .1, .25, .5, .75, 1.0, 2.5, 5.0, 7.5,
+             10.0, float("inf")),
+    labelnames=("endpoint",))
+
+local = threading.local()
+
+
+class RequestProfile(object):
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.start = time.time()
+        # name -> count, e.g. datahandler_calls, db_rows, db_connects
+        self.counts = {}
+        # name -> seconds, e.g. db, db_connect, auth, serialize
+        self.times = {}
+        # name -> depth of timers running, nested timers are not added twice
+        self.depths = {}
+        self.profiler = None
+
+    def count(self, name, n=1):
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def add_time(self, name, seconds):
+        self.times[name] = self.times.get(name, 0) + seconds
+
+    def elapsed(self):
+        return time.time() - self.start
+
+    def summary(self):
+        items = ["%s=%d" % (k, v) for k, v in sorted(self.counts.items())]
+        items.extend(
+            "%s=%.1fms" % (k, v * 1000) for k, v in sorted(self.times.items()))
+        return " ".join(items)
+
+    def server_timing(self, elapsed):
+        items = [
+            "%s;dur=%.1f" % (k, v * 1000)
+            for k, v in sorted(self.times.items())
+        ]
+        items.append("total;dur=%.1f" % (elapsed * 1000))
+        return ", ".join(items)
+
+
+def current():
+    """Returns the RequestProfile of the current request, None outside of
+    requests."""
+    return getattr(local, "profile", None)
+
+
+def count(name, n=1):
+    profile = current()
+    if profile is not None:
+        profile.count(name, n)
+
+
+def add_time(name, seconds):
+    profile = current()
+    if profile is not None:
+        profile.add_time(name, seconds)
+
+
+class timer(object):
+    """Context manager adding the time spent in it to the current request
+    profile. Time in a timer of the same name nested in it is only added
+    once."""
+    __slots__ = ("name", "profile", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.profile = current()
+        if self.profile is not None:
+            depths = self.profile.depths
+            depths[self.name] = depths.get(self.name, 0) + 1
+            self.start = time.time()
+        return self
+
+    def __exit__(self, *args):
+        if self.profile is not None:
+            depths = self.profile.depths
+            depths[self.name] -= 1
+            if depths[self.name] == 0:
+                self.profile.add_time(self.name, time.time() - self.start)
+
+
+def get_settings():
+    return config.get("profiling") or {}
+
+
+def should_run_cprofile(request):
+    settings = get_settings()
+    if settings.get("allow_header", False) and \
+            request.headers.get(PROFILE_HEADER):
+        return True
+    sample_rate = settings.get("sample_rate", 0)
+    return sample_rate > 0 and random.random() < sample_rate
+
+
+def format_cprofile(profiler):
+    out = io.StringIO()
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats("cumulative").print_stats(PROFILE_STATS_LINES)
+    return out.getvalue()
+
+
+def start_request():
+    # Not imported at module level, utils are also used without Flask
+    from flask import request
+
+    profile = RequestProfile(request.endpoint or "none")
+    if should_run_cprofile(request):
+        profile.profiler = cProfile.Profile()
+        profile.profiler.enable()
+    local.profile = profile
+
+
+def finish_request(response):
+    profile = current()
+    if profile is None:
+        return response
+
+    if profile.profiler is not None:
+        profile.profiler.disable()
+
+    elapsed = profile.elapsed()
+    request_latency_histogram.labels(profile.endpoint).observe(elapsed)
+    request_db_histogram.labels(profile.endpoint).observe(
+        profile.times.get("db", 0))
+
+    settings = get_settings()
+    if settings.get("server_timing", False):
+        response.headers["Server-Timing"] = profile.server_timing(elapsed)
+
+    slow_seconds = settings.get("slow_request_seconds",
+                                      DEFAULT_SLOW_REQUEST_SECONDS)
+    if elapsed >= slow_seconds:
+        from flask import request
+        logger.warning("Slow request %s %s took %.3fs: %s", request.method,
+                       request.full_path, elapsed, profile.summary())
+
+    if profile.profiler is not None:
+        logger.info("Profile of %s took %.3fs: %s\n%s", profile.endpoint,
+                    elapsed, profile.summary(),
+                    format_cprofile(profile.profiler))
+        profile.profiler = None
+    return response
+
+
+def end_request(exc=None):
+    profile = current()
+    if profile is not None and profile.profiler is not None:
+        # Request failed before finish_request
+        profile.profiler.disable()
+    local.profile = None
+
+
+def install(app):
+    """Profiles requests of app."""
+    app.before_request(start_request)
+    app.after_request(finish_request)
+    app.teardown_request(end_request)
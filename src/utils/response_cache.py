@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""Conditional GET and short-lived caching of JSON responses.
+
+Responses are cached per (endpoint, key), where key identifies the caller and
+the query, e.g. (userName, vcName), together with the version they were
+produced for. The version is a cheap version of the data behind the response,
+e.g. the cluster status version. A response of another version is replaced,
+so a new version takes effect immediately and only one response is kept per
+key. Changes not captured by the version take at most the TTL to show up.
+
+Every cached response carries an ETag of its body. Requests with a matching
+If-None-Match are answered with 304 Not Modified without a body. Compressed
+bodies are cached as well, with a weak ETag.
+"""
+
+import hashlib
+import threading
+
+from flask import Response, jsonify, request
+from prometheus_client import Counter
+
+from cache import Cache
+import json_response
+
+DEFAULT_TTL = 5
+DEFAULT_MAXSIZE = 4096
+
+not_modified_counter = Counter("restfulapi_not_modified_count",
+                               "count of requests answered with 304",
+                               labelnames=("endpoint",))
+
+
+class CachedResponse(object):
+    __slots__ = ("version", "body", "etag", "mimetype", "encoded")
+
+    def __init__(self, version, body, etag, mimetype):
+        self.version = version
+        self.body = body
+        self.etag = etag
+        self.mimetype = mimetype
+        # content encoding -> compressed body
+        self.encoded = {}
+
+    def get_body(self, encoding):
+        if encoding is None or \
+                len(self.body) < json_response.MIN_COMPRESS_SIZE:
+            return self.body, None
+        body = self.encoded.get(encoding)
+        if body is None:
+            body = json_response.compress(self.body, encoding)
+            self.encoded[encoding] = body
+        return body, encoding
+
+
+class ResponseCache(object):
+    """Caches JSON responses of endpoints.
+
+    Each endpoint has its own Cache, named response_<endpoint> in cache
+    metrics. Concurrent identical requests wait for one of them to produce
+    the response.
+    """
+    def __init__(self, ttl=DEFAULT_TTL, maxsize=DEFAULT_MAXSIZE):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.caches = {}
+
+    def __get_cache(self, endpoint):
+        with self.lock:
+            cache = self.caches.get(endpoint)
+            if cache is None:
+                # max_stale=0: never serve expired responses
+                cache = Cache("response_%s" % endpoint,
+                              maxsize=self.maxsize,
+                              ttl=self.ttl,
+                              max_stale=0)
+                self.caches[endpoint] = cache
+            return cache
+
+    def get(self, endpoint, key, version, produce):
+        """Returns the CachedResponse of produce() for (key, version).
+
+        Args:
+            endpoint: Name of the endpoint.
+            key: Hashable identifying the caller and the query.
+            version: Hashable version of the data behind the response.
+            produce: Function returning the JSON serializable response.
+        """
+        def load():
+            resp = jsonify(produce())
+            body = resp.get_data()
+            etag = hashlib.sha1(body).hexdigest()
+            return CachedResponse(version, body, etag, resp.mimetype)
+
+        cache = self.__get_cache(endpoint)
+        cached = cache.get(key, load)
+        if cached.version != version:
+            # max_stale=0, the invalidated response is dropped and loaded again
+            cache.invalidate(key)
+            cached = cache.get(key, load)
+            if cached.version != version:
+                # Replaced by a concurrent request of another version
+                cached = load()
+        return cached
+
+    def respond(self, endpoint, key, version, produce):
+        """Returns a flask Response for the current request, 304 if
+        If-None-Match of the request matches the response."""
+        cached = self.get(endpoint, key, version, produce)
+        if request.if_none_match.contains_weak(cached.etag):
+            not_modified_counter.labels(endpoint).inc()
+            resp = Response(status=304)
+            resp.set_etag(cached.etag)
+        else:
+            body, encoding = cached.get_body(json_response.choose_encoding())
+            resp = Response(body, mimetype=cached.mimetype)
+            resp.set_etag(cached.etag, weak=encoding is not None)
+            if encoding is not None:
+                resp.headers["Content-Encoding"] = encoding
+        resp.vary.add("Accept-Encoding")
+        # Clients may keep the response but have to revalidate before use
+        resp.headers["Cache-Control"] = "no-cache"
+        return resp
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+
+import json
+import threading
+import time
+import unittest
+
+from flask import Flask, jsonify
+from prometheus_client import REGISTRY
+
+import admission
+from admission import Coalescer, RateLimiter, TokenBucket
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_burst_then_rate(self):
+        bucket = TokenBucket(rate=2, burst=3, now=0)
+        self.assertEqual([0, 0, 0], [bucket.take(0) for _ in range(3)])
+        self.assertAlmostEqual(0.5, bucket.take(0))
+
+        self.assertEqual(0, bucket.take(0.5))
+        self.assertAlmostEqual(0.5, bucket.take(0.5))
+
+        # Refills up to burst only
+        self.assertEqual([0, 0, 0], [bucket.take(100) for _ in range(3)])
+        self.assertNotEqual(0, bucket.take(100))
+
+
+class TestRateLimiter(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.limiter = RateLimiter({"list": {
+            "rate": 1,
+            "burst": 2
+        }},
+                                   maxsize=2,
+                                   clock=self.clock)
+
+    def test_buckets_per_user_and_class(self):
+        self.assertEqual(0, self.limiter.admit("alice", "list"))
+        self.assertEqual(0, self.limiter.admit("alice", "list"))
+        self.assertAlmostEqual(1, self.limiter.admit("alice", "list"))
+
+        self.assertEqual(0, self.limiter.admit("bob", "list"))
+        # Classes without setting are not limited
+        for _ in range(10):
+            self.assertEqual(0, self.limiter.admit("alice", "read"))
+
+        self.clock.now = 1
+        self.assertEqual(0, self.limiter.admit("alice", "list"))
+
+    def test_least_recently_used_buckets_are_dropped(self):
+        self.limiter.admit("alice", "list")
+        self.limiter.admit("bob", "list")
+        self.limiter.admit("carol", "list")
+        self.assertEqual([("bob", "list"), ("carol", "list")],
+                         list(self.limiter.buckets))
+
+
+def coalesced_count(endpoint):
+    return REGISTRY.get_sample_value(
+        "restfulapi_coalesced_request_count_total",
+        {"endpoint": endpoint}) or 0
+
+
+class TestCoalescer(unittest.TestCase):
+    def test_concurrent_calls_are_merged(self):
+        coalescer = Coalescer()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            started.set()
+            release.wait()
+            return {"jobs": [1, 2]}
+
+        results = []
+        coalesced = coalesced_count("test")
+        owner = threading.Thread(target=lambda: results.append(
+            coalescer.do("key", slow, "test")))
+        owner.start()
+        started.wait()
+
+        waiters = [
+            threading.Thread(target=lambda: results.append(
+                coalescer.do("key", slow, "test"))) for _ in range(3)
+        ]
+        for t in waiters:
+            t.start()
+        while coalesced_count("test") < coalesced + 3:
+            time.sleep(0.001)
+        release.set()
+        for t in [owner] + waiters:
+            t.join()
+
+        self.assertEqual(1, len(calls))
+        self.assertEqual([{"jobs": [1, 2]}] * 4, results)
+        self.assertEqual({}, coalescer.calls)
+
+        # Not coalesced once done
+        coalescer.do("key", slow)
+        self.assertEqual(2, len(calls))
+
+    def test_exception_is_raised(self):
+        coalescer = Coalescer()
+
+        def fail():
+            raise ValueError("db down")
+
+        with self.assertRaises(ValueError):
+            coalescer.do("key", fail)
+        self.assertEqual({}, coalescer.calls)
+
+
+class TestAdmissionController(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.controller = admission.install(
+            self.app, {
+                "enabled": True,
+                "exempt_users": ["admin"],
+                "classes": {
+                    "list": {
+                        "rate": 0.001,
+                        "burst": 2
+                    }
+                },
+            })
+        self.calls = 0
+
+        @self.app.route("/listjobs")
+        def listjobs():
+            return jsonify({})
+
+        @self.app.route("/getjob")
+        @admission.coalesced
+        def getjob():
+            self.calls += 1
+            return jsonify({"calls": self.calls})
+
+        @self.app.route("/postjob", methods=["POST"])
+        def postjob():
+            return jsonify({})
+
+        self.client = self.app.test_client()
+
+    def test_rejects_over_limit(self):
+        for _ in range(2):
+            resp = self.client.get("/listjobs?userName=alice")
+            self.assertEqual(200, resp.status_code)
+
+        resp = self.client.get("/listjobs?userName=alice")
+        self.assertEqual(429, resp.status_code)
+        self.assertEqual("1000", resp.headers["Retry-After"])
+        self.assertIn("Too many list requests", json.loads(resp.data)["error"])
+
+        # Other users, exempt users and requests without user are admitted
+        self.assertEqual(
+            200,
+            self.client.get("/listjobs?userName=bob").status_code)
+        for _ in range(3):
+            self.assertEqual(
+                200,
+                self.client.get("/listjobs?userName=admin").status_code)
+            self.assertEqual(200, self.client.get("/listjobs").status_code)
+
+    def test_user_of_json_body(self):
+        self.controller.limiter.classes["write"] = {"rate": 0.001, "burst": 1}
+        resp = self.client.post("/postjob", json={"userName": "alice"})
+        self.assertEqual(200, resp.status_code)
+        resp = self.client.post("/postjob", json={"userName": "alice"})
+        self.assertEqual(429, resp.status_code)
+
+    def test_disabled(self):
+        self.controller.enabled = False
+        for _ in range(5):
+            resp = self.client.get("/listjobs?userName=alice")
+            self.assertEqual(200, resp.status_code)
+
+    def test_coalesced_response_is_copied(self):
+        resp = self.client.get("/getjob?userName=alice&jobId=1")
+        self.assertEqual({"calls": 1}, json.loads(resp.data))
+        self.assertEqual("application/json", resp.mimetype)
+        resp = self.client.get("/getjob?userName=alice&jobId=1")
+        self.assertEqual({"calls": 2}, json.loads(resp.data))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+import importlib
+import unittest
+from unittest.mock import MagicMock, patch
+
+from config import config
+import DataHandler
+
+# authorization needs the MySQL DataHandler
+if "datasource" not in config:
+    config["datasource"] = "MySQL"
+    importlib.reload(DataHandler)
+
+import authorization
+from authorization import AuthorizationIndex, AuthorizationManager, \
+    Permission, ResourceType, INVALID_ID
+
+ACL = [
+    {
+        "identityName": "admins",
+        "identityId": 100,
+        "resource": "Cluster",
+        "permissions": Permission.Admin,
+        "isDeny": 0,
+    },
+    {
+        "identityName": "users",
+        "identityId": 200,
+        "resource": "Cluster/VC:vc1",
+        "permissions": Permission.User,
+        "isDeny": 0,
+    },
+    {
+        "identityName": "bob@example.com",
+        "identityId": 10001,
+        "resource": "Cluster/VC:vc2",
+        "permissions": Permission.Collaborator,
+        "isDeny": 0,
+    },
+    {
+        "identityName": "invalid",
+        "identityId": INVALID_ID,
+        "resource": "Cluster",
+        "permissions": Permission.Admin,
+        "isDeny": 0,
+    },
+]
+
+IDENTITY_GROUPS = {
+    "alice@example.com": [100, 200],
+    "bob@example.com": ["200"],
+    "eve@example.com": [INVALID_ID],
+}
+
+
+class TestAuthorizationIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = AuthorizationIndex(1, ACL, IDENTITY_GROUPS)
+
+    def test_has_access(self):
+        has_access = self.index.has_access
+        self.assertTrue(has_access("alice@example.com", "Cluster",
+                                   Permission.Admin))
+        self.assertTrue(has_access("alice@example.com", "Cluster/VC:vc2",
+                                   Permission.Admin))
+
+        self.assertTrue(has_access("bob@example.com", "Cluster/VC:vc1",
+                                   Permission.User))
+        self.assertFalse(has_access("bob@example.com", "Cluster/VC:vc1",
+                                    Permission.Collaborator))
+        self.assertTrue(has_access("bob@example.com", "Cluster/VC:vc2",
+                                   Permission.Collaborator))
+        self.assertFalse(has_access("bob@example.com", "Cluster",
+                                    Permission.User))
+
+        # Groups out of valid range are ignored
+        self.assertFalse(has_access("eve@example.com", "Cluster",
+                                    Permission.User))
+        self.assertFalse(has_access("unknown@example.com", "Cluster/VC:vc1",
+                                    Permission.User))
+
+    def test_manager_uses_index(self):
+        with patch.object(authorization, "get_auth_index",
+                          return_value=self.index):
+            self.assertTrue(
+                AuthorizationManager.HasAccess("bob@example.com",
+                                               ResourceType.VC, "vc1",
+                                               Permission.User))
+            self.assertTrue(
+                AuthorizationManager.IsClusterAdmin("alice@example.com"))
+            self.assertFalse(
+                AuthorizationManager.IsClusterAdmin("bob@example.com"))
+
+    def test_index_reloaded_on_new_version(self):
+        data_handler = MagicMock()
+        data_handler.get_auth_version.return_value = 1
+        data_handler.load_auth_tables.return_value = (1, ACL, IDENTITY_GROUPS)
+        with patch.object(authorization, "DataHandler",
+                          return_value=data_handler), \
+                patch.object(authorization, "last_auth_index", None):
+            index = authorization.load_auth_index()
+            self.assertEqual(1, index.version)
+            self.assertIs(index, authorization.load_auth_index())
+            self.assertEqual(1, data_handler.load_auth_tables.call_count)
+
+            data_handler.get_auth_version.return_value = 2
+            data_handler.load_auth_tables.return_value = (2, [], {})
+            index = authorization.load_auth_index()
+            self.assertEqual(2, index.version)
+            self.assertFalse(
+                index.has_access("alice@example.com", "Cluster",
+                                 Permission.User))
+
+            # authversion table does not exist
+            data_handler.get_auth_version.return_value = None
+            self.assertIsNone(authorization.load_auth_index())
+
+
+class TestIdentityManager(unittest.TestCase):
+    def setUp(self):
+        self.data_handler = MagicMock()
+        self.data_handler.GetIdentityInfo.return_value = [{
+            "identityName": "alice@example.com",
+            "uid": 10000,
+            "gid": 20000,
+            "groups": ["100", "200"],
+        }]
+        self.data_handler.UpdateIdentityInfo.return_value = True
+        patcher = patch.object(authorization,
+                               "DataHandler",
+                               return_value=self.data_handler)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def update(self, uid, groups):
+        return authorization.IdentityManager.UpdateIdentityInfo(
+            "alice@example.com", uid, 20000, groups, "", "")
+
+    def test_unchanged_identity_keeps_auth_version(self):
+        self.assertTrue(self.update("10000", [200, 100]))
+        self.assertTrue(self.update(10000, '["100", "200"]'))
+        self.data_handler.bump_auth_version.assert_not_called()
+
+    def test_changed_identity_bumps_auth_version(self):
+        self.assertTrue(self.update(10000, [100]))
+        self.assertTrue(self.update(10001, [100, 200]))
+        self.data_handler.GetIdentityInfo.return_value = []
+        self.assertTrue(self.update(10000, [100, 200]))
+        self.assertEqual(3, self.data_handler.bump_auth_version.call_count)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+
+import copy
+import json
+import threading
+import time
+import unittest
+
+from cache import Cache, FrozenDict, FrozenList, fcache, freeze, thaw
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class Loader(object):
+    def __init__(self, value=None):
+        self.value = value
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        with self.lock:
+            self.calls += 1
+            return {"value": self.value, "call": self.calls}
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while not predicate():
+        if time.time() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.01)
+
+
+class TestFreeze(unittest.TestCase):
+    def test_freeze(self):
+        val = freeze({"a": [1, {"b": 2}], "c": {3}})
+        self.assertIsInstance(val, FrozenDict)
+        self.assertIsInstance(val["a"], FrozenList)
+        self.assertIsInstance(val["a"][1], FrozenDict)
+        self.assertEqual(frozenset([3]), val["c"])
+
+        with self.assertRaises(TypeError):
+            val["d"] = 1
+        with self.assertRaises(TypeError):
+            val.update({"d": 1})
+        with self.assertRaises(TypeError):
+            val["a"].append(1)
+        with self.assertRaises(TypeError):
+            val["a"][1]["b"] = 3
+
+    def test_frozen_value_is_usable_as_plain_value(self):
+        val = freeze({"a": [1, {"b": 2}]})
+        self.assertEqual('{"a": [1, {"b": 2}]}', json.dumps(val))
+        self.assertIs(val, copy.copy(val))
+
+        mutable = copy.deepcopy(val)
+        self.assertEqual(dict, type(mutable))
+        mutable["a"].append(3)
+        self.assertEqual([1, {"b": 2}], val["a"])
+        self.assertEqual({"a": [1, {"b": 2}]}, thaw(val))
+
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_hit_returns_same_object(self):
+        cache = Cache("test_hit", ttl=10, clock=self.clock)
+        loader = Loader("v1")
+
+        first = cache.get("k", loader)
+        self.assertEqual({"value": "v1", "call": 1}, first)
+        self.clock.now = 9
+        self.assertIs(first, cache.get("k", loader))
+        self.assertEqual(1, loader.calls)
+
+    def test_stale_while_revalidate(self):
+        cache = Cache("test_stale", ttl=10, clock=self.clock)
+        loader = Loader("v1")
+        cache.get("k", loader)
+
+        self.clock.now = 10
+        loader.value = "v2"
+        self.assertEqual("v1", cache.get("k", loader)["value"])
+        wait_for(lambda: cache.get("k", loader)["value"] == "v2")
+        self.assertEqual(2, loader.calls)
+
+    def test_too_stale_is_loaded_synchronously(self):
+        cache = Cache("test_too_stale", ttl=10, max_stale=5, clock=self.clock)
+        loader = Loader("v1")
+        cache.get("k", loader)
+
+        self.clock.now = 15
+        loader.value = "v2"
+        self.assertEqual("v2", cache.get("k", loader)["value"])
+
+    def test_invalidate(self):
+        cache = Cache("test_invalidate", ttl=10, clock=self.clock)
+        loader = Loader("v1")
+        cache.get("k", loader)
+
+        loader.value = "v2"
+        cache.invalidate("k")
+        wait_for(lambda: cache.get("k", loader)["value"] == "v2")
+
+    def test_lru_eviction(self):
+        cache = Cache("test_lru", maxsize=2, ttl=10, clock=self.clock)
+        loader = Loader()
+        cache.get("a", loader)
+        cache.get("b", loader)
+        cache.get("a", loader)
+        cache.get("c", loader)
+
+        self.assertEqual(2, len(cache))
+        self.assertEqual(3, loader.calls)
+        cache.get("a", loader)
+        self.assertEqual(3, loader.calls)
+        cache.get("b", loader)
+        self.assertEqual(4, loader.calls)
+
+    def test_too_stale_entries_are_dropped(self):
+        cache = Cache("test_drop", ttl=10, max_stale=5, clock=self.clock)
+        loader = Loader()
+        cache.get("a", loader)
+        cache.get("b", loader)
+        self.clock.now = 6
+        cache.get("c", loader)
+
+        self.clock.now = 15
+        # a is dropped when it is hit, b on insert, c is still fresh enough
+        cache.get("a", loader)
+        self.assertEqual(["c", "a"], list(cache.entries))
+
+    def test_single_flight(self):
+        cache = Cache("test_single_flight", ttl=10, clock=self.clock)
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def slow_loader():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return ["v"]
+
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(cache.get("k", slow_loader)))
+            for _ in range(8)
+        ]
+        threads[0].start()
+        started.wait(5)
+        for t in threads[1:]:
+            t.start()
+        release.set()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(1, len(calls))
+        self.assertEqual(8, len(results))
+        for result in results:
+            self.assertIs(results[0], result)
+
+    def test_load_failure(self):
+        cache = Cache("test_failure", ttl=10, clock=self.clock)
+
+        def failing_loader():
+            raise ValueError("failed")
+
+        with self.assertRaises(ValueError):
+            cache.get("k", failing_loader)
+
+        loader = Loader("v1")
+        cache.get("k", loader)
+        self.clock.now = 10
+        # Failed refresh keeps serving the stale value
+        self.assertEqual("v1", cache.get("k", failing_loader)["value"])
+        wait_for(lambda: not cache.loading)
+        self.assertEqual("v1", cache.get("k", loader)["value"])
+
+
+class TestFcache(unittest.TestCase):
+    def test_fcache(self):
+        calls = []
+
+        @fcache(TTLInSec=60)
+        def get_value(a, b=0):
+            calls.append((a, b))
+            return [a, b]
+
+        self.assertEqual([1, 0], get_value(1))
+        self.assertEqual([1, 0], get_value(1))
+        self.assertEqual([1, 2], get_value(1, b=2))
+        self.assertEqual([(1, 0), (1, 2)], calls)
+
+        get_value.invalidate(1)
+        get_value(1)
+        wait_for(lambda: len(calls) == 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+import datetime
+import json
+import unittest
+from unittest.mock import MagicMock, patch
+
+import cluster_status_store
+from cluster_status_store import ClusterStatusReader, \
+    publish_cluster_status, CLUSTER_STATUS_KEY, CLUSTER_STATUS_VERSION_KEY, \
+    CLUSTER_STATUS_TIME_KEY, CLUSTER_STATUS_CHANNEL
+
+
+class FakeRedis(object):
+    def __init__(self):
+        self.data = {}
+        self.published = []
+        self.get_calls = 0
+        self.mget_calls = 0
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def mset(self, mapping):
+        for k, v in mapping.items():
+            self.data[k] = v.encode("utf-8")
+
+    def publish(self, channel, message):
+        self.published.append((channel, message))
+
+    def execute(self):
+        pass
+
+    def get(self, key):
+        self.get_calls += 1
+        return self.data.get(key)
+
+    def mget(self, *keys):
+        self.mget_calls += 1
+        return [self.data.get(key) for key in keys]
+
+
+class TestClusterStatusStore(unittest.TestCase):
+    def test_publish_cluster_status(self):
+        redis_conn = FakeRedis()
+        update_time = datetime.datetime(2020, 1, 1, 12, 0, 0)
+        self.assertTrue(
+            publish_cluster_status(redis_conn, '{"a":1}', "v1", update_time))
+        self.assertEqual(b'{"a":1}', redis_conn.data[CLUSTER_STATUS_KEY])
+        self.assertEqual(b"v1", redis_conn.data[CLUSTER_STATUS_VERSION_KEY])
+        self.assertEqual(b"2020-01-01 12:00:00",
+                         redis_conn.data[CLUSTER_STATUS_TIME_KEY])
+        self.assertEqual([(CLUSTER_STATUS_CHANNEL, "v1")],
+                         redis_conn.published)
+
+    def test_publish_cluster_status_failure(self):
+        redis_conn = MagicMock()
+        redis_conn.pipeline.side_effect = Exception("connection refused")
+        self.assertFalse(publish_cluster_status(redis_conn, "{}", "v1"))
+
+    def test_reader_decodes_only_on_version_change(self):
+        redis_conn = FakeRedis()
+        reader = ClusterStatusReader(redis_conn, subscribe=False)
+        update_time = datetime.datetime(2020, 1, 1, 12, 0, 0)
+
+        publish_cluster_status(redis_conn, json.dumps({"a": 1}), "v1",
+                               update_time)
+        status, t = reader.get()
+        self.assertEqual({"a": 1}, status)
+        self.assertEqual(update_time, t)
+        self.assertEqual(1, redis_conn.mget_calls)
+
+        # Same version is served from in-process cache
+        status_again, _ = reader.get()
+        self.assertIs(status, status_again)
+        self.assertEqual(1, redis_conn.mget_calls)
+
+        publish_cluster_status(redis_conn, json.dumps({"a": 2}), "v2",
+                               update_time)
+        status, _ = reader.get()
+        self.assertEqual({"a": 2}, status)
+        self.assertEqual(2, redis_conn.mget_calls)
+
+    def test_reader_skips_redis_when_notified_version_is_cached(self):
+        redis_conn = FakeRedis()
+        reader = ClusterStatusReader(redis_conn, subscribe=False)
+        publish_cluster_status(redis_conn, json.dumps({"a": 1}), "v1")
+        reader.get()
+        get_calls = redis_conn.get_calls
+
+        # Without notification, version is checked on every call
+        reader.get()
+        self.assertEqual(get_calls + 1, redis_conn.get_calls)
+
+        # Subscription announced the cached version
+        reader.notified_version = "v1"
+        reader.get()
+        self.assertEqual(get_calls + 1, redis_conn.get_calls)
+
+    @patch.object(cluster_status_store.DataManager, "GetClusterStatus")
+    def test_reader_falls_back_to_db(self, get_cluster_status):
+        get_cluster_status.return_value = ({"a": 1}, None)
+
+        # Nothing published
+        reader = ClusterStatusReader(FakeRedis(), subscribe=False)
+        self.assertEqual(({"a": 1}, None), reader.get())
+
+        # Redis not available
+        redis_conn = MagicMock()
+        redis_conn.get.side_effect = Exception("connection refused")
+        reader = ClusterStatusReader(redis_conn, subscribe=False)
+        self.assertEqual(({"a": 1}, None), reader.get())
+        self.assertEqual(2, get_cluster_status.call_count)
+
+        # Redis is not tried again until REDIS_RETRY_INTERVAL has passed
+        self.assertEqual(({"a": 1}, None), reader.get())
+        self.assertEqual(1, redis_conn.get.call_count)
+        reader.redis_disabled_until = 0
+        reader.get()
+        self.assertEqual(2, redis_conn.get.call_count)
+
+    @patch.object(cluster_status_store.DataManager, "GetClusterStatus")
+    def test_reader_get_version(self, get_cluster_status):
+        update_time = datetime.datetime(2020, 1, 1, 12, 0, 0)
+        get_cluster_status.return_value = ({"a": 1}, update_time)
+
+        redis_conn = FakeRedis()
+        reader = ClusterStatusReader(redis_conn, subscribe=False)
+        self.assertEqual(str(update_time), reader.get_version())
+
+        publish_cluster_status(redis_conn, json.dumps({"a": 2}), "v2")
+        self.assertEqual("v2", reader.get_version())
+
+
+if __name__ == '__main__':
+    unittest.main()
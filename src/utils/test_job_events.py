@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+import json
+import unittest
+from unittest.mock import MagicMock
+
+from job_events import JOB_EVENTS_STREAM, JobEventPublisher, \
+    JobEventReader, StreamLimiter, generate_sse, new_status_event, \
+    new_endpoint_event, parse_event_id
+
+
+class FakeRedisStream(object):
+    def __init__(self):
+        self.entries = []
+        self.next_id = 1
+
+    def xadd(self, name, fields, maxlen=None, approximate=True):
+        entry_id = "%d-0" % self.next_id
+        self.next_id += 1
+        self.entries.append((entry_id.encode("utf-8"), {
+            k.encode("utf-8"): str(v).encode("utf-8")
+            for k, v in fields.items()
+        }))
+        return entry_id.encode("utf-8")
+
+    def trim(self, count):
+        self.entries = self.entries[count:]
+
+    def evict(self):
+        self.entries = []
+
+    def xrange(self, name, count=None):
+        return self.entries[:count]
+
+    def xrevrange(self, name, count=None):
+        return list(reversed(self.entries))[:count]
+
+    def xread(self, streams, count=None, block=None):
+        last_id = parse_event_id(streams[JOB_EVENTS_STREAM])
+        entries = [
+            entry for entry in self.entries
+            if parse_event_id(entry[0].decode("utf-8")) > last_id
+        ][:count]
+        if not entries:
+            return []
+        return [[JOB_EVENTS_STREAM.encode("utf-8"), entries]]
+
+
+def parse_sse(messages):
+    events = []
+    for message in messages:
+        event = {}
+        for line in message.strip().split("\n"):
+            key, _, val = line.partition(": ")
+            event[key] = val
+        events.append(event)
+    return events
+
+
+class TestJobEvents(unittest.TestCase):
+    def setUp(self):
+        self.redis_conn = FakeRedisStream()
+        self.publisher = JobEventPublisher(self.redis_conn)
+
+    def test_parse_event_id(self):
+        self.assertEqual((1, 2), parse_event_id("1-2"))
+        self.assertIsNone(parse_event_id("abc"))
+        self.assertIsNone(parse_event_id(None))
+
+    def test_publish_failure_disables_publishing(self):
+        redis_conn = MagicMock()
+        redis_conn.xadd.side_effect = Exception("connection refused")
+        publisher = JobEventPublisher(redis_conn)
+        event = new_status_event("job1", "user1", "vc1", "running")
+        self.assertIsNone(publisher.publish(event))
+        self.assertIsNone(publisher.publish(event))
+        self.assertEqual(1, redis_conn.xadd.call_count)
+
+    def test_reader_starts_from_latest(self):
+        self.publisher.publish(new_status_event("job1", "u", "vc", "queued"))
+        reader = JobEventReader(self.redis_conn)
+        self.assertEqual([], reader.read(0))
+        self.assertFalse(reader.needs_reset)
+
+        self.publisher.publish(new_status_event("job1", "u", "vc", "running"))
+        events = reader.read(0)
+        self.assertEqual(1, len(events))
+        self.assertEqual("2-0", events[0][0])
+        self.assertEqual("running", events[0][1]["jobStatus"])
+
+    def test_reader_resumes(self):
+        for status in ["queued", "scheduling", "running"]:
+            self.publisher.publish(new_status_event("job1", "u", "vc", status))
+
+        reader = JobEventReader(self.redis_conn, "1-0")
+        self.assertFalse(reader.needs_reset)
+        self.assertEqual(["scheduling", "running"],
+                         [e["jobStatus"] for _, e in reader.read(0)])
+
+        self.redis_conn.trim(2)
+        self.assertTrue(JobEventReader(self.redis_conn, "1-0").needs_reset)
+        self.assertTrue(JobEventReader(self.redis_conn, "bad").needs_reset)
+
+        self.redis_conn.evict()
+        self.assertTrue(JobEventReader(self.redis_conn, "3-0").needs_reset)
+
+    def test_reader_detects_evicted_stream(self):
+        self.publisher.publish(new_status_event("job1", "u", "vc", "queued"))
+        reader = JobEventReader(self.redis_conn)
+        self.publisher.publish(new_status_event("job1", "u", "vc", "running"))
+        self.assertEqual(1, len(reader.read(0)))
+
+        # Events published before the eviction are lost
+        self.publisher.publish(new_status_event("job1", "u", "vc", "failed"))
+        self.redis_conn.evict()
+        self.assertEqual([], reader.read(0))
+        self.assertTrue(reader.needs_reset)
+
+        self.publisher.publish(new_status_event("job2", "u", "vc", "queued"))
+        reader.reset()
+        self.assertFalse(reader.needs_reset)
+        self.assertEqual("4-0", reader.last_event_id)
+
+    def test_generate_sse(self):
+        reader = JobEventReader(self.redis_conn)
+        self.publisher.publish(new_status_event("job1", "u1", "vc", "queued"))
+        self.publisher.publish(
+            new_endpoint_event("job1", "u1", "vc", "ep1", None))
+        self.publisher.publish(new_status_event("job2", "u2", "vc", "queued"))
+
+        messages = list(
+            generate_sse(reader,
+                         lambda event: event["userName"] == "u1",
+                         max_seconds=0.1,
+                         block_ms=0))
+        events = parse_sse(messages)
+
+        self.assertEqual("1000", events[0]["retry"])
+        self.assertEqual("1-0", events[1]["id"])
+        self.assertEqual("status", events[1]["event"])
+        self.assertEqual("queued", json.loads(events[1]["data"])["jobStatus"])
+        self.assertEqual("2-0", events[2]["id"])
+        self.assertEqual("endpoint", events[2]["event"])
+        self.assertNotIn("endpointStatus", json.loads(events[2]["data"]))
+        # Skipped event still advances the id of the watcher
+        self.assertEqual({"id": "3-0"}, events[3])
+
+    def test_generate_sse_resets_after_eviction(self):
+        self.publisher.publish(new_status_event("job1", "u1", "vc", "queued"))
+        reader = JobEventReader(self.redis_conn, "1-0")
+        self.publisher.publish(new_status_event("job1", "u1", "vc", "failed"))
+        self.redis_conn.evict()
+        self.publisher.publish(new_status_event("job2", "u1", "vc", "queued"))
+
+        messages = list(
+            generate_sse(reader,
+                         lambda event: True,
+                         max_seconds=0.05,
+                         block_ms=0))
+        events = parse_sse(messages)
+
+        self.assertEqual("reset", events[1]["event"])
+        self.assertEqual("3-0", events[1]["id"])
+
+    def test_stream_limiter(self):
+        limiter = StreamLimiter(max_streams=2)
+        self.assertTrue(limiter.acquire())
+        self.assertTrue(limiter.acquire())
+        self.assertFalse(limiter.acquire())
+        limiter.release()
+        self.assertTrue(limiter.acquire())
+
+
+if __name__ == '__main__':
+    unittest.main()
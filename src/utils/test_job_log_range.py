@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+import unittest
+from unittest.mock import patch
+
+import job_log_range
+from job_log_range import LogIndexes, RawLog, open_raw_log
+
+
+class FakeLog(object):
+    """Lines of 10 bytes, the cursor of a line is its number."""
+    def __init__(self, lines, fail_at=None):
+        self.lines = ["line %04d\n" % i for i in range(lines)]
+        self.fail_at = fail_at
+        self.cursors = []
+
+    def __call__(self, cursor):
+        self.cursors.append(cursor)
+        start = 0 if cursor is None else cursor + 1
+        for i in range(start, len(self.lines)):
+            if i == self.fail_at:
+                raise RuntimeError("backend failed")
+            yield (i, self.lines[i])
+
+    def text(self):
+        return "".join(self.lines)
+
+
+class TestRawLog(unittest.TestCase):
+    def setUp(self):
+        patcher = patch.object(job_log_range, "CHECKPOINT_SIZE", 100)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch.object(job_log_range, "indexes", LogIndexes())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def read(self, raw_log, start=0, end=None):
+        return b"".join(raw_log.read(start, end)).decode("utf-8")
+
+    def test_reading_adds_checkpoints_and_size(self):
+        log = FakeLog(100)
+        raw_log = open_raw_log("job1", log, finished=True)
+        self.assertTrue(raw_log.seekable())
+        self.assertIsNone(raw_log.size())
+
+        self.assertEqual(log.text(), self.read(raw_log))
+        self.assertEqual(1000, raw_log.size())
+        self.assertEqual((500, 49), raw_log.index.locate(555))
+
+    def test_range_is_read_from_checkpoint(self):
+        log = FakeLog(100)
+        raw_log = open_raw_log("job1", log, finished=True)
+        self.assertEqual(1000, raw_log.get_size())
+
+        log.cursors = []
+        self.assertEqual(log.text()[555:567], self.read(raw_log, 555, 566))
+        self.assertEqual([49], log.cursors)
+
+        # The index is shared by later requests of the job
+        raw_log = open_raw_log("job1", log, finished=True)
+        self.assertEqual(1000, raw_log.size())
+        self.assertEqual(log.text()[990:], self.read(raw_log, 990))
+
+    def test_size_is_read_from_last_checkpoint(self):
+        log = FakeLog(100)
+        raw_log = open_raw_log("job1", log, finished=True)
+        self.assertEqual(log.text()[:250], self.read(raw_log, 0, 249))
+        self.assertIsNone(raw_log.size())
+
+        log.cursors = []
+        self.assertEqual(1000, raw_log.get_size())
+        self.assertEqual([19], log.cursors)
+
+    def test_unfinished_job_is_not_indexed(self):
+        log = FakeLog(100)
+        raw_log = open_raw_log("job1", log, finished=False)
+        self.assertFalse(raw_log.seekable())
+        self.assertEqual(log.text(), self.read(raw_log))
+        self.assertIsNone(raw_log.size())
+
+    def test_backend_failure_stops_read(self):
+        log = FakeLog(100, fail_at=30)
+        raw_log = RawLog(log, job_log_range.indexes.get("job1"))
+        self.assertEqual(log.text()[:300], self.read(raw_log))
+        self.assertIsNone(raw_log.size())
+        self.assertIsNone(raw_log.get_size())
+
+
+class TestLogIndexes(unittest.TestCase):
+    def test_least_recently_used_index_is_dropped(self):
+        indexes = LogIndexes(maxsize=2)
+        index1 = indexes.get("job1")
+        indexes.get("job2")
+        self.assertIs(index1, indexes.get("job1"))
+        indexes.get("job3")
+        self.assertEqual(["job1", "job3"], list(indexes.indexes))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+import base64
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import job_log_tail
+from job_log_tail import LogTail, decode_job_log, encode_job_log, \
+    read_file_tail, timestamp_key
+
+
+class TestLogTail(unittest.TestCase):
+    def test_keeps_last_lines(self):
+        tail = LogTail(max_lines=3)
+        for i in range(5):
+            tail.append("%d\n" % i)
+        self.assertEqual(["2\n", "3\n", "4\n"], list(tail.lines))
+        self.assertEqual(5, tail.total)
+
+    def test_trims_long_logs(self):
+        with patch.object(job_log_tail, "MAX_FULL_LINES", 4), \
+                patch.object(job_log_tail, "TRIMMED_LINES", 2):
+            tail = LogTail(max_lines=4)
+            for i in range(3):
+                tail.append("%d\n" % i)
+            self.assertFalse(tail.is_trimmed())
+            self.assertEqual("0\n1\n2\n", tail.text())
+
+            tail.append("3\n")
+            self.assertTrue(tail.is_trimmed())
+            self.assertEqual("2\n3\n", tail.text())
+
+
+class TestReadFileTail(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, "log.txt")
+
+    def test_reads_last_lines_in_blocks(self):
+        with open(self.path, "w") as f:
+            for i in range(1000):
+                f.write("line %d\n" % i)
+
+        with patch.object(job_log_tail, "READ_BLOCK_SIZE", 16):
+            self.assertEqual(["line 997\n", "line 998\n", "line 999\n"],
+                             read_file_tail(self.path, 3))
+        self.assertEqual(1000, len(read_file_tail(self.path, 5000)))
+
+    def test_last_line_without_newline(self):
+        with open(self.path, "w") as f:
+            f.write("a\nb\nc")
+        self.assertEqual(["b\n", "c"], read_file_tail(self.path, 2))
+
+    def test_missing_file(self):
+        self.assertEqual([], read_file_tail(self.path, 2))
+
+
+class TestEncoding(unittest.TestCase):
+    def test_timestamp_key(self):
+        timestamps = [
+            "2020-01-01T00:00:01Z",
+            "2020-01-01T00:00:01.05Z",
+            "2020-01-01T00:00:01.1Z",
+            "2020-01-01T00:00:01.123456789Z",
+            "2020-01-01T00:00:02Z",
+        ]
+        self.assertEqual(timestamps, sorted(timestamps, key=timestamp_key))
+
+    def test_encode_decode(self):
+        text = "hello\n" * 1000
+        encoded = encode_job_log(text)
+        self.assertTrue(encoded.startswith("zlib:"))
+        self.assertLess(len(encoded), len(text) / 10)
+        self.assertEqual(text, decode_job_log(encoded))
+
+    def test_decode_previous_formats(self):
+        self.assertIsNone(decode_job_log(None))
+        self.assertEqual(
+            "hello\n",
+            decode_job_log(base64.b64encode(b"hello\n").decode("utf-8")))
+        self.assertEqual("not base64!", decode_job_log("not base64!"))
+
+
+if __name__ == '__main__':
+    unittest.main()
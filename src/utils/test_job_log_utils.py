@@ -1,26 +1,46 @@
+import importlib.util
+import os
 from datetime import datetime
 from textwrap import dedent
 from unittest import TestCase
-from unittest.mock import call, patch
+from unittest.mock import Mock, call, patch
 
+from azure.common import AzureHttpError
 from azure.storage.blob import AppendBlobService, Blob
 
 from config import config
+import job_log_range
+from JobLogUtils import LogQuery
 
 _CONTAINER_NAME = 'mycontainer'
 
 
-@patch.dict(
-    config, {
-        'logging': 'azure_blob',
-        'azure_blob_log': {
-            'connection_string': 'UseDevelopmentStorage=true',
-            'container_name': _CONTAINER_NAME,
-        },
-    })
+def load_job_log_utils(name):
+    """Loads a separate JobLogUtils module for the log backend in config."""
+    spec = importlib.util.spec_from_file_location(
+        name,
+        os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                     "JobLogUtils.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
 class TestAzureBlob(TestCase):
     JOB_ID = 'd175'
 
+    def setUp(self):
+        with patch.dict(
+                config, {
+                    'logging': 'azure_blob',
+                    'azure_blob_log': {
+                        'connection_string': 'UseDevelopmentStorage=true',
+                        'container_name': _CONTAINER_NAME,
+                    },
+                }):
+            self.module = load_job_log_utils("JobLogUtils_azure_blob")
+        self.addCleanup(self.module.download_executor.shutdown)
+
     @staticmethod
     def create_blob(name, content=None, **kwargs):
         blob = Blob(name)
@@ -38,7 +58,7 @@ class TestAzureBlob(TestCase):
     @patch.object(AppendBlobService, 'get_blob_to_bytes')
     @patch.object(AppendBlobService, 'list_blobs')
     def test_get_job_log(self, list_blobs, get_blob_to_bytes):
-        from JobLogUtils import GetJobLog
+        GetJobLog = self.module.GetJobLog
 
         list_blobs.return_value = iter([
             self.create_blob('jobs.' + self.JOB_ID,
@@ -52,7 +72,8 @@ class TestAzureBlob(TestCase):
 
         logs, cursor = GetJobLog(self.JOB_ID)
         self.assertDictEqual(logs, {'master': "content\n"})
-        self.assertIsNone(cursor)
+        # After the last complete line
+        self.assertEqual(cursor, '{}.{}'.format(0, 1024 * 1024 + 81))
 
         list_blobs.assert_called_once_with(container_name=_CONTAINER_NAME,
                                            prefix='jobs.' + self.JOB_ID)
@@ -63,7 +84,7 @@ class TestAzureBlob(TestCase):
     @patch.object(AppendBlobService, 'get_blob_to_bytes')
     @patch.object(AppendBlobService, 'list_blobs')
     def test_get_job_log_with_multi_blobs(self, list_blobs, get_blob_to_bytes):
-        from JobLogUtils import GetJobLog
+        GetJobLog = self.module.GetJobLog
 
         list_blobs.return_value = iter([
             self.create_blob('jobs.' + self.JOB_ID,
@@ -80,7 +101,8 @@ class TestAzureBlob(TestCase):
 
         logs, cursor = GetJobLog(self.JOB_ID)
         self.assertDictEqual(logs, {'master': "content\n"})
-        self.assertIsNone(cursor)
+        # After the last complete line
+        self.assertEqual(cursor, '{}.{}'.format(1, 1024 * 1024 + 81))
 
         list_blobs.assert_called_once_with(container_name=_CONTAINER_NAME,
                                            prefix='jobs.' + self.JOB_ID)
@@ -92,7 +114,7 @@ class TestAzureBlob(TestCase):
     @patch.object(AppendBlobService, 'get_blob_to_bytes')
     @patch.object(AppendBlobService, 'list_blobs')
     def test_get_job_raw_log(self, list_blobs, get_blob_to_bytes):
-        from JobLogUtils import GetJobRawLog
+        GetJobRawLog = self.module.GetJobRawLog
 
         blobs = [
             self.create_blob('jobs.{}'.format(self.JOB_ID),
@@ -120,17 +142,18 @@ class TestAzureBlob(TestCase):
             {"log":"content 9\n"}
             '''
         ]
-        get_blob_to_bytes.side_effect = [
-            self.fill_blob(blobs[0], contents[0].encode('utf-8')),
-            self.fill_blob(blobs[0], contents[1].encode('utf-8')),
-            self.fill_blob(blobs[0], contents[2].encode('utf-8')),
-            self.fill_blob(blobs[0], contents[3].encode('utf-8')),
-            self.fill_blob(blobs[2], contents[4].encode('utf-8')),
-            self.fill_blob(blobs[2], contents[5].encode('utf-8')),
-            self.fill_blob(blobs[1], contents[6].encode('utf-8')),
-            self.fill_blob(blobs[1], contents[7].encode('utf-8')),
-            self.fill_blob(blobs[1], contents[8].encode('utf-8')),
-        ]
+        # Chunks are downloaded concurrently, in any order
+        chunks = {}
+        for (blob, start_ranges), content in zip(
+            [(blobs[0], range(4)), (blobs[2], range(2)),
+             (blobs[1], range(3))], [contents[0:4], contents[4:6],
+                                     contents[6:9]]):
+            for i, chunk in zip(start_ranges, content):
+                chunks[blob.name, 1024 * 1024 * i] = self.fill_blob(
+                    blob, chunk.encode('utf-8'))
+        get_blob_to_bytes.side_effect = \
+            lambda container, name, start_range, end_range: \
+            chunks[name, start_range]
 
         logs = GetJobRawLog(self.JOB_ID)
         self.assertListEqual(list(logs), [
@@ -145,8 +168,8 @@ class TestAzureBlob(TestCase):
             'content 9\n',
         ])
 
-        list_blobs.assert_called_once_with(_CONTAINER_NAME,
-                                           'jobs.' + self.JOB_ID)
+        list_blobs.assert_called_once_with(container_name=_CONTAINER_NAME,
+                                           prefix='jobs.' + self.JOB_ID)
         get_blob_to_bytes.assert_has_calls([
             call(_CONTAINER_NAME,
                  'jobs.d175',
@@ -184,4 +207,391 @@ class TestAzureBlob(TestCase):
                  'jobs.d175.2',
                  start_range=1024 * 1024 * 2,
                  end_range=int(3e6) - 1),
+        ], any_order=True)
+        self.assertEqual(get_blob_to_bytes.call_count, 9)
+
+    @patch.object(AppendBlobService, 'get_blob_to_bytes')
+    @patch.object(AppendBlobService, 'list_blobs')
+    def test_get_job_log_after_cursor(self, list_blobs, get_blob_to_bytes):
+        GetJobLog = self.module.GetJobLog
+
+        list_blobs.return_value = [
+            self.create_blob('jobs.' + self.JOB_ID, content_length=100),
+            self.create_blob('jobs.' + self.JOB_ID + '.1', content_length=0),
+            # Blob of another job
+            self.create_blob('jobs.' + self.JOB_ID + '0', content_length=10),
+        ]
+        line = '{"kubernetes":{"pod_name":"master"},"time":0,"log":"new\\n"}\n'
+        get_blob_to_bytes.return_value = self.create_blob(
+            'jobs.' + self.JOB_ID, (line + '{"kube').encode('utf-8'))
+
+        logs, cursor = GetJobLog(self.JOB_ID, '0.100')
+        self.assertDictEqual(logs, {'master': "new\n"})
+        self.assertEqual(cursor, '0.{}'.format(100 + len(line)))
+        # Only bytes after the cursor are read, without listing blobs
+        get_blob_to_bytes.assert_called_once_with(
+            container_name=_CONTAINER_NAME,
+            blob_name='jobs.' + self.JOB_ID,
+            start_range=100,
+            end_range=100 + self.module.MAX_TAIL_SIZE - 1)
+        list_blobs.assert_not_called()
+
+        # No more bytes in the first blob, moves on to the next
+        get_blob_to_bytes.reset_mock()
+        get_blob_to_bytes.side_effect = [
+            AzureHttpError('Range Not Satisfiable', 416),
+            self.create_blob('jobs.' + self.JOB_ID + '.1',
+                             line.encode('utf-8')),
+        ]
+        logs, cursor = GetJobLog(self.JOB_ID, cursor)
+        self.assertDictEqual(logs, {'master': "new\n"})
+        self.assertEqual(cursor, '1.{}'.format(len(line)))
+        self.assertEqual(
+            ['jobs.' + self.JOB_ID, 'jobs.' + self.JOB_ID + '.1'], [
+                kwargs['blob_name']
+                for _, kwargs in get_blob_to_bytes.call_args_list
+            ])
+
+        # Nothing new, the listing of blobs is cached
+        get_blob_to_bytes.side_effect = AzureHttpError(
+            'Range Not Satisfiable', 416)
+        self.assertEqual(GetJobLog(self.JOB_ID, cursor), ({}, cursor))
+        list_blobs.assert_called_once_with(container_name=_CONTAINER_NAME,
+                                           prefix='jobs.' + self.JOB_ID)
+
+    @patch.object(AppendBlobService, 'list_blobs')
+    def test_blob_manifest_of_job(self, list_blobs):
+        list_blobs.return_value = [
+            self.create_blob('jobs.' + self.JOB_ID + '.1',
+                             content_length=2,
+                             etag='b'),
+            self.create_blob('jobs.' + self.JOB_ID + '0', content_length=3),
+            self.create_blob('jobs.' + self.JOB_ID,
+                             content_length=1,
+                             etag='a'),
+        ]
+
+        self.assertEqual(self.module.get_blob_manifest(self.JOB_ID), [
+            (0, 'jobs.' + self.JOB_ID, 1, 'a'),
+            (1, 'jobs.' + self.JOB_ID + '.1', 2, 'b'),
+        ])
+        self.module.get_blob_manifest(self.JOB_ID)
+        self.assertEqual(list_blobs.call_count, 1)
+        self.module.get_blob_manifest(self.JOB_ID, refresh=True)
+        self.assertEqual(list_blobs.call_count, 2)
+
+    @patch.object(AppendBlobService, 'get_blob_to_bytes')
+    @patch.object(AppendBlobService, 'list_blobs')
+    def test_search_job_log_resumes_after_cursor(self, list_blobs,
+                                                 get_blob_to_bytes):
+        lines = [
+            '{"kubernetes":{"pod_name":"%s"},"time":"%s","log":"%s\\n"}\n' %
+            (pod, time, log) for (pod, time, log) in [
+                ('master', '2020-01-01T00:00:01Z', 'start'),
+                ('worker', '2020-01-01T00:00:02Z', 'error 1'),
+                ('master', '2020-01-01T00:00:03Z', 'step'),
+                ('master', '2020-01-01T00:00:04Z', 'error 2'),
+            ]
+        ]
+        content = ''.join(lines).encode('utf-8')
+        list_blobs.return_value = [
+            self.create_blob('jobs.' + self.JOB_ID,
+                             content_length=len(content)),
+        ]
+        get_blob_to_bytes.side_effect = \
+            lambda container, name, start_range, end_range: \
+            self.create_blob(name, content[start_range:end_range + 1])
+        query = self.module.LogQuery('error', context=1, limit=1)
+
+        matches, cursor = self.module.SearchJobLog(self.JOB_ID, query)
+        self.assertEqual([{
+            'cursor': cursor,
+            'pod': 'worker',
+            'time': '2020-01-01T00:00:02Z',
+            'line': 'error 1',
+            'before': [],
+            'after': [],
+        }], matches)
+        offset = len(lines[0]) + len(lines[1])
+        self.assertEqual('0.{}'.format(offset), cursor)
+
+        matches, cursor = self.module.SearchJobLog(self.JOB_ID, query,
+                                                   cursor=cursor)
+        self.assertEqual([('error 2', ['step'])],
+                         [(m['line'], m['before']) for m in matches])
+        self.assertIsNone(cursor)
+        get_blob_to_bytes.assert_called_with(_CONTAINER_NAME,
+                                             'jobs.' + self.JOB_ID,
+                                             start_range=offset,
+                                             end_range=len(content) - 1)
+
+    @patch.object(AppendBlobService, 'get_blob_to_bytes')
+    @patch.object(AppendBlobService, 'list_blobs')
+    def test_raw_log_range_after_download_error(self, list_blobs,
+                                                get_blob_to_bytes):
+        content = ''.join('{"log":"line %d\\n"}\n' % i
+                          for i in range(4)).encode('utf-8')
+        list_blobs.return_value = [
+            self.create_blob('jobs.' + self.JOB_ID,
+                             content_length=len(content)),
+            self.create_blob('jobs.' + self.JOB_ID + '.1',
+                             content_length=len(content)),
+        ]
+        failing = {'jobs.' + self.JOB_ID}
+
+        def get_blob(container, name, start_range, end_range):
+            if name in failing:
+                raise AzureHttpError('Service Unavailable', 503)
+            return self.create_blob(name, content[start_range:end_range + 1])
+
+        get_blob_to_bytes.side_effect = get_blob
+
+        # A full download skips the blob
+        self.assertEqual(['line %d\n' % i for i in range(4)],
+                         list(self.module.GetJobRawLog(self.JOB_ID)))
+
+        def open_log(cursor):
+            return self.module.iter_raw_log(self.JOB_ID, cursor=cursor)
+
+        raw_log = job_log_range.RawLog(open_log, job_log_range.LogIndex())
+        self.assertEqual(b'', b''.join(raw_log.read()))
+        self.assertIsNone(raw_log.size())
+
+        failing.clear()
+        self.assertEqual(2 * 4 * len('line 0\n'), raw_log.get_size())
+
+
+class FakeElasticsearch(object):
+    """Elasticsearch with documents sorted by their index."""
+    def __init__(self, num_documents, point_in_time=True):
+        self.documents = [{
+            "_source": {
+                "log": "line %d\n" % i
+            },
+            "sort": [i]
+        } for i in range(num_documents)]
+        if point_in_time:
+            # The client of Elasticsearch 6 has no point in time API
+            self.open_point_in_time = self._open_point_in_time
+        self.searches = []
+        self.msearches = []
+        self.closed = []
+
+    def _open_point_in_time(self, index, keep_alive, ignore_unavailable):
+        return {"id": "pit-" + index}
+
+    def close_point_in_time(self, body):
+        self.closed.append(body["id"])
+
+    def search(self, body, index=None, ignore_unavailable=None):
+        self.searches.append((index, body))
+        start = body["search_after"][0] + 1 if "search_after" in body else 0
+        response = {
+            "hits": {
+                "hits": self.documents[start:start + body["size"]]
+            }
+        }
+        if "pit" in body:
+            response["pit_id"] = body["pit"]["id"]
+        return response
+
+    def msearch(self, body):
+        self.msearches.append(body)
+        responses = []
+        for search in body[1::2]:
+            after = search["search_after"][0]
+            if isinstance(search["sort"][0], dict):
+                hits = self.documents[max(0, after - search["size"]):after]
+                hits = hits[::-1]
+            else:
+                hits = self.documents[after + 1:after + 1 + search["size"]]
+            responses.append({"hits": {"hits": hits}})
+        return {"responses": responses}
+
+
+class TestElasticsearch(TestCase):
+    def setUp(self):
+        with patch.dict(config, {
+                'logging': 'elasticsearch',
+                'elasticsearch': ['http://localhost:9200'],
+        }):
+            self.module = load_job_log_utils("JobLogUtils_elasticsearch")
+
+    def test_raw_log_pages_in_point_in_time(self):
+        elasticsearch = FakeElasticsearch(5)
+        self.module.elasticsearch_client = elasticsearch
+
+        with patch.object(self.module, "RAW_LOG_PAGE_SIZE", 2):
+            lines = list(
+                self.module.GetJobRawLog("job1",
+                                         start_time=datetime(2020, 1, 2),
+                                         end_time=datetime(2020, 1, 2)))
+
+        self.assertEqual(["line %d\n" % i for i in range(5)], lines)
+        indices = "logstash-2020.01.01,logstash-2020.01.02,logstash-2020.01.03"
+        self.assertEqual([None, None, None],
+                         [index for index, _ in elasticsearch.searches])
+        self.assertEqual(["pit-" + indices] * 3, [
+            body["pit"]["id"] for _, body in elasticsearch.searches
+        ])
+        self.assertEqual([None, [1], [3]], [
+            body.get("search_after") for _, body in elasticsearch.searches
+        ])
+        self.assertEqual(["pit-" + indices], elasticsearch.closed)
+
+    def test_raw_log_without_point_in_time(self):
+        elasticsearch = FakeElasticsearch(3, point_in_time=False)
+        self.module.elasticsearch_client = elasticsearch
+
+        documents = list(
+            self.module.iter_documents({}, "logstash-*",
+                                       page_size=3,
+                                       prefetch=False))
+
+        self.assertEqual(3, len(documents))
+        self.assertEqual(["logstash-*", "logstash-*"],
+                         [index for index, _ in elasticsearch.searches])
+        self.assertEqual([], elasticsearch.closed)
+
+    def test_point_in_time_not_supported_by_server(self):
+        elasticsearch = FakeElasticsearch(3)
+        elasticsearch.open_point_in_time = Mock(
+            side_effect=RuntimeError("not supported"))
+        self.module.elasticsearch_client = elasticsearch
+
+        with self.assertLogs(self.module.logger) as logs:
+            documents = list(self.module.iter_documents({}, "logstash-*"))
+        self.assertEqual(3, len(documents))
+        self.assertEqual(["logstash-*"],
+                         [index for index, _ in elasticsearch.searches])
+        self.assertIsNone(logs.records[0].exc_info)
+
+    def test_closing_reader_closes_point_in_time(self):
+        elasticsearch = FakeElasticsearch(10)
+        self.module.elasticsearch_client = elasticsearch
+
+        documents = self.module.iter_documents({}, "logstash-*", page_size=2)
+        next(documents)
+        documents.close()
+        self.assertEqual(["pit-logstash-*"], elasticsearch.closed)
+
+    def test_search_pushes_literal_pattern_down(self):
+        elasticsearch = FakeElasticsearch(10)
+        self.module.elasticsearch_client = elasticsearch
+        query = self.module.LogQuery("line",
+                                     pods=["pod1"],
+                                     start_time="2020-01-01T00:00:00Z",
+                                     context=2,
+                                     limit=2)
+
+        matches, cursor = self.module.SearchJobLog("job1", query)
+
+        self.assertEqual(["line 0", "line 1"],
+                         [match["line"] for match in matches])
+        self.assertEqual("1", cursor)
+        _, body = elasticsearch.searches[0]
+        self.assertEqual(3, body["size"])
+        filters = body["query"]["bool"]["filter"]
+        self.assertIn({"match_phrase": {"log": "line"}}, filters)
+        self.assertIn({"range": {"@timestamp": {
+            "gte": "2020-01-01T00:00:00Z"
+        }}}, filters)
+        # Context of both matches in one request
+        self.assertEqual(1, len(elasticsearch.msearches))
+        self.assertEqual((["line 0"], ["line 2", "line 3"]),
+                         (matches[1]["before"], matches[1]["after"]))
+
+        matches, cursor = self.module.SearchJobLog("job1", query,
+                                                   cursor=cursor)
+        self.assertEqual(["line 2", "line 3"],
+                         [match["line"] for match in matches])
+        self.assertEqual([1], elasticsearch.searches[-1][1]["search_after"])
+
+    def test_search_filters_regular_expression(self):
+        elasticsearch = FakeElasticsearch(10)
+        self.module.elasticsearch_client = elasticsearch
+        query = self.module.LogQuery("line [36]$", context=1)
+
+        matches, cursor = self.module.SearchJobLog("job1", query)
+
+        self.assertEqual([("line 3", ["line 2"], ["line 4"]),
+                          ("line 6", ["line 5"], ["line 7"])],
+                         [(match["line"], match["before"], match["after"])
+                          for match in matches])
+        self.assertIsNone(cursor)
+        filters = elasticsearch.searches[0][1]["query"]["bool"]["filter"]
+        self.assertEqual(1, len(filters))
+        self.assertEqual([], elasticsearch.msearches)
+
+    def test_get_indices(self):
+        self.assertEqual("logstash-*", self.module.get_indices())
+        self.assertEqual(
+            "logstash-*",
+            self.module.get_indices(datetime(2020, 1, 1),
+                                    datetime(2020, 6, 1)))
+        self.assertEqual(
+            "logstash-2019.12.31,logstash-2020.01.01,logstash-2020.01.02,"
+            "logstash-2020.01.03",
+            self.module.get_indices(datetime(2020, 1, 1, 23),
+                                    datetime(2020, 1, 2, 1)))
+
+
+class TestLogQuery(TestCase):
+    def records(self, lines):
+        return [(str(i), pod, time, line)
+                for (i, (pod, time, line)) in enumerate(lines)]
+
+    def test_invalid_query(self):
+        with self.assertRaises(ValueError):
+            LogQuery("(")
+        with self.assertRaises(ValueError):
+            LogQuery("a", start_time="yesterday")
+
+    def test_is_literal(self):
+        self.assertTrue(LogQuery("out of memory").is_literal())
+        self.assertFalse(LogQuery("error.*").is_literal())
+        self.assertFalse(LogQuery(" ").is_literal())
+
+    def test_context_of_the_same_pod(self):
+        records = self.records([
+            ("a", None, "a1\n"),
+            ("b", None, "b1\n"),
+            ("a", None, "error\n"),
+            ("b", None, "b2\n"),
+            ("a", None, "a2\n"),
+            ("a", None, "a3\n"),
+        ])
+        matches, cursor = LogQuery("error", context=1).filter(records)
+        self.assertEqual([{
+            "cursor": "2",
+            "pod": "a",
+            "time": None,
+            "line": "error",
+            "before": ["a1"],
+            "after": ["a2"],
+        }], matches)
+        self.assertIsNone(cursor)
+
+    def test_cursor_when_there_are_more_matches(self):
+        records = self.records([(None, None, "e%d" % i) for i in range(5)])
+        query = LogQuery("e", limit=2)
+        matches, cursor = query.filter(records)
+        self.assertEqual(["e0", "e1"], [m["line"] for m in matches])
+        self.assertEqual("1", cursor)
+
+        matches, cursor = query.filter(records[:2])
+        self.assertIsNone(cursor)
+
+    def test_pods_and_time_range(self):
+        records = self.records([
+            ("a", "2020-01-01T00:00:01Z", "e1"),
+            ("b", "2020-01-01T00:00:02Z", "e2"),
+            ("a", "2020-01-01T00:00:02.5Z", "e3"),
+            ("a", "2020-01-01T00:00:04Z", "e4"),
         ])
+        query = LogQuery("e",
+                         pods=["a"],
+                         start_time="2020-01-01T00:00:02Z",
+                         end_time="2020-01-01T00:00:03Z")
+        matches, _ = query.filter(records)
+        self.assertEqual(["e3"], [m["line"] for m in matches])
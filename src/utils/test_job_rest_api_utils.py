@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+
+import importlib
+import json
+import unittest
+from unittest.mock import MagicMock, patch
+
+from config import config
+import DataHandler
+
+# JobRestAPIUtils needs the MySQL DataHandler
+if "datasource" not in config:
+    config["datasource"] = "MySQL"
+    importlib.reload(DataHandler)
+
+import JobRestAPIUtils
+from cache import Cache
+
+
+def mock_data_handler(data_handler, name="DataHandler"):
+    """Patches DataHandler() in JobRestAPIUtils to return data_handler."""
+    data_handler.__enter__ = MagicMock(return_value=data_handler)
+    data_handler.__exit__ = MagicMock(return_value=False)
+    return patch.object(JobRestAPIUtils, name,
+                        MagicMock(return_value=data_handler))
+
+
+class TestJobEventFilter(unittest.TestCase):
+    def setUp(self):
+        patcher = patch.object(JobRestAPIUtils, "job_owner_cache",
+                               Cache("test_job_owner"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.data_handler = MagicMock()
+        self.data_handler.GetJobTextFields.return_value = {
+            "userName": "user1",
+            "vcName": "vc1",
+        }
+        patcher = mock_data_handler(self.data_handler)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_owner_is_looked_up_once(self):
+        match = JobRestAPIUtils.get_job_event_filter("user1", "vc1", None)
+
+        for status in ["queued", "running"]:
+            event = {"type": "status", "jobId": "job1", "jobStatus": status}
+            self.assertTrue(match(event))
+            self.assertEqual("user1", event["userName"])
+            self.assertEqual("vc1", event["vcName"])
+        self.assertEqual(1, self.data_handler.GetJobTextFields.call_count)
+
+        match = JobRestAPIUtils.get_job_event_filter("user2", "vc1", None)
+        self.assertFalse(match({"type": "status", "jobId": "job1"}))
+
+    def test_unknown_job_is_not_matched(self):
+        self.data_handler.GetJobTextFields.return_value = None
+        match = JobRestAPIUtils.get_job_event_filter("user1", "all", None)
+        self.assertFalse(match({"type": "status", "jobId": "job1"}))
+
+
+class TestSubmitCaches(unittest.TestCase):
+    def setUp(self):
+        for name in ["vc_meta_cache", "public_key_cache"]:
+            patcher = patch.object(JobRestAPIUtils, name,
+                                   Cache("test_" + name))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.data_handler = MagicMock()
+        self.data_handler.GetVC.return_value = {
+            "metadata": json.dumps({"user_quota": 1})
+        }
+        self.data_handler.UpdateVC.return_value = True
+        for patcher in [
+                mock_data_handler(self.data_handler),
+                mock_data_handler(self.data_handler, "GlobalDBHandler"),
+                patch.dict(
+                    config, {
+                        "global-mysql": {
+                            "hostname": "localhost",
+                            "username": "user",
+                            "password": "pass",
+                        }
+                    }),
+                patch.object(JobRestAPIUtils, "has_access",
+                             MagicMock(return_value=True)),
+                patch.object(JobRestAPIUtils.AuthorizationManager,
+                             "IsClusterAdmin", MagicMock(return_value=True)),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def get_vc_metadata(self):
+        return JobRestAPIUtils.get_vc_metadata(self.data_handler, "vc1")
+
+    def test_vc_metadata_is_invalidated_by_vc_update(self):
+        self.assertEqual({"user_quota": 1}, self.get_vc_metadata())
+        self.assertEqual({"user_quota": 1}, self.get_vc_metadata())
+        self.assertEqual(1, self.data_handler.GetVC.call_count)
+
+        metadata = json.dumps({"user_quota": 2})
+        JobRestAPIUtils.UpdateVC("admin", "vc1", "{}", metadata)
+        self.data_handler.GetVC.return_value = {"metadata": metadata}
+        self.assertEqual({"user_quota": 2}, self.get_vc_metadata())
+
+    def test_vc_metadata_is_invalidated_by_meta_patch(self):
+        self.assertEqual({"user_quota": 1}, self.get_vc_metadata())
+
+        _, code = JobRestAPIUtils.patch_vc_meta("admin", "vc1",
+                                                {"scheduling_policy": "FIFO"})
+        self.assertEqual(200, code)
+        metadata = self.data_handler.UpdateVCMeta.call_args[0][1]
+        self.data_handler.GetVC.return_value = {"metadata": metadata}
+        self.assertEqual("FIFO",
+                         self.get_vc_metadata()["admin"]["scheduling_policy"])
+
+    def test_public_keys_are_invalidated_by_key_changes(self):
+        get_keys = JobRestAPIUtils.get_user_public_keys
+        self.data_handler.list_public_keys.return_value = [{"id": 1}]
+        self.assertEqual([{"id": 1}], get_keys("user1"))
+        self.assertEqual([{"id": 1}], get_keys("user1"))
+        self.assertEqual(1, self.data_handler.list_public_keys.call_count)
+
+        self.data_handler.list_public_keys.return_value = [{
+            "id": 1
+        }, {
+            "id": 2
+        }]
+        JobRestAPIUtils.add_public_key("user1", "key2", "ssh-rsa key2")
+        self.assertEqual([{"id": 1}, {"id": 2}], get_keys("user1"))
+
+        self.data_handler.get_public_key.return_value = [{"username": "user1"}]
+        self.data_handler.list_public_keys.return_value = [{"id": 2}]
+        JobRestAPIUtils.delete_public_key("user1", 1)
+        self.assertEqual([{"id": 2}], get_keys("user1"))
+
+
+def fake_prepare_job(jobParams, dataHandler):
+    if not jobParams.get("jobName"):
+        return "ERROR: Job name cannot be empty", None, None
+    jobParams.setdefault("jobId", jobParams["jobName"] + "-id")
+    return None, [jobParams], {jobParams["jobId"]: 100}
+
+
+class TestSubmitJobs(unittest.TestCase):
+    def setUp(self):
+        self.data_handler = MagicMock()
+        for patcher in [
+                mock_data_handler(self.data_handler),
+                patch.object(JobRestAPIUtils, "prepare_job", fake_prepare_job),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_valid_jobs_are_added_in_one_call(self):
+        self.data_handler.add_jobs.return_value = True
+        results = JobRestAPIUtils.SubmitJobs([{
+            "jobName": "a"
+        }, "not a job", {
+            "jobName": ""
+        }, {
+            "jobName": "b"
+        }])
+
+        self.assertEqual({"jobId": "a-id"}, results[0])
+        self.assertIn("must be an object", results[1]["error"])
+        self.assertIn("cannot be empty", results[2]["error"])
+        self.assertEqual({"jobId": "b-id"}, results[3])
+        self.data_handler.add_jobs.assert_called_once_with(
+            [{
+                "jobName": "a",
+                "jobId": "a-id"
+            }, {
+                "jobName": "b",
+                "jobId": "b-id"
+            }], {
+                "a-id": 100,
+                "b-id": 100
+            })
+        self.data_handler.Close.assert_called_once_with()
+
+    def test_failed_transaction_fails_all_jobs(self):
+        self.data_handler.add_jobs.return_value = False
+        results = JobRestAPIUtils.SubmitJobs([{
+            "jobName": "a"
+        }, {
+            "jobName": "b"
+        }])
+        self.assertEqual([{
+            "error": JobRestAPIUtils.ADD_JOB_ERROR
+        }, {
+            "error": JobRestAPIUtils.ADD_JOB_ERROR
+        }], results)
+        self.assertEqual(1, self.data_handler.add_jobs.call_count)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+import datetime
+import gzip
+import json
+import unittest
+from unittest.mock import patch
+
+from flask import Flask, jsonify
+
+import json_response
+from json_response import iter_json, serialize, stream_json
+from response_cache import ResponseCache
+
+
+def get_large_obj():
+    return {
+        "result": [{
+            "id": i,
+            "name": "item%d" % i
+        } for i in range(1000)],
+        "count": 1000,
+    }
+
+
+class TestJsonResponse(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        json_response.install(self.app)
+        self.cache = ResponseCache(ttl=60)
+
+        @self.app.route("/small")
+        def small():
+            return jsonify({"a": 1})
+
+        @self.app.route("/large")
+        def large():
+            return jsonify(get_large_obj())
+
+        @self.app.route("/stream")
+        def stream():
+            return stream_json(get_large_obj())
+
+        @self.app.route("/cached")
+        def cached():
+            return self.cache.respond("cached", (), "v1", get_large_obj)
+
+        self.client = self.app.test_client()
+
+    def check_serialize(self):
+        t = datetime.datetime(2020, 1, 2, 3, 4, 5)
+        obj = {"b": [1, 2.5, None], "a": t, 1: "x", "c": {2: (3, 4)}}
+        self.assertEqual(
+            b'{"1":"x","a":"Thu, 02 Jan 2020 03:04:05 GMT","b":[1,2.5,null],'
+            b'"c":{"2":[3,4]}}', serialize(obj))
+        self.assertEqual(b"123456789012345678901234567890",
+                         serialize(123456789012345678901234567890))
+        with self.assertRaises(TypeError):
+            serialize(object())
+        with self.assertRaises(TypeError):
+            serialize({1: object()})
+
+    def test_serialize(self):
+        self.check_serialize()
+
+    def test_serialize_without_orjson(self):
+        with patch.object(json_response, "orjson", None):
+            self.check_serialize()
+
+    def test_iter_json(self):
+        for obj in [get_large_obj(), list(range(250)), [], {}, "a", None]:
+            self.assertEqual(obj, json.loads(b"".join(iter_json(obj))))
+
+    def test_small_response_is_not_compressed(self):
+        resp = self.client.get("/small", headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("Content-Encoding", resp.headers)
+        self.assertEqual({"a": 1}, json.loads(resp.data))
+
+    def test_gzip(self):
+        resp = self.client.get("/large")
+        self.assertNotIn("Content-Encoding", resp.headers)
+        self.assertEqual(get_large_obj(), json.loads(resp.data))
+
+        resp = self.client.get("/large", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual("gzip", resp.headers["Content-Encoding"])
+        self.assertIn("Accept-Encoding", resp.headers["Vary"])
+        self.assertEqual(get_large_obj(),
+                         json.loads(gzip.decompress(resp.data)))
+
+    def test_streamed_gzip(self):
+        resp = self.client.get("/stream")
+        self.assertEqual(get_large_obj(), json.loads(resp.data))
+
+        resp = self.client.get("/stream", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual("gzip", resp.headers["Content-Encoding"])
+        self.assertEqual(get_large_obj(),
+                         json.loads(gzip.decompress(resp.data)))
+
+    def test_cached_gzip(self):
+        headers = {"Accept-Encoding": "gzip"}
+        resp = self.client.get("/cached", headers=headers)
+        self.assertEqual("gzip", resp.headers["Content-Encoding"])
+        self.assertTrue(resp.headers["ETag"].startswith("W/"))
+        self.assertEqual(get_large_obj(),
+                         json.loads(gzip.decompress(resp.data)))
+
+        headers["If-None-Match"] = resp.headers["ETag"]
+        resp = self.client.get("/cached", headers=headers)
+        self.assertEqual(304, resp.status_code)
+
+
+if __name__ == '__main__':
+    unittest.main()
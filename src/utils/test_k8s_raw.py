@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from k8s_raw import project, to_camel_case, RawObject
+
+FIELDS = {
+    "metadata": {
+        "name": None,
+        "labels": None,
+    },
+    "spec": {
+        "nodeName": None,
+        "containers": {
+            "resources": {
+                "requests": None,
+            },
+        },
+    },
+}
+
+
+def get_raw_pod():
+    return {
+        "apiVersion": "v1",
+        "metadata": {
+            "name": "pod1",
+            "labels": {
+                "jobId": "job1"
+            },
+            "uid": "1234",
+        },
+        "spec": {
+            "nodeName": "node1",
+            "containers": [{
+                "name": "c1",
+                "image": "ubuntu",
+                "resources": {
+                    "requests": {
+                        "cpu": "1"
+                    }
+                },
+            }],
+        },
+        "status": {
+            "phase": "Running"
+        },
+    }
+
+
+class TestK8sRaw(unittest.TestCase):
+    def test_to_camel_case(self):
+        self.assertEqual("name", to_camel_case("name"))
+        self.assertEqual("nodeSelector", to_camel_case("node_selector"))
+
+    def test_project(self):
+        expected = {
+            "metadata": {
+                "name": "pod1",
+                "labels": {
+                    "jobId": "job1"
+                },
+            },
+            "spec": {
+                "nodeName": "node1",
+                "containers": [{
+                    "resources": {
+                        "requests": {
+                            "cpu": "1"
+                        }
+                    },
+                }],
+            },
+        }
+        self.assertEqual(expected, project(get_raw_pod(), FIELDS))
+        self.assertEqual({}, project({"status": {}}, FIELDS))
+        self.assertIsNone(project(None, FIELDS))
+
+    def test_raw_object(self):
+        pod = RawObject(project(get_raw_pod(), FIELDS), FIELDS)
+        self.assertEqual("pod1", pod.metadata.name)
+        self.assertEqual({"jobId": "job1"}, pod.metadata.labels)
+        self.assertEqual("node1", pod.spec.node_name)
+        self.assertIsNone(pod.spec.node_selector)
+        self.assertIsNone(pod.status)
+        self.assertEqual({"cpu": "1"},
+                         pod.spec.containers[0].resources.requests)
+
+
+if __name__ == '__main__':
+    unittest.main()
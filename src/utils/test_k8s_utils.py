@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+import json
+import unittest
+from unittest.mock import patch
+
+from kubernetes.client.rest import ApiException
+
+with patch("kubernetes.config.load_kube_config"):
+    from k8s_utils import K8sUtil
+
+FIELDS = {"metadata": {"name": None}}
+
+
+class FakeResponse(object):
+    def __init__(self, page):
+        self.data = json.dumps(page).encode("utf-8")
+        self.released = False
+
+    def release_conn(self):
+        self.released = True
+
+
+class FakeList(object):
+    """Serves names as pages of raw JSON, fails the page at fail_at."""
+    def __init__(self, names, fail_at=None):
+        self.names = names
+        self.fail_at = fail_at
+        self.calls = []
+
+    def __call__(self, limit, timeout_seconds, _continue=None, **kwargs):
+        self.calls.append(_continue)
+        start = 0 if _continue is None else int(_continue)
+        if start == self.fail_at:
+            raise ApiException(status=410, reason="Gone")
+        end = start + limit
+        page = {
+            "items": [{
+                "metadata": {
+                    "name": name,
+                    "uid": name
+                }
+            } for name in self.names[start:end]],
+            "metadata": {},
+        }
+        if end < len(self.names):
+            page["metadata"]["continue"] = str(end)
+        return FakeResponse(page)
+
+
+class TestK8sUtil(unittest.TestCase):
+    def setUp(self):
+        self.k8s = K8sUtil()
+
+    def list_nodes(self, fake_list):
+        with patch.object(self.k8s.core_api, "list_node", fake_list):
+            return [
+                node.metadata.name
+                for node in self.k8s.get_all_nodes(limit=2, raw_fields=FIELDS)
+            ]
+
+    def test_list_all_pages(self):
+        fake_list = FakeList(["node1", "node2", "node3"])
+        self.assertEqual(["node1", "node2", "node3"],
+                         self.list_nodes(fake_list))
+        self.assertEqual([None, "2"], fake_list.calls)
+
+    def test_failed_page_is_raised(self):
+        fake_list = FakeList(["node1", "node2", "node3"], fail_at=2)
+        with self.assertRaises(ApiException):
+            self.list_nodes(fake_list)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+
+import base64
+import json
+import unittest
+import zlib
+from unittest.mock import MagicMock, patch
+
+import mysql.connector
+
+import MySQLDataHandler
+from MySQLDataHandler import DataHandler, JOB_V2_COLUMNS, project_columns
+from config import config
+from job_log_tail import encode_job_log
+
+
+def b64(obj):
+    return base64.b64encode(json.dumps(obj).encode("utf-8")).decode("utf-8")
+
+
+def make_data_handler(columns, rows):
+    cursor = MagicMock()
+    cursor.description = [(col,) for col in columns]
+    cursor.fetchall.return_value = rows
+    data_handler = DataHandler.__new__(DataHandler)
+    data_handler.jobtablename = "jobs"
+    data_handler.joblogtablename = "joblogs"
+    data_handler.conn = MagicMock()
+    data_handler.conn.cursor.return_value = cursor
+    return data_handler, cursor
+
+
+class TestFieldProjection(unittest.TestCase):
+    def test_project_columns(self):
+        self.assertEqual(list(JOB_V2_COLUMNS),
+                         project_columns(JOB_V2_COLUMNS, None))
+        self.assertEqual(["jobId", "jobName", "jobStatus"],
+                         project_columns(JOB_V2_COLUMNS,
+                                         ["jobStatus", "jobName", "bad`"],
+                                         required=("jobId",)))
+
+    def test_get_job_v2_selects_requested_fields(self):
+        data_handler, cursor = make_data_handler(
+            ["jobId", "userName", "vcName", "jobParams"],
+            [("job1", "user1", "vc1", b64({"image": "ubuntu"}))])
+
+        jobs = data_handler.GetJobV2("job1", ("jobParams",))
+
+        query = cursor.execute.call_args[0][0]
+        self.assertIn("SELECT `jobId`,`userName`,`vcName`,`jobParams` FROM",
+                      query)
+        self.assertNotIn("insight", query)
+        self.assertEqual([{
+            "jobId": "job1",
+            "userName": "user1",
+            "vcName": "vc1",
+            "jobParams": {
+                "image": "ubuntu"
+            },
+        }], jobs)
+
+    def test_get_union_job_list_v2_selects_requested_fields(self):
+        data_handler, cursor = make_data_handler(
+            ["jobId", "jobName", "jobStatus", "jobType"],
+            [("job1", "name1", "running", "training")])
+
+        jobs = data_handler.get_union_job_list_v2("user1", "vc1", 10,
+                                                  "running", ["jobName"])
+
+        query = cursor.execute.call_args[0][0]
+        self.assertTrue(
+            query.startswith("(SELECT jobId,jobName,jobStatus,jobType FROM"))
+        self.assertEqual([{
+            "jobId": "job1",
+            "jobName": "name1",
+            "jobStatus": "running",
+            "jobType": "training",
+        }], jobs["runningJobs"])
+
+
+class TestUpdateJobColumn(unittest.TestCase):
+    def test_update_job_log_cursors_in_one_transaction(self):
+        data_handler, cursor = make_data_handler([], [])
+
+        self.assertTrue(
+            data_handler.update_job_log_cursors({
+                "job1": "1.2",
+                "job2": "3.4"
+            }))
+
+        query, params = cursor.execute.call_args[0]
+        self.assertEqual(
+            "UPDATE `jobs` SET `jobLogCursor` = CASE jobId "
+            "WHEN %s THEN %s WHEN %s THEN %s END WHERE jobId IN (%s,%s)",
+            query)
+        self.assertEqual(["job1", "1.2", "job2", "3.4", "job1", "job2"],
+                         params)
+        data_handler.conn.commit.assert_called_once_with()
+
+    def test_update_job_log_cursors_rolls_back(self):
+        data_handler, cursor = make_data_handler([], [])
+        cursor.execute.side_effect = RuntimeError("db down")
+
+        self.assertFalse(data_handler.update_job_log_cursors({"job1": "1"}))
+        data_handler.conn.rollback.assert_called_once_with()
+
+
+class TestJobLog(unittest.TestCase):
+    def test_update_job_log_compressed_in_joblogs(self):
+        data_handler, cursor = make_data_handler([], [])
+
+        self.assertTrue(data_handler.update_job_log("job1", "hello\n"))
+
+        query, params = cursor.execute.call_args[0]
+        self.assertEqual(
+            "INSERT INTO `joblogs` (`jobId`, `log`) VALUES (%s, %s) "
+            "ON DUPLICATE KEY UPDATE `log` = VALUES(`log`)", query)
+        self.assertEqual("job1", params[0])
+        self.assertEqual(b"hello\n", zlib.decompress(params[1]))
+
+    def test_get_job_log_from_joblogs(self):
+        data_handler, cursor = make_data_handler(
+            ["log"], [(zlib.compress(b"hello\n"),)])
+        data_handler.GetJobTextField = MagicMock()
+
+        self.assertEqual("hello\n", data_handler.get_job_log("job1"))
+        data_handler.GetJobTextField.assert_not_called()
+
+    def test_get_job_log_not_moved_yet(self):
+        data_handler, cursor = make_data_handler(["log"], [])
+        data_handler.GetJobTextField = MagicMock(
+            return_value=encode_job_log("old\n"))
+
+        self.assertEqual("old\n", data_handler.get_job_log("job1"))
+        data_handler.GetJobTextField.assert_called_once_with("job1", "jobLog")
+
+
+class FakePool(object):
+    """Stands in for MySQLConnectionPool, closing a connection returns it."""
+    def __init__(self, pool_size, **kwargs):
+        self.idle = []
+        for _ in range(pool_size):
+            conn = MagicMock()
+            conn.close.side_effect = \
+                lambda conn=conn: self.idle.append(conn)
+            self.idle.append(conn)
+
+    def get_connection(self):
+        if not self.idle:
+            raise mysql.connector.errors.PoolError("pool exhausted")
+        return self.idle.pop()
+
+
+class TestConnectionPool(unittest.TestCase):
+    def setUp(self):
+        for patcher in [
+                patch.object(MySQLDataHandler, "pools", {}),
+                patch.object(mysql.connector.pooling, "MySQLConnectionPool",
+                             FakePool),
+                patch.object(mysql.connector, "connect"),
+                patch.dict(config, {
+                    "clusterId": "test",
+                    "mysql": {
+                        "hostname": "localhost",
+                        "username": "user",
+                        "password": "pass",
+                        "pool_size": 2,
+                    },
+                }),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def get_pool(self):
+        return MySQLDataHandler.pools["DLWSCluster-test"]
+
+    def test_connection_is_returned_after_exception(self):
+        with self.assertRaises(RuntimeError):
+            with DataHandler() as data_handler:
+                self.assertEqual(1, len(self.get_pool().idle))
+                raise RuntimeError("query failed")
+        self.assertEqual(2, len(self.get_pool().idle))
+        self.assertIs(data_handler.conn, self.get_pool().idle[-1])
+
+    def test_exhausted_pool_opens_new_connection(self):
+        handlers = [DataHandler() for _ in range(3)]
+        self.assertEqual(0, len(self.get_pool().idle))
+        self.assertIs(mysql.connector.connect.return_value, handlers[2].conn)
+
+        for data_handler in handlers:
+            data_handler.Close()
+        self.assertEqual(2, len(self.get_pool().idle))
+        mysql.connector.connect.return_value.close.assert_called_once_with()
+
+    def test_pool_size(self):
+        self.assertEqual(2, MySQLDataHandler.get_pool_size())
+        del config["mysql"]["pool_size"]
+        self.assertEqual(MySQLDataHandler.DEFAULT_POOL_SIZE,
+                         MySQLDataHandler.get_pool_size())
+        mod_wsgi = MagicMock(threads_per_process=25)
+        with patch.dict("sys.modules", {"mod_wsgi": mod_wsgi}):
+            self.assertEqual(25, MySQLDataHandler.get_pool_size())
+
+
+def make_jobs_params(count):
+    return [{
+        "jobId": "job%d" % i,
+        "familyToken": "job%d" % i,
+        "isParent": 1,
+        "jobName": "name",
+        "userName": "user1",
+        "vcName": "vc1",
+        "jobType": "training",
+    } for i in range(count)]
+
+
+class TestAddJobs(unittest.TestCase):
+    def setUp(self):
+        patcher = patch.object(MySQLDataHandler, "INSERT_BATCH_SIZE", 2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_insert_jobs_in_batches(self):
+        data_handler, cursor = make_data_handler([], [])
+        data_handler.insert_jobs(cursor, make_jobs_params(3))
+
+        self.assertEqual(2, cursor.execute.call_count)
+        sql, params = cursor.execute.call_args_list[0][0]
+        self.assertTrue(sql.endswith(
+            " VALUES (%s,%s,%s,%s,%s,%s,%s,%s),(%s,%s,%s,%s,%s,%s,%s,%s)"))
+        self.assertEqual(["job0", "job0", 1, "name", "user1", "vc1",
+                          "training"], params[:7])
+        self.assertEqual("job0",
+                         json.loads(base64.b64decode(params[7]))["jobId"])
+        self.assertEqual("job1", params[8])
+        sql, params = cursor.execute.call_args_list[1][0]
+        self.assertTrue(sql.endswith(" VALUES (%s,%s,%s,%s,%s,%s,%s,%s)"))
+        self.assertEqual("job2", params[0])
+
+    def test_update_job_priorities_with_case(self):
+        data_handler, cursor = make_data_handler([], [])
+        data_handler.update_job_priorities(cursor, {
+            "job0": "100",
+            "job1": 200,
+            "job2": 300,
+        })
+
+        self.assertEqual(2, cursor.execute.call_count)
+        sql, params = cursor.execute.call_args_list[0][0]
+        self.assertEqual(
+            "UPDATE `jobs` SET `priority` = CASE jobId "
+            "WHEN %s THEN %s WHEN %s THEN %s END WHERE jobId IN (%s,%s)", sql)
+        self.assertEqual(["job0", 100, "job1", 200, "job0", "job1"], params)
+        sql, params = cursor.execute.call_args_list[1][0]
+        self.assertEqual(["job2", 300, "job2"], params)
+
+    def test_add_jobs_commits_once(self):
+        data_handler, cursor = make_data_handler([], [])
+        data_handler.publish_new_job_event = MagicMock()
+
+        self.assertTrue(
+            data_handler.add_jobs(make_jobs_params(3), {"job0": 100}))
+        self.assertEqual(3, cursor.execute.call_count)
+        data_handler.conn.commit.assert_called_once_with()
+        self.assertEqual(3, data_handler.publish_new_job_event.call_count)
+
+    def test_add_jobs_raises_duplicate_job_id(self):
+        data_handler, cursor = make_data_handler([], [])
+        cursor.execute.side_effect = mysql.connector.errors.IntegrityError(
+            msg="Duplicate entry 'job0' for key 'jobId'")
+
+        with self.assertRaises(mysql.connector.errors.IntegrityError):
+            data_handler.add_jobs(make_jobs_params(1))
+        data_handler.conn.rollback.assert_called_once_with()
+        data_handler.conn.commit.assert_not_called()
+
+    def test_add_jobs_rolls_back_on_failure(self):
+        data_handler, cursor = make_data_handler([], [])
+        cursor.execute.side_effect = [None, Exception("lock wait timeout")]
+        data_handler.publish_new_job_event = MagicMock()
+
+        jobs_params = make_jobs_params(2)
+        self.assertFalse(
+            data_handler.add_jobs(jobs_params, {
+                "job0": 100,
+                "job1": 200
+            }))
+
+        self.assertEqual(2, cursor.execute.call_count)
+        data_handler.conn.rollback.assert_called_once_with()
+        data_handler.conn.commit.assert_not_called()
+        cursor.close.assert_called_once_with()
+        data_handler.publish_new_job_event.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
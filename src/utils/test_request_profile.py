@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from flask import Flask, jsonify
+
+import request_profile
+from MySQLDataHandler import ProfiledConnection, record
+
+
+class TestRequestProfile(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        request_profile.install(self.app)
+        self.profiles = []
+
+        @record
+        def query():
+            time.sleep(0.01)
+
+        @record
+        def nested_query():
+            query()
+
+        @self.app.route("/jobs")
+        def jobs():
+            self.profiles.append(request_profile.current())
+            nested_query()
+            query()
+            request_profile.count("db_rows", 5)
+            return jsonify({})
+
+        self.client = self.app.test_client()
+
+    def test_counts_and_server_timing(self):
+        with patch.object(request_profile,
+                          "get_settings",
+                          return_value={"server_timing": True}):
+            resp = self.client.get("/jobs")
+        profile = self.profiles[0]
+        self.assertEqual("jobs", profile.endpoint)
+        self.assertEqual(3, profile.counts["datahandler_calls"])
+        self.assertEqual(5, profile.counts["db_rows"])
+        # Nested call is not counted twice
+        self.assertGreaterEqual(profile.times["db"], 0.02)
+        self.assertLess(profile.times["db"], 0.03)
+        self.assertIn("db;dur=", resp.headers["Server-Timing"])
+        self.assertIn("total;dur=", resp.headers["Server-Timing"])
+        self.assertIsNone(request_profile.current())
+
+    def test_no_server_timing_by_default(self):
+        with patch.object(request_profile, "get_settings", return_value={}):
+            resp = self.client.get("/jobs")
+        self.assertNotIn("Server-Timing", resp.headers)
+
+    def test_no_profile_outside_of_request(self):
+        request_profile.count("db_rows")
+        with request_profile.timer("db"):
+            pass
+        self.assertIsNone(request_profile.current())
+
+    def test_slow_request_log_and_cprofile(self):
+        settings = {"slow_request_seconds": 0, "allow_header": True}
+        with patch.object(request_profile, "get_settings",
+                          return_value=settings), \
+                self.assertLogs(request_profile.logger) as logs:
+            self.client.get("/jobs",
+                            headers={request_profile.PROFILE_HEADER: "1"})
+        output = "\n".join(logs.output)
+        self.assertIn("Slow request GET /jobs", output)
+        self.assertIn("datahandler_calls=3", output)
+        self.assertIn("function calls", output)
+
+    def test_header_ignored_unless_allowed(self):
+        with patch.object(request_profile, "get_settings", return_value={}):
+            self.client.get("/jobs",
+                            headers={request_profile.PROFILE_HEADER: "1"})
+        self.assertIsNone(self.profiles[0].profiler)
+
+    def test_profiled_connection_counts_rows(self):
+        cursor = MagicMock()
+        cursor.fetchall.return_value = [(1,), (2,)]
+        cursor.__iter__.return_value = iter([(1,), (2,), (3,)])
+        conn = MagicMock()
+        conn.cursor.return_value = cursor
+        profile = request_profile.RequestProfile("test")
+
+        profiled = ProfiledConnection(conn, profile).cursor()
+        profiled.execute("SELECT 1")
+        self.assertEqual(2, len(profiled.fetchall()))
+        self.assertEqual(3, len(list(profiled)))
+        self.assertEqual(5, profile.counts["db_rows"])
+        cursor.execute.assert_called_once_with("SELECT 1")
+
+
+if __name__ == '__main__':
+    unittest.main()
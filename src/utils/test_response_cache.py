@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+import json
+import unittest
+
+from flask import Flask
+
+from response_cache import ResponseCache
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.cache = ResponseCache(ttl=60)
+        self.calls = 0
+        self.version = "v1"
+
+        @self.app.route("/data")
+        def data():
+            def produce():
+                self.calls += 1
+                return {"version": self.version, "calls": self.calls}
+
+            return self.cache.respond("data", ("user",), self.version,
+                                      produce)
+
+        self.client = self.app.test_client()
+
+    def test_response_is_cached_per_version(self):
+        resp = self.client.get("/data")
+        self.assertEqual(200, resp.status_code)
+        self.assertEqual({"version": "v1", "calls": 1}, json.loads(resp.data))
+        self.assertEqual("no-cache", resp.headers["Cache-Control"])
+
+        resp = self.client.get("/data")
+        self.assertEqual({"version": "v1", "calls": 1}, json.loads(resp.data))
+
+        self.version = "v2"
+        resp = self.client.get("/data")
+        self.assertEqual({"version": "v2", "calls": 2}, json.loads(resp.data))
+
+    def test_new_version_replaces_response(self):
+        for i in range(10):
+            self.version = "v%d" % i
+            self.client.get("/data")
+        self.assertEqual(1, len(self.cache.caches["data"]))
+        self.assertEqual("v9", self.cache.caches["data"].entries[(
+            "user", )].value.version)
+
+    def test_not_modified(self):
+        resp = self.client.get("/data")
+        etag = resp.headers["ETag"]
+
+        resp = self.client.get("/data", headers={"If-None-Match": etag})
+        self.assertEqual(304, resp.status_code)
+        self.assertEqual(b"", resp.data)
+        self.assertEqual(etag, resp.headers["ETag"])
+
+        self.version = "v2"
+        resp = self.client.get("/data", headers={"If-None-Match": etag})
+        self.assertEqual(200, resp.status_code)
+        self.assertNotEqual(etag, resp.headers["ETag"])
+
+
+if __name__ == '__main__':
+    unittest.main()